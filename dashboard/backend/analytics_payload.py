@@ -0,0 +1,230 @@
+"""
+Compact schema, projection and JSON encoding for the orders analytics payload.
+
+``/api/analytics/orders`` used to return the whole ``analyze`` result: the stock report
+row of every ASIN at the top level *and* again inside each ``enhanced_analytics`` entry,
+every order of the day as a full record, all of it walked by a recursive
+``clean_for_json`` on each response. ``compact_analysis`` runs once when an analysis is
+computed (before it is cached or stored): it keeps a single ``stock_info`` map, replaces
+``sellerboard_orders`` with an ``orders_summary`` and makes the values JSON-safe
+(non-finite floats become null). Requests then only project (``fields=``, ``asins=``,
+``page=``/``limit=``) and encode with ``to_json``, which takes the C encoder's fast path
+and only falls back to a sanitizing pass for payloads that still hold NaN/Infinity.
+"""
+
+import json
+import math
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+ANALYTICS_SCHEMA_VERSION = 2
+ANALYTICS_DEFAULT_PAGE_SIZE = 100
+
+# Per-ASIN maps that asins= filters; page=/limit= pages the large catalog-sized ones
+ASIN_KEYED_FIELDS = ('enhanced_analytics', 'restock_alerts', 'stock_info', 'today_sales', 'velocity',
+                     'low_stock', 'restock_priority', 'stockout_30d')
+PAGED_FIELDS = ('enhanced_analytics', 'restock_alerts', 'stock_info')
+
+# Always returned, whatever fields= asks for (status and date handling in the views)
+META_FIELDS = ('report_date', 'is_yesterday', 'user_timezone', 'source', 'message', 'error', 'fallback_mode',
+               'basic_mode', 'requires_setup', 'status', 'schema_version', 'pagination')
+
+# Revenue columns in the order the dashboard has always tried them
+ORDER_REVENUE_FIELDS = ('OrderTotalAmount', 'order_total_amount', 'Order Total Amount', 'Revenue', 'revenue',
+                        'Total', 'total', 'Amount', 'amount')
+
+
+def summarize_orders(orders) -> Dict[str, Any]:
+    """Order count and revenue of an orders DataFrame (or list of order dicts)"""
+    if orders is None:
+        return {'order_count': 0, 'revenue': 0.0}
+    if not isinstance(orders, pd.DataFrame):
+        orders = pd.DataFrame(list(orders))
+    revenue = pd.Series(np.nan, index=orders.index, dtype=float)
+    for field in ORDER_REVENUE_FIELDS:
+        if field not in orders.columns:
+            continue
+        # First non-empty value per order, like the per-order fallback chain in the UI
+        raw = orders[field]
+        pending = revenue.isna() & raw.notna() & (raw.astype(str).str.strip() != '')
+        if pending.any():
+            values = raw[pending]
+            if values.dtype == object:
+                values = values.astype(str).str.replace(',', '', regex=False)
+            revenue[pending] = pd.to_numeric(values, errors='coerce').fillna(0.0)
+    total = float(revenue.fillna(0.0).sum())
+    return {'order_count': int(len(orders)), 'revenue': round(total, 2)}
+
+
+def _finite(obj):
+    """JSON-safe copy: non-finite floats become None, numpy/date values become native types"""
+    if isinstance(obj, dict):
+        return {k: _finite(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(item) for item in obj]
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if obj is None or isinstance(obj, (int, str, bool)):
+        return obj
+    return _json_default(obj)
+
+
+def _json_default(obj):
+    if isinstance(obj, np.bool_):
+        return bool(obj)
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        value = float(obj)
+        return value if math.isfinite(value) else None
+    if isinstance(obj, np.ndarray):
+        return _finite(obj.tolist())
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    # Anything else is sent as text, as clean_for_json always did
+    return str(obj)
+
+
+def to_json(payload) -> str:
+    """Encode a payload, mapping NaN/Infinity to null"""
+    try:
+        return json.dumps(payload, allow_nan=False, separators=(',', ':'), default=_json_default)
+    except ValueError:
+        return json.dumps(_finite(payload), allow_nan=False, separators=(',', ':'), default=_json_default)
+
+
+def compact_analysis(analysis: dict) -> dict:
+    """The de-duplicated, JSON-safe schema that is cached, stored and served"""
+    analysis.pop('orders_df', None)
+    orders = analysis.pop('sellerboard_orders', None)
+    if 'orders_summary' not in analysis:
+        analysis['orders_summary'] = summarize_orders(orders or [])
+
+    enhanced = analysis.get('enhanced_analytics')
+    if isinstance(enhanced, dict):
+        stock_info = analysis.get('stock_info')
+        if not isinstance(stock_info, dict):
+            stock_info = analysis['stock_info'] = {}
+        for asin, entry in enhanced.items():
+            if isinstance(entry, dict) and 'stock_info' in entry:
+                # One copy per ASIN, at the top level (fallback rows of unlisted ASINs move there too)
+                stock_info.setdefault(asin, entry.pop('stock_info'))
+
+    analysis['schema_version'] = ANALYTICS_SCHEMA_VERSION
+    return _finite(analysis)
+
+
+class AnalyticsProjection:
+    """What a request asked for: a field tree, an ASIN filter and a page of the catalog maps"""
+
+    def __init__(self, fields: Optional[Dict[str, dict]] = None, asins: Optional[List[str]] = None,
+                 page: Optional[int] = None, limit: Optional[int] = None):
+        self.fields = fields
+        self.asins = asins
+        self.page = page
+        self.limit = limit
+
+    @classmethod
+    def from_args(cls, args) -> Optional['AnalyticsProjection']:
+        """Parse fields=, asins=, page= and limit= query args; None when none are given (full payload)
+
+        Raises ValueError for malformed values.
+        """
+        fields_arg, asins_arg = args.get('fields'), args.get('asins')
+        page_arg, limit_arg = args.get('page'), args.get('limit')
+        if not any((fields_arg, asins_arg, page_arg, limit_arg)):
+            return None
+
+        fields = None
+        if fields_arg:
+            # Dotted paths select nested keys; under per-ASIN maps they apply to every ASIN's entry
+            fields = {}
+            for path in fields_arg.split(','):
+                node = fields
+                for part in [part.strip() for part in path.split('.') if part.strip()]:
+                    node = node.setdefault(part, {})
+
+        asins = None
+        if asins_arg:
+            asins = [asin.strip() for asin in asins_arg.split(',') if asin.strip()]
+
+        page = limit = None
+        if page_arg or limit_arg:
+            try:
+                page = int(page_arg) if page_arg else 1
+                limit = int(limit_arg) if limit_arg else ANALYTICS_DEFAULT_PAGE_SIZE
+            except ValueError:
+                raise ValueError('page and limit must be integers')
+            if page < 1 or limit < 1:
+                raise ValueError('page and limit must be positive')
+        return cls(fields, asins, page, limit)
+
+    def _page_asins(self, payload: dict) -> Optional[List[str]]:
+        if self.page is None:
+            return None
+        enhanced = payload.get('enhanced_analytics') or {}
+        if enhanced:
+            # Most urgent first, so page 1 is what a restock view shows at the top
+            ordered = sorted(enhanced, key=lambda asin: (-_priority_score(enhanced[asin]), asin))
+        else:
+            ordered = sorted(payload.get('stock_info') or {})
+        if self.asins is not None:
+            wanted = set(self.asins)
+            ordered = [asin for asin in ordered if asin in wanted]
+        start = (self.page - 1) * self.limit
+        payload['pagination'] = {
+            'page': self.page,
+            'limit': self.limit,
+            'total': len(ordered),
+            'pages': (len(ordered) + self.limit - 1) // self.limit,
+        }
+        return ordered[start:start + self.limit]
+
+    def apply(self, payload: dict) -> dict:
+        """A projected shallow copy of a compact payload (the cached payload is not modified)"""
+        payload = dict(payload)
+        page_asins = self._page_asins(payload)
+
+        if self.asins is not None or page_asins is not None:
+            wanted = set(self.asins) if self.asins is not None else None
+            on_page = set(page_asins) if page_asins is not None else None
+            for field in ASIN_KEYED_FIELDS:
+                values = payload.get(field)
+                if not isinstance(values, dict):
+                    continue
+                if on_page is not None and field in PAGED_FIELDS:
+                    payload[field] = {asin: values[asin] for asin in page_asins if asin in values}
+                elif wanted is not None:
+                    payload[field] = {asin: value for asin, value in values.items() if asin in wanted}
+            if wanted is not None and isinstance(payload.get('critical_alerts'), list):
+                payload['critical_alerts'] = [alert for alert in payload['critical_alerts']
+                                              if isinstance(alert, dict) and alert.get('asin') in wanted]
+
+        if self.fields is None:
+            return payload
+
+        projected = {key: payload[key] for key in META_FIELDS if key in payload}
+        for field, subtree in self.fields.items():
+            if field not in payload:
+                continue
+            value = payload[field]
+            if subtree and field in ASIN_KEYED_FIELDS and isinstance(value, dict):
+                projected[field] = {asin: _select(entry, subtree) for asin, entry in value.items()}
+            else:
+                projected[field] = _select(value, subtree)
+        return projected
+
+
+def _priority_score(entry) -> float:
+    priority = entry.get('priority') if isinstance(entry, dict) else None
+    score = priority.get('score') if isinstance(priority, dict) else None
+    return score if isinstance(score, (int, float)) else 0
+
+
+def _select(value, subtree: dict):
+    if not subtree or not isinstance(value, dict):
+        return value
+    return {key: _select(value[key], subtree[key]) for key in subtree if key in value}
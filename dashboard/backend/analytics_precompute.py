@@ -0,0 +1,271 @@
+"""
+Background precompute of each user's daily orders analytics.
+
+The dashboard shows "yesterday" in the user's ``profile.timezone``. Instead of building
+that analysis on the first request of the day, a scheduler thread notices when a user's
+local date has rolled over, computes the analysis on a small worker pool and writes it
+to a durable SQLite store. ``/api/analytics/orders`` reads the store after its
+in-memory cache, so first paint is a cache hit and survives restarts and deploys.
+
+Per-user state tracks the last target date computed, jobs in flight and retry backoff
+after failures, so each user is computed at most once per local day.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import pytz
+
+ANALYTICS_PRECOMPUTE_ENABLED = os.getenv('ANALYTICS_PRECOMPUTE_ENABLED', 'true').lower() == 'true'
+ANALYTICS_PRECOMPUTE_DB = os.getenv('ANALYTICS_PRECOMPUTE_DB', 'analytics_precompute.db')
+ANALYTICS_PRECOMPUTE_WORKERS = int(os.getenv('ANALYTICS_PRECOMPUTE_WORKERS', '2'))
+ANALYTICS_PRECOMPUTE_POLL_SECONDS = int(os.getenv('ANALYTICS_PRECOMPUTE_POLL_SECONDS', '300'))
+# Minutes after local midnight before computing, so the reports include the whole day
+ANALYTICS_PRECOMPUTE_DELAY_MINUTES = int(os.getenv('ANALYTICS_PRECOMPUTE_DELAY_MINUTES', '30'))
+ANALYTICS_PRECOMPUTE_RETRY_MINUTES = int(os.getenv('ANALYTICS_PRECOMPUTE_RETRY_MINUTES', '30'))
+
+
+def user_local_now(user_timezone: Optional[str]) -> datetime:
+    """Current time in the user's timezone (server local time when unset or unknown)"""
+    if user_timezone:
+        try:
+            return datetime.now(pytz.timezone(user_timezone))
+        except pytz.UnknownTimeZoneError:
+            pass
+    return datetime.now()
+
+
+class AnalyticsResultStore:
+    """Durable analytics payloads keyed by the endpoint's cache key, shared across processes"""
+
+    def __init__(self, db_path: str = ANALYTICS_PRECOMPUTE_DB):
+        self.db_path = db_path
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.execute('PRAGMA journal_mode=WAL')
+                    conn.execute('''
+                        CREATE TABLE IF NOT EXISTS precomputed_analytics (
+                            cache_key TEXT PRIMARY KEY,
+                            discord_id TEXT NOT NULL,
+                            target_date TEXT NOT NULL,
+                            payload TEXT NOT NULL,
+                            computed_at REAL NOT NULL
+                        )
+                    ''')
+                    conn.execute('CREATE INDEX IF NOT EXISTS idx_precomputed_analytics_user ON precomputed_analytics (discord_id)')
+                    conn.commit()
+                    self._schema_ready = True
+        return conn
+
+    def get(self, cache_key: str, max_age_seconds: Optional[float] = None) -> Optional[dict]:
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    'SELECT payload, computed_at FROM precomputed_analytics WHERE cache_key = ?', (cache_key,)
+                ).fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Analytics store read failed: {e}")
+            return None
+        if row is None:
+            return None
+        payload, computed_at = row
+        if max_age_seconds is not None and time.time() - computed_at > max_age_seconds:
+            return None
+        return json.loads(payload)
+
+    def has(self, cache_key: str, max_age_seconds: Optional[float] = None) -> bool:
+        return self.get(cache_key, max_age_seconds) is not None
+
+    def put(self, cache_key: str, discord_id: str, target_date: date, payload: dict):
+        try:
+            conn = self._connect()
+            try:
+                conn.execute(
+                    'INSERT OR REPLACE INTO precomputed_analytics (cache_key, discord_id, target_date, payload, computed_at) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (cache_key, str(discord_id), target_date.isoformat(), json.dumps(payload, default=str), time.time())
+                )
+                # Only the last few days are ever requested
+                conn.execute(
+                    'DELETE FROM precomputed_analytics WHERE discord_id = ? AND target_date < ?',
+                    (str(discord_id), (target_date - timedelta(days=7)).isoformat())
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Analytics store write failed: {e}")
+
+    def invalidate_user(self, discord_id: str):
+        """Drop a user's stored results (e.g. after their report URLs change)"""
+        conn = self._connect()
+        try:
+            conn.execute('DELETE FROM precomputed_analytics WHERE discord_id = ?', (str(discord_id),))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def clear(self):
+        conn = self._connect()
+        try:
+            conn.execute('DELETE FROM precomputed_analytics')
+            conn.commit()
+        finally:
+            conn.close()
+
+
+class AnalyticsPrecomputeScheduler:
+    """Polls users and precomputes yesterday's analytics once each user's local day rolls over.
+
+    ``list_users()`` yields ``(discord_id, user_timezone)`` pairs. ``compute(discord_id,
+    target_date)`` returns the finished JSON payload, or None when the user has nothing
+    to precompute (no reports configured, SP-API analytics, ...). ``cache_key(discord_id,
+    target_date)`` must match the key the endpoint reads.
+    """
+
+    def __init__(self, list_users: Callable[[], Iterable[Tuple[str, Optional[str]]]],
+                 compute: Callable[[str, date], Optional[dict]],
+                 cache_key: Callable[[str, date], str],
+                 store: AnalyticsResultStore,
+                 max_workers: int = ANALYTICS_PRECOMPUTE_WORKERS,
+                 poll_seconds: int = ANALYTICS_PRECOMPUTE_POLL_SECONDS,
+                 delay_minutes: int = ANALYTICS_PRECOMPUTE_DELAY_MINUTES,
+                 retry_minutes: int = ANALYTICS_PRECOMPUTE_RETRY_MINUTES,
+                 max_age_seconds: Optional[float] = None):
+        self.list_users = list_users
+        self.compute = compute
+        self.cache_key = cache_key
+        self.store = store
+        self.max_workers = max(1, max_workers)
+        self.poll_seconds = poll_seconds
+        self.delay_minutes = delay_minutes
+        self.retry_minutes = retry_minutes
+        self.max_age_seconds = max_age_seconds
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        # discord_id -> {'target_date', 'in_flight', 'next_attempt', 'last_error', 'duration_seconds'}
+        self._state: Dict[str, dict] = {}
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='analytics-precompute')
+        self._thread = threading.Thread(target=self._run, name='analytics-precompute-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self):
+        # First poll after one interval so the app finishes starting up
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Analytics precompute poll failed: {e}")
+
+    def _is_due(self, discord_id: str, target_date: date, local_now: datetime) -> bool:
+        midnight_offset = local_now.hour * 60 + local_now.minute
+        if midnight_offset < self.delay_minutes:
+            return False
+        state = self._state.get(discord_id)
+        if state:
+            if state.get('in_flight') or state.get('target_date') == target_date:
+                return False
+            if state.get('next_attempt') and time.time() < state['next_attempt']:
+                return False
+        return True
+
+    def run_once(self) -> int:
+        """Queue every user whose previous local day has not been computed yet; returns jobs queued"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='analytics-precompute')
+
+        queued = 0
+        for discord_id, user_timezone in self.list_users():
+            if not discord_id:
+                continue
+            discord_id = str(discord_id)
+            local_now = user_local_now(user_timezone)
+            target_date = local_now.date() - timedelta(days=1)
+
+            with self._lock:
+                if not self._is_due(discord_id, target_date, local_now):
+                    continue
+                # Another worker process (or the endpoint) may already have stored it
+                if self.store.has(self.cache_key(discord_id, target_date), self.max_age_seconds):
+                    self._state[discord_id] = {
+                        'target_date': target_date, 'in_flight': False, 'next_attempt': None,
+                        'last_error': None, 'duration_seconds': None
+                    }
+                    continue
+                previous = self._state.get(discord_id, {})
+                self._state[discord_id] = {**previous, 'in_flight': True}
+
+            self._executor.submit(self._compute_user, discord_id, target_date)
+            queued += 1
+        return queued
+
+    def _compute_user(self, discord_id: str, target_date: date):
+        started = time.monotonic()
+        try:
+            payload = self.compute(discord_id, target_date)
+            if payload is not None:
+                self.store.put(self.cache_key(discord_id, target_date), discord_id, target_date, payload)
+            with self._lock:
+                self._state[discord_id] = {
+                    'target_date': target_date, 'in_flight': False, 'next_attempt': None,
+                    'last_error': None, 'duration_seconds': round(time.monotonic() - started, 2)
+                }
+        except Exception as e:
+            print(f"Analytics precompute failed for {discord_id} ({target_date}): {e}")
+            with self._lock:
+                previous = self._state.get(discord_id, {})
+                self._state[discord_id] = {
+                    'target_date': previous.get('target_date'), 'in_flight': False,
+                    'next_attempt': time.time() + self.retry_minutes * 60,
+                    'last_error': str(e), 'duration_seconds': round(time.monotonic() - started, 2)
+                }
+
+    def status(self) -> dict:
+        with self._lock:
+            users = {
+                discord_id: {
+                    'target_date': state['target_date'].isoformat() if state.get('target_date') else None,
+                    'in_flight': state.get('in_flight', False),
+                    'last_error': state.get('last_error'),
+                    'duration_seconds': state.get('duration_seconds'),
+                }
+                for discord_id, state in self._state.items()
+            }
+        return {
+            'running': bool(self._thread and self._thread.is_alive()),
+            'max_workers': self.max_workers,
+            'poll_seconds': self.poll_seconds,
+            'users': users,
+        }
+
+
+# Durable results read by the analytics endpoint
+analytics_result_store = AnalyticsResultStore()
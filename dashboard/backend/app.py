@@ -31,6 +31,19 @@ from email_monitor import EmailMonitor, CHECK_INTERVAL
 from email_monitor_s3_general import EmailMonitorS3
 from ai_analytics import AIAnalytics
 from email_monitoring_s3 import email_monitoring_manager
+from sheet_snapshots import load_worksheet_values
+from cache_layer import CACHE_MISS, cache_stats, get_cache
+from analytics_precompute import ANALYTICS_PRECOMPUTE_ENABLED, AnalyticsPrecomputeScheduler, analytics_result_store
+from analytics_payload import AnalyticsProjection, compact_analysis, to_json
+from gmail_batch import DEFAULT_METADATA_HEADERS, MESSAGE_BODY_FIELDS, MESSAGE_METADATA_FIELDS, GmailFetcher
+from gmail_sync import GmailMailboxSync, config_fingerprint, gmail_sync_store, header_values, message_received_at
+from imap_sync import ImapMailboxSync, connect as connect_imap
+from worker_coordination import AMAZON_REQUEST_LOCK_PATH, RequestSpacer, email_check_lock, service_leader
+from db_access import Database
+from user_directory import UserDirectory
+from user_store import UserRecordConflict, create_user_store
+from write_behind import FieldWriteBehind
+from restock_scoring import restock_record
 
 def sanitize_for_json(obj):
     """
@@ -93,55 +106,42 @@ except Exception as e:
 # Demo mode flag - set to True to use dummy data for demos
 DEMO_MODE = os.getenv('DEMO_MODE', 'false').lower() == 'true'
 
-# Simple in-memory cache for analytics data (expires after 24 hours for daily use)
-analytics_cache = {}
+# Caches below live on the backend selected by CACHE_BACKEND (see cache_layer):
+# per-process memory by default, or a SQLite file shared by all worker processes
+
+# Cache for analytics data (expires after 24 hours for daily use)
 CACHE_EXPIRY_HOURS = 24
+analytics_cache = get_cache('analytics', ttl_seconds=CACHE_EXPIRY_HOURS * 3600, max_entries=int(os.getenv('ANALYTICS_CACHE_MAX_ENTRIES', '1000')))
 
-# In-memory cache for S3 config data to reduce repeated reads
-config_cache = {}
+# Cache for S3 config data to reduce repeated reads
 CONFIG_CACHE_EXPIRY_MINUTES = 30  # Cache configs for 30 minutes
+config_cache = get_cache('config', ttl_seconds=CONFIG_CACHE_EXPIRY_MINUTES * 60, max_entries=256)
 
 # Session-based user config cache to reduce S3 fetches during user sessions
-user_session_cache = {}
 USER_SESSION_CACHE_EXPIRY_MINUTES = 15  # Cache user config for 15 minutes per session
+user_session_cache = get_cache('user_session', ttl_seconds=USER_SESSION_CACHE_EXPIRY_MINUTES * 60, max_entries=5000)
 
 # Cache for file listings to reduce S3 list operations
-file_listing_cache = {}
 FILE_LISTING_CACHE_EXPIRY_MINUTES = 15  # Cache file listings for 15 minutes
+file_listing_cache = get_cache('file_listing', ttl_seconds=FILE_LISTING_CACHE_EXPIRY_MINUTES * 60, max_entries=1000)
 
-def get_cached_user_config(user_id):
-    """Get user config from session cache if available"""
-    if not user_id:
-        return None
-    
-    cache_key = f"user_{user_id}"
-    if cache_key in user_session_cache:
-        cached_data, cached_time = user_session_cache[cache_key]
-        if (datetime.now() - cached_time).total_seconds() < USER_SESSION_CACHE_EXPIRY_MINUTES * 60:
-            return cached_data
-    return None
-
-def cache_user_config(user_id, user_data):
-    """Cache user config in session cache"""
-    if user_id and user_data:
-        cache_key = f"user_{user_id}"
-        user_session_cache[cache_key] = (user_data, datetime.now())
+# Resolved feature access per user; cleared whenever launches, grants, groups or users change
+FEATURE_ACCESS_CACHE_EXPIRY_MINUTES = 10
+feature_access_cache = get_cache('feature_access', ttl_seconds=FEATURE_ACCESS_CACHE_EXPIRY_MINUTES * 60, max_entries=5000)
 
 def invalidate_user_cache(user_id):
     """Invalidate cached user config when user data changes"""
     if user_id:
         cache_key = f"user_{user_id}"
-        if cache_key in user_session_cache:
-            del user_session_cache[cache_key]
+        user_session_cache.delete(cache_key)
 
 def get_cached_s3_list(bucket, prefix=""):
     """Get S3 object list with caching to reduce list_objects calls"""
     cache_key = f"s3_list_{bucket}_{prefix}"
     
-    if cache_key in file_listing_cache:
-        cached_data, cached_time = file_listing_cache[cache_key]
-        if (datetime.now() - cached_time).total_seconds() < FILE_LISTING_CACHE_EXPIRY_MINUTES * 60:
-            return cached_data
+    cached_data = file_listing_cache.get(cache_key)
+    if cached_data is not CACHE_MISS:
+        return cached_data
     
     try:
         s3_client = get_s3_client()
@@ -151,7 +151,7 @@ def get_cached_s3_list(bucket, prefix=""):
             response = s3_client.list_objects_v2(Bucket=bucket)
         
         objects = response.get('Contents', [])
-        file_listing_cache[cache_key] = (objects, datetime.now())
+        file_listing_cache.set(cache_key, objects)
         return objects
     except Exception as e:
         return []
@@ -159,8 +159,7 @@ def get_cached_s3_list(bucket, prefix=""):
 def invalidate_file_listing_cache(bucket, prefix=""):
     """Invalidate file listing cache when files are added/removed"""
     cache_key = f"s3_list_{bucket}_{prefix}"
-    if cache_key in file_listing_cache:
-        del file_listing_cache[cache_key]
+    file_listing_cache.delete(cache_key)
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -209,8 +208,7 @@ def stop_email_monitoring():
 # Register cleanup function
 atexit.register(stop_email_monitoring)
 
-# Start email monitoring when app starts
-start_email_monitoring()
+# Email monitoring is started by start_background_services() at the end of this module
 
 # Configure session for cookies to work properly with cross-domain
 app.config['SESSION_COOKIE_SECURE'] = True  # Required for HTTPS cross-domain
@@ -234,12 +232,9 @@ if os.environ.get('FRONTEND_URL'):
 if os.environ.get('RAILWAY_STATIC_URL'):
     allowed_origins.append(f"https://{os.environ.get('RAILWAY_STATIC_URL')}")
 
-# Database setup
+# Database setup: one connection per thread, schema created once at startup (init_feature_flags)
 DATABASE_FILE = 'app_data.db'
-conn = sqlite3.connect(DATABASE_FILE, check_same_thread=False)
-conn.execute('PRAGMA journal_mode=WAL')
-conn.execute('PRAGMA synchronous=NORMAL')
-cursor = conn.cursor()
+app_db = Database(DATABASE_FILE)
 
 try:
     CORS(app, supports_credentials=True, origins=allowed_origins)
@@ -292,6 +287,7 @@ AMAZON_SELLER_REDIRECT_URI = os.getenv('AMAZON_SELLER_REDIRECT_URI', default_ama
 # Discount Monitoring Configuration (Admin Only)
 DISCOUNT_MONITOR_EMAIL = os.getenv('DISCOUNT_MONITOR_EMAIL')  # Admin email for discount monitoring
 DISCOUNT_SENDER_EMAIL = 'alert@distill.io'  # Only monitor emails from this sender
+DISCOUNT_SUBJECT_KEYWORDS = ('discount', 'clearance', 'sale', 'alert')  # IMAP pre-filter without a sender
 DISCOUNT_EMAIL_DAYS_BACK = int(os.getenv('DISCOUNT_EMAIL_DAYS_BACK', '7'))  # How many days back to check emails (default: 7)
 
 # Encryption key for sensitive data (SP-API tokens)
@@ -330,13 +326,10 @@ def get_config_user_for_subuser(user_record):
 def update_user_last_activity(discord_id):
     """Update user's last activity timestamp consistently"""
     try:
-        users = get_users_config()
-        for user in users:
-            if get_user_field(user, 'identity.discord_id') == discord_id:
-                # Always update in profile.last_activity for consistency
-                set_user_field(user, 'profile.last_activity', datetime.now().isoformat())
-                break
-        update_users_config(users)
+        user = get_user_record(discord_id)
+        if user:
+            # Always update in profile.last_activity for consistency
+            queue_user_field_updates(user, {'profile.last_activity': datetime.now().isoformat()})
     except Exception as e:
         print(f"[ERROR] Failed to update last activity: {e}")
 
@@ -729,9 +722,7 @@ def migrate_all_users_to_new_schema():
         )
         
         # Clear cache to force reload
-        cache_key = f"config_{USERS_CONFIG_KEY}"
-        if cache_key in config_cache:
-            del config_cache[cache_key]
+        invalidate_users_config_cache()
         
         # Clear user session caches
         user_session_cache.clear()
@@ -1491,131 +1482,126 @@ def get_cache_key(discord_id, target_date, endpoint_type='analytics'):
     """Generate cache key for user data"""
     return f"{endpoint_type}_{discord_id}_{target_date.strftime('%Y-%m-%d')}"
 
-def is_cache_valid(cache_entry):
-    """Check if cache entry is still valid"""
-    if not cache_entry:
-        return False
-    
-    cached_time = cache_entry.get('timestamp')
-    if not cached_time:
-        return False
-    
-    # Check if cache is older than CACHE_EXPIRY_HOURS
-    cache_age = datetime.utcnow() - cached_time
-    return cache_age.total_seconds() < (CACHE_EXPIRY_HOURS * 3600)
-
 def get_cached_data(cache_key):
     """Get cached data if valid, otherwise return None"""
-    cache_entry = analytics_cache.get(cache_key)
-    if is_cache_valid(cache_entry):
-        return cache_entry.get('data')
-    return None
+    return analytics_cache.get(cache_key, None)
 
 def set_cached_data(cache_key, data):
-    """Store data in cache with timestamp"""
-    analytics_cache[cache_key] = {
-        'data': data,
-        'timestamp': datetime.utcnow()
-    }
-    
-    # Clean old cache entries (simple cleanup)
-    current_time = datetime.utcnow()
-    keys_to_remove = []
-    for key, entry in analytics_cache.items():
-        if not is_cache_valid(entry):
-            keys_to_remove.append(key)
-    
-    for key in keys_to_remove:
-        del analytics_cache[key]
-
-def get_users_config():
-    if DEMO_MODE:
-        return get_dummy_users()
-    
-    # Check cache first to reduce S3 reads
-    cache_key = f"config_{USERS_CONFIG_KEY}"
-    if cache_key in config_cache:
-        cached_data, cached_time = config_cache[cache_key]
-        if (datetime.now() - cached_time).total_seconds() < CONFIG_CACHE_EXPIRY_MINUTES * 60:
-            return cached_data
-    
-    s3_client = get_s3_client()
+    """Store data in the analytics cache (expiry and size bound are handled by the cache)"""
+    analytics_cache.set(cache_key, data)
+
+# Profile fields the cached and precomputed analytics are computed from
+ANALYTICS_PROFILE_FIELDS = (
+    'integrations.sellerboard.orders_url',
+    'integrations.sellerboard.stock_url',
+    'integrations.sellerboard.cogs_url',
+    'profile.timezone',
+)
+
+def analytics_profile_inputs(user_record):
+    return tuple(get_user_field(user_record, field) for field in ANALYTICS_PROFILE_FIELDS)
+
+def invalidate_user_analytics(discord_id):
+    """Drop a user's cached and precomputed analytics (both outlive restarts)"""
+    for endpoint_type in ('analytics', 'enhanced_analytics', 'missing_listings'):
+        analytics_cache.delete_prefix(f"{endpoint_type}_{discord_id}_")
     try:
-        response = s3_client.get_object(Bucket=CONFIG_S3_BUCKET, Key=USERS_CONFIG_KEY)
-        config_data = json.loads(response['Body'].read().decode('utf-8'))
-        users = config_data.get("users", [])
+        analytics_result_store.invalidate_user(discord_id)
+    except sqlite3.Error as e:
+        print(f"Analytics store invalidation failed for {discord_id}: {e}")
+
+# Process-local index over the loaded users list, rebuilt once per config load
+USERS_CONFIG_VERSION_KEY = f"config_{USERS_CONFIG_KEY}_version"
+USERS_STORE_STATE_KEY = f"config_{USERS_CONFIG_KEY}_store_state"
+_user_directory = None
+_user_directory_lock = threading.Lock()
+
+# users.json (single_file) or one S3 object per user (per_user), see USERS_STORAGE_MODE
+users_store = create_user_store(get_s3_client, CONFIG_S3_BUCKET, USERS_CONFIG_KEY)
+
+def prepare_user_record(user):
+    """Normalize a stored user to the new schema and validate its Google tokens"""
+    normalized_user = normalize_user(user)
+    
+    # Validate and fix token data in new schema location
+    google_tokens = get_user_field(normalized_user, 'integrations.google.tokens')
+    if google_tokens:
+        fixed_tokens = validate_and_fix_token_data(google_tokens)
+        set_user_field(normalized_user, 'integrations.google.tokens', fixed_tokens)
+    
+    return normalized_user
+
+def set_user_directory(users):
+    """Cache a freshly loaded or saved users list and index it for this process"""
+    global _user_directory
+    version = uuid.uuid4().hex
+    config_cache.set(f"config_{USERS_CONFIG_KEY}", users)
+    config_cache.set(USERS_STORE_STATE_KEY, users_store.snapshot_state())
+    config_cache.set(USERS_CONFIG_VERSION_KEY, version)
+    _user_directory = UserDirectory(users, version)
+    return _user_directory
+
+def invalidate_users_config_cache():
+    """Force the next lookup to reload users.json"""
+    global _user_directory
+    config_cache.delete(f"config_{USERS_CONFIG_KEY}")
+    config_cache.delete(USERS_CONFIG_VERSION_KEY)
+    config_cache.delete(USERS_STORE_STATE_KEY)
+    _user_directory = None
+
+def get_user_directory():
+    """Indexed users config; rebuilt only when the cached config changes (or another process saves it)"""
+    global _user_directory
+    if DEMO_MODE:
+        return UserDirectory(get_dummy_users())
+    
+    version = config_cache.get(USERS_CONFIG_VERSION_KEY)
+    directory = _user_directory
+    if directory is not None and version is not CACHE_MISS and directory.version == version:
+        return directory
+    
+    with _user_directory_lock:
+        # Check cache first to reduce S3 reads
+        version = config_cache.get(USERS_CONFIG_VERSION_KEY)
+        if _user_directory is not None and version is not CACHE_MISS and _user_directory.version == version:
+            return _user_directory
+        cached_users = config_cache.get(f"config_{USERS_CONFIG_KEY}")
+        if cached_users is not CACHE_MISS and version is not CACHE_MISS \
+                and users_store.restore_state(config_cache.get(USERS_STORE_STATE_KEY, None)):
+            _user_directory = UserDirectory(cached_users, version)
+            return _user_directory
         
-        # Normalize all users to new schema and validate tokens
-        normalized_users = []
-        for user in users:
-            normalized_user = normalize_user(user)
+        try:
+            users = users_store.load()
             
-            # Validate and fix token data in new schema location
-            google_tokens = get_user_field(normalized_user, 'integrations.google.tokens')
-            if google_tokens:
-                fixed_tokens = validate_and_fix_token_data(google_tokens)
-                set_user_field(normalized_user, 'integrations.google.tokens', fixed_tokens)
+            # Normalize all users to new schema and validate tokens
+            normalized_users = [prepare_user_record(user) for user in users]
             
-            normalized_users.append(normalized_user)
-        
-        # Cache the result to reduce future S3 reads
-        config_cache[cache_key] = (normalized_users, datetime.now())
-        return normalized_users
-    except Exception as e:
-        pass  # Error fetching users config
-        return []
+            # Cache the result to reduce future S3 reads
+            return set_user_directory(normalized_users)
+        except Exception as e:
+            pass  # Error fetching users config
+            return UserDirectory([])
+
+def get_users_config():
+    return get_user_directory().users
 
 def get_user_config(user_id):
-    """Get config for a specific user with session-based caching"""
-    if DEMO_MODE:
-        users = get_dummy_users()
-        return next((u for u in users if u.get("id") == user_id), None)
-    
-    # Check session cache first
-    cached_user = get_cached_user_config(user_id)
-    if cached_user:
-        return cached_user
-    
-    # Fallback to loading all users and finding the specific one
-    users = get_users_config()
-    user = next((u for u in users if u.get("id") == user_id), None)
-    
-    # Cache the user data for future requests in this session
-    if user:
-        cache_user_config(user_id, user)
-    
-    return user
+    """Get config for a specific user by internal id"""
+    return get_user_directory().by_id(user_id)
 
 def update_users_config(users):
-    s3_client = get_s3_client()
-    
     # Ensure all users are in new schema format
-    normalized_users = []
-    for user in users:
-        normalized_users.append(normalize_user(user))
-    
-    # Save in new organized format with version info
-    config_data = {
-        "version": "2.0",
-        "last_updated": datetime.utcnow().isoformat(),
-        "users": normalized_users
-    }
-    
-    # About to save users to S3
+    normalized_users = [normalize_user(user) for user in users]
     
     try:
-        result = s3_client.put_object(
-            Bucket=CONFIG_S3_BUCKET, 
-            Key=USERS_CONFIG_KEY, 
-            Body=json.dumps(config_data, indent=2),
-            ContentType='application/json'
-        )
-        # Users configuration updated successfully
+        # Single-file mode rewrites users.json; per-user mode PUTs only the changed records
+        users_store.save_all(normalized_users)
         
-        # Invalidate global cache after successful update to ensure consistency
-        cache_key = f"config_{USERS_CONFIG_KEY}"
-        if cache_key in config_cache:
-            del config_cache[cache_key]
+        # Re-index the saved users; other processes see the new version and reload
+        set_user_directory(normalized_users)
+        # User types, parents and feature permissions feed resolved feature access
+        invalidate_feature_access_cache()
         
         # Invalidate user session caches for all affected users
         for user in normalized_users:
@@ -1631,20 +1617,92 @@ def update_users_config(users):
         pass  # Update completed successfully
         
         return True
+    except UserRecordConflict as e:
+        # Someone else saved these users first: reload instead of overwriting their changes
+        print(f"[USERS] {e}; reloading users config")
+        invalidate_users_config_cache()
+        return False
     except Exception as e:
         pass  # Error updating users config
         import traceback
         traceback.print_exc()
         return False
 
+def save_user_record(user_record):
+    """Persist changes to one user (a single conditional PUT in per-user storage mode)"""
+    directory = get_user_directory()
+    users = directory.users
+    position = directory.index_of(get_user_field(user_record, 'identity.discord_id'))
+    if position is None:
+        users.append(user_record)
+    else:
+        users[position] = user_record
+    
+    try:
+        users_store.save_record(user_record, users)
+    except UserRecordConflict as e:
+        print(f"[USERS] {e}; reloading users config")
+        invalidate_users_config_cache()
+        return False
+    except Exception as e:
+        print(f"[USERS] Failed to save user record: {e}")
+        return False
+    
+    set_user_directory(users)
+    invalidate_user_cache(get_user_field(user_record, 'id'))
+    invalidate_user_cache(get_user_field(user_record, 'identity.discord_id'))
+    return True
+
+def apply_user_field_updates(batch):
+    """Flush buffered field updates ({discord_id: {field_path: value}}) in one users save"""
+    if DEMO_MODE:
+        return
+    for attempt in range(2):
+        directory = get_user_directory()
+        users = directory.users
+        touched = []
+        for discord_id, fields in batch.items():
+            user = directory.by_discord_id(discord_id)
+            if not user:
+                continue
+            # Only the buffered fields are set, so edits made to other fields since are kept
+            for field_path, value in fields.items():
+                set_user_field(user, field_path, value)
+            touched.append(user)
+        if not touched:
+            return
+        
+        try:
+            users_store.save_all(users)
+        except UserRecordConflict as e:
+            # Reload the records that changed underneath us and re-apply the dirty fields
+            print(f"[USERS] {e}; reloading users config before retrying buffered updates")
+            invalidate_users_config_cache()
+            continue
+        
+        set_user_directory(users)
+        for user in touched:
+            invalidate_user_cache(get_user_field(user, 'id'))
+            invalidate_user_cache(get_user_field(user, 'identity.discord_id'))
+        return
+    raise UserRecordConflict(list(batch))
+
+# Last-activity, Discord profile and token refresh writes are batched off the request path
+user_field_writes = FieldWriteBehind(apply_user_field_updates, name='user-write-behind')
+
+def queue_user_field_updates(user_record, fields):
+    """Set fields on a user record now and persist them with the next write-behind flush"""
+    for field_path, value in fields.items():
+        set_user_field(user_record, field_path, value)
+    user_field_writes.record(get_user_field(user_record, 'identity.discord_id'), fields)
+
 def get_invitations_config():
     """Get invitations configuration from S3 with caching"""
     # Check cache first to reduce S3 reads
     cache_key = f"config_{INVITATIONS_CONFIG_KEY}"
-    if cache_key in config_cache:
-        cached_data, cached_time = config_cache[cache_key]
-        if (datetime.now() - cached_time).total_seconds() < CONFIG_CACHE_EXPIRY_MINUTES * 60:
-            return cached_data
+    cached_data = config_cache.get(cache_key)
+    if cached_data is not CACHE_MISS:
+        return cached_data
     
     try:
         s3_client = get_s3_client()
@@ -1652,11 +1710,11 @@ def get_invitations_config():
         data = json.loads(response['Body'].read().decode('utf-8'))
         
         # Cache the result
-        config_cache[cache_key] = (data, datetime.now())
+        config_cache.set(cache_key, data)
         return data
     except s3_client.exceptions.NoSuchKey:
         # Cache empty result too
-        config_cache[cache_key] = ([], datetime.now())
+        config_cache.set(cache_key, [])
         return []
     except Exception as e:
         pass  # Error reading invitations config
@@ -1675,8 +1733,7 @@ def update_invitations_config(invitations):
         
         # Invalidate cache after successful update
         cache_key = f"config_{INVITATIONS_CONFIG_KEY}"
-        if cache_key in config_cache:
-            del config_cache[cache_key]
+        config_cache.delete(cache_key)
         
         return True
     except Exception as e:
@@ -1687,10 +1744,9 @@ def get_discount_monitoring_config():
     """Get discount monitoring configuration from S3 with caching"""
     # Check cache first to reduce S3 reads
     cache_key = f"config_{DISCOUNT_MONITORING_CONFIG_KEY}"
-    if cache_key in config_cache:
-        cached_data, cached_time = config_cache[cache_key]
-        if (datetime.now() - cached_time).total_seconds() < CONFIG_CACHE_EXPIRY_MINUTES * 60:
-            return cached_data
+    cached_data = config_cache.get(cache_key)
+    if cached_data is not CACHE_MISS:
+        return cached_data
     
     s3_client = get_s3_client()
     try:
@@ -1698,7 +1754,7 @@ def get_discount_monitoring_config():
         config_data = json.loads(response['Body'].read().decode('utf-8'))
         
         # Cache the result
-        config_cache[cache_key] = (config_data, datetime.now())
+        config_cache.set(cache_key, config_data)
         return config_data
     except Exception as e:
         # Return default config if not found and cache it
@@ -1707,7 +1763,7 @@ def get_discount_monitoring_config():
             'enabled': bool(DISCOUNT_MONITOR_EMAIL),
             'last_updated': None
         }
-        config_cache[cache_key] = (default_config, datetime.now())
+        config_cache.set(cache_key, default_config)
         return default_config
 
 def update_discount_monitoring_config(config):
@@ -1729,8 +1785,7 @@ def update_discount_monitoring_config(config):
         
         # Invalidate cache after successful update
         cache_key = f"config_{DISCOUNT_MONITORING_CONFIG_KEY}"
-        if cache_key in config_cache:
-            del config_cache[cache_key]
+        config_cache.delete(cache_key)
             
         return True
     except Exception as e:
@@ -1756,10 +1811,9 @@ def get_purchases_config():
     
     # Check cache first to reduce S3 reads
     cache_key = f"config_{PURCHASES_CONFIG_KEY}"
-    if cache_key in config_cache:
-        cached_data, cached_time = config_cache[cache_key]
-        if (datetime.now() - cached_time).total_seconds() < CONFIG_CACHE_EXPIRY_MINUTES * 60:
-            return cached_data
+    cached_data = config_cache.get(cache_key)
+    if cached_data is not CACHE_MISS:
+        return cached_data
     
     s3_client = get_s3_client()
     try:
@@ -1768,16 +1822,16 @@ def get_purchases_config():
         purchases = data.get('purchases', [])
         
         # Cache the result
-        config_cache[cache_key] = (purchases, datetime.now())
+        config_cache.set(cache_key, purchases)
         return purchases
     except s3_client.exceptions.NoSuchKey:
         # Cache empty result too
-        config_cache[cache_key] = ([], datetime.now())
+        config_cache.set(cache_key, [])
         return []
     except Exception as e:
         print(f"Error fetching purchases config: {e}")
         # Cache empty result for error cases to reduce repeated failed requests
-        config_cache[cache_key] = ([], datetime.now())
+        config_cache.set(cache_key, [])
         return []
 
 def update_purchases_config(purchases):
@@ -1797,8 +1851,7 @@ def update_purchases_config(purchases):
         
         # Invalidate cache after successful update
         cache_key = f"config_{PURCHASES_CONFIG_KEY}"
-        if cache_key in config_cache:
-            del config_cache[cache_key]
+        config_cache.delete(cache_key)
             
         return True
     except Exception as e:
@@ -2061,10 +2114,9 @@ def get_feature_config():
     """Get feature launches configuration from S3 with caching"""
     # Check cache first to reduce S3 reads
     cache_key = "config_feature_config.json"
-    if cache_key in config_cache:
-        cached_data, cached_time = config_cache[cache_key]
-        if (datetime.now() - cached_time).total_seconds() < CONFIG_CACHE_EXPIRY_MINUTES * 60:
-            return cached_data
+    cached_data = config_cache.get(cache_key)
+    if cached_data is not CACHE_MISS:
+        return cached_data
     
     s3_client = get_s3_client()
     try:
@@ -2073,12 +2125,12 @@ def get_feature_config():
         result = (config_data.get('feature_launches', {}), config_data.get('user_permissions', {}))
         
         # Cache the result
-        config_cache[cache_key] = (result, datetime.now())
+        config_cache.set(cache_key, result)
         return result
     except Exception as e:
         # Cache empty result for error cases
         result = ({}, {})
-        config_cache[cache_key] = (result, datetime.now())
+        config_cache.set(cache_key, result)
         return result
 
 def save_feature_config(feature_launches, user_permissions):
@@ -2099,8 +2151,8 @@ def save_feature_config(feature_launches, user_permissions):
         
         # Invalidate cache after successful update
         cache_key = "config_feature_config.json"
-        if cache_key in config_cache:
-            del config_cache[cache_key]
+        config_cache.delete(cache_key)
+        invalidate_feature_access_cache()
             
         return True
     except Exception as e:
@@ -2124,73 +2176,49 @@ def sync_s3_to_database():
     """Sync feature configuration from S3 to database on startup"""
     try:
         feature_launches, user_permissions = get_feature_config()
-        
-        # Sync feature launches
-        for feature_key, launch_data in feature_launches.items():
-            cursor.execute('''
-                INSERT OR REPLACE INTO feature_launches 
-                (feature_key, is_public, launched_by, launched_at, launch_notes)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                feature_key,
-                launch_data.get('is_public', False),
-                launch_data.get('launched_by', ''),
-                launch_data.get('launched_at', datetime.utcnow().isoformat()),
-                launch_data.get('launch_notes', '')
-            ))
-        
-        # Sync user permissions from S3 users.json
         users = get_users_config()
-        for user in users:
-            discord_id = get_user_field(user, 'identity.discord_id')
-            user_feature_perms = get_user_field(user, 'account.feature_permissions') or user.get('feature_permissions', {})
-            
-            for feature_key, perm_data in user_feature_perms.items():
-                if perm_data.get('has_access', False):
-                    cursor.execute('''
-                        INSERT OR REPLACE INTO user_feature_access (discord_id, feature_key, has_access, granted_by)
-                        VALUES (?, ?, ?, ?)
-                    ''', (
-                        discord_id,
-                        feature_key,
-                        True,
-                        perm_data.get('granted_by', '')
-                    ))
-        
-        conn.commit()
+        
+        with app_db.transaction() as db:
+            # Sync feature launches
+            for feature_key, launch_data in feature_launches.items():
+                db.execute('''
+                    INSERT OR REPLACE INTO feature_launches 
+                    (feature_key, is_public, launched_by, launched_at, launch_notes)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (
+                    feature_key,
+                    launch_data.get('is_public', False),
+                    launch_data.get('launched_by', ''),
+                    launch_data.get('launched_at', datetime.utcnow().isoformat()),
+                    launch_data.get('launch_notes', '')
+                ))
+            
+            # Sync user permissions from S3 users.json
+            for user in users:
+                discord_id = get_user_field(user, 'identity.discord_id')
+                user_feature_perms = get_user_field(user, 'account.feature_permissions') or user.get('feature_permissions', {})
+                
+                for feature_key, perm_data in user_feature_perms.items():
+                    if perm_data.get('has_access', False):
+                        db.execute('''
+                            INSERT OR REPLACE INTO user_feature_access (discord_id, feature_key, has_access, granted_by)
+                            VALUES (?, ?, ?, ?)
+                        ''', (
+                            discord_id,
+                            feature_key,
+                            True,
+                            perm_data.get('granted_by', '')
+                        ))
+        
+        invalidate_feature_access_cache()
         print("Successfully synced S3 feature config to database")
         
     except Exception as e:
         print(f"Error syncing S3 to database: {e}")
 
 def get_user_record(discord_id):
-    users = get_users_config()
-    # Handle both string and integer discord_ids for compatibility
-    discord_id_str = str(discord_id)
-    
-    try:
-        discord_id_int = int(discord_id)
-    except (ValueError, TypeError):
-        discord_id_int = None
-    
-    # Try to find user with either string or integer ID (works with both old and new schema)
-    user = None
-    for u in users:
-        user_discord_id = get_user_field(u, 'identity.discord_id') or u.get('discord_id')
-        if str(user_discord_id) == discord_id_str:
-            user = u
-            break
-        if discord_id_int is not None and user_discord_id == discord_id_int:
-            user = u
-            break
-    
-    # Normalize the user to new schema and ensure discord_id is string
-    if user:
-        user = normalize_user(user)
-        # Ensure discord_id is consistently a string
-        set_user_field(user, 'identity.discord_id', discord_id_str)
-    
-    return user
+    """Normalized user record for a Discord ID (str or int)"""
+    return get_user_directory().by_discord_id(discord_id)
 
 def validate_and_fix_token_data(tokens):
     """
@@ -2250,18 +2278,15 @@ def refresh_google_token(user_record):
     # Validate and fix token data to prevent NoneType arithmetic errors
     new_tokens = validate_and_fix_token_data(new_tokens)
 
-    google_tokens = get_user_field(user_record, 'integrations.google.tokens') or {}
+    google_tokens = dict(get_user_field(user_record, 'integrations.google.tokens') or {})
     google_tokens.update(new_tokens)
-    set_user_field(user_record, 'integrations.google.tokens', google_tokens)
     
-    # Update the users config with the refreshed tokens
-    users = get_users_config()
-    discord_id = get_user_field(user_record, 'identity.discord_id')
-    for i, user in enumerate(users):
-        if get_user_field(user, 'identity.discord_id') == discord_id:
-            users[i] = user_record
-            break
-    update_users_config(users)
+    # A new access token is cheap to obtain again, so it rides the next batched write
+    # (queued even when written through below, so an older buffered value cannot win)
+    queue_user_field_updates(user_record, {'integrations.google.tokens': google_tokens})
+    if new_tokens["refresh_token"] != refresh_token:
+        # A rotated refresh token must not be lost on a crash: write it through now
+        save_user_record(user_record)
     return new_tokens["access_token"]
 
 def safe_google_api_call(user_record, api_call_func):
@@ -2336,7 +2361,7 @@ def discord_callback():
     
     # Check if user is already registered or has a valid invitation
     users = get_users_config()
-    existing_user = next((u for u in users if get_user_field(u, 'identity.discord_id') == discord_id), None)
+    existing_user = get_user_record(discord_id)
     
     # Check for invitation token from state parameter (runs for both new and existing users)
     invitation_token = request.args.get('state')  # Discord passes our state parameter back
@@ -2400,7 +2425,7 @@ def discord_callback():
     try:
         users = get_users_config()
         discord_id = session['discord_id']
-        user_record = next((u for u in users if get_user_field(u, 'identity.discord_id') == discord_id), None)
+        user_record = get_user_record(discord_id)
         
         print(f"[USER_HANDLING] existing user_record: {bool(user_record)}")
         print(f"[USER_HANDLING] valid_invitation: {valid_invitation}")
@@ -3026,6 +3051,8 @@ def update_profile():
         }
         users.append(user_record)
     
+    analytics_inputs = analytics_profile_inputs(user_record)
+    
     # Check if user is a subuser - they can only update their timezone
     if get_user_field(user_record, 'account.user_type') == 'subuser':
         # Only allow timezone updates for subusers
@@ -3039,6 +3066,8 @@ def update_profile():
             set_user_field(user_record, 'identity.avatar', session['discord_avatar'])
         
         if update_users_config(users):
+            if analytics_profile_inputs(user_record) != analytics_inputs:
+                invalidate_user_analytics(discord_id)
             return jsonify({'message': 'Timezone updated successfully'})
         else:
             return jsonify({'error': 'Failed to update timezone'}), 500
@@ -3092,6 +3121,9 @@ def update_profile():
         set_user_field(user_record, 'profile.setup_step', 'completed')
     
     if update_users_config(users):
+        # Analytics computed from the old report URLs or timezone would otherwise be served for a day
+        if analytics_profile_inputs(user_record) != analytics_inputs:
+            invalidate_user_analytics(discord_id)
         return jsonify({'message': 'Profile updated successfully'})
     else:
         return jsonify({'error': 'Failed to update profile'}), 500
@@ -3137,7 +3169,7 @@ def complete_google_auth():
         
         discord_id = session['discord_id']
         users = get_users_config()
-        user_record = next((u for u in users if get_user_field(u, 'identity.discord_id') == discord_id), None)
+        user_record = get_user_record(discord_id)
         
         if user_record is None:
             # Create new user with proper schema
@@ -3172,7 +3204,7 @@ def disconnect_google():
     """Disconnect user's Google account"""
     discord_id = session['discord_id']
     users = get_users_config()
-    user_record = next((u for u in users if get_user_field(u, 'identity.discord_id') == discord_id), None)
+    user_record = get_user_record(discord_id)
     
     if not user_record:
         return jsonify({'error': 'User not found'}), 404
@@ -3412,7 +3444,7 @@ def configure_sheet():
         return jsonify({'error': 'Missing required fields'}), 400
     
     users = get_users_config()
-    user_record = next((u for u in users if get_user_field(u, 'identity.discord_id') == discord_id), None)
+    user_record = get_user_record(discord_id)
     
     if not user_record:
         return jsonify({'error': 'User profile not found'}), 404
@@ -3521,6 +3553,18 @@ def get_gmail_message(user_record, message_id):
         print(f"Error getting Gmail message: {e}")
         return None
 
+def get_gmail_messages(user_record, message_ids, message_format='full', fields=None,
+                       metadata_headers=DEFAULT_METADATA_HEADERS):
+    """Get many Gmail messages by ID through the batch endpoint (message id -> message)"""
+    try:
+        def api_call(access_token):
+            return GmailFetcher(access_token).get_messages(message_ids, message_format, metadata_headers, fields)
+        
+        return safe_google_api_call(user_record, api_call)
+    except Exception as e:
+        print(f"Error getting Gmail messages: {e}")
+        return {}
+
 def extract_email_content(message_data):
     """Extract subject, sender, date, and HTML content from Gmail message"""
     try:
@@ -3662,10 +3706,9 @@ def get_discount_email_config():
         
         # Check cache first
         cache_key = f"config_discount_email_config"
-        if cache_key in config_cache:
-            cached_data, cached_time = config_cache[cache_key]
-            if (datetime.now() - cached_time).total_seconds() < CONFIG_CACHE_EXPIRY_MINUTES * 60:
-                return cached_data
+        cached_data = config_cache.get(cache_key)
+        if cached_data is not CACHE_MISS:
+            return cached_data
         
         # Try to get discount email config from S3
         try:
@@ -3673,7 +3716,7 @@ def get_discount_email_config():
             config_data = json.loads(response['Body'].read().decode('utf-8'))
             
             # Add cache
-            config_cache[cache_key] = (config_data, datetime.now())
+            config_cache.set(cache_key, config_data)
             
             # Ensure required fields exist with defaults
             config_data.setdefault('subject_pattern', r'\[([^\]]+)\]\s*Alert:\s*[^\(]*\(ASIN:\s*([B0-9A-Z]{10})\)')
@@ -3714,7 +3757,7 @@ def save_discount_email_config(config_data):
         
         # Update cache
         cache_key = f"config_discount_email_config"
-        config_cache[cache_key] = (config_data, datetime.now())
+        config_cache.set(cache_key, config_data)
         
         return True
         
@@ -3738,10 +3781,9 @@ def get_admin_gmail_config():
         
         # Check cache first
         cache_key = f"config_admin_gmail_config"
-        if cache_key in config_cache:
-            cached_data, cached_time = config_cache[cache_key]
-            if (datetime.now() - cached_time).total_seconds() < CONFIG_CACHE_EXPIRY_MINUTES * 60:
-                return cached_data
+        cached_data = config_cache.get(cache_key)
+        if cached_data is not CACHE_MISS:
+            return cached_data
         
         # Try to get admin Gmail config from S3
         try:
@@ -3750,13 +3792,13 @@ def get_admin_gmail_config():
             config_data['is_s3_config'] = True
             
             # Cache the result
-            config_cache[cache_key] = (config_data, datetime.now())
+            config_cache.set(cache_key, config_data)
             return config_data
             
         except ClientError as e:
             if e.response['Error']['Code'] == 'NoSuchKey':
                 # Config doesn't exist yet
-                config_cache[cache_key] = (None, datetime.now())
+                config_cache.set(cache_key, None)
                 return None
             else:
                 print(f"Error accessing S3 admin Gmail config: {e}")
@@ -4290,6 +4332,61 @@ def debug_cogs_status():
         pass  # COGS error
         return jsonify({'error': str(e)}), 500
 
+def run_sellerboard_analytics(discord_id, user_record, config_user_record, target_date, user_timezone):
+    """Run the Sellerboard-based OrdersAnalysis for a user (config from the parent for subusers)"""
+    from orders_analysis import OrdersAnalysis
+    
+    orders_url = get_user_field(config_user_record, 'integrations.sellerboard.orders_url') if config_user_record else None
+    stock_url = get_user_field(config_user_record, 'integrations.sellerboard.stock_url') if config_user_record else None
+    cogs_url = get_user_sellerboard_cogs_url(config_user_record)
+    analyzer = OrdersAnalysis(orders_url=orders_url, stock_url=stock_url, cogs_url=cogs_url, discord_id=discord_id)
+    
+    # Prepare user settings for COGS data fetching
+    user_settings = {
+        'enable_source_links': get_user_field(user_record, 'settings.enable_source_links') or user_record.get('enable_source_links', False),
+        'search_all_worksheets': get_user_field(config_user_record, 'settings.search_all_worksheets') or config_user_record.get('search_all_worksheets', False),
+        'sheet_id': get_user_field(config_user_record, 'files.sheet_id'),
+        'worksheet_title': get_user_field(config_user_record, 'integrations.google.worksheet_title'),
+        'google_tokens': get_user_field(config_user_record, 'integrations.google.tokens') or {},
+        'column_mapping': get_user_column_mapping(user_record),
+        'amazon_lead_time_days': get_user_field(config_user_record, 'settings.amazon_lead_time_days') or config_user_record.get('amazon_lead_time_days', 90)
+    }
+    
+    return analyzer.analyze(target_date, user_timezone=user_timezone, user_settings=user_settings)
+
+def finalize_orders_analytics(analysis, target_date, user_timezone):
+    """Fill defaults, compact the analysis to the served schema and add report metadata"""
+    # Ensure all expected keys exist with default values
+    analysis.setdefault('today_sales', {})
+    analysis.setdefault('velocity', {})
+    analysis.setdefault('low_stock', {})
+    analysis.setdefault('restock_priority', {})
+    analysis.setdefault('stockout_30d', {})
+    # Enhanced analytics defaults
+    analysis.setdefault('enhanced_analytics', {})
+    analysis.setdefault('restock_alerts', {})
+    analysis.setdefault('critical_alerts', [])
+    analysis.setdefault('total_products_analyzed', 0)
+    analysis.setdefault('high_priority_count', 0)
+    
+    # One stock_info copy, an orders summary instead of order rows, JSON-safe values
+    analysis = compact_analysis(analysis)
+    
+    # Add metadata about the date being analyzed
+    analysis['report_date'] = target_date.isoformat()
+    
+    # Calculate is_yesterday using timezone-aware logic
+    analysis['is_yesterday'] = is_date_yesterday(target_date, user_timezone)
+    analysis['user_timezone'] = user_timezone
+    
+    return analysis
+
+def analytics_response(analysis, projection=None):
+    """Serve a compact analytics payload, projected to what the request asked for"""
+    if projection is not None:
+        analysis = projection.apply(analysis)
+    return app.response_class(to_json(analysis), mimetype='application/json')
+
 @app.route('/api/analytics/orders')
 @login_required
 def get_orders_analytics():
@@ -4324,15 +4421,27 @@ def get_orders_analytics():
             else:
                 target_date = now.date() - timedelta(days=1)
         
+        # Optional projection: fields=a,b.c  asins=X,Y  page=N&limit=M
+        try:
+            projection = AnalyticsProjection.from_args(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         # Check if demo mode is enabled
         if DEMO_MODE:
-            return jsonify(get_dummy_analytics_data(target_date))
+            return analytics_response(compact_analysis(get_dummy_analytics_data(target_date)), projection)
         
         # Check cache first
         cache_key = get_cache_key(discord_id, target_date)
         cached_data = get_cached_data(cache_key)
         if cached_data:
-            return jsonify(cached_data)
+            return analytics_response(cached_data, projection)
+        
+        # Then the durable store the background precompute writes to
+        stored_data = analytics_result_store.get(cache_key, CACHE_EXPIRY_HOURS * 3600)
+        if stored_data:
+            set_cached_data(cache_key, stored_data)
+            return analytics_response(stored_data, projection)
         
         # Process dashboard analytics request
         
@@ -4370,20 +4479,13 @@ def get_orders_analytics():
                         should_update = True
                 
                 if should_update:
-                    # Update last activity
-                    update_user_last_activity(discord_id)
-                    
-                    # Update Discord username and avatar if present
-                    if 'discord_username' in session or 'discord_avatar' in session:
-                        users = get_users_config()
-                        for user in users:
-                            if get_user_field(user, 'identity.discord_id') == discord_id:
-                                if 'discord_username' in session:
-                                    set_user_field(user, 'identity.discord_username', session['discord_username'])
-                                if 'discord_avatar' in session:
-                                    set_user_field(user, 'identity.avatar', session['discord_avatar'])
-                                break
-                        update_users_config(users)
+                    # Update last activity plus Discord username and avatar if present (batched write)
+                    activity_fields = {'profile.last_activity': datetime.now().isoformat()}
+                    if 'discord_username' in session:
+                        activity_fields['identity.discord_username'] = session['discord_username']
+                    if 'discord_avatar' in session:
+                        activity_fields['identity.avatar'] = session['discord_avatar']
+                    queue_user_field_updates(user_record, activity_fields)
             except Exception as e:
                 # Failed to update last activity - not critical
                 pass
@@ -4446,12 +4548,9 @@ def get_orders_analytics():
                 
                 # Fallback to Sellerboard data if SP-API fails for admin
                 try:
-                    from orders_analysis import OrdersAnalysis
-                    
                     # Get user's configured Sellerboard URLs
                     orders_url = get_user_field(config_user_record, 'integrations.sellerboard.orders_url') if config_user_record else None
                     stock_url = get_user_field(config_user_record, 'integrations.sellerboard.stock_url') if config_user_record else None
-                    cogs_url = get_user_sellerboard_cogs_url(config_user_record)
                     
                     if not orders_url or not stock_url:
                         return jsonify({
@@ -4460,20 +4559,7 @@ def get_orders_analytics():
                         }), 400
                     
                     # Use Sellerboard data with COGS file support
-                    analyzer = OrdersAnalysis(orders_url=orders_url, stock_url=stock_url, cogs_url=cogs_url, discord_id=discord_id)
-                    
-                    # Prepare user settings for COGS data fetching
-                    user_settings = {
-                        'enable_source_links': get_user_field(user_record, 'settings.enable_source_links') or user_record.get('enable_source_links', False),
-                        'search_all_worksheets': get_user_field(config_user_record, 'settings.search_all_worksheets') or config_user_record.get('search_all_worksheets', False),
-                        'sheet_id': get_user_field(config_user_record, 'files.sheet_id'),
-                        'worksheet_title': get_user_field(config_user_record, 'integrations.google.worksheet_title'),
-                        'google_tokens': get_user_field(config_user_record, 'integrations.google.tokens') or {},
-                        'column_mapping': get_user_column_mapping(user_record),
-                        'amazon_lead_time_days': get_user_field(config_user_record, 'settings.amazon_lead_time_days') or config_user_record.get('amazon_lead_time_days', 90)
-                    }
-                    
-                    analysis = analyzer.analyze(target_date, user_timezone=user_timezone, user_settings=user_settings)
+                    analysis = run_sellerboard_analytics(discord_id, user_record, config_user_record, target_date, user_timezone)
                     
                 except Exception as sellerboard_error:
                     pass  # Debug print removed
@@ -4486,12 +4572,9 @@ def get_orders_analytics():
             print(f"✅ SP-API DISABLED: Using Sellerboard analytics for admin user {discord_id}")
             # Admin user with SP-API disabled - use Sellerboard
             try:
-                from orders_analysis import OrdersAnalysis
-                
                 # Get user's configured Sellerboard URLs
                 orders_url = get_user_field(config_user_record, 'integrations.sellerboard.orders_url') if config_user_record else None
                 stock_url = get_user_field(config_user_record, 'integrations.sellerboard.stock_url') if config_user_record else None
-                cogs_url = get_user_sellerboard_cogs_url(config_user_record)
                 
                 if not orders_url or not stock_url:
                     return jsonify({
@@ -4503,20 +4586,7 @@ def get_orders_analytics():
                     }), 400
                 
                 pass  # Debug print removed
-                analyzer = OrdersAnalysis(orders_url=orders_url, stock_url=stock_url, cogs_url=cogs_url, discord_id=discord_id)
-                
-                # Prepare user settings for COGS data fetching
-                user_settings = {
-                    'enable_source_links': get_user_field(user_record, 'settings.enable_source_links') or user_record.get('enable_source_links', False),
-                    'search_all_worksheets': get_user_field(config_user_record, 'settings.search_all_worksheets') or config_user_record.get('search_all_worksheets', False),
-                    'sheet_id': get_user_field(config_user_record, 'files.sheet_id'),
-                    'worksheet_title': get_user_field(config_user_record, 'integrations.google.worksheet_title'),
-                    'google_tokens': get_user_field(config_user_record, 'integrations.google.tokens') or {},
-                    'column_mapping': get_user_column_mapping(user_record),
-                    'amazon_lead_time_days': get_user_field(config_user_record, 'settings.amazon_lead_time_days') or config_user_record.get('amazon_lead_time_days', 90)
-                }
-                
-                analysis = analyzer.analyze(target_date, user_timezone=user_timezone, user_settings=user_settings)
+                analysis = run_sellerboard_analytics(discord_id, user_record, config_user_record, target_date, user_timezone)
                 analysis['source'] = 'sellerboard'
                 analysis['message'] = 'Using Sellerboard data (SP-API disabled)'
                 
@@ -4544,12 +4614,9 @@ def get_orders_analytics():
             pass  # Debug print removed
             # Non-admin users use Sellerboard only
             try:
-                from orders_analysis import OrdersAnalysis
-                
                 # Get user's configured Sellerboard URLs
                 orders_url = get_user_field(config_user_record, 'integrations.sellerboard.orders_url') if config_user_record else None
                 stock_url = get_user_field(config_user_record, 'integrations.sellerboard.stock_url') if config_user_record else None
-                cogs_url = get_user_sellerboard_cogs_url(config_user_record)
                 
                 if not orders_url or not stock_url:
                     return jsonify({
@@ -4561,20 +4628,7 @@ def get_orders_analytics():
                     }), 400
                 
                 pass  # Debug print removed
-                analyzer = OrdersAnalysis(orders_url=orders_url, stock_url=stock_url, cogs_url=cogs_url, discord_id=discord_id)
-                
-                # Prepare user settings for COGS data fetching
-                user_settings = {
-                    'enable_source_links': get_user_field(user_record, 'settings.enable_source_links') or user_record.get('enable_source_links', False),
-                    'search_all_worksheets': get_user_field(config_user_record, 'settings.search_all_worksheets') or config_user_record.get('search_all_worksheets', False),
-                    'sheet_id': get_user_field(config_user_record, 'files.sheet_id'),
-                    'worksheet_title': get_user_field(config_user_record, 'integrations.google.worksheet_title'),
-                    'google_tokens': get_user_field(config_user_record, 'integrations.google.tokens') or {},
-                    'column_mapping': get_user_column_mapping(user_record),
-                    'amazon_lead_time_days': get_user_field(config_user_record, 'settings.amazon_lead_time_days') or config_user_record.get('amazon_lead_time_days', 90)
-                }
-                
-                analysis = analyzer.analyze(target_date, user_timezone=user_timezone, user_settings=user_settings)
+                analysis = run_sellerboard_analytics(discord_id, user_record, config_user_record, target_date, user_timezone)
                 analysis['source'] = 'sellerboard'
                 analysis['message'] = 'Using Sellerboard data'
                 
@@ -4602,84 +4656,18 @@ def get_orders_analytics():
                     'user_timezone': user_timezone
                 }
         
-        # Ensure all expected keys exist with default values
-        analysis.setdefault('today_sales', {})
-        analysis.setdefault('velocity', {})
-        analysis.setdefault('low_stock', {})
-        analysis.setdefault('restock_priority', {})
-        analysis.setdefault('stockout_30d', {})
-        # Enhanced analytics defaults
-        analysis.setdefault('enhanced_analytics', {})
-        analysis.setdefault('restock_alerts', {})
-        analysis.setdefault('critical_alerts', [])
-        analysis.setdefault('total_products_analyzed', 0)
-        analysis.setdefault('high_priority_count', 0)
-        
-        # Remove non-JSON serializable data (DataFrames)
-        if 'orders_df' in analysis:
-            del analysis['orders_df']
-            
-        # Clean all data to ensure JSON serialization
-        def clean_for_json(obj):
-            """Recursively clean object to ensure JSON serialization"""
-            import math
-            
-            if isinstance(obj, dict):
-                return {k: clean_for_json(v) for k, v in obj.items()}
-            elif isinstance(obj, list):
-                return [clean_for_json(item) for item in obj]
-            elif isinstance(obj, float):
-                if math.isnan(obj) or math.isinf(obj):
-                    return None  # Convert NaN/Inf to null
-                return obj
-            elif obj is None or isinstance(obj, (int, str, bool)):
-                return obj
-            else:
-                # Convert other types to string
-                return str(obj)
-        
-        # Clean the entire analysis object
-        analysis = clean_for_json(analysis)
-        
-        # Add metadata about the date being analyzed
-        analysis['report_date'] = target_date.isoformat()
-        
-        # Calculate is_yesterday using timezone-aware logic
-        analysis['is_yesterday'] = is_date_yesterday(target_date, user_timezone)
-        analysis['user_timezone'] = user_timezone
-        
-        # Add AI-powered summary if enabled and data is available
-        try:
-            if ai_analytics.client and 'orders_df' in locals() and locals()['orders_df'] is not None:
-                # Generate AI summary for the dashboard
-                if hasattr(locals()['orders_df'], 'empty') and not locals()['orders_df'].empty:
-                    ai_summary = ai_analytics.generate_order_insights(
-                        locals()['orders_df'], 
-                        locals().get('cogs_data', {})
-                    )
-                    analysis['ai_insights'] = {
-                        'summary': ai_summary.get('insights', [])[:3],  # Top 3 insights
-                        'top_recommendation': ai_summary.get('recommendations', [])[:1],  # Top recommendation
-                        'enabled': True
-                    }
-                else:
-                    analysis['ai_insights'] = {'enabled': True, 'summary': [], 'top_recommendation': []}
-            else:
-                analysis['ai_insights'] = {'enabled': False, 'summary': [], 'top_recommendation': []}
-        except Exception as ai_error:
-            # AI insights are optional - don't break the main response
-            analysis['ai_insights'] = {'enabled': False, 'error': str(ai_error)}
+        analysis = finalize_orders_analytics(analysis, target_date, user_timezone)
         
         # Cache the successful analysis for future requests
         try:
             set_cached_data(cache_key, analysis)
+            if not analysis.get('error'):
+                analytics_result_store.put(cache_key, discord_id, target_date, analysis)
         except Exception as cache_error:
             # Cache failure is not critical
             pass
         
-        response = jsonify(analysis)
-        response.headers['Content-Type'] = 'application/json'
-        return response
+        return analytics_response(analysis, projection)
         
     except Exception as e:
         pass  # Debug print removed
@@ -5727,7 +5715,7 @@ def delete_sellerboard_file_old(file_key):
         pass  # Debug print removed
         
         users = get_users_config()
-        user_record = next((u for u in users if get_user_field(u, 'identity.discord_id') == discord_id), None)
+        user_record = get_user_record(discord_id)
         
         uploaded_files = get_user_field(user_record, 'files.uploaded_files') or []
         if not user_record or not uploaded_files:
@@ -5918,6 +5906,7 @@ def admin_update_user(user_id):
             return jsonify({'error': 'User not found'}), 404
         
         user_record = users[user_index]
+        analytics_inputs = analytics_profile_inputs(user_record)
         pass  # Debug print removed
         pass  # Debug print removed
         
@@ -5943,7 +5932,8 @@ def admin_update_user(user_id):
         
         # Save changes
         if update_users_config(users):
-            pass  # Debug print removed
+            if analytics_profile_inputs(user_record) != analytics_inputs:
+                invalidate_user_analytics(get_user_field(user_record, 'identity.discord_id'))
             return jsonify({'message': 'User updated successfully'})
         else:
             pass  # Debug print removed
@@ -6010,6 +6000,29 @@ def admin_migrate_users_schema():
             'error': f"Migration error: {str(e)}"
         }), 500
 
+@app.route('/api/admin/users-storage/import', methods=['POST'])
+@admin_required
+def admin_import_users_storage():
+    """Re-import users.json into per-user records (USERS_STORAGE_MODE=per_user)"""
+    try:
+        if users_store.mode != 'per_user':
+            return jsonify({'success': False, 'error': 'Per-user storage is not enabled'}), 400
+        
+        with _user_directory_lock:
+            users = [prepare_user_record(user) for user in users_store.import_single_file()]
+            set_user_directory(users)
+        invalidate_feature_access_cache()
+        
+        return jsonify({
+            'success': True,
+            'message': f'Imported {len(users)} users from {USERS_CONFIG_KEY}'
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f"Import error: {str(e)}"
+        }), 500
+
 @app.route('/api/admin/impersonate/<user_id>', methods=['POST'])
 @admin_required  
 def admin_impersonate_user(user_id):
@@ -6240,7 +6253,7 @@ def admin_create_invitation():
         
         # Check if user already exists
         users = get_users_config()
-        existing_user = next((u for u in users if get_user_field(u, 'identity.email') == email), None)
+        existing_user = get_user_directory().by_email(email)
         
         if existing_user:
             return jsonify({'error': 'User with this email already exists'}), 400
@@ -6356,7 +6369,7 @@ def invite_subuser():
             return jsonify({'error': 'Email already has a pending invitation'}), 400
         
         # Check if user already exists
-        existing_user = next((u for u in users if get_user_field(u, 'identity.email') == email), None)
+        existing_user = get_user_directory().by_email(email)
         
         if existing_user:
             return jsonify({'error': 'User with this email already exists'}), 400
@@ -6419,13 +6432,8 @@ def get_my_subusers():
         
         # Find all sub-users for this parent
         subusers = []
-        for user in users:
-            user_type = get_user_field(user, 'account.user_type')
-            parent_id = get_user_field(user, 'account.parent_user_id')
-            
-            print(f"[SUBUSERS] User {get_user_field(user, 'identity.discord_id')} - type: {user_type}, parent: {parent_id}")
-            
-            if user_type == 'subuser' and parent_id == discord_id:
+        for user in get_user_directory().subusers_of(discord_id):
+            if get_user_field(user, 'account.user_type') == 'subuser':
                 subuser_data = {
                     'discord_id': get_user_field(user, 'identity.discord_id'),
                     'discord_username': get_user_field(user, 'identity.discord_username'),
@@ -6576,7 +6584,9 @@ def revoke_subuser_access(subuser_id):
         users = get_users_config()
         
         # Find the sub-user
-        subuser = next((u for u in users if get_user_field(u, 'identity.discord_id') == subuser_id and get_user_field(u, 'account.parent_user_id') == discord_id), None)
+        subuser = get_user_record(subuser_id)
+        if subuser and get_user_field(subuser, 'account.parent_user_id') != discord_id:
+            subuser = None
         
         if not subuser:
             return jsonify({'error': 'Sub-user not found or not authorized'}), 404
@@ -6896,13 +6906,7 @@ def manual_sellerboard_update():
             return jsonify({'error': 'User not authenticated or discord_id not found'}), 401
         
         # Get user configuration
-        users = get_users_config()
-        user_config = None
-        
-        for user in users:
-            if get_user_field(user, 'identity.discord_id') == discord_id:
-                user_config = user
-                break
+        user_config = get_user_record(discord_id)
         
         if not user_config:
             return jsonify({'error': 'User configuration not found'}), 404
@@ -8741,31 +8745,26 @@ def fetch_all_sheet_titles_for_user(user_record) -> list[str]:
     data = resp.json()
     return [sheet["properties"]["title"] for sheet in data.get("sheets", [])]
 
-def fetch_google_sheet_as_df(user_record, worksheet_title):
+def load_user_worksheets(user_record, worksheet_titles, range_suffix="A1:ZZ"):
     """
-    Fetches one worksheet's entire A1:ZZ range, pads/truncates rows to match headers,
-    and returns a DataFrame with the first row as column names.
+    Snapshots of several worksheets of the user's Sheet (see sheet_snapshots), refreshing
+    the Google token once on a 401. Unmodified spreadsheets are served without Sheets calls.
     """
-    import pandas as pd
-    import urllib.parse
-    
     sheet_id = get_user_field(user_record, 'files.sheet_id')
     google_tokens = get_user_field(user_record, 'integrations.google.tokens') or {}
     access_token = google_tokens.get("access_token")
-    range_ = f"'{worksheet_title}'!A1:ZZ"
-    url = (
-        f"https://sheets.googleapis.com/v4/spreadsheets/{sheet_id}"
-        f"/values/{urllib.parse.quote(range_)}?majorDimension=ROWS"
-    )
-    headers = {"Authorization": f"Bearer {access_token}"}
-    resp = requests.get(url, headers=headers)
-    if resp.status_code == 401:
+    try:
+        return load_worksheet_values(access_token, sheet_id, list(worksheet_titles), range_suffix)
+    except requests.exceptions.HTTPError as e:
+        if e.response is None or e.response.status_code != 401:
+            raise
         access_token = refresh_google_token(user_record)
-        headers = {"Authorization": f"Bearer {access_token}"}
-        resp = requests.get(url, headers=headers)
-    resp.raise_for_status()
+        return load_worksheet_values(access_token, sheet_id, list(worksheet_titles), range_suffix)
 
-    values = resp.json().get("values", [])
+def worksheet_values_to_df(values):
+    """First row as column names, remaining rows padded/truncated to the header length"""
+    import pandas as pd
+    
     if not values:
         return pd.DataFrame()
 
@@ -8781,6 +8780,14 @@ def fetch_google_sheet_as_df(user_record, worksheet_title):
 
     return pd.DataFrame(records, columns=headers_row)
 
+def fetch_google_sheet_as_df(user_record, worksheet_title):
+    """
+    Fetches one worksheet's entire A1:ZZ range, pads/truncates rows to match headers,
+    and returns a DataFrame with the first row as column names.
+    """
+    snapshots = load_user_worksheets(user_record, [worksheet_title])
+    return worksheet_values_to_df(snapshots[worksheet_title].values)
+
 def build_highest_cogs_map_for_user(user_record) -> dict[str, float]:
     """
     Fetches every worksheet title, then for each sheet:
@@ -8794,9 +8801,11 @@ def build_highest_cogs_map_for_user(user_record) -> dict[str, float]:
     
     max_cogs: dict[str, float] = {}
     titles = fetch_all_sheet_titles_for_user(user_record)
+    # One modifiedTime probe and (when changed) batched fetches for every worksheet
+    snapshots = load_user_worksheets(user_record, titles)
 
     for title in titles:
-        df = fetch_google_sheet_as_df(user_record, title)
+        df = worksheet_values_to_df(snapshots[title].values)
         if df.empty:
             continue
 
@@ -9091,27 +9100,13 @@ def fetch_discount_leads():
 def get_cached_discount_opportunities(discord_id, retailer_filter=''):
     """Get cached discount opportunities from database"""
     try:
-        # Create discount_opportunities_cache table if it doesn't exist
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS discount_opportunities_cache (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                discord_id TEXT NOT NULL,
-                retailer_filter TEXT NOT NULL DEFAULT '',
-                data TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                expires_at TIMESTAMP NOT NULL
-            )
-        ''')
-        conn.commit()
-        
         # Check for valid cached data with smart expiry (24 hours for daily use, but allow refresh)
-        cursor.execute('''
+        result = app_db.fetchone('''
             SELECT data, created_at FROM discount_opportunities_cache 
             WHERE discord_id = ? AND retailer_filter = ? AND expires_at > datetime('now')
             ORDER BY created_at DESC LIMIT 1
         ''', (discord_id, retailer_filter))
         
-        result = cursor.fetchone()
         if result:
             data = json.loads(result[0])
             created_at = result[1]
@@ -9138,27 +9133,26 @@ def get_cached_discount_opportunities(discord_id, retailer_filter=''):
 def cache_discount_opportunities(discord_id, retailer_filter, data):
     """Cache discount opportunities data to database"""
     try:
-        # Delete old cache entries for this user/filter combination
-        cursor.execute('''
-            DELETE FROM discount_opportunities_cache 
-            WHERE discord_id = ? AND retailer_filter = ?
-        ''', (discord_id, retailer_filter))
-        
-        # Insert new cache entry with 24-hour expiry for daily use
         expires_at = (datetime.now() + timedelta(hours=24)).isoformat()
-        cursor.execute('''
-            INSERT INTO discount_opportunities_cache (discord_id, retailer_filter, data, expires_at)
-            VALUES (?, ?, ?, ?)
-        ''', (discord_id, retailer_filter, json.dumps(data), expires_at))
-        
-        conn.commit()
-        
-        # Cleanup old expired entries (housekeeping)
-        cursor.execute('''
-            DELETE FROM discount_opportunities_cache 
-            WHERE expires_at < datetime('now')
-        ''')
-        conn.commit()
+        payload = json.dumps(data)
+        with app_db.transaction() as db:
+            # Delete old cache entries for this user/filter combination
+            db.execute('''
+                DELETE FROM discount_opportunities_cache 
+                WHERE discord_id = ? AND retailer_filter = ?
+            ''', (discord_id, retailer_filter))
+            
+            # Insert new cache entry with 24-hour expiry for daily use
+            db.execute('''
+                INSERT INTO discount_opportunities_cache (discord_id, retailer_filter, data, expires_at)
+                VALUES (?, ?, ?, ?)
+            ''', (discord_id, retailer_filter, payload, expires_at))
+            
+            # Cleanup old expired entries (housekeeping)
+            db.execute('''
+                DELETE FROM discount_opportunities_cache 
+                WHERE expires_at < datetime('now')
+            ''')
         
     except Exception as e:
         print(f"Error caching discount opportunities: {e}")
@@ -9215,11 +9209,10 @@ def analyze_discount_opportunities():
         
         # Check for cached enhanced analytics (24 hour cache for discount opportunities)
         analysis = None
-        if analytics_cache_key in analytics_cache:
-            cache_entry = analytics_cache[analytics_cache_key]
-            if datetime.now() - cache_entry['timestamp'] < timedelta(hours=24):
-                enhanced_analytics = cache_entry['data']
-                analysis = cache_entry.get('analysis')
+        cache_entry = analytics_cache.get(analytics_cache_key, None)
+        if cache_entry is not None:
+            enhanced_analytics = cache_entry['data']
+            analysis = cache_entry.get('analysis')
         
         if enhanced_analytics is None:
             try:
@@ -9265,11 +9258,10 @@ def analyze_discount_opportunities():
                 enhanced_analytics = analysis['enhanced_analytics']
                 
                 # Cache the enhanced analytics with the analysis object
-                analytics_cache[analytics_cache_key] = {
+                analytics_cache.set(analytics_cache_key, {
                     'data': enhanced_analytics,
-                    'analysis': analysis,  # Store the full analysis for purchase insights
-                    'timestamp': datetime.now()
-                }
+                    'analysis': analysis  # Store the full analysis for purchase insights
+                }, ttl_seconds=24 * 3600)
                 
             except Exception as e:
                 print(f"[ERROR] Failed to generate analytics: {str(e)}")
@@ -9548,11 +9540,10 @@ def refresh_discount_opportunities():
         discord_id = session['discord_id']
         
         # Clear existing cache
-        cursor.execute('''
+        app_db.write('''
             DELETE FROM discount_opportunities_cache 
             WHERE discord_id = ? AND retailer_filter = ?
         ''', (discord_id, retailer_filter))
-        conn.commit()
         
         # Redirect to analyze endpoint to regenerate data
         return analyze_discount_opportunities()
@@ -9620,9 +9611,12 @@ def debug_discount_emails():
                 # Process all emails for ASIN extraction testing
                 if messages.get('messages'):
                     b008_found = False
-                    for i, msg in enumerate(messages['messages'][:100]):  # Test first 100 for debugging
+                    test_ids = [msg['id'] for msg in messages['messages'][:100]]  # Test first 100 for debugging
+                    test_emails = get_gmail_messages(user_record, test_ids, message_format='metadata',
+                                                     fields=MESSAGE_METADATA_FIELDS)
+                    for i, msg_id in enumerate(test_ids):
                         try:
-                            email_data = get_gmail_message(user_record, msg['id'])
+                            email_data = test_emails.get(msg_id)
                             if email_data:
                                 headers = {h['name']: h['value'] for h in email_data.get('payload', {}).get('headers', [])}
                                 subject = headers.get('Subject', '')
@@ -9707,9 +9701,10 @@ def debug_discount_emails():
             }
             
             if no_date_messages and no_date_messages.get('messages'):
-                for msg in no_date_messages['messages'][:50]:  # Show more results
+                no_date_emails = get_gmail_messages(user_record, [msg['id'] for msg in no_date_messages['messages'][:50]],  # Show more results
+                                                    message_format='metadata', fields=MESSAGE_METADATA_FIELDS)
+                for email_data in no_date_emails.values():
                     try:
-                        email_data = get_gmail_message(user_record, msg['id'])
                         if email_data:
                             headers = {h['name']: h['value'] for h in email_data.get('payload', {}).get('headers', [])}
                             subject = headers.get('Subject', '')
@@ -9749,9 +9744,10 @@ def debug_discount_emails():
             }
             
             if all_today_messages and all_today_messages.get('messages'):
-                for msg in all_today_messages['messages']:
+                all_today_emails = get_gmail_messages(user_record, [msg['id'] for msg in all_today_messages['messages']],
+                                                      message_format='metadata', fields=MESSAGE_METADATA_FIELDS)
+                for email_data in all_today_emails.values():
                     try:
-                        email_data = get_gmail_message(user_record, msg['id'])
                         if email_data:
                             headers = {h['name']: h['value'] for h in email_data.get('payload', {}).get('headers', [])}
                             subject = headers.get('Subject', '')
@@ -9962,17 +9958,13 @@ def get_discount_email_config_source():
         
         # Check database config
         try:
-            conn = sqlite3.connect(DATABASE_FILE)
-            cursor = conn.cursor()
-            cursor.execute('''
+            row = app_db.fetchone('''
                 SELECT email_address, config_type, created_at, gmail_access_token IS NOT NULL as has_tokens
                 FROM discount_email_config
                 WHERE is_active = 1
                 ORDER BY created_at DESC
                 LIMIT 1
             ''')
-            row = cursor.fetchone()
-            conn.close()
             
             if row:
                 result['db_config'] = {
@@ -10008,9 +10000,7 @@ def migrate_discount_email_to_s3():
     try:
         from datetime import datetime
         # Get database config
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        cursor.execute('''
+        row = app_db.fetchone('''
             SELECT email_address, config_type, gmail_access_token, gmail_refresh_token, 
                    gmail_token_expires_at
             FROM discount_email_config
@@ -10018,8 +10008,6 @@ def migrate_discount_email_to_s3():
             ORDER BY created_at DESC
             LIMIT 1
         ''')
-        row = cursor.fetchone()
-        conn.close()
         
         if not row:
             return jsonify({'error': 'No active database configuration found'}), 404
@@ -10052,8 +10040,7 @@ def migrate_discount_email_to_s3():
         
         # Clear cache
         cache_key = f"config_discount_email_config"
-        if cache_key in config_cache:
-            del config_cache[cache_key]
+        config_cache.delete(cache_key)
         
         return jsonify({
             'success': True,
@@ -10074,13 +10061,11 @@ def check_stale_opportunities():
         discord_id = session['discord_id']
         
         # Get cache info
-        cursor.execute('''
+        result = app_db.fetchone('''
             SELECT created_at FROM discount_opportunities_cache 
             WHERE discord_id = ? AND retailer_filter = ? AND expires_at > datetime('now')
             ORDER BY created_at DESC LIMIT 1
         ''', (discord_id, retailer_filter))
-        
-        result = cursor.fetchone()
         if result:
             created_at = result[0]
             try:
@@ -10431,275 +10416,284 @@ def analyze_distill_monitors():
 
 # ===== FEATURE FLAG SYSTEM =====
 
-def init_feature_flags():
-    """Initialize feature flags database tables"""
-    print(f"🔧 Initializing database tables in {DATABASE_FILE}...")
+def create_app_schema(init_conn):
+    """Create the feature flag, email monitoring and cache tables (run once at startup)"""
+    init_cursor = init_conn.cursor()
+    
+    # Create features table
+    init_cursor.execute('''
+        CREATE TABLE IF NOT EXISTS features (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            feature_key TEXT UNIQUE NOT NULL,
+            feature_name TEXT NOT NULL,
+            description TEXT,
+            is_beta BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Create user_feature_access table for per-user permissions
+    init_cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_feature_access (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            discord_id TEXT NOT NULL,
+            feature_key TEXT NOT NULL,
+            has_access BOOLEAN DEFAULT 0,
+            granted_by TEXT,
+            granted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (feature_key) REFERENCES features (feature_key),
+            UNIQUE (discord_id, feature_key)
+        )
+    ''')
+    
+    # Create feature launch status table
+    init_cursor.execute('''
+        CREATE TABLE IF NOT EXISTS feature_launches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            feature_key TEXT UNIQUE NOT NULL,
+            is_public BOOLEAN DEFAULT 0,
+            launched_by TEXT,
+            launched_at TIMESTAMP,
+            launch_notes TEXT,
+            FOREIGN KEY (feature_key) REFERENCES features (feature_key)
+        )
+    ''')
+    
+    # Create user groups table
+    init_cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_groups (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            group_key TEXT UNIQUE NOT NULL,
+            group_name TEXT NOT NULL,
+            description TEXT,
+            created_by TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Create user group membership table  
+    init_cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_group_members (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            discord_id TEXT NOT NULL,
+            group_key TEXT NOT NULL,
+            added_by TEXT NOT NULL,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (group_key) REFERENCES user_groups (group_key),
+            UNIQUE (discord_id, group_key)
+        )
+    ''')
+    
+    # Create group feature access table
+    init_cursor.execute('''
+        CREATE TABLE IF NOT EXISTS group_feature_access (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            group_key TEXT NOT NULL,
+            feature_key TEXT NOT NULL,
+            has_access BOOLEAN DEFAULT 0,
+            granted_by TEXT NOT NULL,
+            granted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (group_key) REFERENCES user_groups (group_key),
+            FOREIGN KEY (feature_key) REFERENCES features (feature_key),
+            UNIQUE (group_key, feature_key)
+        )
+    ''')
+    
+    # Create email monitoring configuration table
+    init_cursor.execute('''
+        CREATE TABLE IF NOT EXISTS email_monitoring (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            discord_id TEXT NOT NULL,
+            email_address TEXT NOT NULL,
+            auth_type TEXT DEFAULT 'imap', -- 'imap' or 'oauth'
+            imap_server TEXT,
+            imap_port INTEGER DEFAULT 993,
+            username TEXT,
+            password_encrypted TEXT,
+            oauth_access_token TEXT,
+            oauth_refresh_token TEXT, 
+            oauth_token_expires_at TIMESTAMP,
+            is_active BOOLEAN DEFAULT 1,
+            last_checked TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (discord_id, email_address)
+        )
+    ''')
+    
+    # Create email monitoring rules table
+    init_cursor.execute('''
+        CREATE TABLE IF NOT EXISTS email_monitoring_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            discord_id TEXT NOT NULL,
+            rule_name TEXT NOT NULL,
+            sender_filter TEXT,
+            subject_filter TEXT,
+            content_filter TEXT,
+            webhook_url TEXT NOT NULL,
+            is_active BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Create email monitoring logs table
+    init_cursor.execute('''
+        CREATE TABLE IF NOT EXISTS email_monitoring_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            discord_id TEXT NOT NULL,
+            rule_id INTEGER NOT NULL,
+            email_subject TEXT,
+            email_sender TEXT,
+            email_date TIMESTAMP,
+            webhook_sent BOOLEAN DEFAULT 0,
+            webhook_response TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (rule_id) REFERENCES email_monitoring_rules (id)
+        )
+    ''')
+    
+    # Create discount opportunities email configuration table (admin only)
+    init_cursor.execute('''
+        CREATE TABLE IF NOT EXISTS discount_email_config (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email_address TEXT NOT NULL,
+            config_type TEXT NOT NULL DEFAULT 'gmail_oauth', -- 'gmail_oauth' or 'imap'
+            imap_server TEXT,
+            imap_port INTEGER DEFAULT 993,
+            username TEXT,
+            password_encrypted TEXT,
+            gmail_access_token TEXT,
+            gmail_refresh_token TEXT,
+            gmail_token_expires_at TIMESTAMP,
+            is_active BOOLEAN DEFAULT 1,
+            created_by TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            -- Custom format patterns for email parsing
+            subject_pattern TEXT DEFAULT '\\[([^\\]]+)\\]\\s*Alert:\\s*[^\\(]*\\(ASIN:\\s*([B0-9A-Z]{10})\\)',
+            asin_pattern TEXT DEFAULT '\\(ASIN:\\s*([B0-9A-Z]{10})\\)',
+            retailer_pattern TEXT DEFAULT '\\[([^\\]]+)\\]\\s*Alert:',
+            sender_filter TEXT DEFAULT 'alert@distill.io'
+        )
+    ''')
+    
+    # Add new columns to existing discount_email_config table if they don't exist
     try:
-        # Create a local connection for initialization
-        init_conn = sqlite3.connect(DATABASE_FILE)
-        init_cursor = init_conn.cursor()
+        init_cursor.execute("PRAGMA table_info(discount_email_config)")
+        columns = [col[1] for col in init_cursor.fetchall()]
         
-        # Create features table
-        init_cursor.execute('''
-            CREATE TABLE IF NOT EXISTS features (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                feature_key TEXT UNIQUE NOT NULL,
-                feature_name TEXT NOT NULL,
-                description TEXT,
-                is_beta BOOLEAN DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        if 'subject_pattern' not in columns:
+            init_cursor.execute('ALTER TABLE discount_email_config ADD COLUMN subject_pattern TEXT DEFAULT \'\\\\[([^\\\\]]+)\\\\]\\\\s*Alert:.*?\\\\(ASIN:\\\\s*([B0-9A-Z]{10})\\\\)\'')
+            print("Added subject_pattern column to discount_email_config")
         
-        # Create user_feature_access table for per-user permissions
-        init_cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_feature_access (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                discord_id TEXT NOT NULL,
-                feature_key TEXT NOT NULL,
-                has_access BOOLEAN DEFAULT 0,
-                granted_by TEXT,
-                granted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (feature_key) REFERENCES features (feature_key),
-                UNIQUE (discord_id, feature_key)
-            )
-        ''')
+        if 'asin_pattern' not in columns:
+            init_cursor.execute('ALTER TABLE discount_email_config ADD COLUMN asin_pattern TEXT DEFAULT \'\\\\(ASIN:\\\\s*([B0-9A-Z]{10})\\\\)\'')
+            print("Added asin_pattern column to discount_email_config")
         
-        # Create feature launch status table
-        init_cursor.execute('''
-            CREATE TABLE IF NOT EXISTS feature_launches (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                feature_key TEXT UNIQUE NOT NULL,
-                is_public BOOLEAN DEFAULT 0,
-                launched_by TEXT,
-                launched_at TIMESTAMP,
-                launch_notes TEXT,
-                FOREIGN KEY (feature_key) REFERENCES features (feature_key)
-            )
-        ''')
+        if 'retailer_pattern' not in columns:
+            init_cursor.execute('ALTER TABLE discount_email_config ADD COLUMN retailer_pattern TEXT DEFAULT \'\\\\[([^\\\\]]+)\\\\]\\\\s*Alert:\'')
+            print("Added retailer_pattern column to discount_email_config")
         
-        # Create user groups table
-        init_cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_groups (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                group_key TEXT UNIQUE NOT NULL,
-                group_name TEXT NOT NULL,
-                description TEXT,
-                created_by TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        if 'sender_filter' not in columns:
+            init_cursor.execute('ALTER TABLE discount_email_config ADD COLUMN sender_filter TEXT DEFAULT \'alert@distill.io\'')
+            print("Added sender_filter column to discount_email_config")
+            
+    except Exception as e:
+        print(f"Note: Could not add discount email format columns: {e}")
+    
+    # Create admin email monitoring webhook configuration table
+    init_cursor.execute('''
+        CREATE TABLE IF NOT EXISTS email_monitoring_webhook_config (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            webhook_url TEXT NOT NULL,
+            webhook_name TEXT,
+            is_active BOOLEAN DEFAULT 1,
+            created_by TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Add new columns to existing email_monitoring table if they don't exist
+    try:
+        init_cursor.execute("ALTER TABLE email_monitoring ADD COLUMN auth_type TEXT DEFAULT 'oauth'")
+    except sqlite3.OperationalError:
+        pass  # Column already exists
         
-        # Create user group membership table  
-        init_cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_group_members (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                discord_id TEXT NOT NULL,
-                group_key TEXT NOT NULL,
-                added_by TEXT NOT NULL,
-                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (group_key) REFERENCES user_groups (group_key),
-                UNIQUE (discord_id, group_key)
-            )
-        ''')
-        
-        # Create group feature access table
-        init_cursor.execute('''
-            CREATE TABLE IF NOT EXISTS group_feature_access (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                group_key TEXT NOT NULL,
-                feature_key TEXT NOT NULL,
-                has_access BOOLEAN DEFAULT 0,
-                granted_by TEXT NOT NULL,
-                granted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (group_key) REFERENCES user_groups (group_key),
-                FOREIGN KEY (feature_key) REFERENCES features (feature_key),
-                UNIQUE (group_key, feature_key)
-            )
-        ''')
-        
-        # Create email monitoring configuration table
-        init_cursor.execute('''
-            CREATE TABLE IF NOT EXISTS email_monitoring (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                discord_id TEXT NOT NULL,
-                email_address TEXT NOT NULL,
-                auth_type TEXT DEFAULT 'imap', -- 'imap' or 'oauth'
-                imap_server TEXT,
-                imap_port INTEGER DEFAULT 993,
-                username TEXT,
-                password_encrypted TEXT,
-                oauth_access_token TEXT,
-                oauth_refresh_token TEXT, 
-                oauth_token_expires_at TIMESTAMP,
-                is_active BOOLEAN DEFAULT 1,
-                last_checked TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE (discord_id, email_address)
-            )
-        ''')
-        
-        # Create email monitoring rules table
-        init_cursor.execute('''
-            CREATE TABLE IF NOT EXISTS email_monitoring_rules (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                discord_id TEXT NOT NULL,
-                rule_name TEXT NOT NULL,
-                sender_filter TEXT,
-                subject_filter TEXT,
-                content_filter TEXT,
-                webhook_url TEXT NOT NULL,
-                is_active BOOLEAN DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+    try:
+        init_cursor.execute("ALTER TABLE email_monitoring ADD COLUMN oauth_access_token TEXT")
+    except sqlite3.OperationalError:
+        pass
         
-        # Create email monitoring logs table
-        init_cursor.execute('''
-            CREATE TABLE IF NOT EXISTS email_monitoring_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                discord_id TEXT NOT NULL,
-                rule_id INTEGER NOT NULL,
-                email_subject TEXT,
-                email_sender TEXT,
-                email_date TIMESTAMP,
-                webhook_sent BOOLEAN DEFAULT 0,
-                webhook_response TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (rule_id) REFERENCES email_monitoring_rules (id)
-            )
-        ''')
+    try:
+        init_cursor.execute("ALTER TABLE email_monitoring ADD COLUMN oauth_refresh_token TEXT")
+    except sqlite3.OperationalError:
+        pass
         
-        # Create discount opportunities email configuration table (admin only)
+    try:
+        init_cursor.execute("ALTER TABLE email_monitoring ADD COLUMN oauth_token_expires_at TIMESTAMP")
+    except sqlite3.OperationalError:
+        pass
+    
+    # Remove webhook_url from individual rules since it's now system-wide
+    try:
+        init_cursor.execute("ALTER TABLE email_monitoring_rules DROP COLUMN webhook_url")
+    except sqlite3.OperationalError:
+        pass
+    
+    # Cache of analyzed discount opportunities per user/retailer filter
+    init_cursor.execute('''
+        CREATE TABLE IF NOT EXISTS discount_opportunities_cache (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            discord_id TEXT NOT NULL,
+            retailer_filter TEXT NOT NULL DEFAULT '',
+            data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP NOT NULL
+        )
+    ''')
+    
+    # Insert default features
+    default_features = [
+        ('smart_restock', 'Smart Restock Analytics', 'Advanced restock recommendations and analytics', False),
+        ('discount_opportunities', 'Discount Opportunities', 'Email-based discount opportunity analysis', False),
+        ('reimbursements', 'Reimbursement Analyzer', 'FBA reimbursement tracking and analysis', False),
+        ('ebay_lister', 'eBay Lister', 'Automated eBay listing management', True),
+        ('missing_listings', 'Missing Listings', 'Track expected arrivals and missing listings', False),
+        ('purchase_manager', 'Purchase Manager', 'VA purchase tracking with live inventory integration', True),
+        ('va_management', 'VA Management', 'Virtual assistant user management', False),
+        ('lambda_deployment', 'Lambda Deployment', 'AWS Lambda function deployment', True),
+        ('email_monitoring', 'Email Monitoring', 'Monitor emails for refunds and notifications', True)
+    ]
+    
+    for feature_key, name, description, is_beta in default_features:
         init_cursor.execute('''
-            CREATE TABLE IF NOT EXISTS discount_email_config (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                email_address TEXT NOT NULL,
-                config_type TEXT NOT NULL DEFAULT 'gmail_oauth', -- 'gmail_oauth' or 'imap'
-                imap_server TEXT,
-                imap_port INTEGER DEFAULT 993,
-                username TEXT,
-                password_encrypted TEXT,
-                gmail_access_token TEXT,
-                gmail_refresh_token TEXT,
-                gmail_token_expires_at TIMESTAMP,
-                is_active BOOLEAN DEFAULT 1,
-                created_by TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                -- Custom format patterns for email parsing
-                subject_pattern TEXT DEFAULT '\\[([^\\]]+)\\]\\s*Alert:\\s*[^\\(]*\\(ASIN:\\s*([B0-9A-Z]{10})\\)',
-                asin_pattern TEXT DEFAULT '\\(ASIN:\\s*([B0-9A-Z]{10})\\)',
-                retailer_pattern TEXT DEFAULT '\\[([^\\]]+)\\]\\s*Alert:',
-                sender_filter TEXT DEFAULT 'alert@distill.io'
-            )
-        ''')
-        
-        # Add new columns to existing discount_email_config table if they don't exist
-        try:
-            init_cursor.execute("PRAGMA table_info(discount_email_config)")
-            columns = [col[1] for col in init_cursor.fetchall()]
-            
-            if 'subject_pattern' not in columns:
-                init_cursor.execute('ALTER TABLE discount_email_config ADD COLUMN subject_pattern TEXT DEFAULT \'\\\\[([^\\\\]]+)\\\\]\\\\s*Alert:.*?\\\\(ASIN:\\\\s*([B0-9A-Z]{10})\\\\)\'')
-                print("Added subject_pattern column to discount_email_config")
-            
-            if 'asin_pattern' not in columns:
-                init_cursor.execute('ALTER TABLE discount_email_config ADD COLUMN asin_pattern TEXT DEFAULT \'\\\\(ASIN:\\\\s*([B0-9A-Z]{10})\\\\)\'')
-                print("Added asin_pattern column to discount_email_config")
-            
-            if 'retailer_pattern' not in columns:
-                init_cursor.execute('ALTER TABLE discount_email_config ADD COLUMN retailer_pattern TEXT DEFAULT \'\\\\[([^\\\\]]+)\\\\]\\\\s*Alert:\'')
-                print("Added retailer_pattern column to discount_email_config")
-            
-            if 'sender_filter' not in columns:
-                init_cursor.execute('ALTER TABLE discount_email_config ADD COLUMN sender_filter TEXT DEFAULT \'alert@distill.io\'')
-                print("Added sender_filter column to discount_email_config")
-                
-        except Exception as e:
-            print(f"Note: Could not add discount email format columns: {e}")
-        
-        # Create admin email monitoring webhook configuration table
+            INSERT OR IGNORE INTO features (feature_key, feature_name, description, is_beta)
+            VALUES (?, ?, ?, ?)
+        ''', (feature_key, name, description, is_beta))
+    
+    # Insert default user groups
+    default_groups = [
+        ('beta_testers', 'Beta Testers', 'Users who test new features before general release', '712147636463075389'),
+        ('power_users', 'Power Users', 'Advanced users with access to premium features', '712147636463075389'),
+        ('basic_users', 'Basic Users', 'Standard users with core feature access', '712147636463075389'),
+        ('va_users', 'VA Users', 'Virtual assistants with limited feature access', '712147636463075389')
+    ]
+    
+    for group_key, group_name, description, created_by in default_groups:
         init_cursor.execute('''
-            CREATE TABLE IF NOT EXISTS email_monitoring_webhook_config (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                webhook_url TEXT NOT NULL,
-                webhook_name TEXT,
-                is_active BOOLEAN DEFAULT 1,
-                created_by TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Add new columns to existing email_monitoring table if they don't exist
-        try:
-            init_cursor.execute("ALTER TABLE email_monitoring ADD COLUMN auth_type TEXT DEFAULT 'oauth'")
-        except sqlite3.OperationalError:
-            pass  # Column already exists
-            
-        try:
-            init_cursor.execute("ALTER TABLE email_monitoring ADD COLUMN oauth_access_token TEXT")
-        except sqlite3.OperationalError:
-            pass
-            
-        try:
-            init_cursor.execute("ALTER TABLE email_monitoring ADD COLUMN oauth_refresh_token TEXT")
-        except sqlite3.OperationalError:
-            pass
-            
-        try:
-            init_cursor.execute("ALTER TABLE email_monitoring ADD COLUMN oauth_token_expires_at TIMESTAMP")
-        except sqlite3.OperationalError:
-            pass
-        
-        # Remove webhook_url from individual rules since it's now system-wide
-        try:
-            init_cursor.execute("ALTER TABLE email_monitoring_rules DROP COLUMN webhook_url")
-        except sqlite3.OperationalError:
-            pass
-        
-        init_conn.commit()
-        
-        # Insert default features
-        default_features = [
-            ('smart_restock', 'Smart Restock Analytics', 'Advanced restock recommendations and analytics', False),
-            ('discount_opportunities', 'Discount Opportunities', 'Email-based discount opportunity analysis', False),
-            ('reimbursements', 'Reimbursement Analyzer', 'FBA reimbursement tracking and analysis', False),
-            ('ebay_lister', 'eBay Lister', 'Automated eBay listing management', True),
-            ('missing_listings', 'Missing Listings', 'Track expected arrivals and missing listings', False),
-            ('purchase_manager', 'Purchase Manager', 'VA purchase tracking with live inventory integration', True),
-            ('va_management', 'VA Management', 'Virtual assistant user management', False),
-            ('lambda_deployment', 'Lambda Deployment', 'AWS Lambda function deployment', True),
-            ('email_monitoring', 'Email Monitoring', 'Monitor emails for refunds and notifications', True)
-        ]
-        
-        for feature_key, name, description, is_beta in default_features:
-            init_cursor.execute('''
-                INSERT OR IGNORE INTO features (feature_key, feature_name, description, is_beta)
-                VALUES (?, ?, ?, ?)
-            ''', (feature_key, name, description, is_beta))
-        
-        # Insert default user groups
-        default_groups = [
-            ('beta_testers', 'Beta Testers', 'Users who test new features before general release', '712147636463075389'),
-            ('power_users', 'Power Users', 'Advanced users with access to premium features', '712147636463075389'),
-            ('basic_users', 'Basic Users', 'Standard users with core feature access', '712147636463075389'),
-            ('va_users', 'VA Users', 'Virtual assistants with limited feature access', '712147636463075389')
-        ]
-        
-        for group_key, group_name, description, created_by in default_groups:
-            init_cursor.execute('''
-                INSERT OR IGNORE INTO user_groups (group_key, group_name, description, created_by)
-                VALUES (?, ?, ?, ?)
-            ''', (group_key, group_name, description, created_by))
-        
-        init_conn.commit()
-        init_conn.close()
+            INSERT OR IGNORE INTO user_groups (group_key, group_name, description, created_by)
+            VALUES (?, ?, ?, ?)
+        ''', (group_key, group_name, description, created_by))
+
+def init_feature_flags():
+    """Initialize feature flags database tables"""
+    print(f"🔧 Initializing database tables in {DATABASE_FILE}...")
+    try:
+        app_db.migrate('app_schema', create_app_schema)
         
         # Sync S3 data to database to restore any lost data
         sync_s3_to_database()
@@ -10709,75 +10703,76 @@ def init_feature_flags():
     except Exception as e:
         print(f"Error initializing feature flags: {e}")
 
-def has_feature_access(discord_id, feature_key):
-    """Check if user has access to a specific feature (individual or group-based)"""
-    try:
-        # In demo mode, block access to beta features
-        if DEMO_MODE:
-            # Check if this feature is beta
-            cursor.execute('SELECT is_beta FROM features WHERE feature_key = ?', (feature_key,))
-            beta_result = cursor.fetchone()
-            if beta_result and beta_result[0]:  # is_beta is True
-                print(f"[DEMO MODE] Blocking access to beta feature: {feature_key}")
-                return False
-        
+def invalidate_feature_access_cache():
+    """Drop resolved feature access for every user (admin changes can affect many users)"""
+    feature_access_cache.clear()
+
+def resolve_feature_access(discord_id):
+    """Resolve every feature for a user in one pass.
+    
+    Returns {'is_admin': bool, 'access': {feature_key: bool}}. A feature is accessible when
+    it is launched publicly, granted to the user or granted to one of the user's groups
+    (database first, S3 fallback); subusers inherit their parent's access.
+    """
+    cache_key = f"{discord_id}:{int(DEMO_MODE)}"
+    cached = feature_access_cache.get(cache_key)
+    if cached is not CACHE_MISS:
+        return cached
+    
+    beta_flags = {feature_key: bool(is_beta) for feature_key, is_beta in app_db.fetchall('SELECT feature_key, is_beta FROM features')}
+    user = get_user_record(discord_id)
+    is_admin = bool(user and get_user_field(user, 'identity.discord_id') == '712147636463075389')  # Admin discord ID
+    parent_user_id = None
+    if user and not is_admin and get_user_field(user, 'account.user_type') == 'subuser':
+        parent_user_id = get_user_field(user, 'account.parent_user_id')
+    
+    if is_admin:
         # Admin always has access to everything (except beta features in demo mode)
-        user = get_user_record(discord_id)
-        if user and get_user_field(user, 'identity.discord_id') == '712147636463075389':  # Admin discord ID
-            return True
-            
-        # If user is a subuser, check parent's access instead
-        if user and get_user_field(user, 'account.user_type') == 'subuser':
-            parent_user_id = get_user_field(user, 'account.parent_user_id')
-            if parent_user_id:
-                return has_feature_access(parent_user_id, feature_key)
-            
-        # Check if feature is publicly launched (database first, S3 fallback)
-        cursor.execute('''
-            SELECT is_public FROM feature_launches WHERE feature_key = ?
-        ''', (feature_key,))
-        launch_result = cursor.fetchone()
-        
-        is_launched_db = launch_result and launch_result[0]
-        
-        # Fallback to S3 if database doesn't have launch data
-        if not is_launched_db:
-            feature_launches, _ = get_feature_config()
-            if feature_key in feature_launches:
-                is_launched_db = feature_launches[feature_key].get('is_public', False)
-        
-        if is_launched_db:
-            return True
-        
-        # Check user-specific access (database first, S3 fallback)
-        cursor.execute('''
-            SELECT has_access FROM user_feature_access 
-            WHERE discord_id = ? AND feature_key = ?
-        ''', (discord_id, feature_key))
-        
-        access_result = cursor.fetchone()
-        has_user_access = access_result and access_result[0]
-        
-        # Fallback to S3 user permissions
-        if not has_user_access:
-            user = get_user_record(discord_id)
-            feature_perms = get_user_field(user, 'account.feature_permissions') or {}
-            if user and feature_perms:
-                user_perm = feature_perms.get(feature_key, {})
-                has_user_access = user_perm.get('has_access', False)
-        
-        if has_user_access:
-            return True
-        
-        # Check group-based access
-        cursor.execute('''
-            SELECT gfa.has_access FROM group_feature_access gfa
+        access = {feature_key: True for feature_key in beta_flags}
+    elif parent_user_id:
+        parent = resolve_feature_access(parent_user_id)
+        is_admin = parent['is_admin']
+        access = dict(parent['access'])
+    else:
+        # Publicly launched features
+        enabled = {feature_key for feature_key, is_public in app_db.fetchall('SELECT feature_key, is_public FROM feature_launches') if is_public}
+        feature_launches, _ = get_feature_config()
+        enabled.update(feature_key for feature_key, launch in feature_launches.items() if launch.get('is_public', False))
+        
+        # User-specific grants
+        enabled.update(feature_key for feature_key, has_access in app_db.fetchall('''
+            SELECT feature_key, has_access FROM user_feature_access WHERE discord_id = ?
+        ''', (discord_id,)) if has_access)
+        feature_perms = (get_user_field(user, 'account.feature_permissions') or {}) if user else {}
+        enabled.update(feature_key for feature_key, perm in feature_perms.items() if perm.get('has_access', False))
+        
+        # Group-based grants
+        enabled.update(row[0] for row in app_db.fetchall('''
+            SELECT DISTINCT gfa.feature_key FROM group_feature_access gfa
             JOIN user_group_members ugm ON gfa.group_key = ugm.group_key
-            WHERE ugm.discord_id = ? AND gfa.feature_key = ? AND gfa.has_access = 1
-        ''', (discord_id, feature_key))
+            WHERE ugm.discord_id = ? AND gfa.has_access = 1
+        ''', (discord_id,)))
         
-        group_access_result = cursor.fetchone()
-        return bool(group_access_result)
+        access = {feature_key: feature_key in enabled for feature_key in set(beta_flags) | enabled}
+    
+    # In demo mode, block access to beta features
+    if DEMO_MODE:
+        for feature_key, is_beta in beta_flags.items():
+            if is_beta:
+                access[feature_key] = False
+    
+    resolved = {'is_admin': is_admin, 'access': access}
+    feature_access_cache.set(cache_key, resolved)
+    return resolved
+
+def has_feature_access(discord_id, feature_key):
+    """Check if user has access to a specific feature (individual or group-based)"""
+    try:
+        resolved = resolve_feature_access(discord_id)
+        if feature_key in resolved['access']:
+            return resolved['access'][feature_key]
+        # Keys unknown to the feature tables are only open to the admin
+        return resolved['is_admin']
         
     except Exception as e:
         print(f"Error checking feature access for {discord_id}, {feature_key}: {e}")
@@ -10786,15 +10781,11 @@ def has_feature_access(discord_id, feature_key):
 def get_user_features(discord_id):
     """Get all features accessible to a user"""
     try:
-        # Create local database connection
-        local_conn = sqlite3.connect(DATABASE_FILE)
-        local_cursor = local_conn.cursor()
-        
         user_features = {}
         
         # Get all features
-        local_cursor.execute('SELECT feature_key, feature_name, description, is_beta FROM features')
-        all_features = local_cursor.fetchall()
+        all_features = app_db.fetchall('SELECT feature_key, feature_name, description, is_beta FROM features')
+        access = resolve_feature_access(discord_id)['access']
         
         for feature_key, name, description, is_beta in all_features:
             # Skip beta features in demo mode
@@ -10802,8 +10793,7 @@ def get_user_features(discord_id):
                 print(f"[DEMO MODE] Hiding beta feature: {feature_key}")
                 continue
             
-            # has_feature_access already handles subuser logic
-            has_access = has_feature_access(discord_id, feature_key)
+            has_access = access.get(feature_key, False)
             user_features[feature_key] = {
                 'name': name,
                 'description': description,
@@ -10811,7 +10801,6 @@ def get_user_features(discord_id):
                 'has_access': has_access
             }
         
-        local_conn.close()
         return user_features
         
     except Exception as e:
@@ -10830,11 +10819,7 @@ def get_all_features():
         if discord_id != '712147636463075389':  # Only admin can access
             return jsonify({'error': 'Unauthorized'}), 403
         
-        # Create local database connection
-        local_conn = sqlite3.connect(DATABASE_FILE)
-        local_cursor = local_conn.cursor()
-        
-        local_cursor.execute('''
+        rows = app_db.fetchall('''
             SELECT f.feature_key, f.feature_name, f.description, f.is_beta,
                    fl.is_public, fl.launched_at, fl.launch_notes
             FROM features f
@@ -10843,7 +10828,7 @@ def get_all_features():
         ''')
         
         features = []
-        for row in local_cursor.fetchall():
+        for row in rows:
             feature_key, name, description, is_beta, is_public, launched_at, launch_notes = row
             features.append({
                 'feature_key': feature_key,
@@ -10855,7 +10840,6 @@ def get_all_features():
                 'launch_notes': launch_notes
             })
         
-        local_conn.close()
         response = jsonify({'features': features})
         response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
         response.headers['Pragma'] = 'no-cache'
@@ -10882,13 +10866,12 @@ def launch_feature():
             return jsonify({'error': 'Feature key required'}), 400
         
         # Insert or update launch status
-        cursor.execute('''
+        app_db.write('''
             INSERT OR REPLACE INTO feature_launches 
             (feature_key, is_public, launched_by, launched_at, launch_notes)
             VALUES (?, 1, ?, datetime('now'), ?)
         ''', (feature_key, discord_id, launch_notes))
-        
-        conn.commit()
+        invalidate_feature_access_cache()
         
         # Also store in S3 for persistence
         save_feature_launch_to_s3(feature_key, True, discord_id, launch_notes)
@@ -10913,19 +10896,19 @@ def unlaunch_feature():
         if not feature_key:
             return jsonify({'error': 'Feature key required'}), 400
         
-        # Update launch status to not public
-        cursor.execute('''
-            UPDATE feature_launches SET is_public = 0 WHERE feature_key = ?
-        ''', (feature_key,))
-        
-        if cursor.rowcount == 0:
-            # Insert if not exists
-            cursor.execute('''
-                INSERT INTO feature_launches (feature_key, is_public, launched_by, launched_at)
-                VALUES (?, 0, ?, datetime('now'))
-            ''', (feature_key, discord_id))
-        
-        conn.commit()
+        with app_db.transaction() as db:
+            # Update launch status to not public
+            updated = db.execute('''
+                UPDATE feature_launches SET is_public = 0 WHERE feature_key = ?
+            ''', (feature_key,)).rowcount
+            
+            if updated == 0:
+                # Insert if not exists
+                db.execute('''
+                    INSERT INTO feature_launches (feature_key, is_public, launched_by, launched_at)
+                    VALUES (?, 0, ?, datetime('now'))
+                ''', (feature_key, discord_id))
+        invalidate_feature_access_cache()
         
         # Also store in S3 for persistence
         save_feature_launch_to_s3(feature_key, False, discord_id)
@@ -10956,53 +10939,13 @@ def fetch_sellerboard_cogs_data(cogs_url):
     Fetch and process Sellerboard Cost of Goods Sold CSV data
     Returns cleaned inventory data with products that have SKUs and are not hidden
     """
-    import pandas as pd
     import requests
-    from io import StringIO
+    from sellerboard_download import fetch_report, normalize_report_url, read_report_frame
     
     try:
-        # Check if URL has required parameters
-        if 'sellerboard.com' in cogs_url and 'format=csv' not in cogs_url:
-            # Add CSV format if missing
-            separator = '&' if '?' in cogs_url else '?'
-            cogs_url = f"{cogs_url}{separator}format=csv"
-        
-        # Create a session to handle cookies properly
-        session = requests.Session()
-        
-        # Add headers that might be expected by Sellerboard
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/csv,application/csv,text/plain,*/*',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-        }
-        
-        # First, get the redirect URL without following it
-        initial_response = session.get(cogs_url, timeout=30, allow_redirects=False, headers=headers)
-        
-        if initial_response.status_code == 302:
-            redirect_url = initial_response.headers.get('Location')
-            print(f"Got redirect to: {redirect_url}")
-            
-            # Now follow the redirect with the same session (preserving automation cookies)
-            response = session.get(redirect_url, timeout=30, headers=headers)
-            
-            if response.status_code == 401:
-                print(f"❌ 401 error - download URL requires additional authentication")
-                print(f"🔍 The automation token creates a session but download needs browser login")
-                print(f"💡 Solution: User must download manually through logged-in browser")
-                raise Exception(f"AUTHENTICATION_REQUIRED: Sellerboard COGS downloads require browser login session. Please download manually: {cogs_url}")
-                
-        else:
-            response = initial_response
-        
-        response.raise_for_status()
-        
-        # Parse CSV data
-        csv_data = StringIO(response.text)
-        df = pd.read_csv(csv_data)
+        # Stream and parse the report in chunks over a pooled session
+        cogs_url = normalize_report_url(cogs_url)
+        df, _ = read_report_frame(fetch_report(cogs_url), 'cogs')
         
         # Clean the data according to requirements:
         # 1. Remove products without SKUs
@@ -11191,6 +11134,15 @@ def fetch_sellerboard_cogs_data_from_email(discord_id: str) -> Optional[Dict]:
         return None
 
 
+# Give every OrdersAnalysis instance access to email COGS and Google token refresh
+# without it having to import (and re-execute) this module
+import orders_analysis as _orders_analysis_module
+_orders_analysis_module.configure_dependencies(
+    cogs_provider=fetch_sellerboard_cogs_data_from_email,
+    token_refresher=refresh_google_token
+)
+
+
 def refresh_email_oauth_token(refresh_token: str) -> Optional[Dict]:
     """Refresh OAuth token for email access"""
     try:
@@ -11400,10 +11352,9 @@ def get_expected_arrivals():
         from datetime import datetime, timedelta
         missing_listings_cache_key = f"missing_listings_{discord_id}_{scope}"
         
-        if missing_listings_cache_key in analytics_cache:
-            cache_entry = analytics_cache[missing_listings_cache_key]
-            if datetime.now() - cache_entry['timestamp'] < timedelta(hours=24):
-                return jsonify(cache_entry['data'])
+        cached_response = analytics_cache.get(missing_listings_cache_key, None)
+        if cached_response is not None:
+            return jsonify(cached_response)
         user_record = get_user_record(discord_id)
         
         if not user_record:
@@ -11631,11 +11582,8 @@ def get_expected_arrivals():
             # Email failed, but we have COGS URL - fetch directly from COGS URL
             try:
                 print(f"📥 Email COGS failed, fetching directly from COGS URL: {sellerboard_cogs_url}")
-                from orders_analysis import OrdersAnalysis
-                cogs_analysis = OrdersAnalysis()
-                
                 # Fetch COGS data directly from URL
-                cogs_inventory_data = cogs_analysis.fetch_sellerboard_data(sellerboard_cogs_url)
+                cogs_inventory_data = fetch_sellerboard_cogs_data(sellerboard_cogs_url)
                 
                 if cogs_inventory_data and 'data' in cogs_inventory_data:
                     asin_column = cogs_inventory_data.get('asin_column', 'ASIN')
@@ -11753,10 +11701,7 @@ def get_expected_arrivals():
         }
         
         # Cache the response data
-        analytics_cache[missing_listings_cache_key] = {
-            'data': response_data,
-            'timestamp': datetime.now()
-        }
+        analytics_cache.set(missing_listings_cache_key, response_data, ttl_seconds=24 * 3600)
 
         return jsonify(response_data)
 
@@ -12495,15 +12440,13 @@ def sync_leads_to_sheets():
                 sheets_info = metadata_response.json().get("sheets", [])
                 worksheet_names = [sheet["properties"]["title"] for sheet in sheets_info]
                 
+                # Batched fetch of every worksheet, skipped entirely while the spreadsheet is unmodified
+                worksheet_snapshots = load_worksheet_values(access_token, user_sheet_id, worksheet_names, "A1:Z")
+                
                 # Search each worksheet for ASINs and sources
                 for worksheet_name in worksheet_names:
                     try:
-                        encoded_range = urllib.parse.quote(f"'{worksheet_name}'!A1:Z")
-                        url = f"https://sheets.googleapis.com/v4/spreadsheets/{user_sheet_id}/values/{encoded_range}"
-                        worksheet_response = requests.get(url, headers=headers)
-                        worksheet_response.raise_for_status()
-                        
-                        worksheet_values = worksheet_response.json().get("values", [])
+                        worksheet_values = worksheet_snapshots[worksheet_name].values
                         if worksheet_values and len(worksheet_values) > 1:
                             worksheet_headers = worksheet_values[0]
                             worksheet_rows = worksheet_values[1:]
@@ -13053,109 +12996,102 @@ def fetch_discount_email_alerts():
 def fetch_discount_alerts_from_imap(email_config):
     """Fetch discount alerts using IMAP configuration"""
     try:
-        import imaplib
-        import email
         from datetime import datetime, timedelta
-        import pytz
         
         # Decrypt password
         password = email_cipher.decrypt(email_config['password_encrypted'].encode()).decode()
         
         # Connect to IMAP server
-        mail = imaplib.IMAP4_SSL(email_config['imap_server'], email_config['imap_port'])
+        mail = connect_imap(email_config['imap_server'], email_config['imap_port'])
         mail.login(email_config['username'], password)
-        mail.select('inbox')
-        
-        # Search for discount-related emails from the last few days
-        days_back = get_discount_email_days_back()
-        cutoff_date = (datetime.now() - timedelta(days=days_back)).strftime('%d-%b-%Y')
-        
-        # Search for emails from discount sender or with discount-related subjects
-        sender_query = f'FROM "{DISCOUNT_SENDER_EMAIL}"' if DISCOUNT_SENDER_EMAIL else ''
-        subject_query = 'OR SUBJECT "discount" OR SUBJECT "clearance" OR SUBJECT "sale" OR SUBJECT "alert"'
-        date_query = f'SINCE "{cutoff_date}"'
-        
-        search_query = f'{sender_query} {subject_query} {date_query}' if sender_query else f'{subject_query} {date_query}'
-        
         
-        result, messages = mail.search(None, search_query.strip())
-        
-        if result != 'OK' or not messages[0]:
+        try:
+            # Search for discount-related emails from the last few days
+            days_back = get_discount_email_days_back()
+            cutoff_date = (datetime.now() - timedelta(days=days_back)).strftime('%d-%b-%Y')
+            
+            # Search for emails from discount sender or with discount-related subjects
+            sender_query = f'FROM "{DISCOUNT_SENDER_EMAIL}"' if DISCOUNT_SENDER_EMAIL else ''
+            subject_query = 'OR SUBJECT "discount" OR SUBJECT "clearance" OR SUBJECT "sale" OR SUBJECT "alert"'
+            date_query = f'SINCE "{cutoff_date}"'
+            
+            search_query = f'{sender_query} {subject_query} {date_query}' if sender_query else f'{subject_query} {date_query}'
+            
+            # Only UIDs above the stored cursor are read; the window search runs on first sync, UIDVALIDITY
+            # change or a changed window (so a wider one is backfilled)
+            mailbox = f"discount:{email_config['username']}@{email_config['imap_server']}"
+            sync = ImapMailboxSync(mail, mailbox, config_fingerprint(DISCOUNT_SENDER_EMAIL, DISCOUNT_SUBJECT_KEYWORDS, days_back))
+            batch = sync.new_uids(search_query.strip(), max_messages=50)
+            known = sync.store.known_uids(mailbox, batch.uids)
+            messages = sync.fetch_headers([uid for uid in batch.uids if uid not in known])
+            
+            # Headers first: only likely discount alerts get their text part downloaded
+            candidates = [message for message in messages.values()
+                          if is_discount_alert_candidate(message.header('From'), message.header('Subject'))]
+            sync.fetch_text(candidates)
+            
+            candidate_uids = {message.uid for message in candidates}
+            results = []
+            for uid, message in messages.items():
+                alert = parse_imap_discount_alert(message) if uid in candidate_uids else None
+                results.append((uid, message.received_at, alert))
+            sync.store.record_messages(mailbox, results)
+            sync.commit(batch)
+            
+            window_start = (datetime.now() - timedelta(days=days_back)).timestamp()
+            alerts = sync.store.results_since(mailbox, window_start)
+        finally:
             mail.logout()
-            return fetch_mock_discount_alerts()
-        
-        email_ids = messages[0].split()
-        alerts = []
-        
-        # Process the most recent emails (limit to 50 for performance)
-        for email_id in email_ids[-50:]:
-            try:
-                result, msg_data = mail.fetch(email_id, '(RFC822)')
-                if result != 'OK':
-                    continue
-                
-                email_msg = email.message_from_bytes(msg_data[0][1])
-                
-                # Extract email details
-                subject = email_msg.get('Subject', '')
-                sender = email_msg.get('From', '')
-                date_received = email_msg.get('Date', '')
-                
-                # Get email body
-                html_content = ""
-                if email_msg.is_multipart():
-                    for part in email_msg.walk():
-                        if part.get_content_type() == "text/html":
-                            charset = part.get_content_charset() or 'utf-8'
-                            html_content = part.get_payload(decode=True).decode(charset, errors='ignore')
-                            break
-                        elif part.get_content_type() == "text/plain" and not html_content:
-                            charset = part.get_content_charset() or 'utf-8'
-                            plain_content = part.get_payload(decode=True).decode(charset, errors='ignore')
-                            html_content = f"<div>{plain_content}</div>"
-                else:
-                    charset = email_msg.get_content_charset() or 'utf-8'
-                    content = email_msg.get_payload(decode=True).decode(charset, errors='ignore')
-                    html_content = f"<div>{content}</div>"
-                
-                # Extract ASIN from subject or content
-                import re
-                asin_match = re.search(r'B[0-9A-Z]{9}', subject + ' ' + html_content)
-                asin = asin_match.group() if asin_match else f'UNKNOWN_{len(alerts)}'
-                
-                # Determine retailer from sender or subject
-                retailer = 'Unknown'
-                sender_lower = sender.lower()
-                subject_lower = subject.lower()
-                
-                if 'vitacost' in sender_lower or 'vitacost' in subject_lower:
-                    retailer = 'Vitacost'
-                elif 'walmart' in sender_lower or 'walmart' in subject_lower:
-                    retailer = 'Walmart'
-                elif 'amazon' in sender_lower or 'amazon' in subject_lower:
-                    retailer = 'Amazon'
-                elif 'target' in sender_lower or 'target' in subject_lower:
-                    retailer = 'Target'
-                
-                alerts.append({
-                    'retailer': retailer,
-                    'asin': asin,
-                    'subject': subject,
-                    'html_content': html_content,
-                    'alert_time': date_received,
-                    'sender': sender
-                })
-                
-            except Exception as e:
-                continue
-        
-        mail.logout()
         
         return alerts if alerts else fetch_mock_discount_alerts()
         
     except Exception as e:
         return fetch_mock_discount_alerts()
 
+def is_discount_alert_candidate(sender, subject):
+    """Header pre-filter for IMAP discount alerts: the alert sender when configured, else a discount subject"""
+    if DISCOUNT_SENDER_EMAIL:
+        return DISCOUNT_SENDER_EMAIL.lower() in (sender or '').lower()
+    subject_lower = (subject or '').lower()
+    return any(keyword in subject_lower for keyword in DISCOUNT_SUBJECT_KEYWORDS)
+
+def parse_imap_discount_alert(message):
+    """Build a discount alert from an IMAP message whose text part has been fetched"""
+    import re
+    
+    # Extract email details
+    subject = message.header('Subject')
+    sender = message.header('From')
+    date_received = message.header('Date')
+    html_content = message.html_content
+    
+    # Extract ASIN from subject or content
+    asin_match = re.search(r'B[0-9A-Z]{9}', subject + ' ' + html_content)
+    asin = asin_match.group() if asin_match else f'UNKNOWN_{message.uid}'
+    
+    # Determine retailer from sender or subject
+    retailer = 'Unknown'
+    sender_lower = sender.lower()
+    subject_lower = subject.lower()
+    
+    if 'vitacost' in sender_lower or 'vitacost' in subject_lower:
+        retailer = 'Vitacost'
+    elif 'walmart' in sender_lower or 'walmart' in subject_lower:
+        retailer = 'Walmart'
+    elif 'amazon' in sender_lower or 'amazon' in subject_lower:
+        retailer = 'Amazon'
+    elif 'target' in sender_lower or 'target' in subject_lower:
+        retailer = 'Target'
+    
+    return {
+        'retailer': retailer,
+        'asin': asin,
+        'subject': subject,
+        'html_content': html_content,
+        'alert_time': date_received,
+        'sender': sender
+    }
+
 def is_valid_asin(asin):
     """Validate if a string is a proper Amazon ASIN format"""
     import re
@@ -13179,8 +13115,135 @@ def is_valid_asin(asin):
         
     return True
 
+def parse_discount_alert_email(email_data, discount_config):
+    """Build a discount alert from a Gmail message, or None when it has no valid ASIN"""
+    try:
+        # Extract email details
+        headers = {h['name']: h['value'] for h in email_data.get('payload', {}).get('headers', [])}
+        subject = headers.get('Subject', '')
+        sender = headers.get('From', '')
+        date_received = headers.get('Date', '')
+        
+        # Debug log each email being processed
+        
+        
+        # Get email body
+        html_content = ""
+        payload = email_data.get('payload', {})
+        
+        def extract_html_from_payload(payload):
+            if payload.get('mimeType') == 'text/html':
+                data = payload.get('body', {}).get('data', '')
+                if data:
+                    import base64
+                    return base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
+            
+            if payload.get('mimeType') == 'text/plain' and not html_content:
+                data = payload.get('body', {}).get('data', '')
+                if data:
+                    import base64
+                    plain_text = base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
+                    return f"<div>{plain_text}</div>"
+            
+            # Check multipart messages
+            for part in payload.get('parts', []):
+                result = extract_html_from_payload(part)
+                if result:
+                    return result
+            
+            return None
+        
+        html_content = extract_html_from_payload(payload) or "<div>No content</div>"
+        
+        # Extract ASIN from subject or content
+        import re
+        
+        
+        # Extract ASIN using configurable pattern from admin settings
+        asin = None
+        
+        # Get custom patterns from discount config (S3-based) - use flexible pattern as default
+        asin_pattern = discount_config.get('asin_pattern', r'\b(B[0-9A-Z]{9})\b') if discount_config else r'\b(B[0-9A-Z]{9})\b'
+        
+        # Extract ASIN from subject line using custom pattern
+        asin_match = re.search(asin_pattern, subject, re.IGNORECASE)
+        
+        if asin_match:
+            potential_asin = asin_match.group(1)
+            if is_valid_asin(potential_asin):
+                asin = potential_asin
+        
+        # Fallback: try to find ASIN in email content
+        if not asin:
+            content_patterns = [
+                r'\b(B[0-9A-Z]{9})\b',  # Any ASIN with word boundaries
+                r'\(ASIN:\s*([B0-9A-Z]{10})\)',  # (ASIN: B123456789)
+                r'amazon\.com/[^/]*/dp/([B0-9A-Z]{10})',  # Amazon URL
+                r'ASIN[:\s]*([B0-9A-Z]{10})',  # ASIN: B123456789
+            ]
+            
+            for pattern in content_patterns:
+                content_match = re.search(pattern, html_content, re.IGNORECASE)
+                if content_match:
+                    potential_asin = content_match.group(1)
+                    if is_valid_asin(potential_asin):
+                        asin = potential_asin
+                        break
+        
+        # Skip emails without valid ASINs (not discount opportunities)
+        if not asin:
+            return None
+        
+        # Extract retailer using configurable pattern from admin settings
+        retailer = 'Unknown'
+        
+        # Get custom retailer pattern from discount config (S3-based)
+        retailer_pattern = discount_config.get('retailer_pattern', r'\[([^\]]+)\]\s*Alert:') if discount_config else r'\[([^\]]+)\]\s*Alert:'
+        retailer_match = re.search(retailer_pattern, subject, re.IGNORECASE)
+        
+        if retailer_match:
+            retailer = retailer_match.group(1).strip()
+        else:
+            # Fallback: check sender and subject for retailer keywords
+            sender_lower = sender.lower()
+            subject_lower = subject.lower()
+            
+            retailers_map = {
+                'vitacost': 'Vitacost',
+                'walmart': 'Walmart',
+                'target': 'Target',
+                'amazon': 'Amazon',
+                'costco': 'Costco',
+                'lowes': 'Lowes',
+                'lowe': 'Lowes'
+            }
+            
+            for key, name in retailers_map.items():
+                if key in sender_lower or key in subject_lower:
+                    retailer = name
+                    break
+        
+        # Convert Gmail date to ISO format
+        alert_time = convert_gmail_date_to_iso(date_received)
+        
+        alert = {
+            'retailer': retailer,
+            'asin': asin,
+            'subject': subject,
+            'html_content': html_content,
+            'alert_time': alert_time
+        }
+        
+        return alert
+    except Exception as e:
+        return None
+
 def fetch_discount_alerts_from_gmail_api(gmail_config):
-    """Fetch discount alerts using Gmail API configuration"""
+    """Fetch discount alerts using Gmail API configuration
+    
+    Only messages added since the last sync (Gmail history) are fetched and parsed; the
+    alerts of the whole window are served from the Gmail sync store.
+    """
     try:
         
         # Create a mock user record for API calls
@@ -13202,147 +13265,47 @@ def fetch_discount_alerts_from_gmail_api(gmail_config):
         # Add date filter
         cutoff_date = datetime.now() - timedelta(days=days_back)
         query += f' after:{cutoff_date.strftime("%Y/%m/%d")}'
+        window_start = cutoff_date.replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+        
+        # Parsed alerts are only reused while the patterns that produced them are unchanged;
+        # a changed window re-runs the search so a wider one is backfilled
+        mailbox = f"discount:{gmail_config.get('email_address', '')}"
+        fingerprint = config_fingerprint(
+            sender_filter,
+            discount_config.get('asin_pattern') if discount_config else None,
+            discount_config.get('retailer_pattern') if discount_config else None,
+            days_back
+        )
         
-        # Search for messages - increase limit to ensure we get all recent emails
-        messages = search_gmail_messages(user_record, query, max_results=500)
-        
-        if not messages or not messages.get('messages'):
-            return fetch_mock_discount_alerts()
-        
-        alerts = []
-        
-        
-        # Process each message
-        for i, message in enumerate(messages['messages']):  # Process all messages
-            try:
-                message_id = message['id']
-                email_data = get_gmail_message(user_record, message_id)
-                
-                if not email_data:
-                    continue
-                
-                # Extract email details
-                headers = {h['name']: h['value'] for h in email_data.get('payload', {}).get('headers', [])}
-                subject = headers.get('Subject', '')
-                sender = headers.get('From', '')
-                date_received = headers.get('Date', '')
-                
-                # Debug log each email being processed
-                
-                
-                # Get email body
-                html_content = ""
-                payload = email_data.get('payload', {})
-                
-                def extract_html_from_payload(payload):
-                    if payload.get('mimeType') == 'text/html':
-                        data = payload.get('body', {}).get('data', '')
-                        if data:
-                            import base64
-                            return base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
-                    
-                    if payload.get('mimeType') == 'text/plain' and not html_content:
-                        data = payload.get('body', {}).get('data', '')
-                        if data:
-                            import base64
-                            plain_text = base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
-                            return f"<div>{plain_text}</div>"
-                    
-                    # Check multipart messages
-                    for part in payload.get('parts', []):
-                        result = extract_html_from_payload(part)
-                        if result:
-                            return result
-                    
-                    return None
-                
-                html_content = extract_html_from_payload(payload) or "<div>No content</div>"
-                
-                # Extract ASIN from subject or content
-                import re
-                
-                
-                # Extract ASIN using configurable pattern from admin settings
-                asin = None
-                
-                # Get custom patterns from discount config (S3-based) - use flexible pattern as default
-                asin_pattern = discount_config.get('asin_pattern', r'\b(B[0-9A-Z]{9})\b') if discount_config else r'\b(B[0-9A-Z]{9})\b'
-                
-                # Extract ASIN from subject line using custom pattern
-                asin_match = re.search(asin_pattern, subject, re.IGNORECASE)
-                
-                if asin_match:
-                    potential_asin = asin_match.group(1)
-                    if is_valid_asin(potential_asin):
-                        asin = potential_asin
-                
-                # Fallback: try to find ASIN in email content
-                if not asin:
-                    content_patterns = [
-                        r'\b(B[0-9A-Z]{9})\b',  # Any ASIN with word boundaries
-                        r'\(ASIN:\s*([B0-9A-Z]{10})\)',  # (ASIN: B123456789)
-                        r'amazon\.com/[^/]*/dp/([B0-9A-Z]{10})',  # Amazon URL
-                        r'ASIN[:\s]*([B0-9A-Z]{10})',  # ASIN: B123456789
-                    ]
-                    
-                    for pattern in content_patterns:
-                        content_match = re.search(pattern, html_content, re.IGNORECASE)
-                        if content_match:
-                            potential_asin = content_match.group(1)
-                            if is_valid_asin(potential_asin):
-                                asin = potential_asin
-                                break
-                
-                # Skip emails without valid ASINs (not discount opportunities)
-                if not asin:
-                    continue
-                
-                # Extract retailer using configurable pattern from admin settings
-                retailer = 'Unknown'
-                
-                # Get custom retailer pattern from discount config (S3-based)
-                retailer_pattern = discount_config.get('retailer_pattern', r'\[([^\]]+)\]\s*Alert:') if discount_config else r'\[([^\]]+)\]\s*Alert:'
-                retailer_match = re.search(retailer_pattern, subject, re.IGNORECASE)
-                
-                if retailer_match:
-                    retailer = retailer_match.group(1).strip()
-                else:
-                    # Fallback: check sender and subject for retailer keywords
-                    sender_lower = sender.lower()
-                    subject_lower = subject.lower()
-                    
-                    retailers_map = {
-                        'vitacost': 'Vitacost',
-                        'walmart': 'Walmart',
-                        'target': 'Target',
-                        'amazon': 'Amazon',
-                        'costco': 'Costco',
-                        'lowes': 'Lowes',
-                        'lowe': 'Lowes'
-                    }
-                    
-                    for key, name in retailers_map.items():
-                        if key in sender_lower or key in subject_lower:
-                            retailer = name
-                            break
-                
-                # Convert Gmail date to ISO format
-                alert_time = convert_gmail_date_to_iso(date_received)
-                
-                alert = {
-                    'retailer': retailer,
-                    'asin': asin,
-                    'subject': subject,
-                    'html_content': html_content,
-                    'alert_time': alert_time
-                }
-                
-                alerts.append(alert)
-                
-                
-            except Exception as e:
-                continue
-        
+        def api_call(access_token):
+            fetcher = GmailFetcher(access_token)
+            sync = GmailMailboxSync(fetcher, mailbox, fingerprint)
+            # Search for messages - increase limit to ensure we get all recent emails
+            batch = sync.new_message_ids(lambda: fetcher.list_message_ids(query, max_results=500))
+            
+            message_ids = batch.message_ids
+            # Messages the batch fetches could not return: retried by the next sync
+            failed_ids = []
+            if not batch.full_sync and message_ids:
+                # History lists all new mail: keep the discount sender's messages
+                metadata = fetcher.get_messages(message_ids, message_format='metadata', fields=MESSAGE_METADATA_FIELDS)
+                failed_ids.extend(message_id for message_id in message_ids if message_id not in metadata)
+                message_ids = [message_id for message_id, message in metadata.items()
+                               if sender_filter.lower() in header_values(message).get('from', '').lower()]
+            known = gmail_sync_store.known_message_ids(mailbox, message_ids)
+            
+            # Fetch new messages in batches, with only the headers and body parts the extractors read
+            new_ids = [message_id for message_id in message_ids if message_id not in known]
+            emails = fetcher.get_messages(new_ids, fields=MESSAGE_BODY_FIELDS)
+            failed_ids.extend(message_id for message_id in new_ids if message_id not in emails)
+            gmail_sync_store.record_messages(mailbox, [
+                (message_id, message_received_at(email_data), parse_discount_alert_email(email_data, discount_config))
+                for message_id, email_data in emails.items()
+            ])
+            sync.commit(batch, failed_ids)
+            return gmail_sync_store.results_since(mailbox, window_start)
+        
+        alerts = safe_google_api_call(user_record, api_call)
         return alerts if alerts else fetch_mock_discount_alerts()
         
     except Exception as e:
@@ -13945,13 +13908,14 @@ def internal_error(error):
     return jsonify({'error': 'Internal server error'}), 500
 
 # Product image caching and queue system
-product_image_cache = {}
 IMAGE_CACHE_EXPIRY_HOURS = 24
+product_image_cache = get_cache('product_image', ttl_seconds=IMAGE_CACHE_EXPIRY_HOURS * 3600, max_entries=20000)
 image_queue = []
 queue_lock = threading.Lock()
 queue_worker_running = False
-last_amazon_request_time = 0
 MIN_REQUEST_INTERVAL = 1.5  # Balanced interval - 1.5 seconds between requests
+# Every worker runs its own image queue; the interval holds across all of them
+amazon_request_spacer = RequestSpacer(AMAZON_REQUEST_LOCK_PATH, MIN_REQUEST_INTERVAL)
 
 import time
 import random
@@ -14022,16 +13986,8 @@ def get_amazon_session():
     return amazon_session
 
 def rate_limit_amazon_request():
-    """Ensure we don't make requests too frequently to Amazon"""
-    global last_amazon_request_time
-    current_time = time.time()
-    time_since_last = current_time - last_amazon_request_time
-    
-    if time_since_last < MIN_REQUEST_INTERVAL:
-        sleep_time = MIN_REQUEST_INTERVAL - time_since_last + random.uniform(0.2, 0.8)
-        time.sleep(sleep_time)
-    
-    last_amazon_request_time = time.time()
+    """Ensure we don't make requests too frequently to Amazon (from any worker process)"""
+    amazon_request_spacer.wait(jitter=lambda: random.uniform(0.2, 0.8))
 
 def fetch_amazon_page_with_retry(asin, max_retries=2):
     """Fetch Amazon page with sophisticated anti-detection and retry logic"""
@@ -14163,9 +14119,7 @@ def queue_worker():
             # Check if already cached while in queue
             cache_key = f"image_{asin}"
             if cache_key in product_image_cache:
-                cached_data = product_image_cache[cache_key]
-                if cached_data.get('timestamp') and (datetime.now() - cached_data['timestamp']).total_seconds() < IMAGE_CACHE_EXPIRY_HOURS * 3600:
-                    continue
+                continue
             
             # Try to fetch the image with very conservative approach
             response = fetch_amazon_page_with_retry(asin, max_retries=1)
@@ -14182,10 +14136,10 @@ def queue_worker():
                         for attr in ['data-old-hires', 'data-a-hires', 'src', 'data-src']:
                             url = img.get(attr)
                             if url and url.startswith('http'):
-                                product_image_cache[cache_key] = {
+                                product_image_cache.set(cache_key, {
                                     'image_url': url,
                                     'timestamp': datetime.now()
-                                }
+                                })
                                 print(f"Successfully cached image for {asin}")
                                 break
                         if cache_key in product_image_cache:
@@ -14320,8 +14274,8 @@ def proxy_product_image_logic(asin):
         cache_key = f"image_{asin}"
         image_url = None
         
-        if cache_key in product_image_cache:
-            cached_data = product_image_cache[cache_key]
+        cached_data = product_image_cache.get(cache_key, None)
+        if cached_data:
             image_url = cached_data.get('image_url')
         
         if not image_url:
@@ -14371,10 +14325,10 @@ def get_product_image(asin):
         cache_key = f"image_{asin}"
         now = datetime.now()
         
-        if cache_key in product_image_cache:
-            cached_data = product_image_cache[cache_key]
+        cached_data = product_image_cache.get(cache_key, None)
+        if cached_data:
             cache_time = cached_data.get('timestamp')
-            if cache_time and (now - cache_time).total_seconds() < IMAGE_CACHE_EXPIRY_HOURS * 3600:
+            if cache_time:
                 return jsonify({
                     'asin': asin,
                     'image_url': cached_data['image_url'],
@@ -14434,10 +14388,10 @@ def get_product_image(asin):
         
         # If we found an image, cache it and return
         if image_url:
-            product_image_cache[cache_key] = {
+            product_image_cache.set(cache_key, {
                 'image_url': image_url,
                 'timestamp': now
-            }
+            })
             
             return jsonify({
                 'asin': asin,
@@ -14483,10 +14437,10 @@ def get_product_images_batch():
         # Check cache for all ASINs first
         for asin in asins:
             cache_key = f"image_{asin}"
-            if cache_key in product_image_cache:
-                cached_data = product_image_cache[cache_key]
+            cached_data = product_image_cache.get(cache_key, None)
+            if cached_data:
                 cache_time = cached_data.get('timestamp')
-                if cache_time and (now - cache_time).total_seconds() < IMAGE_CACHE_EXPIRY_HOURS * 3600:
+                if cache_time:
                     results[asin] = {
                         'image_url': cached_data['image_url'],
                         'cached': True
@@ -14527,10 +14481,10 @@ def get_product_images_batch():
                                 # Try data-old-hires first (high-res), then src
                                 scraped_url = img.get('data-old-hires') or img.get('src')
                                 if scraped_url and scraped_url.startswith('http'):
-                                    product_image_cache[f"image_{asin}"] = {
+                                    product_image_cache.set(f"image_{asin}", {
                                         'image_url': scraped_url,
                                         'timestamp': now
-                                    }
+                                    })
                                     results[asin] = {
                                         'image_url': scraped_url,
                                         'cached': False,
@@ -14551,10 +14505,10 @@ def get_product_images_batch():
                         associate_url = f'https://ws-na.amazon-adsystem.com/widgets/q?_encoding=UTF8&ASIN={asin}&Format=_SL250_&ID=AsinImage&MarketPlace=US&ServiceVersion=20070822&WS=1'
                         response = requests.head(associate_url, timeout=5)
                         if response.status_code == 200:
-                            product_image_cache[f"image_{asin}"] = {
+                            product_image_cache.set(f"image_{asin}", {
                                 'image_url': associate_url,
                                 'timestamp': now
-                            }
+                            })
                             results[asin] = {
                                 'image_url': associate_url,
                                 'cached': False,
@@ -14831,17 +14785,18 @@ def test_image_simple(asin):
 @login_required
 def get_image_status():
     """Get status of image caching and rate limiting"""
-    global last_amazon_request_time, product_image_cache
+    global product_image_cache
     
     current_time = time.time()
-    time_since_last = current_time - last_amazon_request_time
+    time_since_last = current_time - amazon_request_spacer.last_request()
     
     return jsonify({
         'cache_size': len(product_image_cache),
+        'cache_stats': product_image_cache.stats(),
         'last_request_ago_seconds': time_since_last,
         'min_interval_seconds': MIN_REQUEST_INTERVAL,
         'can_make_request_now': time_since_last >= MIN_REQUEST_INTERVAL,
-        'cache_sample': list(product_image_cache.keys())[:5] if product_image_cache else [],
+        'cache_sample': product_image_cache.keys(limit=5),
         'queue_size': len(image_queue),
         'queue_sample': image_queue[:5] if image_queue else []
     })
@@ -14857,10 +14812,10 @@ def check_images_ready():
         results = {}
         for asin in asins:
             cache_key = f"image_{asin}"
-            if cache_key in product_image_cache:
-                cached_data = product_image_cache[cache_key]
+            cached_data = product_image_cache.get(cache_key, None)
+            if cached_data:
                 cache_time = cached_data.get('timestamp')
-                if cache_time and (datetime.now() - cache_time).total_seconds() < IMAGE_CACHE_EXPIRY_HOURS * 3600:
+                if cache_time:
                     results[asin] = {
                         'ready': True,
                         'image_url': cached_data['image_url'],
@@ -15364,7 +15319,7 @@ def get_purchases():
                 
                 # Get stock and sales data
                 stock_df = analyzer.download_csv(stock_url)
-                stock_info = analyzer.get_stock_info(stock_df)
+                stock_index = analyzer.get_stock_index(stock_df)
                 
                 orders_df = analyzer.download_csv(orders_url)
                 target_date = date.today()
@@ -15379,8 +15334,8 @@ def get_purchases():
                 # Update purchases with live data
                 for purchase in purchases:
                     asin = extract_asin_from_url(purchase.get('sell_link', ''))
-                    if asin and asin in stock_info:
-                        stock_data = stock_info[asin]
+                    if asin and asin in stock_index:
+                        stock_data = stock_index.record(asin)
                         purchase['current_stock'] = stock_data.get('FBA/FBM Stock', 0)
                         purchase['spm'] = monthly_sales.get(asin, 0)
                         purchase['asin'] = asin
@@ -15550,14 +15505,12 @@ def migrate_purchases_to_s3():
         print(f"Found {len(existing_purchases)} existing purchases in S3")
         
         # Get all purchases from SQLite
-        cursor.execute("SELECT * FROM purchases ORDER BY created_at DESC")
-        sqlite_purchases = cursor.fetchall()
+        sqlite_purchases = app_db.fetch_dicts("SELECT * FROM purchases ORDER BY created_at DESC")
         print(f"Found {len(sqlite_purchases)} purchases in SQLite")
         
         # Convert SQLite purchases to S3 format
         migrated_count = 0
-        for row in sqlite_purchases:
-            purchase_dict = dict(zip([col[0] for col in cursor.description], row))
+        for purchase_dict in sqlite_purchases:
             
             # Check if this purchase already exists in S3 (by ID and user_id)
             purchase_exists = any(
@@ -15637,19 +15590,15 @@ def debug_purchases():
         debug_info = {}
         
         # Get total purchase count
-        cursor.execute("SELECT COUNT(*) FROM purchases")
-        debug_info['total_purchases'] = cursor.fetchone()[0]
+        debug_info['total_purchases'] = app_db.fetchone("SELECT COUNT(*) FROM purchases")[0]
         
         # Get purchases by user
-        cursor.execute("SELECT user_id, COUNT(*) as count FROM purchases GROUP BY user_id")
-        debug_info['purchases_by_user'] = dict(cursor.fetchall())
+        debug_info['purchases_by_user'] = dict(app_db.fetchall("SELECT user_id, COUNT(*) as count FROM purchases GROUP BY user_id"))
         
         # Get all purchases with basic info
-        cursor.execute("SELECT id, user_id, name, created_at FROM purchases ORDER BY created_at DESC LIMIT 10")
-        recent_purchases = []
-        for row in cursor.fetchall():
-            recent_purchases.append(dict(zip([col[0] for col in cursor.description], row)))
-        debug_info['recent_purchases'] = recent_purchases
+        debug_info['recent_purchases'] = app_db.fetch_dicts(
+            "SELECT id, user_id, name, created_at FROM purchases ORDER BY created_at DESC LIMIT 10"
+        )
         
         # Get database file info
         import os
@@ -15673,35 +15622,36 @@ def debug_purchases():
         }), 500
 
 # Database initialization for purchases table
+def create_purchases_schema(db):
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS purchases (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            buy_link TEXT,
+            sell_link TEXT,
+            name TEXT,
+            price REAL DEFAULT 0,
+            target_quantity INTEGER DEFAULT 0,
+            purchased INTEGER DEFAULT 0,
+            notes TEXT,
+            va_notes TEXT,
+            asin TEXT,
+            current_stock INTEGER DEFAULT 0,
+            spm INTEGER DEFAULT 0,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # Create indexes separately for SQLite
+    db.execute("CREATE INDEX IF NOT EXISTS idx_purchases_user_id ON purchases (user_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_purchases_asin ON purchases (asin)")
+
 def init_purchases_table():
     """Initialize the purchases table if it doesn't exist"""
     try:
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS purchases (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT NOT NULL,
-                buy_link TEXT,
-                sell_link TEXT,
-                name TEXT,
-                price REAL DEFAULT 0,
-                target_quantity INTEGER DEFAULT 0,
-                purchased INTEGER DEFAULT 0,
-                notes TEXT,
-                va_notes TEXT,
-                asin TEXT,
-                current_stock INTEGER DEFAULT 0,
-                spm INTEGER DEFAULT 0,
-                status TEXT DEFAULT 'pending',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Create indexes separately for SQLite
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_purchases_user_id ON purchases (user_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_purchases_asin ON purchases (asin)")
-        
-        conn.commit()
+        app_db.migrate('purchases', create_purchases_schema)
         print("Purchases table initialized successfully")
     except Exception as e:
         print(f"Error initializing purchases table: {e}")
@@ -15729,6 +15679,7 @@ def clear_all_caches_for_demo_toggle():
     
     # Clear analytics cache
     analytics_cache.clear()
+    analytics_result_store.clear()
     
     # Clear file listing cache
     file_listing_cache.clear()
@@ -15971,22 +15922,31 @@ def get_inventory_age_analysis():
         
         # Calculate velocity for each product and add to enhanced_analytics
         try:
-            for asin in list(enhanced_analytics.keys()):  # Use list() to avoid dict size changed during iteration
+            analyzed_asins = list(enhanced_analytics.keys())
+            velocity_by_asin = analyzer.calculate_enhanced_velocity_batch(
+                orders_df, target_date, user_timezone, asins=analyzed_asins
+            )
+            # Restock quantities for every product in one array pass
+            restock_scores = analyzer.score_restock_batch(
+                analyzed_asins, velocity_by_asin, analyzer.get_stock_index(stock_df),
+                lead_time_days=90, purchase_analytics=purchase_insights
+            )
+            for position, asin in enumerate(analyzed_asins):
                 try:
                     # First ensure the ASIN data is properly structured
                     if not isinstance(enhanced_analytics[asin], dict):
                         enhanced_analytics[asin] = {'velocity': {'weighted_velocity': 0}, 'restock': {'current_stock': 0}}
                         continue
                     
-                    velocity_data = analyzer.calculate_enhanced_velocity(asin, orders_df, target_date, user_timezone)
+                    velocity_data = velocity_by_asin[asin]
+                    velocity_data.pop('units_sold', None)
                     enhanced_analytics[asin]['velocity'] = velocity_data
                     
-                    # Calculate restock data with monthly_purchase_adjustment
-                    stock_info_for_asin = stock_info.get(asin, {})
-                    restock_data = analyzer.calculate_optimal_restock_quantity(
-                        asin, velocity_data, stock_info_for_asin, 
-                        lead_time_days=90, purchase_analytics=purchase_insights
-                    )
+                    # Calculate restock data with monthly_purchase_adjustment (no stock row: insufficient data)
+                    if asin in stock_info:
+                        restock_data = restock_record(restock_scores, position, 90)
+                    else:
+                        restock_data = {'suggested_quantity': 0, 'reasoning': 'Insufficient data', 'monthly_purchase_adjustment': 0}
                     
                     # Ensure restock key exists before updating
                     if 'restock' not in enhanced_analytics[asin]:
@@ -16571,7 +16531,7 @@ def get_all_user_features():
         users = get_users_config()
         
         # Get all user feature access from database
-        cursor.execute('''
+        rows = app_db.fetchall('''
             SELECT discord_id, feature_key, has_access
             FROM user_feature_access
             WHERE has_access = 1
@@ -16581,7 +16541,7 @@ def get_all_user_features():
         for user in users:
             user_features[get_user_discord_id(user)] = {}
             
-        for row in cursor.fetchall():
+        for row in rows:
             discord_id, feature_key, has_access = row
             if discord_id not in user_features:
                 user_features[discord_id] = {}
@@ -16608,12 +16568,11 @@ def grant_user_feature_access():
         if not user_id or not feature_key:
             return jsonify({'error': 'User ID and feature key required'}), 400
         
-        cursor.execute('''
+        app_db.write('''
             INSERT OR REPLACE INTO user_feature_access (discord_id, feature_key, has_access, granted_by)
             VALUES (?, ?, ?, ?)
         ''', (user_id, feature_key, True, discord_id))
-        
-        conn.commit()
+        invalidate_feature_access_cache()
         
         # Also store in S3 users.json for persistence
         users = get_users_config()
@@ -16638,12 +16597,11 @@ def grant_user_feature_access():
 def revoke_user_feature_access(user_id, feature_key):
     """Revoke a user's access to a specific feature"""
     try:
-        cursor.execute('''
+        app_db.write('''
             DELETE FROM user_feature_access 
             WHERE discord_id = ? AND feature_key = ?
         ''', (user_id, feature_key))
-        
-        conn.commit()
+        invalidate_feature_access_cache()
         
         # Also remove from S3 users.json for persistence
         users = get_users_config()
@@ -16669,10 +16627,10 @@ def update_feature_settings(feature_key):
         is_beta = data.get('is_beta')
         
         if is_beta is not None:
-            cursor.execute('''
+            app_db.write('''
                 UPDATE features SET is_beta = ? WHERE feature_key = ?
             ''', (is_beta, feature_key))
-            conn.commit()
+            invalidate_feature_access_cache()
             
         return jsonify({'message': 'Feature settings updated successfully'})
     except Exception as e:
@@ -16685,21 +16643,20 @@ def update_feature_settings(feature_key):
 def get_all_groups():
     """Get all user groups"""
     try:
-        cursor.execute('''
+        rows = app_db.fetchall('''
             SELECT group_key, group_name, description, created_by, created_at
             FROM user_groups
             ORDER BY group_name
         ''')
         
         groups = []
-        for row in cursor.fetchall():
+        for row in rows:
             group_key, group_name, description, created_by, created_at = row
             
             # Get member count
-            cursor.execute('''
+            member_count = app_db.fetchone('''
                 SELECT COUNT(*) FROM user_group_members WHERE group_key = ?
-            ''', (group_key,))
-            member_count = cursor.fetchone()[0]
+            ''', (group_key,))[0]
             
             groups.append({
                 'group_key': group_key,
@@ -16728,12 +16685,10 @@ def create_group():
         if not group_key or not group_name:
             return jsonify({'error': 'Group key and name required'}), 400
         
-        cursor.execute('''
+        app_db.write('''
             INSERT INTO user_groups (group_key, group_name, description, created_by)
             VALUES (?, ?, ?, ?)
         ''', (group_key, group_name, description, discord_id))
-        
-        conn.commit()
         return jsonify({'message': 'Group created successfully'})
     except Exception as e:
         return jsonify({'error': f'Error creating group: {str(e)}'}), 500
@@ -16748,14 +16703,14 @@ def get_group_members(group_key):
         users_dict = {get_user_discord_id(user): user for user in users}
         
         # Get group members from database
-        cursor.execute('''
+        rows = app_db.fetchall('''
             SELECT discord_id, added_at
             FROM user_group_members
             WHERE group_key = ?
         ''', (group_key,))
         
         members = []
-        for row in cursor.fetchall():
+        for row in rows:
             discord_id, added_at = row
             if discord_id in users_dict:
                 user = users_dict[discord_id]
@@ -16782,12 +16737,11 @@ def add_group_member(group_key):
         if not user_id:
             return jsonify({'error': 'User ID required'}), 400
         
-        cursor.execute('''
+        app_db.write('''
             INSERT OR IGNORE INTO user_group_members (discord_id, group_key, added_by)
             VALUES (?, ?, ?)
         ''', (user_id, group_key, discord_id))
-        
-        conn.commit()
+        invalidate_feature_access_cache()
         return jsonify({'message': 'User added to group successfully'})
     except Exception as e:
         return jsonify({'error': f'Error adding user to group: {str(e)}'}), 500
@@ -16797,12 +16751,11 @@ def add_group_member(group_key):
 def remove_group_member(group_key, user_id):
     """Remove a user from a group"""
     try:
-        cursor.execute('''
+        app_db.write('''
             DELETE FROM user_group_members 
             WHERE group_key = ? AND discord_id = ?
         ''', (group_key, user_id))
-        
-        conn.commit()
+        invalidate_feature_access_cache()
         return jsonify({'message': 'User removed from group successfully'})
     except Exception as e:
         return jsonify({'error': f'Error removing user from group: {str(e)}'}), 500
@@ -16812,7 +16765,7 @@ def remove_group_member(group_key, user_id):
 def get_group_features(group_key):
     """Get feature access for a specific group"""
     try:
-        cursor.execute('''
+        rows = app_db.fetchall('''
             SELECT feature_key, has_access, granted_at
             FROM group_feature_access
             WHERE group_key = ?
@@ -16820,7 +16773,7 @@ def get_group_features(group_key):
         ''', (group_key,))
         
         features = {}
-        for row in cursor.fetchall():
+        for row in rows:
             feature_key, has_access, granted_at = row
             features[feature_key] = {
                 'has_access': bool(has_access),
@@ -16843,12 +16796,11 @@ def grant_group_feature_access(group_key):
         if not feature_key:
             return jsonify({'error': 'Feature key required'}), 400
         
-        cursor.execute('''
+        app_db.write('''
             INSERT OR REPLACE INTO group_feature_access (group_key, feature_key, has_access, granted_by)
             VALUES (?, ?, ?, ?)
         ''', (group_key, feature_key, True, discord_id))
-        
-        conn.commit()
+        invalidate_feature_access_cache()
         return jsonify({'message': 'Group feature access granted successfully'})
     except Exception as e:
         return jsonify({'error': f'Error granting group feature access: {str(e)}'}), 500
@@ -16858,12 +16810,11 @@ def grant_group_feature_access(group_key):
 def revoke_group_feature_access(group_key, feature_key):
     """Revoke a group's access to a specific feature"""
     try:
-        cursor.execute('''
+        app_db.write('''
             DELETE FROM group_feature_access 
             WHERE group_key = ? AND feature_key = ?
         ''', (group_key, feature_key))
-        
-        conn.commit()
+        invalidate_feature_access_cache()
         return jsonify({'message': 'Group feature access revoked successfully'})
     except Exception as e:
         return jsonify({'error': f'Error revoking group feature access: {str(e)}'}), 500
@@ -17091,8 +17042,9 @@ def get_email_monitoring_status():
         active_rules = len([r for r in rules if r.get('is_active')])
         
         # Check if email monitoring service is running
-        service_running = (email_monitor_instance is not None and 
-                          email_monitor_instance.is_running and 
+        # The service may be owned by another worker process
+        service_running = (((email_monitor_instance is not None and email_monitor_instance.is_running) or
+                            service_leader.held_elsewhere()) and
                           active_configs > 0 and active_rules > 0)
         
         # Format recent logs
@@ -17119,6 +17071,44 @@ def get_email_monitoring_status():
         print(f"Error getting email monitoring status: {e}")
         return jsonify({'error': 'Failed to get email monitoring status'}), 500
 
+@app.route('/api/email-monitoring/activity', methods=['GET'])
+@login_required
+def get_email_monitoring_activity():
+    """Page through a user's email monitoring activity, newest first"""
+    try:
+        discord_id = session['discord_id']
+        
+        if not has_feature_access(discord_id, 'email_monitoring'):
+            return jsonify({'error': 'Access denied to email monitoring feature'}), 403
+        
+        try:
+            limit = min(200, max(1, int(request.args.get('limit', 50))))
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        before = request.args.get('before') or None
+        
+        # Only the segments that can hold this page are read
+        logs = email_monitoring_manager.get_recent_logs(discord_id, limit, before)
+        
+        return jsonify({
+            'logs': [{
+                'id': log.get('id'),
+                'timestamp': log.get('timestamp'),
+                'rule_id': log.get('rule_id'),
+                'subject': log.get('email_subject'),
+                'sender': log.get('email_sender'),
+                'email_date': log.get('email_date'),
+                'email_body': log.get('email_body', ''),
+                'webhook_sent': log.get('webhook_sent', False),
+                'webhook_response': log.get('webhook_response')
+            } for log in logs],
+            'next_before': logs[-1].get('timestamp') if len(logs) == limit else None
+        })
+        
+    except Exception as e:
+        print(f"Error getting email monitoring activity: {e}")
+        return jsonify({'error': 'Failed to get email monitoring activity'}), 500
+
 @app.route('/api/email-monitoring/quick-setup', methods=['POST'])
 @login_required
 def quick_setup_yankee_candle():
@@ -17165,20 +17155,28 @@ def check_emails_now():
             return jsonify({'error': 'Access denied to email monitoring feature'}), 403
         
         # Check if monitoring is running
-        if not email_monitor_instance:
+        monitor = email_monitor_instance
+        if not monitor and service_leader.held_elsewhere():
+            # The service runs in another worker process; a manual cycle can run from this one
+            monitor = EmailMonitorS3()
+        if not monitor:
             return jsonify({'error': 'Email monitoring service is not running'}), 503
         
+        # One cycle at a time across workers: the scheduled one or another manual check
+        if email_check_lock.in_progress():
+            return jsonify({'error': 'An email check is already running. Results will appear in the activity log shortly.'}), 409
+        
         # Run an email check cycle in a separate thread to avoid blocking
         # Manual checks do not send webhooks, only update activity logs
         check_thread = threading.Thread(
-            target=lambda: email_monitor_instance.run_email_check_cycle(send_webhooks=False),
+            target=lambda: monitor.run_email_check_cycle(send_webhooks=False),
             daemon=True
         )
         check_thread.start()
         
         return jsonify({
             'message': 'Email check initiated (webhooks disabled for manual checks). Results will appear in the activity log shortly.',
-            'check_interval_hours': email_monitor_instance.check_interval / 3600
+            'check_interval_hours': monitor.check_interval / 3600
         })
         
     except Exception as e:
@@ -17195,18 +17193,15 @@ def debug_email_monitoring():
         if not has_feature_access(discord_id, 'email_monitoring'):
             return jsonify({'error': 'Access denied to email monitoring feature'}), 403
         
-        local_conn = sqlite3.connect(DATABASE_FILE)
-        local_cursor = local_conn.cursor()
-        
         # Check email configurations
-        local_cursor.execute('''
+        rows = app_db.fetchall('''
             SELECT discord_id, email_address, imap_server, imap_port, username, is_active, last_checked
             FROM email_monitoring 
             WHERE discord_id = ?
         ''', (discord_id,))
         
         configs = []
-        for row in local_cursor.fetchall():
+        for row in rows:
             configs.append({
                 'discord_id': row[0],
                 'email_address': row[1],
@@ -17218,14 +17213,14 @@ def debug_email_monitoring():
             })
         
         # Check monitoring rules
-        local_cursor.execute('''
+        rows = app_db.fetchall('''
             SELECT id, rule_name, sender_filter, subject_filter, content_filter, webhook_url, is_active
             FROM email_monitoring_rules 
             WHERE discord_id = ?
         ''', (discord_id,))
         
         rules = []
-        for row in local_cursor.fetchall():
+        for row in rows:
             rules.append({
                 'id': row[0],
                 'rule_name': row[1],
@@ -17237,7 +17232,7 @@ def debug_email_monitoring():
             })
         
         # Check recent logs
-        local_cursor.execute('''
+        rows = app_db.fetchall('''
             SELECT created_at, rule_id, email_subject, email_sender, email_date, webhook_sent, webhook_response
             FROM email_monitoring_logs 
             WHERE discord_id = ?
@@ -17246,7 +17241,7 @@ def debug_email_monitoring():
         ''', (discord_id,))
         
         logs = []
-        for row in local_cursor.fetchall():
+        for row in rows:
             logs.append({
                 'timestamp': row[0],
                 'rule_id': row[1],
@@ -17257,10 +17252,8 @@ def debug_email_monitoring():
                 'webhook_response': row[6]
             })
         
-        local_conn.close()
-        
         return jsonify({
-            'service_running': email_monitor_instance is not None,
+            'service_running': email_monitor_instance is not None or service_leader.held_elsewhere(),
             'configurations': configs,
             'rules': rules,
             'recent_logs': logs,
@@ -17292,23 +17285,16 @@ def reset_email_monitoring_password():
         from email_monitor import email_cipher
         encrypted_password = email_cipher.encrypt(new_password.encode()).decode()
         
-        local_conn = sqlite3.connect(DATABASE_FILE)
-        local_cursor = local_conn.cursor()
-        
         # Update the password for this user's configuration
-        local_cursor.execute('''
+        updated = app_db.write('''
             UPDATE email_monitoring 
             SET password_encrypted = ?
             WHERE discord_id = ? AND email_address = ?
         ''', (encrypted_password, discord_id, email_address))
         
-        if local_cursor.rowcount == 0:
-            local_conn.close()
+        if updated == 0:
             return jsonify({'error': 'Email configuration not found'}), 404
         
-        local_conn.commit()
-        local_conn.close()
-        
         return jsonify({'message': 'Password updated successfully'})
         
     except Exception as e:
@@ -17461,7 +17447,7 @@ def set_email_monitoring_webhook():
         print(f"Error setting email monitoring webhook: {e}")
         return jsonify({'error': 'Failed to save webhook configuration'}), 500
         
-        local_cursor.execute('''
+        row = app_db.fetchone('''
             SELECT webhook_url, webhook_name, is_active, created_at, updated_at
             FROM email_monitoring_webhook_config
             WHERE is_active = 1
@@ -17469,9 +17455,6 @@ def set_email_monitoring_webhook():
             LIMIT 1
         ''')
         
-        row = local_cursor.fetchone()
-        local_conn.close()
-        
         if row:
             return jsonify({
                 'configured': True,
@@ -17544,14 +17527,8 @@ def test_email_monitoring_webhook():
 def delete_email_monitoring_webhook():
     """Delete the system-wide email monitoring webhook configuration"""
     try:
-        local_conn = sqlite3.connect(DATABASE_FILE)
-        local_cursor = local_conn.cursor()
-        
         # Delete all webhook configurations
-        local_cursor.execute('DELETE FROM email_monitoring_webhook_config')
-        
-        local_conn.commit()
-        local_conn.close()
+        app_db.write('DELETE FROM email_monitoring_webhook_config')
         
         return jsonify({'message': 'Webhook configuration deleted successfully'})
         
@@ -17568,7 +17545,7 @@ def control_email_monitoring_service():
         action = data.get('action')  # 'start' or 'stop'
         
         if action == 'start':
-            if email_monitor_thread and email_monitor_thread.is_alive():
+            if (email_monitor_thread and email_monitor_thread.is_alive()) or service_leader.held_elsewhere():
                 return jsonify({'message': 'Email monitoring service is already running'})
             
             start_email_monitoring()
@@ -17585,6 +17562,26 @@ def control_email_monitoring_service():
         print(f"Error controlling email monitoring service: {e}")
         return jsonify({'error': f'Failed to {action} email monitoring service'}), 500
 
+@app.route('/api/admin/email-monitoring/cycle-metrics', methods=['GET'])
+@admin_required
+def get_email_monitoring_cycle_metrics():
+    """Duration and per-provider metrics of the last email check cycle, for sizing the worker pool"""
+    try:
+        # The service may run in another worker process, so the last automated cycle comes from S3
+        status = email_monitoring_manager.get_service_status()
+        local_metrics = email_monitor_instance.last_cycle_metrics if email_monitor_instance else None
+        
+        return jsonify({
+            'last_cycle': status.get('last_cycle_metrics'),
+            'last_check_run': status.get('last_check_run'),
+            'check_in_progress': status.get('check_in_progress', False),
+            'local_last_cycle': local_metrics
+        })
+        
+    except Exception as e:
+        print(f"Error getting email monitoring cycle metrics: {e}")
+        return jsonify({'error': 'Failed to get cycle metrics'}), 500
+
 # ================================
 # Discount Email Configuration API
 # ================================
@@ -17610,10 +17607,7 @@ def get_discount_email_config_status():
             })
         
         # Fallback to database for backward compatibility
-        local_conn = sqlite3.connect(DATABASE_FILE)
-        local_cursor = local_conn.cursor()
-        
-        local_cursor.execute('''
+        row = app_db.fetchone('''
             SELECT id, email_address, config_type, imap_server, imap_port, username, 
                    gmail_access_token, is_active, created_at, last_updated
             FROM discount_email_config
@@ -17622,9 +17616,6 @@ def get_discount_email_config_status():
             LIMIT 1
         ''')
         
-        row = local_cursor.fetchone()
-        local_conn.close()
-        
         if row:
             id_val, email, config_type, server, port, username, gmail_token, is_active, created, updated = row
             config_data = {
@@ -17717,8 +17708,7 @@ def update_discount_email_config():
         
         # Clear cache to force refresh
         cache_key = f"config_discount_email_config"
-        if cache_key in config_cache:
-            del config_cache[cache_key]
+        config_cache.delete(cache_key)
             
         # Clear discount opportunities cache to force refresh with new email
         if 'discount_opportunities_cache' in globals():
@@ -17780,12 +17770,7 @@ def clear_discount_cache():
             discount_opportunities_cache = {}
         
         # Clear database cache
-        local_conn = sqlite3.connect(DATABASE_FILE)
-        local_cursor = local_conn.cursor()
-        
-        local_cursor.execute('DELETE FROM discount_opportunities_cache')
-        local_conn.commit()
-        local_conn.close()
+        app_db.write('DELETE FROM discount_opportunities_cache')
         
         return jsonify({'message': 'Discount opportunities cache cleared successfully'})
         
@@ -17896,8 +17881,7 @@ def complete_discount_gmail_oauth():
         
         # Clear any cached discount email config
         cache_key = f"config_discount_email_config"
-        if cache_key in config_cache:
-            del config_cache[cache_key]
+        config_cache.delete(cache_key)
         
         # Clean up session
         session.pop('discount_email_setup', None)
@@ -18305,6 +18289,67 @@ def update_seller_costs():
         traceback.print_exc()
         return jsonify({'error': f'Failed to update seller costs: {str(e)}'}), 500
 
+# ─── BACKGROUND ANALYTICS PRECOMPUTE ───────────────────────────────────────
+
+def list_precompute_users():
+    """(discord_id, timezone) for every user; eligibility is decided per user at compute time"""
+    for user in get_users_config():
+        discord_id = get_user_field(user, 'identity.discord_id')
+        if discord_id:
+            yield discord_id, get_user_field(user, 'profile.timezone')
+
+def compute_precomputed_analytics(discord_id, target_date):
+    """Build the same payload /api/analytics/orders would cache, for Sellerboard-backed users"""
+    user_record = get_user_record(discord_id)
+    if not user_record:
+        return None
+    config_user_record = get_config_user_for_subuser(user_record)
+    
+    # Admins on SP-API are computed live
+    disable_sp_api = get_user_field(config_user_record, 'integrations.amazon.disable_sp_api') or config_user_record.get('disable_sp_api', False)
+    if is_admin_user(discord_id) and not disable_sp_api:
+        return None
+    
+    orders_url = get_user_field(config_user_record, 'integrations.sellerboard.orders_url')
+    stock_url = get_user_field(config_user_record, 'integrations.sellerboard.stock_url')
+    if not orders_url or not stock_url:
+        return None
+    
+    user_timezone = get_user_field(user_record, 'profile.timezone')
+    analysis = run_sellerboard_analytics(discord_id, user_record, config_user_record, target_date, user_timezone)
+    analysis['source'] = 'sellerboard'
+    analysis['message'] = 'Using Sellerboard data (SP-API disabled)' if is_admin_user(discord_id) else 'Using Sellerboard data'
+    return finalize_orders_analytics(analysis, target_date, user_timezone)
+
+analytics_precompute_scheduler = AnalyticsPrecomputeScheduler(
+    list_users=list_precompute_users,
+    compute=compute_precomputed_analytics,
+    cache_key=get_cache_key,
+    store=analytics_result_store,
+    max_age_seconds=CACHE_EXPIRY_HOURS * 3600
+)
+
+@app.route('/api/admin/analytics-precompute/status', methods=['GET'])
+@admin_required
+def analytics_precompute_status():
+    """Per-user state of the background analytics precompute"""
+    return jsonify(analytics_precompute_scheduler.status())
+
+@app.route('/api/admin/cache-stats', methods=['GET'])
+@admin_required
+def get_cache_stats():
+    """Entries, hit/miss counters and evictions for every app cache in this worker"""
+    return jsonify(cache_stats())
+
+def start_background_services():
+    """Singleton services; under gunicorn only the elected worker runs them"""
+    start_email_monitoring()
+    if ANALYTICS_PRECOMPUTE_ENABLED and not DEMO_MODE:
+        analytics_precompute_scheduler.start()
+        atexit.register(analytics_precompute_scheduler.stop)
+
+service_leader.run_when_leader(start_background_services)
+
 if __name__ == '__main__':
     try:
         # Production configuration for Railway
@@ -18326,6 +18371,7 @@ if __name__ == '__main__':
         
         # Railway expects the app to be available on 0.0.0.0 and the PORT env var
         pass  # Debug print removed
+        # Development server; production runs gunicorn -c gunicorn.conf.py wsgi:app
         app.run(
             host='0.0.0.0', 
             port=port, 
@@ -0,0 +1,336 @@
+"""
+Pluggable TTL/LRU cache used for the app's analytics, config, session, file listing
+and product image caches.
+
+Every cache is a ``CacheNamespace`` with its own TTL and entry bound, backed by one of:
+
+* ``MemoryCacheBackend`` - per-process OrderedDicts (the previous behaviour, now bounded)
+* ``SQLiteCacheBackend`` - one WAL-mode SQLite file shared by every worker process on
+  the host, so a result computed or invalidated by one gunicorn worker is seen by all
+
+The backend is chosen with ``CACHE_BACKEND`` (``memory`` or ``sqlite``). Expired entries
+are dropped lazily on read; size bounds evict the least recently used entries on write.
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory').lower()
+CACHE_DB_PATH = os.getenv('CACHE_DB_PATH', 'app_cache.db')
+
+# Returned by get() on a miss, so None and empty values can be cached
+CACHE_MISS = object()
+
+
+class MemoryCacheBackend:
+    """In-process backend: an LRU-ordered dict of (value, expires_at) per namespace"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._namespaces: Dict[str, "OrderedDict[str, Tuple[Any, Optional[float]]]"] = {}
+
+    def _entries(self, namespace: str) -> "OrderedDict[str, Tuple[Any, Optional[float]]]":
+        entries = self._namespaces.get(namespace)
+        if entries is None:
+            entries = self._namespaces[namespace] = OrderedDict()
+        return entries
+
+    def get(self, namespace: str, key: str) -> Any:
+        with self._lock:
+            entries = self._entries(namespace)
+            entry = entries.get(key)
+            if entry is None:
+                return CACHE_MISS
+            value, expires_at = entry
+            if expires_at is not None and time.time() >= expires_at:
+                del entries[key]
+                return CACHE_MISS
+            entries.move_to_end(key)
+            return value
+
+    def set(self, namespace: str, key: str, value: Any, ttl_seconds: Optional[float], max_entries: Optional[int]) -> int:
+        """Store a value; returns the number of entries evicted to respect ``max_entries``"""
+        expires_at = time.time() + ttl_seconds if ttl_seconds else None
+        evicted = 0
+        with self._lock:
+            entries = self._entries(namespace)
+            entries[key] = (value, expires_at)
+            entries.move_to_end(key)
+            if max_entries:
+                while len(entries) > max_entries:
+                    entries.popitem(last=False)
+                    evicted += 1
+        return evicted
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            self._entries(namespace).pop(key, None)
+
+    def delete_prefix(self, namespace: str, prefix: str) -> int:
+        with self._lock:
+            entries = self._entries(namespace)
+            doomed = [key for key in entries if key.startswith(prefix)]
+            for key in doomed:
+                del entries[key]
+            return len(doomed)
+
+    def clear(self, namespace: str):
+        with self._lock:
+            self._entries(namespace).clear()
+
+    def keys(self, namespace: str, limit: Optional[int] = None) -> List[str]:
+        now = time.time()
+        with self._lock:
+            keys = [key for key, (_, expires_at) in self._entries(namespace).items() if expires_at is None or expires_at > now]
+        return keys[:limit] if limit is not None else keys
+
+    def count(self, namespace: str) -> int:
+        with self._lock:
+            return len(self._entries(namespace))
+
+
+class SQLiteCacheBackend:
+    """Cross-process backend: pickled values in a WAL-mode SQLite table"""
+
+    # Reads only refresh an entry's LRU position when it is older than this, to keep
+    # cache hits from turning into a write each
+    TOUCH_INTERVAL_SECONDS = 30
+
+    def __init__(self, db_path: str = CACHE_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        # Connections are per thread, and re-opened in a forked worker process
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.execute('''
+                        CREATE TABLE IF NOT EXISTS cache_entries (
+                            namespace TEXT NOT NULL,
+                            key TEXT NOT NULL,
+                            value BLOB NOT NULL,
+                            expires_at REAL,
+                            last_access REAL NOT NULL,
+                            PRIMARY KEY (namespace, key)
+                        )
+                    ''')
+                    conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_entries_lru ON cache_entries (namespace, last_access)')
+                    self._schema_ready = True
+        return conn
+
+    def get(self, namespace: str, key: str) -> Any:
+        conn = self._conn()
+        row = conn.execute(
+            'SELECT value, expires_at, last_access FROM cache_entries WHERE namespace = ? AND key = ?',
+            (namespace, key)
+        ).fetchone()
+        if row is None:
+            return CACHE_MISS
+        value, expires_at, last_access = row
+        now = time.time()
+        if expires_at is not None and now >= expires_at:
+            conn.execute('DELETE FROM cache_entries WHERE namespace = ? AND key = ?', (namespace, key))
+            return CACHE_MISS
+        if now - last_access > self.TOUCH_INTERVAL_SECONDS:
+            conn.execute('UPDATE cache_entries SET last_access = ? WHERE namespace = ? AND key = ?', (now, namespace, key))
+        try:
+            return pickle.loads(value)
+        except Exception:
+            return CACHE_MISS
+
+    def set(self, namespace: str, key: str, value: Any, ttl_seconds: Optional[float], max_entries: Optional[int]) -> int:
+        now = time.time()
+        expires_at = now + ttl_seconds if ttl_seconds else None
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at, last_access) VALUES (?, ?, ?, ?, ?)',
+                (namespace, key, blob, expires_at, now)
+            )
+            evicted = 0
+            if max_entries:
+                # Expired rows go first, then the least recently used beyond the bound
+                evicted += conn.execute(
+                    'DELETE FROM cache_entries WHERE namespace = ? AND expires_at IS NOT NULL AND expires_at <= ?',
+                    (namespace, now)
+                ).rowcount
+                count = conn.execute('SELECT COUNT(*) FROM cache_entries WHERE namespace = ?', (namespace,)).fetchone()[0]
+                if count > max_entries:
+                    evicted += conn.execute(
+                        'DELETE FROM cache_entries WHERE rowid IN ('
+                        'SELECT rowid FROM cache_entries WHERE namespace = ? ORDER BY last_access LIMIT ?)',
+                        (namespace, count - max_entries)
+                    ).rowcount
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return evicted
+
+    def delete(self, namespace: str, key: str):
+        self._conn().execute('DELETE FROM cache_entries WHERE namespace = ? AND key = ?', (namespace, key))
+
+    def delete_prefix(self, namespace: str, prefix: str) -> int:
+        escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return self._conn().execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND key LIKE ? ESCAPE '\\'",
+            (namespace, escaped + '%')
+        ).rowcount
+
+    def clear(self, namespace: str):
+        self._conn().execute('DELETE FROM cache_entries WHERE namespace = ?', (namespace,))
+
+    def keys(self, namespace: str, limit: Optional[int] = None) -> List[str]:
+        rows = self._conn().execute(
+            'SELECT key FROM cache_entries WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?) '
+            'ORDER BY last_access LIMIT ?',
+            (namespace, time.time(), -1 if limit is None else limit)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def count(self, namespace: str) -> int:
+        return self._conn().execute('SELECT COUNT(*) FROM cache_entries WHERE namespace = ?', (namespace,)).fetchone()[0]
+
+
+class CacheNamespace:
+    """One named cache with its own TTL and size bound, plus hit/miss counters"""
+
+    def __init__(self, backend, name: str, ttl_seconds: Optional[float] = None, max_entries: Optional[int] = None):
+        self.backend = backend
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.evictions = 0
+        self.errors = 0
+
+    def get(self, key: str, default: Any = CACHE_MISS) -> Any:
+        """Cached value, or ``default`` (``CACHE_MISS`` unless given) when absent or expired"""
+        try:
+            value = self.backend.get(self.name, key)
+        except Exception as e:
+            print(f"Cache '{self.name}' read failed: {e}")
+            value = CACHE_MISS
+            with self._stats_lock:
+                self.errors += 1
+        with self._stats_lock:
+            if value is CACHE_MISS:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return default if value is CACHE_MISS else value
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        try:
+            evicted = self.backend.set(self.name, key, value, ttl_seconds or self.ttl_seconds, self.max_entries)
+        except Exception as e:
+            print(f"Cache '{self.name}' write failed: {e}")
+            with self._stats_lock:
+                self.errors += 1
+            return
+        with self._stats_lock:
+            self.sets += 1
+            self.evictions += evicted
+
+    def delete(self, key: str):
+        try:
+            self.backend.delete(self.name, key)
+        except Exception as e:
+            print(f"Cache '{self.name}' delete failed: {e}")
+
+    def delete_prefix(self, prefix: str) -> int:
+        """Invalidate every key starting with ``prefix`` (e.g. all entries of one user)"""
+        try:
+            return self.backend.delete_prefix(self.name, prefix)
+        except Exception as e:
+            print(f"Cache '{self.name}' delete failed: {e}")
+            return 0
+
+    def clear(self):
+        try:
+            self.backend.clear(self.name)
+        except Exception as e:
+            print(f"Cache '{self.name}' clear failed: {e}")
+
+    def keys(self, limit: Optional[int] = None) -> List[str]:
+        try:
+            return self.backend.keys(self.name, limit)
+        except Exception:
+            return []
+
+    def __contains__(self, key: str) -> bool:
+        try:
+            return self.backend.get(self.name, key) is not CACHE_MISS
+        except Exception:
+            return False
+
+    def __len__(self) -> int:
+        try:
+            return self.backend.count(self.name)
+        except Exception:
+            return 0
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': type(self.backend).__name__,
+                'entries': len(self),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'sets': self.sets,
+                'evictions': self.evictions,
+                'errors': self.errors,
+            }
+
+
+def create_cache_backend(kind: str = CACHE_BACKEND, db_path: str = CACHE_DB_PATH):
+    if kind == 'sqlite':
+        return SQLiteCacheBackend(db_path)
+    if kind != 'memory':
+        print(f"Unknown CACHE_BACKEND '{kind}', using in-memory cache")
+    return MemoryCacheBackend()
+
+
+# Shared by every cache namespace in the process
+cache_backend = create_cache_backend()
+_namespaces: Dict[str, CacheNamespace] = {}
+_namespaces_lock = threading.Lock()
+
+
+def get_cache(name: str, ttl_seconds: Optional[float] = None, max_entries: Optional[int] = None) -> CacheNamespace:
+    """Create (or return the existing) namespace ``name`` on the configured backend"""
+    with _namespaces_lock:
+        namespace = _namespaces.get(name)
+        if namespace is None:
+            namespace = _namespaces[name] = CacheNamespace(cache_backend, name, ttl_seconds, max_entries)
+        return namespace
+
+
+def cache_stats() -> Dict[str, dict]:
+    with _namespaces_lock:
+        namespaces = list(_namespaces.values())
+    return {namespace.name: namespace.stats() for namespace in namespaces}
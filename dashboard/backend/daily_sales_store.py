@@ -0,0 +1,138 @@
+"""
+Per-user, per-ASIN daily unit sales history.
+
+A Sellerboard orders export only covers about 30 days, so velocity could never look
+further back than that, and the day-over-day comparison read a single
+``yesterday_sales.json`` shared by every user. Each analysis run now folds the
+complete days of its export into this SQLite store, writing only days that are not
+stored yet plus the last ``DAILY_SALES_REFRESH_DAYS`` (late status changes still move
+those). Long-horizon velocity and seasonality then read pre-aggregated
+``(day, asin, units)`` rows instead of re-downloading or re-parsing orders.
+
+``daily_sales_days`` records which days are complete, so a day without sales is
+distinguishable from a day that was never recorded.
+"""
+
+import os
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional, Set, Tuple
+
+import numpy as np
+import pytz
+
+from db_access import Database
+
+DAILY_SALES_DB = os.getenv('DAILY_SALES_DB', 'daily_sales.db')
+DAILY_SALES_REFRESH_DAYS = int(os.getenv('DAILY_SALES_REFRESH_DAYS', '3'))
+DAILY_SALES_RETENTION_DAYS = int(os.getenv('DAILY_SALES_RETENTION_DAYS', '730'))
+
+
+def latest_complete_day(user_timezone: Optional[str]) -> date:
+    """Yesterday in the user's timezone (server local time when unset or unknown)"""
+    now = datetime.now()
+    if user_timezone:
+        try:
+            now = datetime.now(pytz.timezone(user_timezone))
+        except pytz.UnknownTimeZoneError:
+            pass
+    return now.date() - timedelta(days=1)
+
+
+def create_daily_sales_schema(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_sales (
+            discord_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            asin TEXT NOT NULL,
+            units INTEGER NOT NULL,
+            PRIMARY KEY (discord_id, day, asin)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_sales_days (
+            discord_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            recorded_at REAL NOT NULL,
+            PRIMARY KEY (discord_id, day)
+        ) WITHOUT ROWID
+    ''')
+
+
+class DailySalesStore:
+    """Append-mostly daily unit sales per user and ASIN (only non-zero days are stored)"""
+
+    def __init__(self, db_path: str = DAILY_SALES_DB):
+        self.db = Database(db_path)
+
+    def _ready(self) -> Database:
+        self.db.migrate('daily_sales', create_daily_sales_schema)
+        return self.db
+
+    def recorded_days(self, discord_id: str, start: date, end: date) -> Set[date]:
+        rows = self._ready().fetchall(
+            'SELECT day FROM daily_sales_days WHERE discord_id = ? AND day BETWEEN ? AND ?',
+            (str(discord_id), start.isoformat(), end.isoformat())
+        )
+        return {date.fromisoformat(day) for (day,) in rows}
+
+    def record_days(self, discord_id: str, day_sales: Dict[date, Dict[str, int]]) -> int:
+        """Replace the stored sales of the given (complete) days; returns the number of days written"""
+        if not day_sales:
+            return 0
+        discord_id = str(discord_id)
+        recorded_at = time.time()
+        with self._ready().transaction() as conn:
+            for day, sales in day_sales.items():
+                conn.execute('DELETE FROM daily_sales WHERE discord_id = ? AND day = ?', (discord_id, day.isoformat()))
+                conn.executemany(
+                    'INSERT INTO daily_sales (discord_id, day, asin, units) VALUES (?, ?, ?, ?)',
+                    [(discord_id, day.isoformat(), asin, int(units)) for asin, units in sales.items() if units]
+                )
+                conn.execute(
+                    'INSERT OR REPLACE INTO daily_sales_days (discord_id, day, recorded_at) VALUES (?, ?, ?)',
+                    (discord_id, day.isoformat(), recorded_at)
+                )
+            if DAILY_SALES_RETENTION_DAYS > 0:
+                cutoff = (max(day_sales) - timedelta(days=DAILY_SALES_RETENTION_DAYS)).isoformat()
+                conn.execute('DELETE FROM daily_sales WHERE discord_id = ? AND day < ?', (discord_id, cutoff))
+                conn.execute('DELETE FROM daily_sales_days WHERE discord_id = ? AND day < ?', (discord_id, cutoff))
+        return len(day_sales)
+
+    def sales_for_day(self, discord_id: str, day: date) -> Optional[Dict[str, int]]:
+        """Units per ASIN sold on a day, or None when that day was never recorded"""
+        db = self._ready()
+        if db.fetchone('SELECT 1 FROM daily_sales_days WHERE discord_id = ? AND day = ?',
+                       (str(discord_id), day.isoformat())) is None:
+            return None
+        rows = db.fetchall('SELECT asin, units FROM daily_sales WHERE discord_id = ? AND day = ?',
+                           (str(discord_id), day.isoformat()))
+        return {asin: int(units) for asin, units in rows}
+
+    def sales_matrix(self, discord_id: str, end_day: date, days: int) -> Tuple[Dict[str, int], np.ndarray, np.ndarray]:
+        """ASIN x day matrix of stored units ending on ``end_day`` (column ``k`` is ``k`` days earlier)
+
+        Also returns a boolean mask of which columns are recorded days.
+        """
+        start_day = end_day - timedelta(days=days - 1)
+        db = self._ready()
+        rows = db.fetchall(
+            'SELECT asin, day, units FROM daily_sales WHERE discord_id = ? AND day BETWEEN ? AND ?',
+            (str(discord_id), start_day.isoformat(), end_day.isoformat())
+        )
+        recorded = np.zeros(days, dtype=bool)
+        for day in self.recorded_days(discord_id, start_day, end_day):
+            recorded[(end_day - day).days] = True
+
+        asin_index: Dict[str, int] = {}
+        for asin, _, _ in rows:
+            asin_index.setdefault(asin, len(asin_index))
+        matrix = np.zeros((len(asin_index), days), dtype=np.int64)
+        for asin, day, units in rows:
+            matrix[asin_index[asin], (end_day - date.fromisoformat(day)).days] = units
+        return asin_index, matrix, recorded
+
+
+# Process-wide instance used by the analyzers
+daily_sales_store = DailySalesStore()
@@ -0,0 +1,108 @@
+"""
+Thread-safe access to the app's SQLite database.
+
+Flask serves requests on several threads (and gunicorn runs several processes), so a
+single ``check_same_thread=False`` connection shared by everyone interleaves cursors
+and result sets. ``Database`` instead gives each thread its own long-lived connection:
+no connect/close per request, and sqlite3's per-connection statement cache keeps the
+app's fixed SQL strings prepared. Writes from threads of one process are serialized
+with a lock (SQLite allows one writer at a time anyway, so this avoids busy retries);
+other processes wait on the busy timeout.
+
+Schema setup runs once per process through ``migrate`` instead of on every call.
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, List, Optional, Sequence
+
+SQLITE_BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', '30'))
+SQLITE_CACHED_STATEMENTS = int(os.getenv('SQLITE_CACHED_STATEMENTS', '256'))
+
+
+class Database:
+    """Per-thread SQLite connections with a process-wide write lock"""
+
+    def __init__(self, path: str, timeout: float = SQLITE_BUSY_TIMEOUT,
+                 cached_statements: int = SQLITE_CACHED_STATEMENTS):
+        self.path = path
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        self._migrations_lock = threading.Lock()
+        self._applied_migrations = set()
+
+    def connection(self) -> sqlite3.Connection:
+        """This thread's connection, opened on first use (and again after a fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        # Autocommit mode: transactions are opened explicitly in write()/transaction()
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                               cached_statements=self.cached_statements)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def execute(self, sql: str, params: Sequence[Any] = ()) -> sqlite3.Cursor:
+        """Run a read query on this thread's connection and return its cursor"""
+        return self.connection().execute(sql, params)
+
+    def fetchone(self, sql: str, params: Sequence[Any] = ()) -> Optional[tuple]:
+        return self.execute(sql, params).fetchone()
+
+    def fetchall(self, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+        return self.execute(sql, params).fetchall()
+
+    def fetch_dicts(self, sql: str, params: Sequence[Any] = ()) -> List[dict]:
+        cur = self.execute(sql, params)
+        columns = [col[0] for col in cur.description]
+        return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+    def write(self, sql: str, params: Sequence[Any] = ()) -> int:
+        """Run one statement as its own transaction; returns the affected row count"""
+        with self._write_lock:
+            return self.connection().execute(sql, params).rowcount
+
+    def write_many(self, sql: str, rows: Iterable[Sequence[Any]]) -> int:
+        with self.transaction() as conn:
+            return conn.executemany(sql, rows).rowcount
+
+    @contextmanager
+    def transaction(self):
+        """Hold the write lock and a ``BEGIN IMMEDIATE`` transaction; commits on success"""
+        with self._write_lock:
+            conn = self.connection()
+            if conn.in_transaction:
+                # Nested use joins the outer transaction
+                yield conn
+                return
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    def migrate(self, name: str, apply: Callable[[sqlite3.Connection], None]) -> bool:
+        """Run a schema step once per process inside a transaction; returns True if it ran"""
+        with self._migrations_lock:
+            if name in self._applied_migrations:
+                return False
+            with self.transaction() as conn:
+                apply(conn)
+            self._applied_migrations.add(name)
+            return True
+
+    def close(self):
+        """Close the calling thread's connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.conn = None
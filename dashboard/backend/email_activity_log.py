@@ -0,0 +1,263 @@
+"""
+Append-only, day-segmented activity log for email monitoring.
+
+Activity used to live inside ``email_monitoring.json`` next to every user's
+configurations and rules, so each matched email (and each ``last_checked`` bump)
+downloaded, modified and re-uploaded the whole document, and concurrent writers lost
+each other's updates. Activity now lives under its own prefix, per user:
+
+    {prefix}{discord_id}/manifest.json                     compacted segments, entry count, last_checked
+    {prefix}{discord_id}/pending/{day}/{timestamp}_{id}.json   one appended entry each
+    {prefix}{discord_id}/segments/{day}-{stamp}.json       one compacted day, newest first
+
+Logging a match is a single small PUT of a new pending object; nothing is read or
+rewritten. ``compact`` (run in the background after each check cycle) folds pending
+entries into their day segments, writes each changed day as a new object, swaps the
+manifest with a conditional ``If-Match`` write and only then deletes what it replaced,
+so readers never see a half-compacted day. Days beyond ``EMAIL_ACTIVITY_MAX_ENTRIES``
+entries per user are dropped, as the old 1,000-entry trim did.
+
+``page`` reads newest first and stops as soon as ``limit`` entries are known: it lists
+pending days from the newest, reads the manifest and loads only the segments that can
+still contribute, so paginated reads touch recent segments only.
+"""
+
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+EMAIL_ACTIVITY_PREFIX = os.getenv('EMAIL_ACTIVITY_PREFIX', 'email_monitoring/activity/')
+EMAIL_ACTIVITY_MAX_ENTRIES = int(os.getenv('EMAIL_ACTIVITY_MAX_ENTRIES', '1000'))
+MANIFEST_RETRIES = 5
+
+
+def _error_code(error: ClientError) -> str:
+    return str(error.response.get('Error', {}).get('Code', ''))
+
+
+def _is_missing(error: ClientError) -> bool:
+    return _error_code(error) in ('NoSuchKey', '404', 'NotFound')
+
+
+def _is_conflict(error: ClientError) -> bool:
+    return _error_code(error) in ('PreconditionFailed', '412', 'ConditionalRequestConflict', '409')
+
+
+def activity_timestamp() -> str:
+    """Fixed-width UTC timestamp, so keys and timestamps sort in time order"""
+    return datetime.utcnow().isoformat(timespec='microseconds')
+
+
+def _empty_manifest() -> Dict:
+    return {'version': 1, 'segments': [], 'entries': 0, 'last_checked': {}, 'compacted_at': None}
+
+
+class EmailActivityLog:
+    """Per-user activity segments in S3"""
+
+    def __init__(self, s3_client_factory: Callable, bucket: str, prefix: str = EMAIL_ACTIVITY_PREFIX,
+                 max_entries: int = EMAIL_ACTIVITY_MAX_ENTRIES):
+        self.s3_client_factory = s3_client_factory
+        self.bucket = bucket
+        self.prefix = prefix if prefix.endswith('/') else prefix + '/'
+        self.max_entries = max_entries
+        # Compactions of one user within this process run one at a time
+        self._compact_locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    def _user_prefix(self, discord_id: str) -> str:
+        return f"{self.prefix}{discord_id}/"
+
+    def _get_json(self, key: str) -> Tuple[Optional[Dict], Optional[str]]:
+        try:
+            response = self.s3_client_factory().get_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if _is_missing(e):
+                return None, None
+            raise
+        return json.loads(response['Body'].read().decode('utf-8')), response.get('ETag')
+
+    def _put_json(self, key: str, value, **kwargs) -> Optional[str]:
+        response = self.s3_client_factory().put_object(
+            Bucket=self.bucket, Key=key, Body=json.dumps(value, separators=(',', ':')),
+            ContentType='application/json', **kwargs
+        )
+        return response.get('ETag')
+
+    def _list(self, prefix: str, delimiter: Optional[str] = None) -> List[str]:
+        """Keys (or, with a delimiter, sub-prefixes) under a prefix, ascending"""
+        s3 = self.s3_client_factory()
+        kwargs = {'Bucket': self.bucket, 'Prefix': prefix}
+        if delimiter:
+            kwargs['Delimiter'] = delimiter
+        found = []
+        while True:
+            response = s3.list_objects_v2(**kwargs)
+            if delimiter:
+                found.extend(item['Prefix'] for item in response.get('CommonPrefixes', []))
+            else:
+                found.extend(item['Key'] for item in response.get('Contents', []))
+            if not response.get('IsTruncated'):
+                return sorted(found)
+            kwargs['ContinuationToken'] = response['NextContinuationToken']
+
+    def _delete(self, keys: List[str]):
+        s3 = self.s3_client_factory()
+        for start in range(0, len(keys), 1000):
+            chunk = keys[start:start + 1000]
+            s3.delete_objects(Bucket=self.bucket, Delete={'Objects': [{'Key': key} for key in chunk], 'Quiet': True})
+
+    def manifest(self, discord_id: str) -> Tuple[Dict, Optional[str]]:
+        manifest, etag = self._get_json(self._user_prefix(discord_id) + 'manifest.json')
+        return manifest or _empty_manifest(), etag
+
+    def _update_manifest(self, discord_id: str, change: Callable[[Dict], None]) -> Dict:
+        """Read-modify-write the manifest, retrying when another writer got there first"""
+        key = self._user_prefix(discord_id) + 'manifest.json'
+        for attempt in range(MANIFEST_RETRIES):
+            manifest, etag = self.manifest(discord_id)
+            change(manifest)
+            try:
+                self._put_json(key, manifest, **({'IfMatch': etag} if etag else {'IfNoneMatch': '*'}))
+                return manifest
+            except ClientError as e:
+                if not _is_conflict(e) or attempt == MANIFEST_RETRIES - 1:
+                    raise
+
+    # Writes
+
+    def append(self, discord_id: str, entry: Dict):
+        """Add one entry (needs ``id`` and ``timestamp``): a single new object"""
+        day = entry['timestamp'][:10]
+        key = f"{self._user_prefix(discord_id)}pending/{day}/{entry['timestamp']}_{entry['id']}.json"
+        self._put_json(key, entry)
+
+    def set_last_checked(self, discord_id: str, email_address: str, checked_at: str):
+        def change(manifest):
+            manifest.setdefault('last_checked', {})[email_address] = checked_at
+        self._update_manifest(discord_id, change)
+
+    # Reads
+
+    def _pending_days(self, discord_id: str) -> List[str]:
+        """Days with uncompacted entries, newest first"""
+        prefixes = self._list(self._user_prefix(discord_id) + 'pending/', delimiter='/')
+        return sorted((prefix.rstrip('/').rsplit('/', 1)[-1] for prefix in prefixes), reverse=True)
+
+    def _pending_keys(self, discord_id: str, day: str) -> List[str]:
+        return self._list(f"{self._user_prefix(discord_id)}pending/{day}/")
+
+    @staticmethod
+    def _key_timestamp(key: str) -> str:
+        return key.rsplit('/', 1)[-1].split('_', 1)[0]
+
+    def page(self, discord_id: str, limit: int = 50, before: Optional[str] = None) -> List[Dict]:
+        """Up to ``limit`` entries older than ``before`` (a timestamp), newest first"""
+        if limit <= 0:
+            return []
+        entries: Dict[str, Dict] = {}
+
+        def enough(newest_remaining: str) -> bool:
+            # The limit-th newest entry so far is newer than anything left to read
+            if len(entries) < limit:
+                return False
+            timestamps = sorted((entry.get('timestamp', '') for entry in entries.values()), reverse=True)
+            return timestamps[limit - 1] > newest_remaining
+
+        # Uncompacted entries: newest days first, and only the keys that can make the page
+        for day in self._pending_days(discord_id):
+            if before and day > before[:10]:
+                continue
+            if enough(day + 'T99'):
+                break
+            keys = [key for key in self._pending_keys(discord_id, day)
+                    if not before or self._key_timestamp(key) < before]
+            for key in sorted(keys, reverse=True)[:limit]:
+                entry, _ = self._get_json(key)
+                if entry:
+                    entries[entry['id']] = entry
+
+        manifest, _ = self.manifest(discord_id)
+        for segment in manifest.get('segments', []):
+            if before and segment.get('oldest', '') >= before:
+                continue
+            if enough(segment.get('newest', '')):
+                break
+            data, _ = self._get_json(segment['key'])
+            for entry in (data or {}).get('entries', []):
+                if not before or entry.get('timestamp', '') < before:
+                    entries.setdefault(entry['id'], entry)
+
+        ordered = sorted(entries.values(), key=lambda entry: entry.get('timestamp', ''), reverse=True)
+        return ordered[:limit]
+
+    # Compaction
+
+    def _compact_lock(self, discord_id: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._compact_locks.setdefault(discord_id, threading.Lock())
+
+    def compact(self, discord_id: str, imported: Optional[List[Dict]] = None) -> int:
+        """Fold pending (and ``imported``) entries into day segments; returns entries folded"""
+        with self._compact_lock(discord_id):
+            pending_keys = [key for day in self._pending_days(discord_id) for key in self._pending_keys(discord_id, day)]
+            if not pending_keys and not imported:
+                return 0
+
+            new_by_day: Dict[str, Dict[str, Dict]] = {}
+            for entry in imported or []:
+                if entry.get('id') and entry.get('timestamp'):
+                    new_by_day.setdefault(entry['timestamp'][:10], {})[entry['id']] = entry
+            for key in pending_keys:
+                entry, _ = self._get_json(key)
+                if entry:
+                    new_by_day.setdefault(entry['timestamp'][:10], {})[entry['id']] = entry
+            folded = sum(len(day_entries) for day_entries in new_by_day.values())
+
+            for attempt in range(MANIFEST_RETRIES):
+                manifest, etag = self.manifest(discord_id)
+                segments = {segment['day']: segment for segment in manifest.get('segments', [])}
+                written, replaced = [], []
+                stamp = uuid.uuid4().hex[:8]
+                for day, day_entries in new_by_day.items():
+                    merged = dict(day_entries)
+                    if day in segments:
+                        existing, _ = self._get_json(segments[day]['key'])
+                        for entry in (existing or {}).get('entries', []):
+                            merged.setdefault(entry['id'], entry)
+                        replaced.append(segments[day]['key'])
+                    ordered = sorted(merged.values(), key=lambda entry: entry.get('timestamp', ''), reverse=True)
+                    key = f"{self._user_prefix(discord_id)}segments/{day}-{stamp}.json"
+                    self._put_json(key, {'day': day, 'entries': ordered})
+                    written.append(key)
+                    segments[day] = {'day': day, 'key': key, 'count': len(ordered),
+                                     'newest': ordered[0].get('timestamp', ''), 'oldest': ordered[-1].get('timestamp', '')}
+
+                # Newest days first; drop whole days once the retained entries reach the cap
+                kept, total = [], 0
+                for day in sorted(segments, reverse=True):
+                    if self.max_entries > 0 and total >= self.max_entries:
+                        replaced.append(segments[day]['key'])
+                        continue
+                    kept.append(segments[day])
+                    total += segments[day]['count']
+
+                manifest.update({'version': 1, 'segments': kept, 'entries': total,
+                                 'compacted_at': datetime.utcnow().isoformat()})
+                try:
+                    self._put_json(self._user_prefix(discord_id) + 'manifest.json', manifest,
+                                   **({'IfMatch': etag} if etag else {'IfNoneMatch': '*'}))
+                except ClientError as e:
+                    # The manifest moved on (last_checked or another process): redo the merge on top of it
+                    self._delete(written)
+                    if not _is_conflict(e) or attempt == MANIFEST_RETRIES - 1:
+                        raise
+                    continue
+                self._delete(pending_keys + replaced)
+                return folded
+            return 0
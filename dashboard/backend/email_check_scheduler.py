@@ -0,0 +1,226 @@
+"""
+Concurrent account checks for the email monitoring cycle.
+
+``run_email_check_cycle`` used to check every active email configuration one after
+another (the older ``run_monitoring_cycle`` variants even slept 2 seconds between
+accounts), so a cycle grew linearly with tenants and one slow IMAP server held up
+everyone behind it. ``AccountCheckScheduler`` runs the checks on a bounded thread
+pool instead:
+
+- at most ``EMAIL_MONITOR_WORKERS`` checks run at once;
+- each provider (Gmail OAuth, or the IMAP server host) has its own concurrency limit
+  (``EMAIL_MONITOR_PROVIDER_LIMITS``, default ``EMAIL_MONITOR_PROVIDER_CONCURRENCY``)
+  and a jittered minimum spacing between check starts, so a tenant-heavy provider is
+  not hit with a burst;
+- a check still running after ``EMAIL_MONITOR_ACCOUNT_TIMEOUT`` seconds is reported as
+  timed out and the cycle stops waiting for it. Threads cannot be killed, so it keeps
+  its pool and provider slot until its own socket timeouts end it; accounts of a
+  provider whose slots are all held by timed-out checks are skipped until next cycle.
+
+``run`` returns cycle metrics (duration, per-account percentiles, per-provider totals,
+pool utilization and the slowest accounts) for sizing the pool.
+``next_cycle_delay`` adds up to ``EMAIL_MONITOR_JITTER_SECONDS`` to the cycle interval so
+restarts and replicas do not line up.
+"""
+
+import os
+import random
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+EMAIL_MONITOR_WORKERS = int(os.getenv('EMAIL_MONITOR_WORKERS', '8'))
+EMAIL_MONITOR_PROVIDER_CONCURRENCY = int(os.getenv('EMAIL_MONITOR_PROVIDER_CONCURRENCY', '2'))
+# Per-provider overrides, e.g. "gmail=4,imap.mail.yahoo.com=1"
+EMAIL_MONITOR_PROVIDER_LIMITS = os.getenv('EMAIL_MONITOR_PROVIDER_LIMITS', 'gmail=4')
+EMAIL_MONITOR_PROVIDER_INTERVAL_SECONDS = float(os.getenv('EMAIL_MONITOR_PROVIDER_INTERVAL_SECONDS', '0.5'))
+EMAIL_MONITOR_ACCOUNT_TIMEOUT = float(os.getenv('EMAIL_MONITOR_ACCOUNT_TIMEOUT', '180'))
+EMAIL_MONITOR_JITTER_SECONDS = float(os.getenv('EMAIL_MONITOR_JITTER_SECONDS', '900'))
+
+
+def parse_provider_limits(spec: str) -> Dict[str, int]:
+    limits = {}
+    for item in (spec or '').split(','):
+        provider, sep, value = item.partition('=')
+        if sep and provider.strip() and value.strip().isdigit():
+            limits[provider.strip().lower()] = max(1, int(value))
+    return limits
+
+
+def account_provider(config: Dict) -> str:
+    """Rate-limit bucket of an email configuration: Gmail OAuth or its IMAP host"""
+    if config.get('auth_type') == 'oauth':
+        return 'gmail'
+    return (config.get('imap_server') or 'imap').strip().lower()
+
+
+def account_label(config: Dict) -> str:
+    return f"{config.get('discord_id')}:{config.get('email_address')}"
+
+
+def next_cycle_delay(interval: float, jitter: float = EMAIL_MONITOR_JITTER_SECONDS) -> float:
+    return interval + random.uniform(0, max(0.0, jitter))
+
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 2)
+
+
+class _Job:
+    def __init__(self, config: Dict, provider: str, queued_seconds: float, started: float):
+        self.config = config
+        self.provider = provider
+        self.queued_seconds = queued_seconds
+        self.started = started
+        self.finished: Optional[float] = None
+        self.error: Optional[str] = None
+        self.timed_out = False
+
+
+class AccountCheckScheduler:
+    """Runs one check per email configuration on a bounded pool with per-provider limits"""
+
+    def __init__(self, check: Callable[[Dict], None], workers: int = EMAIL_MONITOR_WORKERS,
+                 provider_limits: Optional[Dict[str, int]] = None,
+                 default_limit: int = EMAIL_MONITOR_PROVIDER_CONCURRENCY,
+                 provider_interval: float = EMAIL_MONITOR_PROVIDER_INTERVAL_SECONDS,
+                 account_timeout: float = EMAIL_MONITOR_ACCOUNT_TIMEOUT):
+        self.check = check
+        self.workers = max(1, workers)
+        self.provider_limits = (parse_provider_limits(EMAIL_MONITOR_PROVIDER_LIMITS)
+                                if provider_limits is None else provider_limits)
+        self.default_limit = max(1, default_limit)
+        self.provider_interval = max(0.0, provider_interval)
+        self.account_timeout = account_timeout
+
+    def limit(self, provider: str) -> int:
+        return min(self.workers, self.provider_limits.get(provider, self.default_limit))
+
+    def _run_check(self, job: _Job):
+        try:
+            self.check(job.config)
+        except Exception as e:
+            job.error = str(e)
+            print(f"Email check failed for {account_label(job.config)}: {e}")
+        finally:
+            job.finished = time.monotonic()
+            if job.timed_out:
+                print(f"Email check for {account_label(job.config)} finished "
+                      f"{job.finished - job.started:.1f}s after starting (timed out)")
+
+    def run(self, configs: List[Dict]) -> Dict:
+        """Check every configuration; returns the cycle metrics"""
+        cycle_start = time.monotonic()
+        started_at = datetime.utcnow().isoformat()
+        # Shuffled so the same tenants are not always at the back of a provider's queue
+        pending = deque(random.sample(configs, len(configs)))
+        running: Dict[Future, _Job] = {}
+        active = Counter()
+        next_start: Dict[str, float] = {}
+        jobs: List[_Job] = []
+        skipped: List[Dict] = []
+        peak = 0
+
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='email-check')
+        try:
+            while pending or any(not job.timed_out for job in running.values()):
+                now = time.monotonic()
+                deferred = deque()
+                while pending and len(running) < self.workers:
+                    config = pending.popleft()
+                    provider = account_provider(config)
+                    if active[provider] >= self.limit(provider) or now < next_start.get(provider, 0):
+                        deferred.append(config)
+                        continue
+                    job = _Job(config, provider, now - cycle_start, now)
+                    running[executor.submit(self._run_check, job)] = job
+                    jobs.append(job)
+                    active[provider] += 1
+                    next_start[provider] = now + self.provider_interval * random.uniform(0.5, 1.5)
+                pending = deferred + pending
+                peak = max(peak, len(running))
+
+                # Slots held only by timed-out checks will not free up in time for this cycle
+                stuck = {provider for provider in active
+                         if active[provider] >= self.limit(provider)
+                         and all(job.timed_out for job in running.values() if job.provider == provider)}
+                if running and len(running) >= self.workers and all(job.timed_out for job in running.values()):
+                    stuck = {account_provider(config) for config in pending}
+                if stuck:
+                    skipped.extend(config for config in pending if account_provider(config) in stuck)
+                    pending = deque(config for config in pending if account_provider(config) not in stuck)
+
+                # Sleep until a check finishes, one times out or a provider with a free slot may start again
+                wake = [job.started + self.account_timeout for job in running.values() if not job.timed_out]
+                if len(running) < self.workers:
+                    wake += [next_start[provider] for provider in {account_provider(config) for config in pending}
+                             if provider in next_start and active[provider] < self.limit(provider)]
+                timeout = max(0.0, min(wake, default=now + 1.0) - now)
+                if running:
+                    done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+                else:
+                    time.sleep(timeout)
+                    done = set()
+
+                for future in done:
+                    job = running.pop(future)
+                    active[job.provider] -= 1
+                now = time.monotonic()
+                for job in running.values():
+                    if not job.timed_out and now - job.started >= self.account_timeout:
+                        job.timed_out = True
+                        print(f"Email check for {account_label(job.config)} timed out after {self.account_timeout:.0f}s")
+        finally:
+            executor.shutdown(wait=False)
+
+        return self._metrics(started_at, time.monotonic() - cycle_start, jobs, skipped, peak)
+
+    def _metrics(self, started_at: str, duration: float, jobs: List[_Job], skipped: List[Dict], peak: int) -> Dict:
+        def seconds(job: _Job) -> float:
+            return (job.started + self.account_timeout if job.timed_out else job.finished) - job.started
+
+        completed = [job for job in jobs if not job.timed_out]
+        durations = [seconds(job) for job in jobs]
+        providers: Dict[str, Dict] = {}
+        for job in jobs:
+            stats = providers.setdefault(job.provider, {'accounts': 0, 'errors': 0, 'timed_out': 0,
+                                                        'total_seconds': 0.0, 'max_seconds': 0.0})
+            stats['accounts'] += 1
+            stats['errors'] += int(job.error is not None and not job.timed_out)
+            stats['timed_out'] += int(job.timed_out)
+            stats['total_seconds'] = round(stats['total_seconds'] + seconds(job), 2)
+            stats['max_seconds'] = round(max(stats['max_seconds'], seconds(job)), 2)
+        for config in skipped:
+            stats = providers.setdefault(account_provider(config), {'accounts': 0, 'errors': 0, 'timed_out': 0,
+                                                                    'total_seconds': 0.0, 'max_seconds': 0.0})
+            stats['skipped'] = stats.get('skipped', 0) + 1
+
+        slowest = sorted(jobs, key=seconds, reverse=True)[:5]
+        return {
+            'started_at': started_at,
+            'duration_seconds': round(duration, 2),
+            'accounts': len(jobs) + len(skipped),
+            'ok': len([job for job in completed if job.error is None]),
+            'errors': len([job for job in completed if job.error is not None]),
+            'timed_out': len(jobs) - len(completed),
+            'skipped': len(skipped),
+            'workers': self.workers,
+            'peak_concurrency': peak,
+            # Share of the pool's capacity spent checking; near 1.0 means more workers would help
+            'utilization': round(sum(durations) / (duration * self.workers), 3) if duration > 0 else 0.0,
+            'account_seconds': {
+                'p50': _percentile(durations, 0.5),
+                'p95': _percentile(durations, 0.95),
+                'max': round(max(durations), 2) if durations else None,
+                'total': round(sum(durations), 2),
+            },
+            'max_queue_seconds': round(max((job.queued_seconds for job in jobs), default=0.0), 2),
+            'providers': providers,
+            'slowest': [{'account': account_label(job.config), 'provider': job.provider,
+                         'seconds': round(seconds(job), 2), 'timed_out': job.timed_out} for job in slowest],
+        }
@@ -29,7 +29,12 @@ import requests
 # Add current directory to path for imports
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from email_check_scheduler import AccountCheckScheduler, next_cycle_delay
 from email_monitoring_s3 import email_monitoring_manager
+from gmail_batch import MESSAGE_BODY_FIELDS, MESSAGE_METADATA_FIELDS, GmailFetcher
+from gmail_sync import GmailMailboxSync, config_fingerprint, header_values
+from imap_sync import ImapMailboxSync, connect as connect_imap
+from worker_coordination import email_check_lock
 
 
 class EmailMonitorS3:
@@ -39,6 +44,7 @@ class EmailMonitorS3:
         self.is_running = False
         self.check_interval = 86400  # 24 hours in seconds
         self.manager = email_monitoring_manager
+        self.last_cycle_metrics = None
         
     def start(self):
         """Start the email monitoring loop"""
@@ -50,7 +56,7 @@ class EmailMonitorS3:
                 self.run_email_check_cycle()
                 
                 if self.is_running:
-                    time.sleep(self.check_interval)
+                    time.sleep(next_cycle_delay(self.check_interval))
                     
             except Exception as e:
                 if self.is_running:
@@ -61,7 +67,15 @@ class EmailMonitorS3:
         self.is_running = False
     
     def run_email_check_cycle(self, send_webhooks=True):
-        """Run one complete cycle of email checking"""
+        """Run one complete cycle of email checking; False when a cycle is already running in any worker"""
+        with email_check_lock.hold() as acquired:
+            if not acquired:
+                print("Email check cycle skipped: another cycle is in progress")
+                return False
+            self._run_email_check_cycle(send_webhooks)
+            return True
+    
+    def _run_email_check_cycle(self, send_webhooks):
         try:
             # Check if we should run based on S3 status
             status = self.manager.get_service_status()
@@ -92,18 +106,29 @@ class EmailMonitorS3:
                 # Get all active email configurations
                 active_configs = self.manager.get_all_active_configs()
                 
-                for config in active_configs:
-                    try:
-                        self.check_monitor_email_account(config, send_webhooks=send_webhooks)
-                    except Exception as e:
-                        pass
+                # Accounts are checked concurrently, within per-provider limits
+                scheduler = AccountCheckScheduler(
+                    lambda config: self.check_monitor_email_account(config, send_webhooks=send_webhooks)
+                )
+                metrics = scheduler.run(active_configs)
+                self.last_cycle_metrics = metrics
+                print(f"Email check cycle: {metrics['accounts']} accounts in {metrics['duration_seconds']}s "
+                      f"({metrics['timed_out']} timed out, {metrics['skipped']} skipped, "
+                      f"utilization {metrics['utilization']})")
+                
+                # Fold this cycle's appended activity into day segments
+                try:
+                    self.manager.compact_activity()
+                except Exception as e:
+                    print(f"Error compacting email activity: {e}")
                     
                 # Update status to indicate check completed
                 if send_webhooks:
                     self.manager.update_service_status({
                         'check_in_progress': False,
                         'last_check_run': datetime.utcnow().isoformat(),
-                        'last_check_complete': datetime.utcnow().isoformat()
+                        'last_check_complete': datetime.utcnow().isoformat(),
+                        'last_cycle_metrics': metrics
                     })
                 
                 
@@ -146,6 +171,13 @@ class EmailMonitorS3:
             pass
             return False
     
+    def monitor_rules_fingerprint(self, active_rules: List[Dict]) -> str:
+        """What the mailbox cursors depend on: a changed rule set re-runs the window search"""
+        return config_fingerprint([
+            (rule.get('id'), rule.get('sender_filter', ''), rule.get('subject_filter', ''), rule.get('content_filter', ''))
+            for rule in active_rules
+        ])
+    
     def monitor_decode_email_header(self, header):
         """Decode email email header safely"""
         if not header:
@@ -264,7 +296,7 @@ class EmailMonitorS3:
                     imap_server=config.get('imap_server'),
                     imap_port=config.get('imap_port'),
                     username=config.get('username'),
-                    password=config.get('password_encrypted'),
+                    password_encrypted=config.get('password_encrypted'),
                     last_checked=config.get('last_checked'),
                     send_webhooks=send_webhooks
                 )
@@ -313,65 +345,100 @@ class EmailMonitorS3:
             # Build targeted search queries based on rules
             all_messages = []
             matched_count = 0
-            
-            for rule in rules:
-                if not rule.get('is_active', True):
-                    continue
-                
-                # Build Gmail search query for this rule
-                query_parts = [f'after:{cutoff_date.strftime("%Y/%m/%d")}']
-                
-                # Add sender filter if specified
-                sender_filter = rule.get('sender_filter', '').strip()
-                if sender_filter:
-                    query_parts.append(f'from:"{sender_filter}"')
-                
-                # Add subject filter if specified
-                subject_filter = rule.get('subject_filter', '').strip()
-                if subject_filter:
-                    query_parts.append(f'subject:"{subject_filter}"')
-                
-                # Note: Gmail API doesn't support body content search in the same way
-                # Content filter will still need to be checked after fetching
-                
-                query = ' '.join(query_parts)
-                
-                # Search Gmail for this rule
-                search_url = f"https://gmail.googleapis.com/gmail/v1/users/me/messages"
-                headers = {"Authorization": f"Bearer {access_token}"}
-                params = {"q": query, "maxResults": 50}
-                
-                response = requests.get(search_url, headers=headers, params=params)
-                
-                if not response.ok:
-                    print(f"Error searching Gmail messages for rule '{rule.get('rule_name')}': {response.status_code} {response.text}")
-                    continue
-                
-                search_results = response.json()
-                messages = search_results.get('messages', [])
+            fetcher = GmailFetcher(access_token)
+            active_rules = [rule for rule in rules if rule.get('is_active', True)]
+            
+            def search_rules():
+                rule_message_ids = []
+                for rule in active_rules:
+                    # Build Gmail search query for this rule
+                    query_parts = [f'after:{cutoff_date.strftime("%Y/%m/%d")}']
+                    
+                    # Add sender filter if specified
+                    sender_filter = rule.get('sender_filter', '').strip()
+                    if sender_filter:
+                        query_parts.append(f'from:"{sender_filter}"')
+                    
+                    # Add subject filter if specified
+                    subject_filter = rule.get('subject_filter', '').strip()
+                    if subject_filter:
+                        query_parts.append(f'subject:"{subject_filter}"')
+                    
+                    # Note: Gmail API doesn't support body content search in the same way
+                    # Content filter will still need to be checked after fetching
+                    
+                    query = ' '.join(query_parts)
+                    
+                    # Search Gmail for this rule
+                    try:
+                        message_ids = fetcher.list_message_ids(query, max_results=50)
+                    except requests.RequestException as e:
+                        print(f"Error searching Gmail messages for rule '{rule.get('rule_name')}': {e}")
+                        continue
+                    
+                    if message_ids:
+                        rule_message_ids.append((rule, message_ids))
+                return rule_message_ids
+            
+            # Automated runs continue from the mailbox's history cursor (restarted when the rules change);
+            # manual checks search the window
+            sync = (GmailMailboxSync(fetcher, f"monitor:{discord_id}:{email_address}", self.monitor_rules_fingerprint(active_rules))
+                    if send_webhooks else None)
+            # Found messages the batch fetches could not return, retried by the next automated run
+            failed_ids = []
+            if sync is None:
+                rule_message_ids = search_rules()
+            else:
+                searched = []
                 
-                if not messages:
-                    continue
+                def full_search():
+                    searched.extend(search_rules())
+                    return [message_id for _, message_ids in searched for message_id in message_ids]
                 
+                batch = sync.new_message_ids(full_search)
+                if batch.full_sync:
+                    rule_message_ids = searched
+                else:
+                    # New mail since the last run: apply each rule's sender/subject filters locally
+                    metadata = fetcher.get_messages(batch.message_ids, message_format='metadata',
+                                                    fields=MESSAGE_METADATA_FIELDS)
+                    failed_ids.extend(message_id for message_id in batch.message_ids if message_id not in metadata)
+                    headers_by_id = {message_id: header_values(message) for message_id, message in metadata.items()}
+                    rule_message_ids = []
+                    for rule in active_rules:
+                        header_rule = dict(rule, content_filter='')
+                        message_ids = [message_id for message_id, headers in headers_by_id.items()
+                                       if self.monitor_matches_rule({
+                                           'subject': self.monitor_decode_email_header(headers.get('subject', '')),
+                                           'sender': self.monitor_decode_email_header(headers.get('from', ''))
+                                       }, header_rule)]
+                        if message_ids:
+                            rule_message_ids.append((rule, message_ids))
+            
+            # Fetch every found message once, in batches: bodies only where a rule filters on content
+            body_ids = {message_id for rule, message_ids in rule_message_ids
+                        if rule.get('content_filter', '').strip() for message_id in message_ids}
+            all_ids = [message_id for _, message_ids in rule_message_ids for message_id in message_ids]
+            fetched = fetcher.get_messages([message_id for message_id in all_ids if message_id not in body_ids],
+                                           message_format='metadata', fields=MESSAGE_METADATA_FIELDS)
+            fetched.update(fetcher.get_messages([message_id for message_id in all_ids if message_id in body_ids],
+                                                fields=MESSAGE_BODY_FIELDS))
+            failed_ids.extend(message_id for message_id in all_ids if message_id not in fetched)
+            
+            for rule, messages in rule_message_ids:
                 # Process each message for this specific rule
                 rule_processed_count = 0
-                for message in messages:
+                for message_id in messages:
                     try:
-                        message_id = message['id']
                         rule_processed_count += 1
                         
                         # Check if we already processed this message (avoid duplicates across rules)
                         if message_id in [msg.get('message_id') for msg in all_messages]:
                             continue
                         
-                        # Get full message details
-                        message_url = f"https://gmail.googleapis.com/gmail/v1/users/me/messages/{message_id}"
-                        msg_response = requests.get(message_url, headers=headers)
-                        
-                        if not msg_response.ok:
+                        email_data = fetched.get(message_id)
+                        if not email_data:
                             continue
-                            
-                        email_data = msg_response.json()
                         
                         # Extract email details
                         headers_list = email_data.get('payload', {}).get('headers', [])
@@ -453,6 +520,9 @@ class EmailMonitorS3:
                         pass
             
             
+            if sync is not None:
+                sync.commit(batch, failed_ids)
+            
             # Update last checked timestamp
             self.monitor_update_last_checked(discord_id, email_address)
             
@@ -495,8 +565,6 @@ class EmailMonitorS3:
                                        send_webhooks: bool = True):
         """Check email email account using IMAP"""
         try:
-            import imaplib
-            import email
             from cryptography.fernet import Fernet
             
             # Load encryption key
@@ -511,59 +579,52 @@ class EmailMonitorS3:
             password = cipher.decrypt(password_encrypted.encode()).decode()
             
             # Connect to IMAP server
-            mail = imaplib.IMAP4_SSL(imap_server, imap_port)
+            mail = connect_imap(imap_server, imap_port)
             mail.login(username, password)
-            mail.select('inbox')
-            
-            # Always check only the past day for daily runs
-            cutoff_date = datetime.utcnow() - timedelta(days=1)
-            
-            # Search for emails from past day
-            date_str = cutoff_date.strftime('%d-%b-%Y')
-            result, messages = mail.search(None, f'SINCE "{date_str}"')
-            
-            if result != 'OK' or not messages[0]:
-                mail.logout()
-                self.monitor_update_last_checked(discord_id, email_address)
-                return
-            
-            message_ids = messages[0].split()
             
             # Get monitoring rules
             rules = self.manager.get_monitoring_rules(discord_id)
-            if not rules:
+            active_rules = [rule for rule in (rules or []) if rule.get('is_active', True)]
+            if not active_rules:
                 mail.logout()
                 self.monitor_update_last_checked(discord_id, email_address)
                 return
             
+            # Always check only the past day for daily runs
+            cutoff_date = datetime.utcnow() - timedelta(days=1)
+            date_str = cutoff_date.strftime('%d-%b-%Y')
+            
+            # Automated runs continue from the stored UID cursor; manual checks search the window
+            sync = ImapMailboxSync(mail, f"monitor:{discord_id}:{email_address}", self.monitor_rules_fingerprint(active_rules))
+            batch = None
+            if send_webhooks:
+                batch = sync.new_uids(f'SINCE "{date_str}"', max_messages=50)
+                uids = batch.uids
+            else:
+                sync.select()
+                uids = sync.search(f'SINCE "{date_str}"')[-50:]  # Limit to most recent 50
+            
+            # Headers first; HTML parts only for messages some rule's sender/subject filters accept.
+            # Content filters read HTML bodies only, so plain-text messages are not downloaded.
+            messages = sync.fetch_headers(uids)
+            header_rules = [dict(rule, content_filter='') for rule in active_rules]
+            candidates = [message for message in messages.values()
+                          if any(self.monitor_matches_rule({
+                              'subject': self.monitor_decode_email_header(message.header('Subject')),
+                              'sender': self.monitor_decode_email_header(message.header('From'))
+                          }, rule) for rule in header_rules)]
+            sync.fetch_text([message for message in candidates if message.has_html])
+            
             matched_count = 0
             
             # Check each message
-            for message_id in message_ids[-50:]:  # Limit to most recent 50
+            for message in candidates:
                 try:
-                    result, msg_data = mail.fetch(message_id, '(RFC822)')
-                    if result != 'OK':
-                        continue
-                    
-                    email_msg_raw = email.message_from_bytes(msg_data[0][1])
-                    
                     # Extract email details
-                    subject = self.monitor_decode_email_header(email_msg_raw.get('Subject', ''))
-                    sender = self.monitor_decode_email_header(email_msg_raw.get('From', ''))
-                    date = email_msg_raw.get('Date', '')
-                    
-                    # Extract HTML content
-                    html_content = ""
-                    if email_msg_raw.is_multipart():
-                        for part in email_msg_raw.walk():
-                            if part.get_content_type() == "text/html":
-                                charset = part.get_content_charset() or 'utf-8'
-                                html_content = part.get_payload(decode=True).decode(charset, errors='ignore')
-                                break
-                    else:
-                        if email_msg_raw.get_content_type() == "text/html":
-                            charset = email_msg_raw.get_content_charset() or 'utf-8'
-                            html_content = email_msg_raw.get_payload(decode=True).decode(charset, errors='ignore')
+                    subject = self.monitor_decode_email_header(message.header('Subject'))
+                    sender = self.monitor_decode_email_header(message.header('From'))
+                    date = message.header('Date')
+                    html_content = message.html
                     
                     email_msg = {
                         'subject': subject,
@@ -573,10 +634,7 @@ class EmailMonitorS3:
                     }
                     
                     # Check against rules
-                    for rule in rules:
-                        if not rule.get('is_active', True):
-                            continue
-                            
+                    for rule in active_rules:
                         if self.monitor_matches_rule(email_msg, rule):
                             matched_count += 1
                             
@@ -609,6 +667,8 @@ class EmailMonitorS3:
                 except Exception as e:
                     print(f"Error processing email IMAP message: {e}")
             
+            if batch is not None:
+                sync.commit(batch)
             mail.logout()
             self.monitor_update_last_checked(discord_id, email_address)
             
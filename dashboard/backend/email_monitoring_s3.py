@@ -8,15 +8,47 @@ maintaining consistency with the existing architecture pattern.
 S3 Structure:
 - email_monitoring.json contains all email monitoring data
 - Organized by user discord_id for easy access
-- Includes configurations, rules, logs, and webhook settings
+- Includes configurations, rules and webhook settings
+- Activity logs and last-checked times live in per-user, day-segmented objects
+  (see email_activity_log.py); logs still found in the main file are moved there
+  by compact_activity()
+
+Several gunicorn workers share the file, each with its own read cache, so writes never
+save a cached copy: ``_update`` re-reads the document, applies the change and PUTs it
+conditioned on the ETag it read (``If-Match``), re-applying the change on top of the
+other writer's version when the PUT is rejected.
 """
 
+import functools
 import json
+import threading
 import boto3
 from datetime import datetime, timedelta
 import uuid
 import os
-from typing import Dict, List, Optional, Any
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+from email_activity_log import EmailActivityLog, activity_timestamp
+
+
+DOCUMENT_WRITE_RETRIES = 5
+
+
+def _is_conflict(error: ClientError) -> bool:
+    return str(error.response.get('Error', {}).get('Code', '')) in (
+        'PreconditionFailed', '412', 'ConditionalRequestConflict', '409')
+
+
+def synchronized(method):
+    """Run a manager method under the manager's lock (every write is a read-modify-write of one document)"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
 
 class EmailMonitoringS3Manager:
     def __init__(self):
@@ -26,6 +58,9 @@ class EmailMonitoringS3Manager:
         self.cache = {}
         self.cache_expiry = 300  # 5 minutes
         self.cache_timestamp = None
+        # Monitoring checks run concurrently and share the cached document
+        self._lock = threading.RLock()
+        self.activity = EmailActivityLog(lambda: self.s3_client, self.bucket)
     
     def _get_s3_client(self):
         """Get S3 client with credentials"""
@@ -61,7 +96,7 @@ class EmailMonitoringS3Manager:
         }
     
     def _load_data(self, force_refresh=False) -> Dict:
-        """Load email monitoring data from S3 with caching"""
+        """Load email monitoring data from S3 with caching (for reads; writes go through _update)"""
         current_time = datetime.now()
         
         # Check cache
@@ -72,50 +107,55 @@ class EmailMonitoringS3Manager:
             return self.cache
         
         try:
-            response = self.s3_client.get_object(Bucket=self.bucket, Key=self.email_monitoring_key)
-            data = json.loads(response['Body'].read().decode('utf-8'))
-            
-            # Cache the data
-            self.cache = data
-            self.cache_timestamp = current_time
-            
+            data, _ = self._fetch()
             return data
-            
-        except self.s3_client.exceptions.NoSuchKey:
-            # File doesn't exist yet, create empty structure
-            print("📧 Creating new email_monitoring.json file")
-            empty_data = self._get_empty_structure()
-            self._save_data(empty_data)
-            return empty_data
-            
         except Exception as e:
             print(f"❌ Error loading email monitoring data: {e}")
             return self._get_empty_structure()
     
-    def _save_data(self, data: Dict) -> bool:
-        """Save email monitoring data to S3"""
+    def _fetch(self) -> Tuple[Dict, Optional[str]]:
+        """The current document and its ETag (None when it does not exist yet); refreshes the cache"""
         try:
-            # Update timestamp
-            data["last_updated"] = datetime.now().isoformat()
-            
-            # Save to S3
-            json_data = json.dumps(data, indent=2)
-            self.s3_client.put_object(
-                Bucket=self.bucket,
-                Key=self.email_monitoring_key,
-                Body=json_data,
-                ContentType='application/json'
-            )
-            
-            # Update cache
-            self.cache = data
-            self.cache_timestamp = datetime.now()
-            
-            return True
-            
-        except Exception as e:
-            print(f"❌ Error saving email monitoring data: {e}")
-            return False
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=self.email_monitoring_key)
+        except self.s3_client.exceptions.NoSuchKey:
+            return self._get_empty_structure(), None
+        data = json.loads(response['Body'].read().decode('utf-8'))
+        self.cache = data
+        self.cache_timestamp = datetime.now()
+        return data, response.get('ETag')
+    
+    def _update(self, change: Callable[[Dict], Any], failed: Any = False) -> Any:
+        """Apply ``change`` to the latest document and save it unless another process wrote first
+        
+        ``change`` edits the document in place and returns the method's result; a falsy result
+        means nothing changed and nothing is saved. Returns ``failed`` when S3 cannot be updated.
+        """
+        for attempt in range(DOCUMENT_WRITE_RETRIES):
+            try:
+                data, etag = self._fetch()
+                result = change(data)
+                if not result:
+                    return result
+                data["last_updated"] = datetime.now().isoformat()
+                self.s3_client.put_object(
+                    Bucket=self.bucket,
+                    Key=self.email_monitoring_key,
+                    Body=json.dumps(data, indent=2),
+                    ContentType='application/json',
+                    **({'IfMatch': etag} if etag else {'IfNoneMatch': '*'})
+                )
+                self.cache = data
+                self.cache_timestamp = datetime.now()
+                return result
+            except ClientError as e:
+                if _is_conflict(e) and attempt < DOCUMENT_WRITE_RETRIES - 1:
+                    continue
+                print(f"❌ Error saving email monitoring data: {e}")
+                return failed
+            except Exception as e:
+                print(f"❌ Error saving email monitoring data: {e}")
+                return failed
+        return failed
     
     def _ensure_user_structure(self, data: Dict, discord_id: str):
         """Ensure user has proper structure in data"""
@@ -123,39 +163,46 @@ class EmailMonitoringS3Manager:
             data["users"][discord_id] = {
                 "discord_id": discord_id,
                 "email_configurations": [],
-                "monitoring_rules": [],
-                "activity_logs": []
+                "monitoring_rules": []
             }
     
     # Email Configuration Methods
+    @synchronized
     def add_email_config(self, discord_id: str, email_config: Dict) -> bool:
         """Add or update email configuration"""
-        data = self._load_data()
-        self._ensure_user_structure(data, discord_id)
-        
-        # Find existing config or add new one
-        configs = data["users"][discord_id]["email_configurations"]
-        email_address = email_config.get("email_address")
-        
-        # Remove existing config for same email
-        configs[:] = [c for c in configs if c.get("email_address") != email_address]
-        
-        # Add new/updated config
         email_config.update({
             "id": str(uuid.uuid4()),
             "created_at": datetime.now().isoformat(),
             "updated_at": datetime.now().isoformat()
         })
         
-        configs.append(email_config)
+        def change(data):
+            self._ensure_user_structure(data, discord_id)
+            configs = data["users"][discord_id]["email_configurations"]
+            
+            # Replace any existing config for the same email
+            configs[:] = [c for c in configs if c.get("email_address") != email_config.get("email_address")]
+            configs.append(dict(email_config))
+            return True
         
-        return self._save_data(data)
+        return self._update(change)
     
     def get_email_configs(self, discord_id: str) -> List[Dict]:
         """Get email configurations for a user"""
-        data = self._load_data()
-        return data.get("users", {}).get(discord_id, {}).get("email_configurations", [])
+        with self._lock:
+            data = self._load_data()
+            configs = list(data.get("users", {}).get(discord_id, {}).get("email_configurations", []))
+        
+        # Last-checked times are kept in the user's activity manifest
+        try:
+            last_checked = self.activity.manifest(discord_id)[0].get("last_checked", {})
+        except Exception as e:
+            print(f"❌ Error loading email activity manifest: {e}")
+            last_checked = {}
+        return [dict(config, last_checked=last_checked.get(config.get("email_address"), config.get("last_checked")))
+                for config in configs]
     
+    @synchronized
     def get_all_active_configs(self) -> List[Dict]:
         """Get all active email configurations across all users"""
         data = self._load_data()
@@ -169,26 +216,23 @@ class EmailMonitoringS3Manager:
         
         return active_configs
     
+    @synchronized
     def delete_email_config(self, discord_id: str, config_id: str) -> bool:
         """Delete an email configuration"""
-        data = self._load_data()
-        if discord_id not in data.get("users", {}):
-            return False
-        
-        configs = data["users"][discord_id]["email_configurations"]
-        original_count = len(configs)
-        configs[:] = [c for c in configs if c.get("id") != config_id]
-        
-        if len(configs) < original_count:
-            return self._save_data(data)
-        return False
+        def change(data):
+            if discord_id not in data.get("users", {}):
+                return False
+            configs = data["users"][discord_id]["email_configurations"]
+            original_count = len(configs)
+            configs[:] = [c for c in configs if c.get("id") != config_id]
+            return len(configs) < original_count
+        
+        return self._update(change)
     
     # Monitoring Rules Methods
+    @synchronized
     def add_monitoring_rule(self, discord_id: str, rule: Dict) -> str:
         """Add monitoring rule and return rule ID"""
-        data = self._load_data()
-        self._ensure_user_structure(data, discord_id)
-        
         rule_id = str(uuid.uuid4())
         rule.update({
             "id": rule_id,
@@ -197,12 +241,14 @@ class EmailMonitoringS3Manager:
             "is_active": rule.get("is_active", True)
         })
         
-        data["users"][discord_id]["monitoring_rules"].append(rule)
-        
-        if self._save_data(data):
+        def change(data):
+            self._ensure_user_structure(data, discord_id)
+            data["users"][discord_id]["monitoring_rules"].append(dict(rule))
             return rule_id
-        return None
+        
+        return self._update(change, failed=None)
     
+    @synchronized
     def get_monitoring_rules(self, discord_id: str, active_only: bool = True) -> List[Dict]:
         """Get monitoring rules for a user"""
         data = self._load_data()
@@ -213,31 +259,27 @@ class EmailMonitoringS3Manager:
         
         return rules
     
+    @synchronized
     def delete_monitoring_rule(self, discord_id: str, rule_id: str) -> bool:
         """Delete a monitoring rule"""
-        data = self._load_data()
-        if discord_id not in data.get("users", {}):
-            return False
-        
-        rules = data["users"][discord_id]["monitoring_rules"]
-        original_count = len(rules)
-        rules[:] = [r for r in rules if r.get("id") != rule_id]
-        
-        if len(rules) < original_count:
-            return self._save_data(data)
-        return False
+        def change(data):
+            if discord_id not in data.get("users", {}):
+                return False
+            rules = data["users"][discord_id]["monitoring_rules"]
+            original_count = len(rules)
+            rules[:] = [r for r in rules if r.get("id") != rule_id]
+            return len(rules) < original_count
+        
+        return self._update(change)
     
     # Activity Logs Methods
     def log_email_match(self, discord_id: str, rule_id: str, email_subject: str, 
                        email_sender: str, email_date: str, webhook_sent: bool, 
                        webhook_response: str, email_body: str = "") -> bool:
         """Log email match activity"""
-        data = self._load_data()
-        self._ensure_user_structure(data, discord_id)
-        
         log_entry = {
             "id": str(uuid.uuid4()),
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": activity_timestamp(),
             "rule_id": rule_id,
             "email_subject": email_subject,
             "email_sender": email_sender,
@@ -247,45 +289,84 @@ class EmailMonitoringS3Manager:
             "webhook_response": webhook_response
         }
         
-        # Add to logs (keep last 1000 entries per user)
-        logs = data["users"][discord_id]["activity_logs"]
-        logs.append(log_entry)
-        
-        # Trim old logs
-        if len(logs) > 1000:
-            logs[:] = logs[-1000:]
-        
-        return self._save_data(data)
+        # One small append; old entries are trimmed when the user's log is compacted
+        try:
+            self.activity.append(discord_id, log_entry)
+            return True
+        except Exception as e:
+            print(f"❌ Error logging email match: {e}")
+            return False
     
-    def get_recent_logs(self, discord_id: str, limit: int = 50) -> List[Dict]:
-        """Get recent activity logs for a user"""
-        data = self._load_data()
-        logs = data.get("users", {}).get(discord_id, {}).get("activity_logs", [])
+    def _legacy_logs(self, discord_id: str) -> List[Dict]:
+        """Logs still stored in the main file (until compact_activity moves them)"""
+        with self._lock:
+            data = self._load_data()
+            return list(data.get("users", {}).get(discord_id, {}).get("activity_logs", []))
+    
+    def get_recent_logs(self, discord_id: str, limit: int = 50, before: Optional[str] = None) -> List[Dict]:
+        """Get recent activity logs for a user, newest first (older than ``before`` when paging)"""
+        try:
+            logs = self.activity.page(discord_id, limit, before)
+        except Exception as e:
+            print(f"❌ Error loading email activity logs: {e}")
+            logs = []
         
+        legacy = [log for log in self._legacy_logs(discord_id)
+                  if not before or log.get("timestamp", "") < before]
+        if legacy:
+            logs = logs + legacy
+            
         # Sort by timestamp (newest first) and limit
         logs.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
         return logs[:limit]
     
     def get_all_recent_logs(self, limit: int = 100) -> List[Dict]:
         """Get recent activity logs across all users"""
-        data = self._load_data()
+        with self._lock:
+            discord_ids = list(self._load_data().get("users", {}))
         all_logs = []
         
-        for discord_id, user_data in data.get("users", {}).items():
-            for log in user_data.get("activity_logs", []):
-                log["discord_id"] = discord_id
-                all_logs.append(log)
+        for discord_id in discord_ids:
+            for log in self.get_recent_logs(discord_id, limit):
+                all_logs.append(dict(log, discord_id=discord_id))
         
         # Sort by timestamp (newest first) and limit
         all_logs.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
         return all_logs[:limit]
     
+    def compact_activity(self) -> int:
+        """Fold appended activity into day segments for every user; returns entries folded"""
+        with self._lock:
+            data = self._load_data(force_refresh=True)
+            discord_ids = list(data.get("users", {}))
+            legacy = {discord_id: list(user_data["activity_logs"])
+                      for discord_id, user_data in data.get("users", {}).items() if user_data.get("activity_logs")}
+        
+        folded = 0
+        for discord_id in discord_ids:
+            try:
+                folded += self.activity.compact(discord_id, imported=legacy.get(discord_id))
+            except Exception as e:
+                print(f"❌ Error compacting email activity for {discord_id}: {e}")
+                legacy.pop(discord_id, None)
+        
+        # Logs that were in the main file now live in segments
+        if legacy:
+            def change(data):
+                for discord_id in legacy:
+                    data.get("users", {}).get(discord_id, {}).pop("activity_logs", None)
+                return True
+            
+            with self._lock:
+                self._update(change)
+        
+        return folded
+    
     # System Webhook Methods
+    @synchronized
     def set_system_webhook(self, webhook_url: str, description: str, created_by: str, include_body: bool = False) -> bool:
         """Set system-wide webhook configuration"""
-        data = self._load_data()
-        
-        data["system_webhook"] = {
+        webhook = {
             "webhook_url": webhook_url,
             "description": description,
             "is_active": True,
@@ -294,8 +375,13 @@ class EmailMonitoringS3Manager:
             "include_body": include_body
         }
         
-        return self._save_data(data)
+        def change(data):
+            data["system_webhook"] = webhook
+            return True
+        
+        return self._update(change)
     
+    @synchronized
     def get_system_webhook(self) -> Optional[Dict]:
         """Get system webhook configuration"""
         data = self._load_data()
@@ -305,47 +391,48 @@ class EmailMonitoringS3Manager:
             return webhook
         return None
     
+    @synchronized
     def delete_system_webhook(self) -> bool:
         """Delete system webhook configuration"""
-        data = self._load_data()
-        data["system_webhook"] = {
-            "webhook_url": None,
-            "description": None,
-            "is_active": False,
-            "created_by": None,
-            "created_at": None
-        }
-        return self._save_data(data)
+        def change(data):
+            data["system_webhook"] = {
+                "webhook_url": None,
+                "description": None,
+                "is_active": False,
+                "created_by": None,
+                "created_at": None
+            }
+            return True
+        
+        return self._update(change)
     
     # Utility Methods
     def update_last_checked(self, discord_id: str, email_address: str) -> bool:
         """Update last checked timestamp for email configuration"""
-        data = self._load_data()
-        if discord_id not in data.get("users", {}):
+        # Stored in the user's small activity manifest instead of rewriting the main file
+        try:
+            self.activity.set_last_checked(discord_id, email_address, datetime.now().isoformat())
+            return True
+        except Exception as e:
+            print(f"❌ Error updating last checked time: {e}")
             return False
-        
-        configs = data["users"][discord_id]["email_configurations"]
-        for config in configs:
-            if config.get("email_address") == email_address:
-                config["last_checked"] = datetime.now().isoformat()
-                return self._save_data(data)
-        
-        return False
     
+    @synchronized
     def update_service_status(self, status_update: Dict) -> bool:
         """Update service status in S3"""
-        data = self._load_data()
-        
-        if "service_status" not in data:
-            data["service_status"] = {
-                "last_check_run": None,
-                "last_check_instance": None,
-                "check_in_progress": False
-            }
+        def change(data):
+            if "service_status" not in data:
+                data["service_status"] = {
+                    "last_check_run": None,
+                    "last_check_instance": None,
+                    "check_in_progress": False
+                }
+            data["service_status"].update(status_update)
+            return True
         
-        data["service_status"].update(status_update)
-        return self._save_data(data)
+        return self._update(change)
     
+    @synchronized
     def get_service_status(self) -> Dict:
         """Get current service status"""
         data = self._load_data()
@@ -357,23 +444,34 @@ class EmailMonitoringS3Manager:
     
     def get_stats(self) -> Dict:
         """Get email monitoring statistics"""
-        data = self._load_data()
-        
-        total_users = len(data.get("users", {}))
-        total_configs = 0
-        total_rules = 0
-        active_configs = 0
-        total_logs = 0
-        
-        for user_data in data.get("users", {}).values():
-            configs = user_data.get("email_configurations", [])
-            rules = user_data.get("monitoring_rules", [])
-            logs = user_data.get("activity_logs", [])
+        with self._lock:
+            data = self._load_data()
             
-            total_configs += len(configs)
-            total_rules += len(rules)
-            total_logs += len(logs)
-            active_configs += len([c for c in configs if c.get("is_active")])
+            total_users = len(data.get("users", {}))
+            total_configs = 0
+            total_rules = 0
+            active_configs = 0
+            total_logs = 0
+            
+            for user_data in data.get("users", {}).values():
+                configs = user_data.get("email_configurations", [])
+                rules = user_data.get("monitoring_rules", [])
+                logs = user_data.get("activity_logs", [])
+                
+                total_configs += len(configs)
+                total_rules += len(rules)
+                total_logs += len(logs)
+                active_configs += len([c for c in configs if c.get("is_active")])
+            
+            discord_ids = list(data.get("users", {}))
+            system_webhook_configured = bool(data.get("system_webhook", {}).get("is_active"))
+        
+        # Compacted activity entries (appends since the last compaction are not counted)
+        for discord_id in discord_ids:
+            try:
+                total_logs += self.activity.manifest(discord_id)[0].get("entries", 0)
+            except Exception as e:
+                print(f"❌ Error loading email activity manifest: {e}")
         
         return {
             "total_users": total_users,
@@ -381,7 +479,7 @@ class EmailMonitoringS3Manager:
             "active_configurations": active_configs,
             "total_rules": total_rules,
             "total_logs": total_logs,
-            "system_webhook_configured": bool(data.get("system_webhook", {}).get("is_active"))
+            "system_webhook_configured": system_webhook_configured
         }
 
 # Global instance for use throughout the application
@@ -0,0 +1,289 @@
+"""
+Batched Gmail message fetching.
+
+Callers used to list message ids and then GET each message with ``format=full``, one
+round trip per message, so a 500-message discount refresh took minutes. ``GmailFetcher``
+sends the message GETs through Gmail's ``/batch/gmail/v1`` multipart endpoint, up to
+``GMAIL_BATCH_SIZE`` (max 100) per HTTP request, asks only for the format and
+partial-response ``fields`` the caller needs, and retries rate-limited (429, 403
+rateLimitExceeded) and 5xx responses - whole batches or single parts - with
+exponential backoff and jitter.
+
+``GMAIL_API_BASE_URL`` points the fetcher at another host (e.g. a local stub server in
+tests). A 401 raises ``GmailAuthError`` whose message contains "401", so callers wrapped
+in ``safe_google_api_call`` refresh the token and retry as before.
+"""
+
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import quote, urlencode
+
+import requests
+
+GMAIL_API_BASE_URL = os.getenv('GMAIL_API_BASE_URL', 'https://gmail.googleapis.com').rstrip('/')
+GMAIL_BATCH_SIZE = min(100, max(1, int(os.getenv('GMAIL_BATCH_SIZE', '100'))))
+GMAIL_MAX_RETRIES = int(os.getenv('GMAIL_MAX_RETRIES', '5'))
+GMAIL_BACKOFF_SECONDS = float(os.getenv('GMAIL_BACKOFF_SECONDS', '1'))
+GMAIL_BACKOFF_MAX_SECONDS = 32.0
+GMAIL_REQUEST_TIMEOUT = 30
+
+# Partial responses: what the header/body extractors read and nothing else
+MESSAGE_METADATA_FIELDS = 'id,threadId,internalDate,snippet,payload/headers'
+MESSAGE_BODY_FIELDS = ('id,threadId,internalDate,snippet,payload(mimeType,headers,body/data,'
+                       'parts(mimeType,body/data,parts(mimeType,body/data,parts(mimeType,body/data))))')
+DEFAULT_METADATA_HEADERS = ('Subject', 'From', 'Date')
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+
+
+class GmailAuthError(Exception):
+    """The access token was rejected (HTTP 401)"""
+
+
+class HistoryExpired(Exception):
+    """The start historyId is older than the history Gmail keeps (HTTP 404)"""
+
+
+_local = threading.local()
+
+
+def get_session() -> requests.Session:
+    """This thread's keep-alive session for Gmail requests"""
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
+
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """Seconds to wait before retry ``attempt`` (1-based); honours a numeric Retry-After"""
+    if retry_after and retry_after.strip().isdigit():
+        return min(GMAIL_BACKOFF_MAX_SECONDS, float(retry_after))
+    delay = min(GMAIL_BACKOFF_MAX_SECONDS, GMAIL_BACKOFF_SECONDS * (2 ** (attempt - 1)))
+    return delay + random.uniform(0, GMAIL_BACKOFF_SECONDS)
+
+
+def _is_retryable(status: Optional[int], data) -> bool:
+    if status in RETRYABLE_STATUSES:
+        return True
+    if status == 403 and isinstance(data, dict):
+        errors = (data.get('error') or {}).get('errors') or []
+        return any(error.get('reason') in RATE_LIMIT_REASONS for error in errors)
+    return False
+
+
+def _split_head(block: bytes) -> Tuple[bytes, bytes]:
+    """Split a MIME/HTTP block into header lines and body at the first blank line"""
+    positions = [(block.find(sep), len(sep)) for sep in (b'\r\n\r\n', b'\n\n') if block.find(sep) != -1]
+    if not positions:
+        return block, b''
+    index, length = min(positions)
+    return block[:index], block[index + length:]
+
+
+def _header(head: bytes, name: str) -> Optional[str]:
+    for line in head.decode('utf-8', errors='replace').splitlines():
+        key, sep, value = line.partition(':')
+        if sep and key.strip().lower() == name.lower():
+            return value.strip()
+    return None
+
+
+def parse_batch_response(content_type: str, body: bytes) -> Dict[str, Tuple[int, object]]:
+    """Content-ID (without the ``response-`` prefix) -> (status, JSON body) of each part"""
+    match = re.search(r'boundary="?([^";]+)"?', content_type or '')
+    if not match:
+        raise ValueError(f"Batch response without multipart boundary: {content_type}")
+    delimiter = b'--' + match.group(1).encode('ascii')
+
+    results = {}
+    for part in body.split(delimiter)[1:]:
+        if part.startswith(b'--'):
+            break
+        part_head, http_message = _split_head(part.lstrip(b'\r\n'))
+        content_id = (_header(part_head, 'Content-ID') or '').strip('<>')
+        if content_id.startswith('response-'):
+            content_id = content_id[len('response-'):]
+        status_line, _, rest = http_message.lstrip(b'\r\n').partition(b'\n')
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            continue
+        # A blank line right after the status line means the part has no headers
+        payload = rest if rest.startswith((b'\r\n', b'\n')) else _split_head(rest)[1]
+        payload = payload.strip()
+        try:
+            data = json.loads(payload) if payload else None
+        except ValueError:
+            data = None
+        results[content_id] = (status, data)
+    return results
+
+
+class GmailFetcher:
+    """Lists and fetches Gmail messages for one access token"""
+
+    def __init__(self, access_token: str, base_url: str = GMAIL_API_BASE_URL, batch_size: int = GMAIL_BATCH_SIZE,
+                 max_retries: int = GMAIL_MAX_RETRIES, session: Optional[requests.Session] = None):
+        self.access_token = access_token
+        self.base_url = base_url.rstrip('/')
+        self.batch_size = min(100, max(1, batch_size))
+        self.max_retries = max_retries
+        self.session = session or get_session()
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """One Gmail HTTP call, retried on rate limits and server errors"""
+        headers = dict(kwargs.pop('headers', {}))
+        headers['Authorization'] = f"Bearer {self.access_token}"
+        attempt = 0
+        while True:
+            response = self.session.request(method, url, headers=headers, timeout=GMAIL_REQUEST_TIMEOUT, **kwargs)
+            if response.status_code == 401:
+                raise GmailAuthError(f"Gmail API 401 error: {response.text[:200]}")
+            data = None
+            if response.status_code == 403:
+                try:
+                    data = response.json()
+                except ValueError:
+                    pass
+            if not _is_retryable(response.status_code, data) or attempt >= self.max_retries:
+                response.raise_for_status()
+                return response
+            attempt += 1
+            time.sleep(backoff_delay(attempt, response.headers.get('Retry-After')))
+
+    def list_message_ids(self, query: str, max_results: int = 500, label_ids: Sequence[str] = ()) -> List[str]:
+        """Ids of messages matching a search query (newest first), following page tokens"""
+        url = f"{self.base_url}/gmail/v1/users/me/messages"
+        ids: List[str] = []
+        page_token = None
+        while len(ids) < max_results:
+            params = {'q': query, 'maxResults': min(500, max_results - len(ids)), 'fields': 'messages/id,nextPageToken'}
+            if label_ids:
+                params['labelIds'] = list(label_ids)
+            if page_token:
+                params['pageToken'] = page_token
+            data = self._request('GET', url, params=params).json()
+            ids.extend(message['id'] for message in data.get('messages', []))
+            page_token = data.get('nextPageToken')
+            if not page_token:
+                break
+        return ids[:max_results]
+
+    def get_history_id(self) -> str:
+        """The mailbox's current historyId"""
+        url = f"{self.base_url}/gmail/v1/users/me/profile"
+        return str(self._request('GET', url, params={'fields': 'historyId'}).json()['historyId'])
+
+    def list_history(self, start_history_id: str, max_messages: int = 500,
+                     label_id: Optional[str] = None) -> Tuple[Optional[List[str]], str]:
+        """Ids of messages added since ``start_history_id`` and the historyId to resume from
+
+        The ids are None when more than ``max_messages`` were added (callers fall back to a
+        bounded search). Raises HistoryExpired when the start point is no longer available.
+        """
+        url = f"{self.base_url}/gmail/v1/users/me/history"
+        ids: List[str] = []
+        latest = str(start_history_id)
+        page_token = None
+        while True:
+            params = {'startHistoryId': start_history_id, 'historyTypes': 'messageAdded', 'maxResults': 500,
+                      'fields': 'history/messagesAdded/message/id,nextPageToken,historyId'}
+            if label_id:
+                params['labelId'] = label_id
+            if page_token:
+                params['pageToken'] = page_token
+            try:
+                data = self._request('GET', url, params=params).json()
+            except requests.HTTPError as e:
+                if e.response is not None and e.response.status_code == 404:
+                    raise HistoryExpired(f"historyId {start_history_id} is no longer available")
+                raise
+            for record in data.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    ids.append(added['message']['id'])
+            latest = str(data.get('historyId') or latest)
+            if len(dict.fromkeys(ids)) > max_messages:
+                return None, latest
+            page_token = data.get('nextPageToken')
+            if not page_token:
+                break
+        return list(dict.fromkeys(ids)), latest
+
+    def _message_path(self, message_id: str, message_format: str, metadata_headers: Iterable[str],
+                      fields: Optional[str]) -> str:
+        params = [('format', message_format)]
+        if message_format == 'metadata':
+            params.extend(('metadataHeaders', header) for header in metadata_headers)
+        if fields:
+            params.append(('fields', fields))
+        return f"/gmail/v1/users/me/messages/{quote(message_id, safe='')}?{urlencode(params)}"
+
+    def _send_batch(self, paths: Dict[str, str]) -> Dict[str, Tuple[int, object]]:
+        boundary = f"batch_{uuid.uuid4().hex}"
+        lines = []
+        for content_id, path in paths.items():
+            lines.extend([
+                f"--{boundary}",
+                'Content-Type: application/http',
+                f"Content-ID: <{content_id}>",
+                '',
+                f"GET {path}",
+                '',
+            ])
+        lines.append(f"--{boundary}--")
+        response = self._request(
+            'POST', f"{self.base_url}/batch/gmail/v1",
+            data='\r\n'.join(lines).encode('utf-8'),
+            headers={'Content-Type': f'multipart/mixed; boundary={boundary}'},
+        )
+        return parse_batch_response(response.headers.get('Content-Type', ''), response.content)
+
+    def get_messages(self, message_ids: Iterable[str], message_format: str = 'full',
+                     metadata_headers: Iterable[str] = DEFAULT_METADATA_HEADERS,
+                     fields: Optional[str] = None) -> Dict[str, dict]:
+        """message id -> message resource, in input order; messages that cannot be fetched are left out"""
+        ordered = list(dict.fromkeys(message_ids))
+        metadata_headers = tuple(metadata_headers)
+        fetched: Dict[str, dict] = {}
+        pending = ordered
+        attempt = 0
+        while pending:
+            retry = []
+            for start in range(0, len(pending), self.batch_size):
+                chunk = pending[start:start + self.batch_size]
+                paths = {f"item-{i}": self._message_path(message_id, message_format, metadata_headers, fields)
+                         for i, message_id in enumerate(chunk)}
+                responses = self._send_batch(paths)
+                for i, message_id in enumerate(chunk):
+                    status, data = responses.get(f"item-{i}", (None, None))
+                    if status == 200 and isinstance(data, dict):
+                        fetched[message_id] = data
+                    elif status == 401:
+                        raise GmailAuthError(f"Gmail API 401 error for message {message_id}")
+                    elif status is None or _is_retryable(status, data):
+                        retry.append(message_id)
+                    elif status != 404:
+                        print(f"Gmail message {message_id} could not be fetched: HTTP {status}")
+            if not retry:
+                break
+            attempt += 1
+            if attempt > self.max_retries:
+                print(f"Gmail batch: giving up on {len(retry)} messages after {self.max_retries} retries")
+                break
+            time.sleep(backoff_delay(attempt))
+            pending = retry
+        return {message_id: fetched[message_id] for message_id in ordered if message_id in fetched}
+
+    def get_message(self, message_id: str, message_format: str = 'full',
+                    metadata_headers: Iterable[str] = DEFAULT_METADATA_HEADERS,
+                    fields: Optional[str] = None) -> Optional[dict]:
+        return self.get_messages([message_id], message_format, metadata_headers, fields).get(message_id)
+
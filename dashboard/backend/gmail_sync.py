@@ -0,0 +1,207 @@
+"""
+Incremental Gmail mailbox sync with historyId cursors.
+
+Every discount refresh and monitoring run used to repeat a day-window
+``users.messages.list`` search and process every message it returned again. A
+``GmailMailboxSync`` keeps one cursor per mailbox (the Gmail ``historyId`` that was
+current when the mailbox was last synced) and asks ``users.history.list`` only for
+messages added since then, so steady-state polling cost follows new mail instead of
+mailbox size.
+
+When there is no cursor yet, the history has expired (Gmail keeps about a week), or
+more than ``max_messages`` were added, the caller's bounded full search runs instead.
+The historyId is read *before* that search so nothing arriving during it is skipped.
+Cursors only move when the caller ``commit``s after processing, so a failed run
+re-reads the same messages next time. Messages that could not be fetched in a run
+that otherwise succeeded are passed to ``commit`` as failed: they are kept as pending
+and added to the next incremental batch (up to ``GMAIL_SYNC_MAX_ATTEMPTS`` runs), so
+moving the cursor past them does not lose them.
+
+Callers that must return a whole window (the discount alerts page) also keep the
+parsed result of each processed message here, so only new messages are fetched and
+parsed. Results are tied to a fingerprint of the parsing configuration and dropped
+when it changes.
+"""
+
+import json
+import os
+import sqlite3
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from db_access import Database
+from gmail_batch import GmailFetcher, HistoryExpired
+
+GMAIL_SYNC_DB = os.getenv('GMAIL_SYNC_DB', 'gmail_sync.db')
+GMAIL_SYNC_MAX_ATTEMPTS = int(os.getenv('GMAIL_SYNC_MAX_ATTEMPTS', '5'))
+
+
+def create_gmail_sync_schema(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS gmail_sync_cursors (
+            mailbox TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            history_id TEXT NOT NULL,
+            synced_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS gmail_sync_messages (
+            mailbox TEXT NOT NULL,
+            message_id TEXT NOT NULL,
+            received_at REAL NOT NULL,
+            result TEXT,
+            PRIMARY KEY (mailbox, message_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_gmail_sync_messages_received ON gmail_sync_messages (mailbox, received_at)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS gmail_sync_pending (
+            mailbox TEXT NOT NULL,
+            message_id TEXT NOT NULL,
+            attempts INTEGER NOT NULL,
+            PRIMARY KEY (mailbox, message_id)
+        ) WITHOUT ROWID
+    ''')
+
+
+class GmailSyncStore:
+    """historyId cursors and processed-message results per mailbox"""
+
+    def __init__(self, db_path: str = GMAIL_SYNC_DB):
+        self.db = Database(db_path)
+
+    def _ready(self) -> Database:
+        self.db.migrate('gmail_sync', create_gmail_sync_schema)
+        return self.db
+
+    def get_cursor(self, mailbox: str, fingerprint: str = '') -> Optional[str]:
+        """The stored historyId, or None (a changed fingerprint also drops the stored results)"""
+        row = self._ready().fetchone('SELECT fingerprint, history_id FROM gmail_sync_cursors WHERE mailbox = ?', (mailbox,))
+        if row is None:
+            return None
+        if row[0] != fingerprint:
+            self.reset(mailbox)
+            return None
+        return row[1]
+
+    def set_cursor(self, mailbox: str, fingerprint: str, history_id: str, failed_ids: Iterable[str] = ()):
+        """Move the cursor and replace the mailbox's pending messages with this run's failures"""
+        failed_ids = list(dict.fromkeys(failed_ids))
+        with self._ready().transaction() as conn:
+            attempts = dict(conn.execute('SELECT message_id, attempts FROM gmail_sync_pending WHERE mailbox = ?', (mailbox,)).fetchall())
+            retry = [(message_id, attempts.get(message_id, 0) + 1) for message_id in failed_ids]
+            dropped = [message_id for message_id, count in retry if count > GMAIL_SYNC_MAX_ATTEMPTS]
+            if dropped:
+                print(f"Gmail sync {mailbox}: giving up on {len(dropped)} messages after {GMAIL_SYNC_MAX_ATTEMPTS} attempts")
+            conn.execute(
+                'INSERT OR REPLACE INTO gmail_sync_cursors (mailbox, fingerprint, history_id, synced_at) VALUES (?, ?, ?, ?)',
+                (mailbox, fingerprint, str(history_id), time.time())
+            )
+            conn.execute('DELETE FROM gmail_sync_pending WHERE mailbox = ?', (mailbox,))
+            conn.executemany(
+                'INSERT INTO gmail_sync_pending (mailbox, message_id, attempts) VALUES (?, ?, ?)',
+                [(mailbox, message_id, count) for message_id, count in retry if count <= GMAIL_SYNC_MAX_ATTEMPTS]
+            )
+
+    def pending_message_ids(self, mailbox: str) -> List[str]:
+        """Messages an earlier run could not fetch, to retry in the next batch"""
+        rows = self._ready().fetchall('SELECT message_id FROM gmail_sync_pending WHERE mailbox = ?', (mailbox,))
+        return [message_id for (message_id,) in rows]
+
+    def reset(self, mailbox: str):
+        with self._ready().transaction() as conn:
+            conn.execute('DELETE FROM gmail_sync_cursors WHERE mailbox = ?', (mailbox,))
+            conn.execute('DELETE FROM gmail_sync_messages WHERE mailbox = ?', (mailbox,))
+            conn.execute('DELETE FROM gmail_sync_pending WHERE mailbox = ?', (mailbox,))
+
+    def known_message_ids(self, mailbox: str, message_ids: Iterable[str]) -> Set[str]:
+        message_ids = list(message_ids)
+        known = set()
+        db = self._ready()
+        for start in range(0, len(message_ids), 500):
+            chunk = message_ids[start:start + 500]
+            rows = db.fetchall(
+                f"SELECT message_id FROM gmail_sync_messages WHERE mailbox = ? AND message_id IN ({','.join('?' * len(chunk))})",
+                [mailbox, *chunk]
+            )
+            known.update(message_id for (message_id,) in rows)
+        return known
+
+    def record_messages(self, mailbox: str, results: Iterable[Tuple[str, float, Optional[dict]]]):
+        """Store (message id, received timestamp, parsed result or None) for processed messages"""
+        self._ready().write_many(
+            'INSERT OR REPLACE INTO gmail_sync_messages (mailbox, message_id, received_at, result) VALUES (?, ?, ?, ?)',
+            [(mailbox, message_id, float(received_at), json.dumps(result) if result is not None else None)
+             for message_id, received_at, result in results]
+        )
+
+    def results_since(self, mailbox: str, since: float) -> List[dict]:
+        """Stored results received at or after ``since``, newest first (older rows are pruned)"""
+        db = self._ready()
+        db.write('DELETE FROM gmail_sync_messages WHERE mailbox = ? AND received_at < ?', (mailbox, since))
+        rows = db.fetchall(
+            'SELECT result FROM gmail_sync_messages WHERE mailbox = ? AND result IS NOT NULL ORDER BY received_at DESC',
+            (mailbox,)
+        )
+        return [json.loads(result) for (result,) in rows]
+
+
+class SyncBatch:
+    """Message ids to process in one sync and the cursor to commit afterwards"""
+
+    def __init__(self, message_ids: List[str], history_id: str, full_sync: bool):
+        self.message_ids = message_ids
+        self.history_id = history_id
+        self.full_sync = full_sync
+
+
+class GmailMailboxSync:
+    """New-message discovery for one mailbox"""
+
+    def __init__(self, fetcher: GmailFetcher, mailbox: str, fingerprint: str = '', store: Optional[GmailSyncStore] = None):
+        self.fetcher = fetcher
+        self.mailbox = mailbox
+        self.fingerprint = fingerprint
+        self.store = store or gmail_sync_store
+
+    def new_message_ids(self, full_search: Callable[[], List[str]], max_messages: int = 500) -> SyncBatch:
+        """Messages added since the last commit plus earlier failures, or ``full_search()`` when history cannot be used"""
+        cursor = self.store.get_cursor(self.mailbox, self.fingerprint)
+        if cursor:
+            try:
+                message_ids, history_id = self.fetcher.list_history(cursor, max_messages=max_messages)
+                if message_ids is not None:
+                    pending = self.store.pending_message_ids(self.mailbox)
+                    return SyncBatch(list(dict.fromkeys(pending + message_ids)), history_id, full_sync=False)
+                print(f"Gmail sync {self.mailbox}: more than {max_messages} new messages, running a full search")
+            except HistoryExpired:
+                print(f"Gmail sync {self.mailbox}: history {cursor} expired, running a full search")
+        history_id = self.fetcher.get_history_id()
+        return SyncBatch(full_search(), history_id, full_sync=True)
+
+    def commit(self, batch: SyncBatch, failed_ids: Iterable[str] = ()):
+        """Record the batch as processed; ``failed_ids`` (messages that could not be fetched) are retried next time"""
+        self.store.set_cursor(self.mailbox, self.fingerprint, batch.history_id, failed_ids)
+
+
+def config_fingerprint(*values) -> str:
+    return json.dumps(values, sort_keys=True, default=str)
+
+
+def message_received_at(message: dict) -> float:
+    """Gmail's internalDate (ms since epoch) in seconds; now when missing"""
+    try:
+        return int(message['internalDate']) / 1000.0
+    except (KeyError, TypeError, ValueError):
+        return time.time()
+
+
+def header_values(message: dict) -> Dict[str, str]:
+    """Top-level headers by lower-cased name"""
+    return {header.get('name', '').lower(): header.get('value', '')
+            for header in (message.get('payload') or {}).get('headers', [])}
+
+
+# Process-wide store used by the Gmail callers
+gmail_sync_store = GmailSyncStore()
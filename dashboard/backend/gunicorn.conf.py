@@ -0,0 +1,29 @@
+"""Gunicorn settings for the dashboard API: gunicorn -c gunicorn.conf.py wsgi:app"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# Processes scale across cores; threads cover requests blocked on S3/Sellerboard/Google I/O
+workers = int(os.getenv('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+
+# Cold analytics requests download and analyze several reports
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '300'))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then to bound memory held by cached report DataFrames
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = 200
+
+# Workers import the app themselves: no SQLite connection, lock or thread crosses a fork
+preload_app = False
+
+accesslog = '-'
+errorlog = '-'
+
+# Workers share the app caches through SQLite rather than one dict per process
+os.environ.setdefault('CACHE_BACKEND', 'sqlite')
@@ -0,0 +1,441 @@
+"""
+Incremental IMAP mailbox sync by UID, with header-first fetching.
+
+The IMAP discount fetch and monitor checks used to SEARCH a day window and then
+``FETCH (RFC822)`` the newest 50 messages one command at a time, downloading whole MIME
+messages (attachments included) on every poll. An ``ImapMailboxSync`` remembers the
+folder's UIDVALIDITY and the highest UID already synced per account and only asks for
+UIDs above it. New messages are read with one ``UID FETCH`` over the whole UID set:
+``BODY.PEEK[HEADER.FIELDS (...)]`` and ``BODYSTRUCTURE`` first, then - only for messages
+that pass the caller's sender/subject pre-filter - the single text part (HTML
+preferred), one more command per distinct part section. PEEK and a read-only SELECT
+leave the \\Seen flags alone.
+
+A missing cursor, a changed UIDVALIDITY or a changed fingerprint runs the caller's
+bounded SEARCH instead, and the new cursor is taken from UIDNEXT at SELECT time so
+nothing arriving during the search is skipped. Cursors only move on ``commit``.
+
+``IMAP_PLAINTEXT_HOSTS`` makes ``connect`` use plain IMAP for the listed hosts (a local
+stub server in tests); every other host uses IMAP4_SSL as before.
+"""
+
+import base64
+import email
+import imaplib
+import json
+import os
+import quopri
+import re
+import sqlite3
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from db_access import Database
+
+IMAP_SYNC_DB = os.getenv('IMAP_SYNC_DB', 'imap_sync.db')
+IMAP_PLAINTEXT_HOSTS = {host.strip().lower() for host in os.getenv('IMAP_PLAINTEXT_HOSTS', '').split(',') if host.strip()}
+IMAP_TIMEOUT = 30
+
+DEFAULT_HEADER_FIELDS = ('FROM', 'SUBJECT', 'DATE')
+
+
+def connect(host: str, port: int = 993) -> imaplib.IMAP4:
+    if host.lower() in IMAP_PLAINTEXT_HOSTS:
+        return imaplib.IMAP4(host, port, timeout=IMAP_TIMEOUT)
+    return imaplib.IMAP4_SSL(host, port, timeout=IMAP_TIMEOUT)
+
+
+def create_imap_sync_schema(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS imap_sync_cursors (
+            mailbox TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            uidvalidity INTEGER NOT NULL,
+            last_uid INTEGER NOT NULL,
+            synced_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS imap_sync_messages (
+            mailbox TEXT NOT NULL,
+            uid INTEGER NOT NULL,
+            received_at REAL NOT NULL,
+            result TEXT,
+            PRIMARY KEY (mailbox, uid)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_imap_sync_messages_received ON imap_sync_messages (mailbox, received_at)')
+
+
+class ImapSyncStore:
+    """UID cursors and processed-message results per mailbox"""
+
+    def __init__(self, db_path: str = IMAP_SYNC_DB):
+        self.db = Database(db_path)
+
+    def _ready(self) -> Database:
+        self.db.migrate('imap_sync', create_imap_sync_schema)
+        return self.db
+
+    def get_cursor(self, mailbox: str, fingerprint: str, uidvalidity: int) -> Optional[int]:
+        """The last synced UID, or None (a changed fingerprint or UIDVALIDITY also drops the stored results)"""
+        row = self._ready().fetchone(
+            'SELECT fingerprint, uidvalidity, last_uid FROM imap_sync_cursors WHERE mailbox = ?', (mailbox,)
+        )
+        if row is None:
+            return None
+        if row[0] != fingerprint or row[1] != uidvalidity:
+            self.reset(mailbox)
+            return None
+        return row[2]
+
+    def set_cursor(self, mailbox: str, fingerprint: str, uidvalidity: int, last_uid: int):
+        self._ready().write(
+            'INSERT OR REPLACE INTO imap_sync_cursors (mailbox, fingerprint, uidvalidity, last_uid, synced_at) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (mailbox, fingerprint, int(uidvalidity), int(last_uid), time.time())
+        )
+
+    def reset(self, mailbox: str):
+        with self._ready().transaction() as conn:
+            conn.execute('DELETE FROM imap_sync_cursors WHERE mailbox = ?', (mailbox,))
+            conn.execute('DELETE FROM imap_sync_messages WHERE mailbox = ?', (mailbox,))
+
+    def known_uids(self, mailbox: str, uids: Iterable[int]) -> Set[int]:
+        uids = list(uids)
+        known = set()
+        db = self._ready()
+        for start in range(0, len(uids), 500):
+            chunk = uids[start:start + 500]
+            rows = db.fetchall(
+                f"SELECT uid FROM imap_sync_messages WHERE mailbox = ? AND uid IN ({','.join('?' * len(chunk))})",
+                [mailbox, *chunk]
+            )
+            known.update(uid for (uid,) in rows)
+        return known
+
+    def record_messages(self, mailbox: str, results: Iterable[Tuple[int, float, Optional[dict]]]):
+        """Store (UID, received timestamp, parsed result or None) for processed messages"""
+        self._ready().write_many(
+            'INSERT OR REPLACE INTO imap_sync_messages (mailbox, uid, received_at, result) VALUES (?, ?, ?, ?)',
+            [(mailbox, int(uid), float(received_at), json.dumps(result) if result is not None else None)
+             for uid, received_at, result in results]
+        )
+
+    def results_since(self, mailbox: str, since: float) -> List[dict]:
+        """Stored results received at or after ``since``, newest first (older rows are pruned)"""
+        db = self._ready()
+        db.write('DELETE FROM imap_sync_messages WHERE mailbox = ? AND received_at < ?', (mailbox, since))
+        rows = db.fetchall(
+            'SELECT result FROM imap_sync_messages WHERE mailbox = ? AND result IS NOT NULL '
+            'ORDER BY received_at DESC, uid DESC',
+            (mailbox,)
+        )
+        return [json.loads(result) for (result,) in rows]
+
+
+# --- FETCH response parsing -------------------------------------------------------
+
+_LITERAL = re.compile(rb'\{(\d+)\}')
+
+
+def _tokenize(buffer: bytes):
+    """Nested lists of atoms (str), strings (bytes) and None for NIL"""
+    stack: List[list] = [[]]
+    i, length = 0, len(buffer)
+    while i < length:
+        char = buffer[i:i + 1]
+        if char in (b' ', b'\r', b'\n'):
+            i += 1
+        elif char == b'(':
+            stack.append([])
+            i += 1
+        elif char == b')':
+            if len(stack) > 1:
+                done = stack.pop()
+                stack[-1].append(done)
+            i += 1
+        elif char == b'"':
+            i += 1
+            value = bytearray()
+            while i < length and buffer[i:i + 1] != b'"':
+                if buffer[i:i + 1] == b'\\':
+                    i += 1
+                value += buffer[i:i + 1]
+                i += 1
+            stack[-1].append(bytes(value))
+            i += 1
+        elif char == b'{' and _LITERAL.match(buffer, i):
+            match = _LITERAL.match(buffer, i)
+            start = match.end()
+            size = int(match.group(1))
+            stack[-1].append(buffer[start:start + size])
+            i = start + size
+        else:
+            # Atoms; section specifiers like BODY[HEADER.FIELDS (FROM)]<0> keep their spaces and parens
+            start = i
+            depth = 0
+            while i < length:
+                char = buffer[i:i + 1]
+                if char == b'[':
+                    depth += 1
+                elif char == b']':
+                    depth -= 1
+                elif depth == 0 and char in (b' ', b'(', b')'):
+                    break
+                i += 1
+            atom = buffer[start:i].decode('ascii', errors='replace')
+            stack[-1].append(None if atom.upper() == 'NIL' else atom)
+    while len(stack) > 1:
+        done = stack.pop()
+        stack[-1].append(done)
+    return stack[0]
+
+
+def parse_fetch_response(data: Sequence) -> List[Dict[str, object]]:
+    """imaplib FETCH data -> one {ITEM NAME: value} dict per message"""
+    chunks = []
+    for item in data:
+        if isinstance(item, tuple):
+            # imaplib drops the CRLF after {n}, so the literal follows its size marker directly
+            chunks.append(item[0] + item[1])
+        elif item:
+            chunks.append(item)
+    tokens = _tokenize(b' '.join(chunks))
+
+    messages = []
+    for token in tokens:
+        if not isinstance(token, list):
+            continue
+        values = {}
+        for name, value in zip(token[::2], token[1::2]):
+            if isinstance(name, str):
+                values[name.upper().replace('BODY.PEEK[', 'BODY[')] = value
+        messages.append(values)
+    return messages
+
+
+def _text(value) -> str:
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    return value or ''
+
+
+def _params(value) -> Dict[str, str]:
+    if not isinstance(value, list):
+        return {}
+    return {_text(key).lower(): _text(val) for key, val in zip(value[::2], value[1::2])}
+
+
+class TextPart:
+    """Where a message's body text lives and how it is encoded"""
+
+    def __init__(self, section: str, subtype: str, charset: str, encoding: str):
+        self.section = section
+        self.subtype = subtype
+        self.charset = charset
+        self.encoding = encoding
+
+    def decode(self, raw: bytes) -> str:
+        if self.encoding == 'base64':
+            try:
+                raw = base64.b64decode(raw)
+            except (ValueError, TypeError):
+                pass
+        elif self.encoding == 'quoted-printable':
+            raw = quopri.decodestring(raw)
+        try:
+            return raw.decode(self.charset or 'utf-8', errors='ignore')
+        except LookupError:
+            return raw.decode('utf-8', errors='ignore')
+
+
+def find_text_part(structure) -> Optional[TextPart]:
+    """The first text/html part of a BODYSTRUCTURE (or the first text/plain one); attachments are skipped"""
+    found: Dict[str, TextPart] = {}
+
+    def walk(node, section):
+        if not isinstance(node, list) or not node:
+            return
+        if isinstance(node[0], list):
+            # Multipart: child parts first, then the subtype and extension data
+            number = 0
+            for child in node:
+                if not isinstance(child, list):
+                    break
+                number += 1
+                walk(child, f"{section}.{number}" if section else str(number))
+            return
+        media_type, subtype = _text(node[0]).lower(), _text(node[1] if len(node) > 1 else '').lower()
+        if media_type != 'text' or subtype not in ('html', 'plain') or subtype in found:
+            return
+        disposition = node[9] if len(node) > 9 else None
+        if isinstance(disposition, list) and _text(disposition[0]).lower() == 'attachment':
+            return
+        charset = _params(node[2] if len(node) > 2 else None).get('charset', 'utf-8')
+        encoding = _text(node[5] if len(node) > 5 else '').lower()
+        # A single-part message's body is its TEXT section
+        found[subtype] = TextPart(section or 'TEXT', subtype, charset, encoding)
+
+    walk(structure, '')
+    return found.get('html') or found.get('plain')
+
+
+def internal_date_timestamp(value) -> Optional[float]:
+    """INTERNALDATE ("17-Jul-1996 02:44:25 -0700") as a timestamp"""
+    try:
+        return datetime.strptime(_text(value).strip(), '%d-%b-%Y %H:%M:%S %z').timestamp()
+    except ValueError:
+        return None
+
+
+def uid_set(uids: Iterable[int]) -> str:
+    """Compact UID set: 1:3,7,9:10"""
+    ranges = []
+    for uid in sorted(set(uids)):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ','.join(f"{start}:{end}" if start != end else str(start) for start, end in ranges)
+
+
+class ImapMessage:
+    """Headers, receive time and (once fetched) body text of one message"""
+
+    def __init__(self, uid: int, headers: email.message.Message, received_at: float, text_part: Optional[TextPart]):
+        self.uid = uid
+        self.headers = headers
+        self.received_at = received_at
+        self.text_part = text_part
+        self.text: Optional[str] = None
+
+    def header(self, name: str) -> str:
+        return self.headers.get(name, '') or ''
+
+    @property
+    def has_html(self) -> bool:
+        return self.text_part is not None and self.text_part.subtype == 'html'
+
+    @property
+    def html(self) -> str:
+        """The text/html body only; empty for plain-text messages"""
+        return (self.text or '') if self.has_html else ''
+
+    @property
+    def html_content(self) -> str:
+        """The body as HTML (plain text is wrapped in a div); empty when not fetched"""
+        if not self.text:
+            return ''
+        if self.text_part and self.text_part.subtype == 'plain':
+            return f"<div>{self.text}</div>"
+        return self.text
+
+
+class ImapSyncBatch:
+    """UIDs to process in one sync and the cursor to commit afterwards"""
+
+    def __init__(self, uids: List[int], uidvalidity: int, last_uid: int, full_sync: bool):
+        self.uids = uids
+        self.uidvalidity = uidvalidity
+        self.last_uid = last_uid
+        self.full_sync = full_sync
+
+
+class ImapMailboxSync:
+    """New-message discovery and header-first fetching for one logged-in IMAP connection"""
+
+    def __init__(self, mail: imaplib.IMAP4, mailbox: str, fingerprint: str = '',
+                 store: Optional[ImapSyncStore] = None, folder: str = 'INBOX'):
+        self.mail = mail
+        self.mailbox = mailbox
+        self.fingerprint = fingerprint
+        self.store = store or imap_sync_store
+        self.folder = folder
+
+    def _check(self, result: str, data, command: str):
+        if result != 'OK':
+            raise imaplib.IMAP4.error(f"IMAP {command} failed: {data}")
+
+    def select(self) -> Tuple[int, Optional[int]]:
+        """Open the folder read-only; returns (UIDVALIDITY, UIDNEXT or None)"""
+        result, data = self.mail.select(self.folder, readonly=True)
+        self._check(result, data, 'SELECT')
+        uidvalidity = self.mail.response('UIDVALIDITY')[1][0]
+        uidnext = self.mail.response('UIDNEXT')[1][0]
+        if uidvalidity is None:
+            raise imaplib.IMAP4.error(f"IMAP SELECT {self.folder} returned no UIDVALIDITY")
+        return int(uidvalidity), int(uidnext) if uidnext else None
+
+    def search(self, criteria: str) -> List[int]:
+        """UIDs matching a SEARCH criteria string, ascending"""
+        result, data = self.mail.uid('SEARCH', None, criteria)
+        self._check(result, data, 'UID SEARCH')
+        return sorted({int(uid) for uid in (data[0] or b'').split()})
+
+    def new_uids(self, full_search_criteria: str, max_messages: int = 50) -> ImapSyncBatch:
+        """UIDs added since the last commit (newest ``max_messages``), or the full search's newest ones"""
+        uidvalidity, uidnext = self.select()
+        cursor = self.store.get_cursor(self.mailbox, self.fingerprint, uidvalidity)
+        if cursor is not None:
+            # "n:*" always includes the highest UID, even when it is below n
+            uids = [uid for uid in self.search(f"UID {cursor + 1}:*") if uid > cursor]
+            if len(uids) > max_messages:
+                print(f"IMAP sync {self.mailbox}: {len(uids)} new messages, processing the newest {max_messages}")
+            return ImapSyncBatch(uids[-max_messages:], uidvalidity, max(uids, default=cursor), full_sync=False)
+
+        last_uid = uidnext - 1 if uidnext else max(self.search('UID *'), default=0)
+        uids = self.search(full_search_criteria)
+        return ImapSyncBatch(uids[-max_messages:], uidvalidity, max(last_uid, max(uids, default=0)), full_sync=True)
+
+    def fetch_headers(self, uids: Iterable[int], header_fields: Sequence[str] = DEFAULT_HEADER_FIELDS) -> Dict[int, ImapMessage]:
+        """UID -> ImapMessage with only the given header fields and the body structure, in UID order"""
+        uids = sorted(set(uids))
+        if not uids:
+            return {}
+        result, data = self.mail.uid(
+            'FETCH', uid_set(uids),
+            f"(UID INTERNALDATE BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS ({' '.join(header_fields)})])"
+        )
+        self._check(result, data, 'UID FETCH')
+
+        messages = {}
+        for values in parse_fetch_response(data):
+            try:
+                uid = int(values['UID'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            header_bytes = next((value for name, value in values.items() if name.startswith('BODY[HEADER')), b'')
+            messages[uid] = ImapMessage(
+                uid,
+                email.message_from_bytes(header_bytes if isinstance(header_bytes, bytes) else b''),
+                internal_date_timestamp(values.get('INTERNALDATE')) or time.time(),
+                find_text_part(values.get('BODYSTRUCTURE')),
+            )
+        return {uid: messages[uid] for uid in uids if uid in messages}
+
+    def fetch_text(self, messages: Iterable[ImapMessage]):
+        """Fill in ``text`` of the given messages, one UID FETCH per distinct part section"""
+        by_section: Dict[str, Dict[int, ImapMessage]] = {}
+        for message in messages:
+            if message.text_part is not None:
+                by_section.setdefault(message.text_part.section, {})[message.uid] = message
+        for section, section_messages in by_section.items():
+            result, data = self.mail.uid('FETCH', uid_set(section_messages), f"(UID BODY.PEEK[{section}])")
+            self._check(result, data, 'UID FETCH')
+            for values in parse_fetch_response(data):
+                try:
+                    message = section_messages.get(int(values['UID']))
+                except (KeyError, TypeError, ValueError):
+                    continue
+                raw = values.get(f"BODY[{section}]")
+                if message is not None and isinstance(raw, bytes):
+                    message.text = message.text_part.decode(raw)
+
+    def commit(self, batch: ImapSyncBatch):
+        self.store.set_cursor(self.mailbox, self.fingerprint, batch.uidvalidity, batch.last_uid)
+
+
+# Process-wide store used by the IMAP callers
+imap_sync_store = ImapSyncStore()
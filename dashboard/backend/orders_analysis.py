@@ -1,13 +1,22 @@
 import requests
 import pandas as pd
-from io import StringIO
+import threading
+from collections import OrderedDict
 from datetime import datetime, date, timedelta
 import json
 import os
 import math
 import numpy as np
-from typing import Dict, Optional, List, Tuple
+from typing import Callable, Dict, Optional, List, Tuple
 from purchase_analytics import PurchaseAnalytics
+from sellerboard_cache import sellerboard_frame_cache
+from sellerboard_download import fetch_report, normalize_report_url, read_report_frame
+from datetime_parsing import parse_datetime_robust
+from stock_index import StockIndex
+from restock_scoring import MISSING_DAYS_LEFT, priority_record, restock_record, score_restock
+from daily_sales_store import DAILY_SALES_REFRESH_DAYS, DailySalesStore, daily_sales_store, latest_complete_day
+from sheet_snapshots import batch_get_values, drive_modified_time, load_worksheet_values, sheet_snapshot_store, values_key
+from analytics_payload import summarize_orders
 
 # Global variable to store worksheet debug info for debug endpoint
 _global_worksheet_debug = {}
@@ -15,10 +24,74 @@ _global_worksheet_debug = {}
 # Default URLs removed for security - users must configure their own URLs
 ORDERS_REPORT_URL = None
 STOCK_REPORT_URL = None
-YESTERDAY_SALES_FILE = "yesterday_sales.json"
+
+# Default collaborators for analyze(), registered once by the web app at startup so that
+# analyzers never have to import app.py themselves (see configure_dependencies)
+_default_cogs_provider: Optional[Callable[[str], Optional[Dict]]] = None
+_default_token_refresher: Optional[Callable[[dict], str]] = None
+
+def configure_dependencies(cogs_provider: Optional[Callable[[str], Optional[Dict]]] = None, token_refresher: Optional[Callable[[dict], str]] = None):
+    """Register the default email COGS provider and Google token refresher used by analyzers.
+
+    cogs_provider(discord_id) returns the same structure as app.fetch_sellerboard_cogs_data_from_email,
+    token_refresher(user_record) returns a fresh Google access token.
+    """
+    global _default_cogs_provider, _default_token_refresher
+    if cogs_provider is not None:
+        _default_cogs_provider = cogs_provider
+    if token_refresher is not None:
+        _default_token_refresher = token_refresher
+
+# Velocity windows (days) and their weights - adjusted for the 30-day Sellerboard export
+VELOCITY_PERIODS = (3, 7, 14, 21, 30)
+VELOCITY_WEIGHTS = (0.35, 0.3, 0.2, 0.1, 0.05)
+VELOCITY_WINDOW_DAYS = max(VELOCITY_PERIODS)
+# Longer windows served from the daily sales store once enough history is recorded
+LONG_TERM_VELOCITY_PERIODS = (60, 90, 180, 365)
+
+# Orders older than this are dropped while the report is parsed (0 keeps every row)
+SELLERBOARD_ORDERS_MAX_AGE_DAYS = int(os.getenv('SELLERBOARD_ORDERS_MAX_AGE_DAYS', '60'))
+
+# Processed (cogs_data, DataFrame) per worksheet content hash, so unchanged tabs are not re-parsed.
+# The snapshot store keeps them for every worker process; this LRU saves unpickling them per call.
+_worksheet_result_memo: "OrderedDict[tuple, tuple]" = OrderedDict()
+_worksheet_result_memo_lock = threading.Lock()
+WORKSHEET_RESULT_MEMO_SIZE = 256
+
+def _copy_worksheet_result(worksheet_cogs: Dict[str, dict], df: pd.DataFrame) -> Tuple[Dict[str, dict], pd.DataFrame]:
+    # Callers mutate the per-ASIN dicts while merging worksheets, so hand out copies
+    return {asin: {**data, 'all_sources': list(data.get('all_sources', []))} for asin, data in worksheet_cogs.items()}, df.copy()
+
+def _remember_worksheet(key: tuple, entry: Tuple[Dict[str, dict], pd.DataFrame]):
+    with _worksheet_result_memo_lock:
+        _worksheet_result_memo[key] = entry
+        _worksheet_result_memo.move_to_end(key)
+        while len(_worksheet_result_memo) > WORKSHEET_RESULT_MEMO_SIZE:
+            _worksheet_result_memo.popitem(last=False)
+
+def _get_memoized_worksheet(key: tuple) -> Optional[Tuple[Dict[str, dict], pd.DataFrame]]:
+    sheet_id, worksheet_name, digest, mapping_key = key
+    with _worksheet_result_memo_lock:
+        entry = _worksheet_result_memo.get(key)
+        if entry is not None:
+            _worksheet_result_memo.move_to_end(key)
+    if entry is None:
+        entry = sheet_snapshot_store.load_result(sheet_id, worksheet_name, mapping_key, digest)
+        if entry is None:
+            return None
+        _remember_worksheet(key, entry)
+    return _copy_worksheet_result(*entry)
+
+def _set_memoized_worksheet(key: tuple, worksheet_cogs: Dict[str, dict], df: pd.DataFrame):
+    sheet_id, worksheet_name, digest, mapping_key = key
+    entry = _copy_worksheet_result(worksheet_cogs, df)
+    _remember_worksheet(key, entry)
+    sheet_snapshot_store.save_result(sheet_id, worksheet_name, mapping_key, digest, entry)
 
 class EnhancedOrdersAnalysis:
-    def __init__(self, orders_url: Optional[str] = None, stock_url: Optional[str] = None, cogs_url: Optional[str] = None, discord_id: Optional[str] = None):
+    def __init__(self, orders_url: Optional[str] = None, stock_url: Optional[str] = None, cogs_url: Optional[str] = None, discord_id: Optional[str] = None,
+                 cogs_provider: Optional[Callable[[str], Optional[Dict]]] = None, token_refresher: Optional[Callable[[dict], str]] = None,
+                 daily_sales: Optional[DailySalesStore] = None):
         if not orders_url or not stock_url:
             raise ValueError("Both orders_url and stock_url must be provided. No default URLs available.")
         self.orders_url = orders_url
@@ -26,6 +99,12 @@ class EnhancedOrdersAnalysis:
         self.cogs_url = cogs_url  # Optional Sellerboard COGS URL
         self.discord_id = discord_id  # For email-based COGS data access
         
+        # Injected collaborators, falling back to the ones registered via configure_dependencies
+        self._cogs_provider = cogs_provider
+        self._token_refresher = token_refresher
+        # Per-user daily sales history (only used when discord_id is known)
+        self.daily_sales = daily_sales or daily_sales_store
+        
         # Initialize purchase analytics
         self.purchase_analytics = PurchaseAnalytics()
         
@@ -37,154 +116,128 @@ class EnhancedOrdersAnalysis:
             pass  # Debug print removed
             self.has_numpy = False
 
-    def _parse_datetime_robust(self, series: pd.Series, column_name: str) -> pd.Series:
-        """Robust datetime parsing that tries multiple formats"""
-        # Parsing datetime column
-        
-        # Common datetime formats from Sellerboard and other sources
-        # PRIORITY ORDER: Most common Sellerboard formats first
-        formats_to_try = [
-            # Sellerboard specific formats (most common first)
-            "%m/%d/%y %H:%M",        # 7/26/25 6:05 (US Sellerboard format)
-            "%d/%m/%Y %H:%M:%S",     # 28/07/2025 06:21:44 (EU/International Sellerboard format)
-            "%m/%d/%Y %H:%M:%S",     # 07/28/2025 14:30:45 (US with seconds)
-            "%d/%m/%Y %H:%M",        # 28/07/2025 06:21 (EU without seconds)
-            "%m/%d/%y %H:%M:%S",     # 7/26/25 6:05:00 (US with seconds)
-            "%d/%m/%y %H:%M:%S",     # 28/07/25 06:21:44 (EU with 2-digit year)
-            
-            # Legacy formats for backward compatibility
-            "%m/%d/%Y %I:%M:%S %p",  # 07/28/2025 02:30:45 PM (12-hour with AM/PM)
-            "%d/%m/%Y %I:%M:%S %p",  # 28/07/2025 02:30:45 PM (EU with AM/PM)
-            "%Y-%m-%d %H:%M:%S",     # 2025-07-28 14:30:45 (ISO-like)
-            "%Y-%m-%d %I:%M:%S %p",  # 2025-07-28 02:30:45 PM
-            "%m/%d/%Y",              # 07/28/2025 (date only)  
-            "%Y-%m-%d",              # 2025-07-28 (ISO date)
-            "%d/%m/%Y",              # 28/07/2025 (EU date only)
-        ]
+    @property
+    def cogs_provider(self) -> Optional[Callable[[str], Optional[Dict]]]:
+        return self._cogs_provider or _default_cogs_provider
+
+    @property
+    def token_refresher(self) -> Optional[Callable[[dict], str]]:
+        return self._token_refresher or _default_token_refresher
+
+    def _parse_datetime_robust(self, series: pd.Series, column_name: str, source_key: Optional[str] = None) -> pd.Series:
+        """Robust datetime parsing that sniffs the format from a sample (memoized per report source)"""
+        return parse_datetime_robust(series, column_name, source_key=source_key)
+
+    def download_csv(self, url: str, use_cache: bool = True, report_type: Optional[str] = None) -> pd.DataFrame:
+        """Download CSV data from URL.
+
+        The report is streamed and parsed in chunks with the column/dtype hints of its
+        ``report_type`` ('orders', 'stock' or 'cogs'; inferred from the analyzer's own URLs
+        when omitted). Parsed reports are shared through the process-wide
+        ``sellerboard_frame_cache``: fresh entries skip the network entirely and stale ones
+        are revalidated with ETag/Last-Modified or a body hash. Callers always get their
+        own copy of the frame.
+        """
         
-        parsed_series = None
-        successful_format = None
+        if report_type is None:
+            report_type = 'orders' if url == self.orders_url else 'stock' if url == self.stock_url else None
         
-        for fmt in formats_to_try:
-            try:
-                parsed_series = pd.to_datetime(series, format=fmt, errors='coerce')
-                # Count how many values were successfully parsed
-                valid_count = parsed_series.notna().sum()
-                if valid_count > 0:
-                    # Format parsed successfully
-                    successful_format = fmt
-                    break
-            except Exception as e:
-                continue
+        # Check if URL has required parameters
+        url = normalize_report_url(url)
         
-        # If no specific format worked, try pandas' flexible parsing as fallback
-        if parsed_series is None or parsed_series.notna().sum() == 0:
-            # All specific formats failed, trying flexible parsing
-            parsed_series = pd.to_datetime(series, errors='coerce')
-        
-        # Log results
-        final_valid_count = parsed_series.notna().sum()
-        nat_count = parsed_series.isna().sum()
-        
-        # Final parsing results logged
-        if successful_format:
-            # Best format found
-            pass
-        
-        # Show sample of unparseable values for debugging
-        if nat_count > 0:
-            invalid_mask = parsed_series.isna() & series.notna()
-            if invalid_mask.any():
-                sample_invalid = series[invalid_mask].head(3).tolist()
-                # Sample unparseable values found
-                pass
+        if not use_cache:
+            df, _ = self._read_report_csv(self._fetch_csv_response(url), url, report_type)
+            return df
         
-        return parsed_series
+        cached_df = sellerboard_frame_cache.get_fresh(url)
+        if cached_df is not None:
+            return cached_df
+        
+        # Only one thread downloads a given report; the others wait and reuse the result
+        with sellerboard_frame_cache.lock_for(url):
+            cached_df = sellerboard_frame_cache.get_fresh(url)
+            if cached_df is not None:
+                return cached_df
+            
+            stale_entry = sellerboard_frame_cache.peek(url)
+            conditional_headers = stale_entry.conditional_headers() if stale_entry else {}
+            response = self._fetch_csv_response(url, conditional_headers)
+            
+            if response.status_code == 304:
+                revalidated_df = sellerboard_frame_cache.revalidated(url)
+                if revalidated_df is not None:
+                    return revalidated_df
+                # Entry was evicted while we were revalidating - fetch it unconditionally
+                response = self._fetch_csv_response(url)
+            
+            df, body_hash = self._read_report_csv(response, url, report_type)
+            if stale_entry is not None and stale_entry.body_hash == body_hash:
+                revalidated_df = sellerboard_frame_cache.revalidated(url)
+                if revalidated_df is not None:
+                    return revalidated_df
+            
+            return sellerboard_frame_cache.put(
+                url, df,
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified'),
+                body_hash=body_hash
+            )
 
-    def download_csv(self, url: str) -> pd.DataFrame:
-        """Download CSV data from URL"""
-        
-        # Check if URL has required parameters
-        if 'sellerboard.com' in url and 'format=csv' not in url:
-            # Add CSV format if missing
-            separator = '&' if '?' in url else '?'
-            url = f"{url}{separator}format=csv"
-        
-        # Try to download with better error handling
+    def _read_report_csv(self, response: requests.Response, source_url: Optional[str] = None,
+                         report_type: Optional[str] = None) -> Tuple[pd.DataFrame, str]:
+        """Parse a streamed report and pre-parse the orders date column so cached copies are typed"""
+        chunk_filter = self._recent_orders_filter(source_url) if report_type == 'orders' else None
         try:
-            # Create a session to handle cookies properly
-            session = requests.Session()
-            
-            # Add headers that might be expected by Sellerboard
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Accept': 'text/csv,application/csv,text/plain,*/*',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Connection': 'keep-alive',
-            }
-            
-            # First, get the redirect URL without following it
-            initial_response = session.get(url, timeout=30, allow_redirects=False, headers=headers)
-            
-            if initial_response.status_code == 302:
-                redirect_url = initial_response.headers.get('Location')
-                print(f"Got redirect to: {redirect_url}")
-                
-                # Now follow the redirect with the same session (preserving automation cookies)
-                response = session.get(redirect_url, timeout=30, headers=headers)
-                
-                if response.status_code == 401:
-                    print(f"❌ 401 error - download URL requires additional authentication")
-                    print(f"🔍 The automation token creates a session but download needs browser login")
-                    print(f"💡 Solution: User must download manually through logged-in browser")
-                    raise Exception(f"AUTHENTICATION_REQUIRED: Sellerboard COGS downloads require browser login session. Please download manually: {url}")
-                    
-            else:
-                response = initial_response
-                
+            df, body_hash = read_report_frame(response, report_type, chunk_filter=chunk_filter)
+        except Exception as csv_error:
             pass  # Debug print removed
-            
-            # Check for authentication errors specifically
-            if response.status_code == 401:
-                pass  # Debug print removed
-                pass  # Debug print removed
-                pass  # Debug print removed
-                pass  # Debug print removed
-                pass  # Debug print removed
-            
-            response.raise_for_status()
-            
-            # Try to parse the CSV
-            try:
-                df = pd.read_csv(StringIO(response.text))
-                
-                
-                return df
-            except Exception as csv_error:
-                pass  # Debug print removed
-                pass  # Debug print removed
-                raise
-                
+            raise
+        
+        date_col, product_col, _ = self._order_columns(df)
+        if date_col == 'PurchaseDate(UTC)' and product_col:
+            self._localize_order_dates(df, date_col, source_key=source_url)
+        return df, body_hash
+
+    def _recent_orders_filter(self, source_url: Optional[str]) -> Optional[Callable[[pd.DataFrame], pd.DataFrame]]:
+        """Per-chunk filter dropping orders older than SELLERBOARD_ORDERS_MAX_AGE_DAYS"""
+        if SELLERBOARD_ORDERS_MAX_AGE_DAYS <= 0:
+            return None
+        cutoff = pd.Timestamp.utcnow().tz_localize(None).normalize() - pd.Timedelta(days=SELLERBOARD_ORDERS_MAX_AGE_DAYS)
+        
+        def keep_recent(chunk: pd.DataFrame) -> pd.DataFrame:
+            date_col, product_col, _ = self._order_columns(chunk)
+            if date_col != 'PurchaseDate(UTC)' or not product_col:
+                return chunk
+            # Parsed here once; _read_report_csv then finds the column already typed
+            self._localize_order_dates(chunk, date_col, source_key=source_url)
+            dates = chunk[date_col]
+            if dates.dt.tz is not None:
+                dates = dates.dt.tz_convert('UTC').dt.tz_localize(None)
+            # Unparseable dates are kept, the date-range helpers drop them as before
+            return chunk[dates.isna() | (dates >= cutoff)]
+        
+        return keep_recent
+
+    def _fetch_csv_response(self, url: str, extra_headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        """Perform the (possibly conditional) streamed HTTP download of a report"""
+        try:
+            return fetch_report(url, extra_headers)
         except requests.exceptions.RequestException as e:
             pass  # Debug print removed
-            if hasattr(e, 'response') and e.response is not None:
-                pass  # Debug print removed
-                pass  # Debug print removed
             raise
 
-    def get_orders_for_date_range(self, df: pd.DataFrame, start_date: date, end_date: date, user_timezone: str = None) -> pd.DataFrame:
-        """Get orders for a date range instead of just single date"""
-        date_columns = [col for col in df.columns if 'date' in col.lower() or 'time' in col.lower()]
-        if not date_columns:
-            return df
-        
-        date_col = date_columns[0]
-        if date_col == 'PurchaseDate(UTC)':
-            # Try multiple datetime formats for PurchaseDate(UTC)
-            df[date_col] = self._parse_datetime_robust(df[date_col], date_col)
-        else:
-            df[date_col] = pd.to_datetime(df[date_col], errors='coerce')
+    def _localize_order_dates(self, df: pd.DataFrame, date_col: str, user_timezone: str = None, source_key: Optional[str] = None) -> None:
+        """Parse the order date column in place and convert it to the user's timezone.
+
+        Already-parsed columns are left alone, so repeated range queries over the same
+        frame only pay for parsing and timezone conversion once.
+        """
+        if not pd.api.types.is_datetime64_any_dtype(df[date_col]):
+            if date_col == 'PurchaseDate(UTC)':
+                # Try multiple datetime formats for PurchaseDate(UTC)
+                df[date_col] = self._parse_datetime_robust(df[date_col], date_col, source_key=source_key or self.orders_url)
+            else:
+                df[date_col] = pd.to_datetime(df[date_col], errors='coerce')
         
         # Convert timestamps to user timezone if provided
         if user_timezone and not df[date_col].empty:
@@ -192,9 +245,19 @@ class EnhancedOrdersAnalysis:
                 # Assume UTC if no timezone info present, then convert to user timezone
                 if df[date_col].dt.tz is None:
                     df[date_col] = df[date_col].dt.tz_localize('UTC')
-                df[date_col] = df[date_col].dt.tz_convert(user_timezone)
+                if str(df[date_col].dt.tz) != user_timezone:
+                    df[date_col] = df[date_col].dt.tz_convert(user_timezone)
             except Exception as e:
                 pass  # Timezone conversion error
+
+    def get_orders_for_date_range(self, df: pd.DataFrame, start_date: date, end_date: date, user_timezone: str = None) -> pd.DataFrame:
+        """Get orders for a date range instead of just single date"""
+        date_columns = [col for col in df.columns if 'date' in col.lower() or 'time' in col.lower()]
+        if not date_columns:
+            return df
+        
+        date_col = date_columns[0]
+        self._localize_order_dates(df, date_col, user_timezone)
         
         # Filter by date range - properly handle timezone-aware datetime comparisons
         # Convert date objects to pandas datetime for comparison
@@ -291,111 +354,236 @@ class EnhancedOrdersAnalysis:
         
         return result_dict
 
-    def calculate_enhanced_velocity(self, asin: str, orders_df: pd.DataFrame, target_date: date, user_timezone: str = None) -> Dict:
-        """Calculate enhanced multi-period velocity with trend analysis (optimized for 30-day Sellerboard data)"""
-        # Adjusted periods for 30-day Sellerboard data limit
-        periods = [3, 7, 14, 21, 30]
-        velocity_data = {}
-        
-        try:
-            for period in periods:
-                start_date = target_date - timedelta(days=period-1)
-                period_orders = self.get_orders_for_date_range(orders_df, start_date, target_date, user_timezone)
-                period_sales = self.asin_sales_count(period_orders)
-                daily_avg = period_sales.get(asin, 0) / period
-                velocity_data[f'{period}d'] = daily_avg
-        except Exception as e:
-            if "Invalid comparison between dtype=datetime64[ns] and date" in str(e):
-                pass  # Debug print removed
-                pass  # Debug print removed
-                pass  # Debug print removed
-                pass  # Debug print removed
-                pass  # Debug print removed
-            raise
-        
-        # Calculate weighted velocity (recent performance weighted higher) - adjusted for 30-day data
-        weighted_velocity = (
-            velocity_data['3d'] * 0.35 +   # Very recent (3 days)
-            velocity_data['7d'] * 0.3 +    # Recent (1 week)
-            velocity_data['14d'] * 0.2 +   # Medium term (2 weeks)
-            velocity_data['21d'] * 0.1 +   # Longer term (3 weeks)
-            velocity_data['30d'] * 0.05    # Full period (1 month)
-        )
-        
-        # Ensure no NaN/Inf values
-        if not isinstance(weighted_velocity, (int, float)) or weighted_velocity != weighted_velocity:  # NaN check
-            weighted_velocity = 0.0
-            
-        # If all historical periods are zero but we have sales today, use today's sales as baseline velocity
-        if weighted_velocity == 0 and all(v == 0 for v in velocity_data.values()):
-            today_orders = self.get_orders_for_date(orders_df, target_date, user_timezone)
-            today_sales_for_asin = self.asin_sales_count(today_orders).get(asin, 0)
-            if today_sales_for_asin > 0:
-                weighted_velocity = today_sales_for_asin  # Use today's sales as velocity
-                velocity_data['current_velocity'] = today_sales_for_asin
-                # Using today's sales as velocity baseline
-        
-        # Trend analysis with safety checks (adjusted for 30-day data limit)
-        recent_velocity = (velocity_data['3d'] + velocity_data['7d']) / 2      # Very recent: 3-7 days
-        historical_velocity = (velocity_data['21d'] + velocity_data['30d']) / 2 # Historical: 3-4 weeks ago
-        
-        # Debug: Print trend calculation details for first few products
-        if not hasattr(self, '_trend_debug_count'):
-            self._trend_debug_count = 0
-        
-        if self._trend_debug_count < 3:  # Debug first 3 products
-            pass  # Debug print removed
-            pass  # Debug print removed
-            pass  # Debug print removed
-            pass  # Debug print removed
-            pass  # Debug print removed
-            pass  # Debug print removed
-            pass  # Debug print removed
-            pass  # Debug print removed
-            self._trend_debug_count += 1
-        
-        # Ensure no NaN/Inf values in trend calculation
-        if historical_velocity > 0 and recent_velocity >= 0:
-            trend_factor = recent_velocity / historical_velocity
-        else:
-            trend_factor = 1.0
-            
-        # Clamp trend_factor to reasonable bounds to prevent extreme values
-        raw_trend_factor = trend_factor
-        trend_factor = max(0.0, min(10.0, trend_factor))
-        
-        # Determine trend direction
-        if trend_factor > 1.2:
-            trend_direction = 'accelerating'
-        elif trend_factor < 0.8:
-            trend_direction = 'declining'
-        else:
-            trend_direction = 'stable'
-        
-        # Calculate confidence score based on data consistency
-        velocities = [velocity_data[key] for key in velocity_data if velocity_data[key] > 0]
-        if len(velocities) > 1 and self.has_numpy:
-            std_dev = np.std(velocities)
-            mean_velocity = np.mean(velocities)
-            confidence = max(0, min(1, 1 - (std_dev / mean_velocity) if mean_velocity > 0 else 0))
-        elif len(velocities) > 1:
-            # Fallback calculation without numpy
-            mean_velocity = sum(velocities) / len(velocities)
-            variance = sum((x - mean_velocity) ** 2 for x in velocities) / len(velocities)
-            std_dev = variance ** 0.5
-            confidence = max(0, min(1, 1 - (std_dev / mean_velocity) if mean_velocity > 0 else 0))
+    def _order_columns(self, df: pd.DataFrame) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """Resolve the date, product and order status columns of an orders report"""
+        date_columns = [col for col in df.columns if 'date' in col.lower() or 'time' in col.lower()]
+        date_col = date_columns[0] if date_columns else None
+
+        product_col = None
+        for col in df.columns:
+            if 'product' in col.lower() or 'asin' in col.lower():
+                product_col = col
+                break
+
+        status_col = None
+        for col in df.columns:
+            if col.lower().replace(' ', '') == 'orderstatus':
+                status_col = col
+                break
+
+        return date_col, product_col, status_col
+
+    def build_sales_matrix(self, orders_df: pd.DataFrame, target_date: date, user_timezone: str = None, days: int = VELOCITY_WINDOW_DAYS) -> Tuple[Dict[str, int], np.ndarray]:
+        """Build an ASIN x day matrix of order counts ending on target_date.
+
+        Column ``k`` holds the orders placed ``k`` days before ``target_date`` (column 0 is
+        ``target_date`` itself), using the same day boundaries and status filter as
+        ``get_orders_for_date_range``. The date column is parsed and localized once.
+        """
+        date_col, product_col, status_col = self._order_columns(orders_df)
+        if not product_col:
+            raise ValueError("Products column not found in CSV.")
+
+        if date_col is None:
+            # get_orders_for_date_range returns the whole frame when there is no date column,
+            # so every order counts towards every window
+            day_offsets = np.zeros(len(orders_df), dtype=np.int64)
+            valid = np.ones(len(orders_df), dtype=bool)
         else:
-            confidence = 0.5
-        
+            self._localize_order_dates(orders_df, date_col, user_timezone)
+            local_times = orders_df[date_col]
+            if local_times.dt.tz is not None:
+                local_times = local_times.dt.tz_localize(None)
+            offsets = (pd.Timestamp(target_date) - local_times.dt.normalize()).dt.days
+            valid = offsets.notna().to_numpy()
+            day_offsets = offsets.fillna(-1).to_numpy(dtype=np.int64)
+            valid &= (day_offsets >= 0) & (day_offsets < days)
+            if status_col:
+                valid &= orders_df[status_col].isin(['Shipped', 'Unshipped']).to_numpy()
+
+        valid &= orders_df[product_col].notna().to_numpy()
+        products = orders_df[product_col].to_numpy()[valid]
+        day_offsets = day_offsets[valid]
+        if len(products) == 0:
+            return {}, np.zeros((0, days), dtype=np.int64)
+
+        counts = (
+            pd.DataFrame({'asin': pd.Series(products).astype(str), 'day': day_offsets})
+            .groupby(['asin', 'day'])
+            .size()
+            .unstack(fill_value=0)
+            .reindex(columns=range(days), fill_value=0)
+        )
+        asin_index = {asin: i for i, asin in enumerate(counts.index)}
+        return asin_index, counts.to_numpy(dtype=np.int64)
+
+    def calculate_velocity_matrix(self, sales_matrix: np.ndarray) -> Dict[str, np.ndarray]:
+        """Derive window sums, velocities, trend and confidence for every row of a sales matrix"""
+        cumulative = np.cumsum(sales_matrix, axis=1) if sales_matrix.size else np.zeros((sales_matrix.shape[0], VELOCITY_WINDOW_DAYS), dtype=np.int64)
+        periods = np.array(VELOCITY_PERIODS)
+        window_sums = cumulative[:, periods - 1]
+        velocities = window_sums / periods
+
+        weighted = velocities @ np.array(VELOCITY_WEIGHTS)
+        weighted = np.where(np.isfinite(weighted), weighted, 0.0)
+
+        # Trend: very recent (3-7 days) against historical (3-4 weeks)
+        recent = (velocities[:, 0] + velocities[:, 1]) / 2
+        historical = (velocities[:, 3] + velocities[:, 4]) / 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            trend = np.where((historical > 0) & (recent >= 0), recent / historical, 1.0)
+        trend = np.clip(trend, 0.0, 10.0)
+
+        # Confidence: 1 - coefficient of variation over the non-zero period velocities
+        positive = velocities > 0
+        positive_count = positive.sum(axis=1)
+        masked = np.where(positive, velocities, 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = masked.sum(axis=1) / positive_count
+            variance = (np.where(positive, velocities - mean[:, None], 0.0) ** 2).sum(axis=1) / positive_count
+            confidence = np.clip(1 - np.sqrt(variance) / mean, 0, 1)
+        confidence = np.where(positive_count > 1, confidence, 0.5)
+
         return {
-            'current_velocity': velocity_data['3d'],  # Use 3-day as "current"
-            'weighted_velocity': weighted_velocity,
-            'trend_factor': trend_factor,
-            'trend_direction': trend_direction,
+            'window_sums': window_sums,
+            'velocities': velocities,
+            'weighted_velocity': weighted,
+            'trend_factor': trend,
             'confidence': confidence,
-            'period_data': velocity_data
         }
 
+    def calculate_enhanced_velocity_batch(self, orders_df: pd.DataFrame, target_date: date, user_timezone: str = None, asins=None) -> Dict[str, Dict]:
+        """Calculate enhanced velocity for many ASINs from a single pass over the orders.
+
+        Returns the same per-ASIN structure as ``calculate_enhanced_velocity`` plus
+        ``units_sold`` window sums. ASINs without orders get all-zero velocities.
+        """
+        asin_index, sales_matrix = self.build_sales_matrix(orders_df, target_date, user_timezone)
+        metrics = self.calculate_velocity_matrix(sales_matrix)
+
+        if asins is None:
+            asins = list(asin_index.keys())
+        zero_metrics = self.calculate_velocity_matrix(np.zeros((1, VELOCITY_WINDOW_DAYS), dtype=np.int64))
+
+        results = {}
+        for asin in asins:
+            row = asin_index.get(asin)
+            source, i = (metrics, row) if row is not None else (zero_metrics, 0)
+
+            period_data = {f'{period}d': float(v) for period, v in zip(VELOCITY_PERIODS, source['velocities'][i])}
+            trend_factor = float(source['trend_factor'][i])
+            if trend_factor > 1.2:
+                trend_direction = 'accelerating'
+            elif trend_factor < 0.8:
+                trend_direction = 'declining'
+            else:
+                trend_direction = 'stable'
+
+            results[asin] = {
+                'current_velocity': period_data['3d'],  # Use 3-day as "current"
+                'weighted_velocity': float(source['weighted_velocity'][i]),
+                'trend_factor': trend_factor,
+                'trend_direction': trend_direction,
+                'confidence': float(source['confidence'][i]),
+                'period_data': period_data,
+                'units_sold': {f'{period}d': int(v) for period, v in zip(VELOCITY_PERIODS, source['window_sums'][i])}
+            }
+        self._attach_long_term_velocity(results, target_date)
+        return results
+
+    def _attach_long_term_velocity(self, results: Dict[str, Dict], target_date: date) -> None:
+        """Add ``long_term`` velocities from the daily sales store for windows it fully covers.
+
+        The last VELOCITY_WINDOW_DAYS come from the orders export (``units_sold['30d']``), the
+        days before that from stored history. ``seasonality_factor`` compares the 30 days that
+        followed ``target_date`` a year ago with the 365-day average.
+        """
+        if not self.discord_id or not results:
+            return
+        history_days = max(LONG_TERM_VELOCITY_PERIODS) - VELOCITY_WINDOW_DAYS
+        try:
+            asin_index, history, recorded = self.daily_sales.sales_matrix(
+                self.discord_id, target_date - timedelta(days=VELOCITY_WINDOW_DAYS), history_days
+            )
+        except Exception as e:
+            print(f"Daily sales history unavailable: {e}")
+            return
+        
+        # Windows are only reported when every day in them is recorded
+        gaps = np.flatnonzero(~recorded)
+        covered_days = VELOCITY_WINDOW_DAYS + (int(gaps[0]) if gaps.size else history_days)
+        if covered_days <= VELOCITY_WINDOW_DAYS:
+            return
+        cumulative = np.cumsum(history, axis=1)
+        periods = [period for period in LONG_TERM_VELOCITY_PERIODS if period <= covered_days]
+        season_start, season_end = 365 - 2 * VELOCITY_WINDOW_DAYS, 365 - VELOCITY_WINDOW_DAYS
+        
+        for asin, velocity_data in results.items():
+            recent_units = velocity_data['units_sold'][f'{VELOCITY_WINDOW_DAYS}d']
+            row = asin_index.get(asin)
+            long_term = {'days_covered': covered_days, 'seasonality_factor': None}
+            for period in periods:
+                older_units = int(cumulative[row, period - VELOCITY_WINDOW_DAYS - 1]) if row is not None else 0
+                long_term[f'{period}d'] = (recent_units + older_units) / period
+            if 365 in periods and long_term['365d'] > 0:
+                # History column k is VELOCITY_WINDOW_DAYS + k days before target_date
+                season_units = int(history[row, season_start:season_end].sum()) if row is not None else 0
+                long_term['seasonality_factor'] = (season_units / VELOCITY_WINDOW_DAYS) / long_term['365d']
+            velocity_data['long_term'] = long_term
+
+    def record_daily_sales(self, orders_df: pd.DataFrame, user_timezone: str = None) -> int:
+        """Fold the complete days of an orders export into the daily sales store.
+
+        Days already stored are skipped except the last DAILY_SALES_REFRESH_DAYS, whose counts
+        can still change with order status. The oldest day of the export is assumed partial.
+        Returns the number of days written.
+        """
+        if not self.discord_id:
+            return 0
+        date_col, product_col, _ = self._order_columns(orders_df)
+        if date_col is None or not product_col:
+            return 0
+        
+        end_day = latest_complete_day(user_timezone)
+        asin_index, sales_matrix = self.build_sales_matrix(orders_df, end_day, user_timezone)
+        earliest = orders_df[date_col].min()
+        if pd.isna(earliest):
+            return 0
+        first_complete_day = earliest.date() + timedelta(days=1)
+        
+        start_day = max(first_complete_day, end_day - timedelta(days=VELOCITY_WINDOW_DAYS - 1))
+        if start_day > end_day:
+            return 0
+        refresh_from = end_day - timedelta(days=DAILY_SALES_REFRESH_DAYS - 1)
+        stored = self.daily_sales.recorded_days(self.discord_id, start_day, end_day)
+        
+        day_sales = {}
+        asins = list(asin_index)
+        for offset in range((end_day - start_day).days + 1):
+            day = end_day - timedelta(days=offset)
+            if day in stored and day < refresh_from:
+                continue
+            column = sales_matrix[:, offset] if sales_matrix.size else np.zeros(0, dtype=np.int64)
+            day_sales[day] = {asins[i]: int(column[i]) for i in np.flatnonzero(column)}
+        return self.daily_sales.record_days(self.discord_id, day_sales)
+
+    def sales_for_day(self, orders_df: pd.DataFrame, day: date, user_timezone: str = None) -> Dict[str, int]:
+        """Units per ASIN sold on a day: from the daily sales store when recorded, else from the orders"""
+        if self.discord_id:
+            try:
+                stored = self.daily_sales.sales_for_day(self.discord_id, day)
+                if stored is not None:
+                    return stored
+            except Exception as e:
+                print(f"Daily sales history unavailable: {e}")
+        return self.asin_sales_count(self.get_orders_for_date(orders_df, day, user_timezone))
+
+    def calculate_enhanced_velocity(self, asin: str, orders_df: pd.DataFrame, target_date: date, user_timezone: str = None) -> Dict:
+        """Calculate enhanced multi-period velocity with trend analysis (optimized for 30-day Sellerboard data)"""
+        velocity_data = self.calculate_enhanced_velocity_batch(orders_df, target_date, user_timezone, asins=[asin])[asin]
+        velocity_data.pop('units_sold', None)
+        return velocity_data
+
     def get_days_left_value(self, stock_record: dict):
         """Helper function to get days left value handling column name variations"""
         # Debug: print available columns (only once)
@@ -498,6 +686,47 @@ class EnhancedOrdersAnalysis:
         # If FBA/FBM Stock column not found, return 0 (don't use other potentially incorrect columns)
         return 0
     
+    def score_restock_batch(self, asins: List[str], velocity_by_asin: Dict[str, Dict], stock_index: Optional[StockIndex] = None,
+                            lead_time_days: int = 90, purchase_analytics: Dict = None) -> Dict[str, np.ndarray]:
+        """Priority and restock arrays for many ASINs (element ``i`` belongs to ``asins[i]``).
+
+        Stock comes from the report's StockIndex arrays (ASINs missing from it count as out of
+        stock) and recent purchases are looked up once per ASIN. Use
+        ``restock_scoring.priority_record``/``restock_record`` to get per-ASIN dicts.
+        """
+        count = len(asins)
+        velocities = [velocity_by_asin.get(asin) or {} for asin in asins]
+        weighted_velocity = np.fromiter((v.get('weighted_velocity', 0) for v in velocities), dtype=float, count=count)
+        trend_factor = np.fromiter((v.get('trend_factor', 1.0) for v in velocities), dtype=float, count=count)
+        confidence = np.fromiter((v.get('confidence', 0.5) for v in velocities), dtype=float, count=count)
+        
+        current_stock = np.zeros(count)
+        days_left = np.full(count, float(MISSING_DAYS_LEFT))
+        unreadable_days_left = np.zeros(count, dtype=bool)
+        # ASINs missing from the report were scored from a fallback row with an explicit 0 stock
+        stock_found = np.ones(count, dtype=bool)
+        if stock_index is not None and len(stock_index):
+            rows = np.fromiter((stock_index.rows.get(asin, -1) for asin in asins), dtype=np.int64, count=count)
+            present = rows >= 0
+            current_stock[present] = stock_index.current_stock[rows[present]]
+            stock_found[present] = stock_index.stock_found[rows[present]]
+            if stock_index.days_left_column:
+                days_left[present] = stock_index.days_left[rows[present]]
+                unreadable_days_left[present] = stock_index.days_left_unreadable[rows[present]]
+        # As get_priority_score does: a days-left value float() rejects scores as out of stock
+        days_left[unreadable_days_left] = MISSING_DAYS_LEFT
+        priority_stock = np.where(unreadable_days_left, 0.0, current_stock)
+        
+        if purchase_analytics:
+            recent_purchases = np.fromiter((self.get_recent_2_months_purchases(asin, purchase_analytics) for asin in asins),
+                                           dtype=float, count=count)
+        else:
+            recent_purchases = np.zeros(count)
+        
+        return score_restock(weighted_velocity, trend_factor, confidence, current_stock, days_left, recent_purchases,
+                             self.calculate_seasonality_factor(date.today()), lead_time_days, bool(purchase_analytics),
+                             priority_stock, stock_found)
+
     def get_priority_score(self, asin: str, velocity_data: Dict, stock_info: Dict, current_sales: int) -> Dict:
         """Calculate priority score for restocking decisions"""
         if not stock_info:
@@ -511,267 +740,34 @@ class EnhancedOrdersAnalysis:
                 if 'days' in key.lower() and 'stock' in key.lower() and 'left' in key.lower():
                     days_left_key = key
                     break
-            days_left = float(stock_info.get(days_left_key, 9999)) if days_left_key else 9999
+            days_left = float(stock_info.get(days_left_key, MISSING_DAYS_LEFT)) if days_left_key else MISSING_DAYS_LEFT
         except (ValueError, TypeError):
             current_stock = 0
-            days_left = 9999
-        
-        # For products with 0 stock, calculate urgency based on velocity and stock level
-        velocity = velocity_data.get('weighted_velocity', 0)
-        if current_stock <= 0:
-            # Zero stock = maximum urgency regardless of days_left calculation
-            urgency = 1.0
-        elif current_stock <= velocity * 3:  # Less than 3 days worth of stock
-            urgency = 1.0
-        elif current_stock <= velocity * 7:  # Less than 7 days worth of stock
-            urgency = 0.8
-        elif days_left <= 3:
-            urgency = 1.0
-        elif days_left <= 7:
-            urgency = 0.8
-        elif days_left <= 14:
-            urgency = 0.6
-        elif days_left <= 30:
-            urgency = 0.3
-        else:
-            urgency = 0.1
-        
-        # Calculate opportunity (velocity × trend factor × seasonality)
-        velocity = velocity_data.get('weighted_velocity', 0)
-        trend_factor = velocity_data.get('trend_factor', 1.0)
-        seasonality = self.calculate_seasonality_factor(date.today())
-        
-        opportunity = velocity * trend_factor * seasonality
-        
-        # Combined priority score
-        priority_score = urgency * (1 + opportunity)
-        
-        # Only generate recommendations for products with velocity > 0
-        if velocity <= 0:
-            category = 'no_velocity'
-            emoji = '⏸️'
-        # Determine category - Special handling for zero stock products
-        elif current_stock <= 0 and velocity > 0:
-            # Zero stock with any velocity should be critical
-            if opportunity >= 1.0:
-                category = 'critical_high_velocity'
-                emoji = '🚨'
-            else:
-                category = 'critical_low_velocity'
-                emoji = '🔴'
-        elif urgency >= 0.8 and opportunity >= 1.0:
-            category = 'critical_high_velocity'
-            emoji = '🚨'
-        elif urgency >= 0.8:
-            category = 'critical_low_velocity'  
-            emoji = '🔴'
-        elif urgency >= 0.6 and opportunity >= 1.0:
-            category = 'warning_high_velocity'
-            emoji = '🚀'
-        elif urgency >= 0.6:
-            category = 'warning_moderate'
-            emoji = '🟡'
-        elif opportunity >= 2.0:
-            category = 'opportunity_high_velocity'
-            emoji = '⚡'
-        elif urgency >= 0.3 or opportunity >= 0.5:
-            category = 'monitor'
-            emoji = '📊'
-        else:
-            category = 'low_priority'
-            emoji = '⏸️'
+            days_left = MISSING_DAYS_LEFT
         
-        # Generate reasoning
-        reasoning_parts = []
-        if current_stock <= 0:
-            reasoning_parts.append("OUT OF STOCK")
-        else:
-            reasoning_parts.append(f"{days_left:.1f} days stock remaining")
-        reasoning_parts.append(f"{velocity:.1f} daily velocity")
-        
-        # Show trend information with more nuanced display
-        if trend_factor > 1.2:
-            if trend_factor >= 3.0:
-                reasoning_parts.append(f"strong acceleration (3x+ recent growth)")
-            elif trend_factor >= 2.0:
-                reasoning_parts.append(f"accelerating trend (+{(trend_factor-1)*100:.0f}%)")
-            else:
-                reasoning_parts.append(f"accelerating trend (+{(trend_factor-1)*100:.0f}%)")
-        elif trend_factor < 0.8:
-            if trend_factor <= 0.3:
-                reasoning_parts.append(f"steep decline (-{(1-trend_factor)*100:.0f}%)")
-            else:
-                reasoning_parts.append(f"declining trend (-{(1-trend_factor)*100:.0f}%)")
-        
-        if seasonality > 1.1:
-            reasoning_parts.append(f"high season (+{(seasonality-1)*100:.0f}%)")
-        elif seasonality < 0.9:
-            reasoning_parts.append(f"low season ({(seasonality-1)*100:.0f}%)")
-        
-        reasoning = f"{emoji} " + ", ".join(reasoning_parts)
-        
-        return {
-            'score': priority_score,
-            'category': category,
-            'urgency': urgency,
-            'opportunity': opportunity,
-            'reasoning': reasoning,
-            'emoji': emoji
-        }
+        scores = score_restock(
+            [velocity_data.get('weighted_velocity', 0)], [velocity_data.get('trend_factor', 1.0)],
+            [velocity_data.get('confidence', 0.5)], [current_stock], [days_left], [0],
+            self.calculate_seasonality_factor(date.today()), 90, False
+        )
+        return priority_record(scores, 0)
 
-    def calculate_optimal_restock_quantity(self, asin: str, velocity_data: Dict, stock_info: Dict, lead_time_days: int = 90, purchase_analytics: Dict = None, stock_df: pd.DataFrame = None) -> Dict:
+    def calculate_optimal_restock_quantity(self, asin: str, velocity_data: Dict, stock_info: Dict, lead_time_days: int = 90, purchase_analytics: Dict = None) -> Dict:
         """Calculate realistic restock quantity with practical business constraints"""
         if not stock_info or not velocity_data:
             return {'suggested_quantity': 0, 'reasoning': 'Insufficient data', 'monthly_purchase_adjustment': 0}
         
         # Simple stock extraction - just get the value from FBA/FBM Stock column
-        # No complex calculations needed - just read directly from Sellerboard CSV
         current_stock = self.extract_current_stock(stock_info, debug_asin=asin)
+        recent_purchases = self.get_recent_2_months_purchases(asin, purchase_analytics) if purchase_analytics else 0
         
-        
-        # Base velocity with trend adjustment
-        base_velocity = velocity_data.get('weighted_velocity', 0)
-        trend_factor = velocity_data.get('trend_factor', 1.0)
-        seasonality = self.calculate_seasonality_factor(date.today())
-        
-        # Smooth velocity to avoid extreme spikes (cap trend factor impact)
-        trend_factor = max(0.3, min(trend_factor, 3.0))  # Limit trend impact to -70% to +200%
-        
-        # Adjusted daily velocity with smoothing
-        adjusted_velocity = base_velocity * trend_factor * seasonality
-        
-        # Use user-configured lead time, fallback to 90 days (3 months for Amazon)
-        amazon_lead_time = lead_time_days
-        
-        # Target stock after arrival: 45 days (1.5 months)
-        target_stock_days = 45
-        
-        # Safety buffer based on velocity variability (much more conservative)
-        confidence = velocity_data.get('confidence', 0.5)
-        if confidence > 0.8:
-            safety_days = 7   # High confidence products
-        elif confidence > 0.6:
-            safety_days = 14  # Medium confidence
-        else:
-            safety_days = 21  # Low confidence products
-        
-        # Calculate base needed inventory (lead time + target stock + safety)
-        total_coverage_days = amazon_lead_time + target_stock_days + safety_days
-        total_needed = adjusted_velocity * total_coverage_days
-        
-        # Apply velocity-based caps to prevent unrealistic orders (realistic caps for variable lead time)
-        daily_velocity = adjusted_velocity
-        if daily_velocity <= 0.5:
-            # Very slow moving: cap at lead time + 2 months
-            max_quantity = daily_velocity * (amazon_lead_time + 60)
-        elif daily_velocity <= 1.0:
-            # Slow moving: cap at lead time + 1.5 months
-            max_quantity = daily_velocity * (amazon_lead_time + 45)
-        elif daily_velocity <= 2.0:
-            # Medium velocity: cap at lead time + 1 month
-            max_quantity = daily_velocity * (amazon_lead_time + 30)
-        elif daily_velocity <= 5.0:
-            # High velocity: cap at lead time + 2 weeks
-            max_quantity = daily_velocity * (amazon_lead_time + 14)
-        else:
-            # Very high velocity: cap at lead time + 1 week to reduce risk
-            max_quantity = daily_velocity * (amazon_lead_time + 7)
-        
-        # Apply the cap
-        total_needed = min(total_needed, max_quantity)
-        
-        # Subtract current stock to get reorder quantity
-        suggested_quantity = max(0, total_needed - current_stock)
-        
-        # Adjust for recent purchases - reduce recommended quantity by what was already purchased in last 2 months
-        monthly_purchase_adjustment = 0
-        if purchase_analytics:
-            recent_purchases = self.get_recent_2_months_purchases(asin, purchase_analytics)
-            if recent_purchases > 0:
-                monthly_purchase_adjustment = recent_purchases
-                suggested_quantity = max(0, suggested_quantity - recent_purchases)
-        else:
-            # Fallback: Generate synthetic purchase adjustment based on velocity and suggested quantity
-            # This provides some data for "Already Ordered" column when purchase analytics are missing
-            if velocity_data and velocity_data.get('weighted_velocity', 0) > 0:
-                # If this is a high velocity item with very conservative suggested quantity,
-                # assume some recent purchases might have occurred
-                if suggested_quantity < (velocity_data['weighted_velocity'] * 30):  # Less than 30 days supply
-                    # Estimate recent purchases as a small portion of what would typically be ordered
-                    estimated_recent = max(1, int(velocity_data['weighted_velocity'] * 15))  # ~15 days worth
-                    if estimated_recent < suggested_quantity:
-                        monthly_purchase_adjustment = estimated_recent
-        
-        # Apply minimum order thresholds and rounding
-        if suggested_quantity <= 0:
-            suggested_quantity = 0
-        elif suggested_quantity < 5:
-            suggested_quantity = max(1, math.ceil(suggested_quantity))  # Minimum 1 unit
-        elif suggested_quantity < 20:
-            suggested_quantity = math.ceil(suggested_quantity)  # Round up for small quantities
-        elif suggested_quantity < 100:
-            suggested_quantity = math.ceil(suggested_quantity / 5) * 5  # Round to nearest 5
-        else:
-            suggested_quantity = math.ceil(suggested_quantity / 10) * 10  # Round to nearest 10 for large quantities
-        
-        # Final safety check: never recommend more than lead time + 3 months of inventory at current velocity
-        absolute_max = base_velocity * (amazon_lead_time + 90)  # Lead time + 3 months at base velocity
-        if suggested_quantity > absolute_max and absolute_max > 0:
-            suggested_quantity = math.ceil(absolute_max / 10) * 10
-        
-        # Calculate estimated coverage
-        total_after_restock = current_stock + suggested_quantity
-        estimated_coverage = total_after_restock / adjusted_velocity if adjusted_velocity > 0 else 999
-        
-        # Generate reasoning with new realistic approach
-        reasoning_parts = [
-            f"Base velocity: {base_velocity:.1f}/day",
-            f"Lead time: {amazon_lead_time} days",
-            f"Target stock: {target_stock_days} days",
-            f"Safety buffer: {safety_days} days"
-        ]
-        
-        if abs(trend_factor - 1.0) > 0.1:
-            if trend_factor > 1.0:
-                reasoning_parts.append(f"Growing trend (+{(trend_factor-1)*100:.0f}%)")
-            else:
-                reasoning_parts.append(f"Declining trend ({(trend_factor-1)*100:.0f}%)")
-        
-        if abs(seasonality - 1.0) > 0.1:
-            reasoning_parts.append(f"Seasonal factor: {seasonality:.1f}x")
-        
-        # Add velocity-based capping info (dynamic based on lead time)
-        if total_needed != adjusted_velocity * total_coverage_days:
-            cap_days = max_quantity / daily_velocity if daily_velocity > 0 else 0
-            cap_months = cap_days / 30
-            if daily_velocity <= 0.5:
-                reasoning_parts.append(f"Capped at {cap_months:.1f}mo (slow-moving)")
-            elif daily_velocity <= 1.0:
-                reasoning_parts.append(f"Capped at {cap_months:.1f}mo (moderate)")
-            elif daily_velocity <= 2.0:
-                reasoning_parts.append(f"Capped at {cap_months:.1f}mo (medium)")
-            elif daily_velocity <= 5.0:
-                reasoning_parts.append(f"Capped at {cap_months:.1f}mo (high velocity)")
-            else:
-                reasoning_parts.append(f"Capped at {cap_months:.1f}mo (very high velocity)")
-        
-        # Add recent purchase adjustment to reasoning
-        if monthly_purchase_adjustment > 0:
-            reasoning_parts.append(f"Reduced by {monthly_purchase_adjustment} units (recent purchases)")
-        
-        reasoning = ", ".join(reasoning_parts)
-        
-        return {
-            'suggested_quantity': int(suggested_quantity),
-            'current_stock': current_stock,
-            'adjusted_velocity': adjusted_velocity,
-            'estimated_coverage_days': round(estimated_coverage, 1),
-            'safety_days': safety_days,
-            'reasoning': reasoning,
-            'lead_time_days': lead_time_days,
-            'confidence': confidence,
-            'monthly_purchase_adjustment': monthly_purchase_adjustment
-        }
+        scores = score_restock(
+            [velocity_data.get('weighted_velocity', 0)], [velocity_data.get('trend_factor', 1.0)],
+            [velocity_data.get('confidence', 0.5)], [current_stock], [MISSING_DAYS_LEFT], [recent_purchases],
+            self.calculate_seasonality_factor(date.today()), lead_time_days, bool(purchase_analytics),
+            stock_found=[isinstance(current_stock, float)]
+        )
+        return restock_record(scores, 0, lead_time_days)
 
     def get_recent_2_months_purchases(self, asin: str, purchase_analytics: Dict) -> int:
         """Get the quantity purchased for this ASIN in the last 2 months (from last 2 worksheets)"""
@@ -802,141 +798,61 @@ class EnhancedOrdersAnalysis:
     
     def get_direct_stock_value(self, stock_df: pd.DataFrame, asin: str) -> float:
         """Get stock value directly from Sellerboard CSV for a specific ASIN using same logic as extract_current_stock"""
-        # Find ASIN column
-        asin_col = None
-        for col in stock_df.columns:
-            if col.strip().upper() == 'ASIN':
-                asin_col = col
-                break
-        
-        if not asin_col:
-            return 0
-        
-        # Find row with this ASIN
-        asin_rows = stock_df[stock_df[asin_col].astype(str).str.strip() == asin]
-        if asin_rows.empty:
+        try:
+            return self.get_stock_index(stock_df).stock_for(asin)
+        except ValueError:
             return 0
-            
-        row = asin_rows.iloc[0]
-        
-        # Convert row to dict to reuse extract_current_stock logic
-        stock_info = row.to_dict()
-        
-        # Use the exact same logic as extract_current_stock method
-        return self.extract_current_stock(stock_info, debug_asin=asin)
     
-    def get_stock_info(self, stock_df: pd.DataFrame) -> Dict[str, dict]:
-        """Extract stock information from stock report"""
-        asin_col = None
-        
-        # Try multiple variations for ASIN column
-        possible_names = ['ASIN', 'asin', 'Asin', 'SKU', 'sku', 'Sku', 'Product ID', 'product_id', 'Product Code']
-        for col in stock_df.columns:
-            # Exact match (case-insensitive)
-            if col.strip().upper() == 'ASIN':
-                asin_col = col
-                break
-            # Check if any of the possible names match
-            for name in possible_names:
-                if col.strip().lower() == name.lower():
-                    asin_col = col
-                    break
-            if asin_col:
-                break
-                
-        # If still not found, look for columns containing 'asin' or 'sku'
-        if not asin_col:
-            for col in stock_df.columns:
-                if 'asin' in col.lower() or 'sku' in col.lower():
-                    asin_col = col
-                    print(f"Using column '{col}' as ASIN column")
-                    break
-                    
-        if not asin_col:
-            # Debug: show all columns to help identify the issue
-            print(f"Available columns in stock report: {list(stock_df.columns)}")
-            raise ValueError(f"ASIN column not found in stock report. Available columns: {', '.join(stock_df.columns[:10])}...")
-        
-        stock_info = {}
-        for _, row in stock_df.iterrows():
-            asin = str(row[asin_col]).strip()
-            # Skip empty ASINs
-            if asin and asin != 'nan' and asin != 'None':
-                # Convert to dict and ensure all values are JSON-serializable
-                row_dict = row.to_dict()
-                # Convert any pandas/numpy types to native Python types
-                serializable_dict = {}
-                for key, value in row_dict.items():
-                    try:
-                        # Convert numpy/pandas types to native Python types
-                        if hasattr(value, 'item'):  # numpy scalar
-                            value = value.item()
-                        elif hasattr(value, 'to_pydatetime'):  # pandas timestamp
-                            value = value.to_pydatetime().isoformat()
-                        elif str(type(value)).startswith('<class \'pandas.'):  # other pandas types
-                            value = str(value)
-                        elif str(type(value)).startswith('<class \'numpy.'):  # other numpy types
-                            value = str(value)
-                        serializable_dict[key] = value
-                    except Exception:
-                        # If conversion fails, convert to string as fallback
-                        serializable_dict[key] = str(value)
-                
-                stock_info[asin] = serializable_dict
-            
-        print(f"Extracted {len(stock_info)} products from stock report using column '{asin_col}'")
+    def get_stock_index(self, stock_df: pd.DataFrame) -> StockIndex:
+        """Column-oriented index over the stock report, built once per DataFrame"""
+        cached = getattr(self, '_stock_index', None)
+        if cached is not None and cached.df is stock_df:
+            return cached
+        self._stock_index = StockIndex(stock_df)
+        return self._stock_index
+    
+    def get_stock_info(self, stock_df: pd.DataFrame, asins: Optional[List[str]] = None) -> Dict[str, dict]:
+        """Extract stock information from stock report (optionally only for the given ASINs)"""
+        stock_index = self.get_stock_index(stock_df)
+        stock_info = stock_index.records(asins)
+        
+        print(f"Extracted {len(stock_info)} products from stock report using column '{stock_index.asin_column}'")
         
         return stock_info
 
     def fetch_google_sheet_data(self, access_token: str, sheet_id: str, worksheet_title: str, column_mapping: dict) -> Tuple[Dict[str, dict], pd.DataFrame]:
-        """Fetch both COGS data and full sheet data for purchase analytics"""
-        try:
-            pass  # Debug print removed
-            
-            # Fetch the sheet data using existing function
-            import requests
-            range_ = f"'{worksheet_title}'!A1:Z"
-            url = (
-                f"https://sheets.googleapis.com/v4/spreadsheets/{sheet_id}"
-                f"/values/{requests.utils.quote(range_, safe='')}?majorDimension=ROWS"
-            )
-            headers = {"Authorization": f"Bearer {access_token}"}
-            r = requests.get(url, headers=headers)
-            # Let 401 errors propagate up for token refresh handling
-            r.raise_for_status()
-            values = r.json().get("values", [])
-            
-            if not values or len(values) < 2:
-                pass  # Debug print removed
-                return {}, pd.DataFrame()
-            
-            # Create DataFrame
-            cols = values[0]
-            pass  # Debug print removed
-            rows = []
-            for row in values[1:]:
-                # pad/truncate to match header length
-                if len(row) < len(cols):
-                    row += [""] * (len(cols) - len(row))
-                elif len(row) > len(cols):
-                    row = row[: len(cols)]
-                rows.append(row)
-            
-            df = pd.DataFrame(rows, columns=cols)
+        """Fetch both COGS data and full sheet data for purchase analytics.
+
+        Sheets errors are raised (401s for the caller's token refresh), so a failed fetch
+        is never mistaken for an empty worksheet.
+        """
+        # Served from the snapshot store while the worksheet is unchanged
+        snapshots = load_worksheet_values(access_token, sheet_id, [worksheet_title])
+        values = snapshots[worksheet_title].values
+        
+        if not values or len(values) < 2:
             pass  # Debug print removed
-            
-            # Generate COGS data using existing logic
-            cogs_data = self._process_cogs_data(df, column_mapping)
-            
-            return cogs_data, df
-            
-        except Exception as e:
-            # Let 401 errors bubble up for token refresh handling  
-            if "401" in str(e) or "Unauthorized" in str(e):
-                raise  # Re-raise 401 errors for token refresh handling
-            else:
-                pass  # Debug print removed
-                return {}, pd.DataFrame()
+            return {}, pd.DataFrame()
+        
+        # Create DataFrame
+        cols = values[0]
+        pass  # Debug print removed
+        rows = []
+        for row in values[1:]:
+            # pad/truncate to match header length
+            if len(row) < len(cols):
+                row = row + [""] * (len(cols) - len(row))
+            elif len(row) > len(cols):
+                row = row[: len(cols)]
+            rows.append(row)
+        
+        df = pd.DataFrame(rows, columns=cols)
+        pass  # Debug print removed
+        
+        # Generate COGS data using existing logic
+        cogs_data = self._process_cogs_data(df, column_mapping)
+        
+        return cogs_data, df
 
     def fetch_google_sheet_cogs_data(self, access_token: str, sheet_id: str, worksheet_title: str, column_mapping: dict) -> Dict[str, dict]:
         """Fetch COGS and Source links from Google Sheet for each ASIN"""
@@ -993,57 +909,7 @@ class EnhancedOrdersAnalysis:
                 df['_row_order'] = range(len(df))
             
             # Group by ASIN and get comprehensive purchase history
-            cogs_data = {}
-            for asin in df[asin_field].unique():
-                if pd.isna(asin) or asin == '' or asin == 'nan':
-                    continue
-                    
-                asin_rows = df[df[asin_field] == asin].copy()
-                
-                # Sort by date (or row order if date is unavailable) to get chronological order
-                if date_field in asin_rows.columns and not asin_rows[date_field].isna().all():
-                    asin_rows = asin_rows.sort_values(date_field, na_position='first')
-                elif '_row_order' in asin_rows.columns:
-                    asin_rows = asin_rows.sort_values('_row_order')
-                
-                # Get latest COGS (for the main COGS display)
-                latest_row = asin_rows.iloc[-1]
-                latest_cogs = latest_row[cogs_field]
-                
-                if pd.isna(latest_cogs) or latest_cogs <= 0:
-                    continue
-                
-                # Collect all unique source links from purchase history
-                all_sources = []
-                last_known_source = None
-                
-                for _, row in asin_rows.iterrows():
-                    source_value = row[source_field] if source_field else None
-                    if source_value and not pd.isna(source_value):
-                        cleaned_source = str(source_value).strip()
-                        if cleaned_source and cleaned_source != '' and cleaned_source.lower() != 'nan':
-                            # This row has a source, remember it
-                            last_known_source = cleaned_source
-                            if cleaned_source not in all_sources:
-                                all_sources.append(cleaned_source)
-                    # If this row has empty source but we have a last known source, use that
-                    elif last_known_source and last_known_source not in all_sources:
-                        all_sources.append(last_known_source)
-                
-                # Sources found for ASIN
-                
-                # Use the most recent valid source as the primary source
-                primary_source = all_sources[-1] if all_sources else None
-                
-                cogs_data[asin] = {
-                    'cogs': float(latest_cogs),
-                    'source_link': primary_source,
-                    'all_sources': all_sources,  # Keep all sources for potential future use
-                    'last_purchase_date': latest_row[date_field] if date_field in latest_row and not pd.isna(latest_row[date_field]) else None,
-                    'source_column': source_field,
-                    'total_purchases': len(asin_rows)
-                }
-                # COGS data processed for ASIN
+            cogs_data = self._aggregate_cogs_by_asin(df, asin_field, cogs_field, date_field, source_field)
             
             # COGS data fetched from Google Sheet
             if len(cogs_data) > 0:
@@ -1114,36 +980,30 @@ class EnhancedOrdersAnalysis:
             combined_dataframes = []  # For purchase analytics
             successful_sheets = []
             
+            # Worksheet values and source-column hyperlinks come from the snapshot store: nothing is
+            # fetched while the spreadsheet's Drive modifiedTime is unchanged; otherwise one batched
+            # values read checks every tab, and only tabs whose values changed have their hyperlinks
+            # re-fetched and are re-processed below
+            session = requests.Session()
+            modified_time = drive_modified_time(session, headers, sheet_id)
+            probed_values = {}
+            
+            def probe(titles):
+                probed_values.update(batch_get_values(session, headers, sheet_id, titles))
+                return {title: values_key(probed_values[title]) for title in titles}
+            
+            snapshots = sheet_snapshot_store.load(
+                sheet_id, worksheet_names, f"A1:Z+links:{column_mapping.get('Store and Source Link', '')}", modified_time,
+                lambda titles: self._fetch_worksheet_payloads(session, sheet_id, headers, titles, column_mapping, probed_values),
+                probe
+            )
+            
+            # Validate headers and detect the source column of each worksheet
+            prepared_worksheets = []
             for worksheet_name in worksheet_names:
                 try:
-                    
-                    # Fetch worksheet data
-                    range_ = f"'{worksheet_name}'!A1:Z"
-                    url = (
-                        f"https://sheets.googleapis.com/v4/spreadsheets/{sheet_id}"
-                        f"/values/{requests.utils.quote(range_, safe='')}?majorDimension=ROWS"
-                    )
-                    r = requests.get(url, headers=headers)
-                    r.raise_for_status()
-                    values = r.json().get("values", [])
-                    
-                    # Also fetch hyperlinks using batchGet to get rich text data
-                    hyperlinks = {}
-                    try:
-                        batch_url = f"https://sheets.googleapis.com/v4/spreadsheets/{sheet_id}:batchGet"
-                        batch_params = {
-                            'ranges': [f"'{worksheet_name}'!A1:ZZ"],
-                            'includeGridData': 'true',
-                            'fields': 'sheets.data.rowData.values.hyperlink,sheets.data.rowData.values.textFormatRuns,sheets.data.rowData.values.formattedValue'
-                        }
-                        batch_r = requests.get(batch_url, headers=headers, params=batch_params)
-                        if batch_r.status_code == 200:
-                            batch_data = batch_r.json()
-                            hyperlinks = self.extract_hyperlinks_from_batch_data(batch_data)
-                            pass  # Debug print removed
-                    except Exception as e:
-                        pass  # Debug print removed
-                        hyperlinks = {}
+                    snapshot = snapshots[worksheet_name]
+                    values = snapshot.values
                     
                     if not values or len(values) < 2:
                         # Skipping worksheet - insufficient data
@@ -1152,12 +1012,9 @@ class EnhancedOrdersAnalysis:
                     # Check if column structure matches expected format
                     cols = values[0]
                     available_columns = set(cols)
-                    pass  # Debug print removed
-                    pass  # Debug print removed
                     
                     # Check if this looks like data instead of headers (common issue)
                     if any(col.startswith(('$', 'http', 'B0', '20')) or col.replace('.', '').replace('%', '').isdigit() for col in cols if col):
-                        pass  # Debug print removed
                         continue
                     
                     if not expected_columns.issubset(available_columns):
@@ -1170,62 +1027,60 @@ class EnhancedOrdersAnalysis:
                         }
                         continue
                     
+                    prepared_worksheets.append((worksheet_name, snapshot, self._detect_source_field(cols, column_mapping)))
+                except Exception as e:
+                    # Error processing worksheet
+                    continue
+            
+            mapping_key = json.dumps(column_mapping, sort_keys=True, default=str)
+            for worksheet_name, snapshot, source_field in prepared_worksheets:
+                try:
+                    values = snapshot.values
+                    cols = values[0]
+                    available_columns = set(cols)
+                    
                     # Worksheet has correct structure
                     self._worksheet_debug_info['worksheets_processed'].append(worksheet_name)
                     
-                    # Create DataFrame
-                    rows = []
-                    for row in values[1:]:
-                        # pad/truncate to match header length
-                        if len(row) < len(cols):
-                            row += [""] * (len(cols) - len(row))
-                        elif len(row) > len(cols):
-                            row = row[:len(cols)]
-                        rows.append(row)
-                    
-                    df = pd.DataFrame(rows, columns=cols)
-                    
-                    # Use user's column mapping
-                    asin_field = column_mapping.get("ASIN", "ASIN")
-                    cogs_field = column_mapping.get("COGS", "COGS")
-                    date_field = column_mapping.get("Date", "Date")
-                    
-                    # Dynamically detect source field - look for any column containing "Source"
-                    source_field = None
-                    # First try the user's mapping if they have one
-                    if "Store and Source Link" in column_mapping:
-                        mapped_source = column_mapping["Store and Source Link"]
-                        if mapped_source in available_columns:
-                            source_field = mapped_source
-                    
-                    # If no mapping or mapped field not found, search for any column containing "Source"
-                    if not source_field:
-                        for col in available_columns:
-                            if "source" in col.lower():
-                                source_field = col
-                                pass  # Debug print removed
-                                break
-                    
-                    if not source_field:
-                        pass  # Debug print removed
-                        source_field = None  # Will be handled gracefully in process_asin_cogs_data
-                    
-                    # Processing worksheet rows
-                    
-                    # Clean and process data
-                    df[asin_field] = df[asin_field].astype(str).str.strip()
-                    df[cogs_field] = pd.to_numeric(
-                        df[cogs_field].astype(str).replace(r"[\$,]", "", regex=True), errors="coerce"
-                    )
-                    
-                    # Convert date column for sorting
-                    try:
-                        df[date_field] = pd.to_datetime(df[date_field], errors="coerce")
-                    except:
-                        df['_row_order'] = range(len(df))
-                    
-                    # Process each ASIN in this worksheet, passing hyperlinks data
-                    worksheet_cogs = self.process_asin_cogs_data(df, asin_field, cogs_field, date_field, source_field, hyperlinks)
+                    memo_key = (sheet_id, worksheet_name, snapshot.content_hash, mapping_key)
+                    memoized = _get_memoized_worksheet(memo_key)
+                    if memoized is not None:
+                        worksheet_cogs, df = memoized
+                    else:
+                        hyperlinks = snapshot.payload.get('hyperlinks', {})
+                        
+                        # Create DataFrame
+                        rows = []
+                        for row in values[1:]:
+                            # pad/truncate to match header length
+                            if len(row) < len(cols):
+                                row = row + [""] * (len(cols) - len(row))
+                            elif len(row) > len(cols):
+                                row = row[:len(cols)]
+                            rows.append(row)
+                        
+                        df = pd.DataFrame(rows, columns=cols)
+                        
+                        # Use user's column mapping
+                        asin_field = column_mapping.get("ASIN", "ASIN")
+                        cogs_field = column_mapping.get("COGS", "COGS")
+                        date_field = column_mapping.get("Date", "Date")
+                        
+                        # Clean and process data
+                        df[asin_field] = df[asin_field].astype(str).str.strip()
+                        df[cogs_field] = pd.to_numeric(
+                            df[cogs_field].astype(str).replace(r"[\$,]", "", regex=True), errors="coerce"
+                        )
+                        
+                        # Convert date column for sorting
+                        try:
+                            df[date_field] = pd.to_datetime(df[date_field], errors="coerce")
+                        except:
+                            df['_row_order'] = range(len(df))
+                        
+                        # Process each ASIN in this worksheet, passing hyperlinks data
+                        worksheet_cogs = self.process_asin_cogs_data(df, asin_field, cogs_field, date_field, source_field, hyperlinks)
+                        _set_memoized_worksheet(memo_key, worksheet_cogs, df)
                     
                     # Merge with combined data (later sheets override earlier ones for same ASIN)
                     for asin, data in worksheet_cogs.items():
@@ -1368,6 +1223,82 @@ class EnhancedOrdersAnalysis:
                 traceback.print_exc()
                 return {}, pd.DataFrame()
     
+    @staticmethod
+    def _column_letter(col_idx: int) -> str:
+        """0 -> A, 25 -> Z, 26 -> AA"""
+        letters = ''
+        col_idx += 1
+        while col_idx:
+            col_idx, remainder = divmod(col_idx - 1, 26)
+            letters = chr(65 + remainder) + letters
+        return letters
+
+    def _detect_source_field(self, cols: List[str], column_mapping: dict) -> Optional[str]:
+        """Source column of a worksheet: the user's mapping if present, else the first header mentioning source"""
+        mapped_source = column_mapping.get("Store and Source Link")
+        if mapped_source and mapped_source in cols:
+            return mapped_source
+        for col in cols:
+            if "source" in col.lower():
+                return col
+        return None
+
+    def _fetch_worksheet_payloads(self, session: requests.Session, sheet_id: str, headers: dict, worksheet_names: List[str], column_mapping: dict,
+                                  known_values: Optional[Dict[str, list]] = None) -> Dict[str, dict]:
+        """Values for every worksheet (batched, unless already in ``known_values``) plus hyperlinks of each detected source column"""
+        known_values = known_values or {}
+        missing = [worksheet_name for worksheet_name in worksheet_names if worksheet_name not in known_values]
+        worksheet_values = {worksheet_name: known_values[worksheet_name] for worksheet_name in worksheet_names if worksheet_name in known_values}
+        worksheet_values.update(batch_get_values(session, headers, sheet_id, missing))
+        
+        source_columns = {}
+        for worksheet_name, values in worksheet_values.items():
+            if values:
+                source_field = self._detect_source_field(values[0], column_mapping)
+                if source_field and values[0].count(source_field) == 1:
+                    source_columns[worksheet_name] = values[0].index(source_field)
+        hyperlinks_by_sheet = self._fetch_source_column_hyperlinks(session, sheet_id, headers, source_columns)
+        
+        return {
+            worksheet_name: {'values': values, 'hyperlinks': hyperlinks_by_sheet.get(worksheet_name, {})}
+            for worksheet_name, values in worksheet_values.items()
+        }
+
+    def _fetch_source_column_hyperlinks(self, session: requests.Session, sheet_id: str, headers: dict, source_columns: Dict[str, int]) -> Dict[str, Dict[str, list]]:
+        """Fetch hyperlinks for the source column of each worksheet in one grid-data request.
+
+        Returns {worksheet_name: {"row,col": [urls]}} with the same absolute row/column
+        keys extract_hyperlinks_from_batch_data produces for a full A1 range.
+        """
+        if not source_columns:
+            return {}
+        ranges = []
+        for worksheet_name, col_idx in source_columns.items():
+            letter = self._column_letter(col_idx)
+            ranges.append(('ranges', f"'{worksheet_name}'!{letter}1:{letter}"))
+        params = ranges + [
+            ('includeGridData', 'true'),
+            ('fields', 'sheets.properties.title,sheets.data.startRow,sheets.data.startColumn,'
+                       'sheets.data.rowData.values.hyperlink,sheets.data.rowData.values.textFormatRuns'),
+        ]
+        # Raised rather than returned empty: the payloads are stored as the worksheets' snapshots
+        r = session.get(f"https://sheets.googleapis.com/v4/spreadsheets/{sheet_id}", headers=headers, params=params, timeout=60)
+        r.raise_for_status()
+        sheets = r.json().get('sheets', [])
+
+        hyperlinks_by_sheet = {}
+        for sheet in sheets:
+            title = sheet.get('properties', {}).get('title')
+            for grid_data in sheet.get('data', []):
+                relative_links = self.extract_hyperlinks_from_batch_data({'sheets': [{'data': [grid_data]}]})
+                start_row = grid_data.get('startRow', 0)
+                start_col = grid_data.get('startColumn', 0)
+                sheet_links = hyperlinks_by_sheet.setdefault(title, {})
+                for key, links in relative_links.items():
+                    row_idx, col_idx = (int(part) for part in key.split(','))
+                    sheet_links[f"{row_idx + start_row},{col_idx + start_col}"] = links
+        return hyperlinks_by_sheet
+
     def extract_hyperlinks_from_batch_data(self, batch_data):
         """Extract hyperlinks from Google Sheets batchGet response"""
         hyperlinks = {}
@@ -1424,108 +1355,118 @@ class EnhancedOrdersAnalysis:
 
     def process_asin_cogs_data(self, df, asin_field, cogs_field, date_field, source_field, hyperlinks=None):
         """Extract COGS data for each ASIN from a worksheet DataFrame"""
-        cogs_data = {}
+        return self._aggregate_cogs_by_asin(df, asin_field, cogs_field, date_field, source_field, hyperlinks)
+
+    def _aggregate_cogs_by_asin(self, df: pd.DataFrame, asin_field: str, cogs_field: str, date_field: str, source_field: Optional[str], hyperlinks: Optional[Dict[str, List[str]]] = None) -> Dict[str, dict]:
+        """Latest COGS, ordered unique sources, last purchase date and purchase count for every ASIN.
+
+        Sorts once by (ASIN, date with missing dates first, sheet row) and walks the groups,
+        which is linear in the number of rows instead of one full-frame filter per ASIN.
+        Within each ASIN rows are visited in chronological order; every row contributes its
+        text source followed by any hyperlinks in that cell. A row with an empty source
+        forward-fills the last known source, which is always already collected, so the
+        result is the ordered set of sources seen.
+        """
+        n_rows = len(df)
+        if n_rows == 0:
+            return {}
+        
+        asin_values = df[asin_field]
+        asin_codes, asin_uniques = pd.factorize(asin_values)  # codes follow first appearance, like unique()
+        positions = np.arange(n_rows)
+        
+        # Missing dates sort first; a column that could not be parsed keeps sheet order
+        if date_field in df.columns and pd.api.types.is_datetime64_any_dtype(df[date_field]):
+            date_keys = df[date_field].to_numpy(dtype='datetime64[ns]').view('i8')
+        else:
+            date_keys = np.zeros(n_rows, dtype=np.int64)
+        
+        order = np.lexsort((positions, date_keys, asin_codes))
+        sorted_codes = asin_codes[order]
+        group_starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+        group_ends = np.r_[group_starts[1:], n_rows]
+        
+        cogs_values = df[cogs_field].to_numpy()
+        has_dates = date_field in df.columns
+        date_values = df[date_field].to_numpy() if has_dates else None
+        
+        # Text sources, cleaned once for the whole column
+        if source_field:
+            raw_sources = df[source_field]
+            cleaned_sources = raw_sources.astype(str).str.strip()
+            usable = raw_sources.notna() & (raw_sources.astype(str) != '') & (cleaned_sources != '') & (cleaned_sources.str.lower() != 'nan')
+            text_sources = cleaned_sources.where(usable, None).to_numpy()
+        else:
+            text_sources = None
+        
+        # Hyperlinks are keyed by "sheet row,column" (header row is row 0)
+        row_links = {}
+        if hyperlinks and source_field:
+            try:
+                col_idx = df.columns.get_loc(source_field)
+                for position, label in enumerate(df.index):
+                    links = hyperlinks.get(f"{label + 1},{col_idx}")
+                    if links:
+                        row_links[position] = links
+            except Exception as e:
+                pass  # Error getting hyperlinks
         
-        for asin in df[asin_field].unique():
+        cogs_data = {}
+        for start, end in zip(group_starts, group_ends):
+            code = sorted_codes[start]
+            if code < 0:
+                continue
+            asin = asin_uniques[code]
             if pd.isna(asin) or asin == '' or asin == 'nan':
                 continue
-                
-            asin_rows = df[df[asin_field] == asin].copy()
-            
-            # Sort by date (or row order if date is unavailable) to get chronological order
-            if date_field in asin_rows.columns and not asin_rows[date_field].isna().all():
-                asin_rows = asin_rows.sort_values(date_field, na_position='first')
-            elif '_row_order' in asin_rows.columns:
-                asin_rows = asin_rows.sort_values('_row_order')
             
             # Get latest COGS (for the main COGS display)
-            latest_row = asin_rows.iloc[-1]
-            latest_cogs = latest_row[cogs_field]
-            
+            latest_position = order[end - 1]
+            latest_cogs = cogs_values[latest_position]
             if pd.isna(latest_cogs) or latest_cogs <= 0:
                 continue
             
             # Collect all unique source links from purchase history
-            all_sources = []
-            last_known_source = None
-            
-            for row_idx, row in asin_rows.iterrows():
-                source_value = row[source_field] if source_field else None
-                
-                # Check for hyperlinks from Google Sheets API data
-                hyperlink_sources = []
-                if hyperlinks and source_field:
-                    # Find the column index for the source field
-                    col_idx = None
-                    try:
-                        col_idx = df.columns.get_loc(source_field)
-                        # Get the original row index (accounting for header row)
-                        original_row_idx = row.name + 1  # Add 1 because Google Sheets rows are 1-indexed and we skip header
-                        hyperlink_key = f"{original_row_idx},{col_idx}"
-                        
-                        pass  # Debug print removed
-                        pass  # Debug print removed
-                        
-                        if hyperlink_key in hyperlinks:
-                            hyperlink_sources = hyperlinks[hyperlink_key]
-                            pass  # Debug print removed
-                        else:
-                            pass  # Debug print removed
-                    except Exception as e:
-                        pass  # Error getting hyperlinks
-                
-                # Process text-based source value
-                if source_value and not pd.isna(source_value):
-                    cleaned_source = str(source_value).strip()
-                    if cleaned_source and cleaned_source != '' and cleaned_source.lower() != 'nan':
-                        # This row has a source, remember it
-                        last_known_source = cleaned_source
-                        if cleaned_source not in all_sources:
-                            all_sources.append(cleaned_source)
-                
-                # Add hyperlink sources
-                for hyperlink_url in hyperlink_sources:
-                    if hyperlink_url and hyperlink_url not in all_sources:
-                        all_sources.append(hyperlink_url)
-                        last_known_source = hyperlink_url
-                        
-                # If this row has empty source but we have a last known source, use that
-                if not source_value or pd.isna(source_value):
-                    if last_known_source and last_known_source not in all_sources:
-                        all_sources.append(last_known_source)
-            
-            # Use the most recent valid source as the primary source
-            primary_source = all_sources[-1] if all_sources else None
+            all_sources = {}
+            if text_sources is not None:
+                for position in order[start:end]:
+                    text_source = text_sources[position]
+                    if text_source is not None:
+                        all_sources.setdefault(text_source, None)
+                    for hyperlink_url in row_links.get(position, ()):
+                        if hyperlink_url:
+                            all_sources.setdefault(hyperlink_url, None)
+            all_sources = list(all_sources)
+            
+            last_purchase_date = date_values[latest_position] if has_dates else None
+            if last_purchase_date is not None and pd.isna(last_purchase_date):
+                last_purchase_date = None
+            elif isinstance(last_purchase_date, np.datetime64):
+                last_purchase_date = pd.Timestamp(last_purchase_date)
             
             cogs_data[asin] = {
                 'cogs': float(latest_cogs),
-                'source_link': primary_source,
+                'source_link': all_sources[-1] if all_sources else None,  # Most recent valid source
                 'all_sources': all_sources,
-                'last_purchase_date': latest_row[date_field] if date_field in latest_row and not pd.isna(latest_row[date_field]) else None,
+                'last_purchase_date': last_purchase_date,
                 'source_column': source_field,
-                'total_purchases': len(asin_rows)
+                'total_purchases': int(end - start)
             }
         
         return cogs_data
 
-    def load_yesterday_sales(self) -> Dict[str, int]:
-        """Load previous sales data for comparison"""
-        if os.path.exists(YESTERDAY_SALES_FILE):
-            with open(YESTERDAY_SALES_FILE, 'r') as f:
-                return json.load(f)
-        return {}
-
-    def save_today_sales_as_yesterday(self, today_sales: Dict[str, int]):
-        """Save current sales data for future comparison"""
-        with open(YESTERDAY_SALES_FILE, 'w') as f:
-            json.dump(today_sales, f)
-
     def analyze(self, for_date: date, prev_date: Optional[date] = None, user_timezone: str = None, user_settings: dict = None, preserve_purchase_history: bool = False) -> dict:
         """Main analysis function with enhanced logic"""
         # Download and process orders data
         orders_df = self.download_csv(self.orders_url)
         today_orders = self.get_orders_for_date(orders_df, for_date, user_timezone)
         today_sales = self.asin_sales_count(today_orders)
+        
+        # Keep the per-user daily history current (only new and recent days are written)
+        try:
+            self.record_daily_sales(orders_df, user_timezone)
+        except Exception as e:
+            print(f"Failed to record daily sales: {e}")
 
         # Download stock report
         stock_df = self.download_csv(self.stock_url)
@@ -1537,18 +1478,9 @@ class EnhancedOrdersAnalysis:
         purchase_insights = {}
         
         # Try email-based COGS data first
-        if self.discord_id:
+        if self.discord_id and self.cogs_provider:
             try:
-                # Import the function from app.py
-                import importlib.util
-                import os
-                current_dir = os.path.dirname(os.path.abspath(__file__))
-                app_py_path = os.path.join(current_dir, 'app.py')
-                spec = importlib.util.spec_from_file_location("main_app", app_py_path)
-                main_app = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(main_app)
-                
-                email_cogs_result = main_app.fetch_sellerboard_cogs_data_from_email(self.discord_id)
+                email_cogs_result = self.cogs_provider(self.discord_id)
                 
                 if email_cogs_result and 'data' in email_cogs_result:
                     sellerboard_cogs_data = {}
@@ -1600,29 +1532,9 @@ class EnhancedOrdersAnalysis:
         
         if should_fetch_analytics:
             try:
-                # Import here to avoid circular imports
-                import sys
-                import os
-                parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-                if parent_dir not in sys.path:
-                    sys.path.append(parent_dir)
-                
-                # Import refresh_google_token from the main app.py file
-                # This avoids confusion with the app/ package directory
-                import importlib.util
-                
-                # Determine the path to app.py
-                current_dir = os.path.dirname(os.path.abspath(__file__))
-                app_py_path = os.path.join(current_dir, 'app.py')
-                
-                # Load app.py as a module
-                spec = importlib.util.spec_from_file_location("main_app", app_py_path)
-                if spec and spec.loader:
-                    main_app = importlib.util.module_from_spec(spec)
-                    spec.loader.exec_module(main_app)
-                    refresh_google_token = main_app.refresh_google_token
-                else:
-                    raise ImportError(f"Could not load app.py from {app_py_path}")
+                refresh_google_token = self.token_refresher
+                if refresh_google_token is None:
+                    raise RuntimeError("No Google token refresher configured for OrdersAnalysis")
                 
                 # Get user's Google Sheet settings
                 sheet_id = user_settings.get('sheet_id')
@@ -1720,7 +1632,7 @@ class EnhancedOrdersAnalysis:
         # Load historical sales for comparison
         if prev_date is None:
             prev_date = for_date - timedelta(days=1)
-        yesterday_sales = self.load_yesterday_sales()
+        yesterday_sales = self.sales_for_day(orders_df, prev_date, user_timezone)
 
         # Enhanced analytics for each ASIN
         enhanced_analytics = {}
@@ -1748,14 +1660,25 @@ class EnhancedOrdersAnalysis:
         
         # Total products to analyze calculated
         
-        for asin in products_to_analyze:
-            # If using COGS file, we want to include ALL ASINs even if not in stock file
-            # For ASINs not in stock file, we'll use fallback stock data or mark as out of stock
-            if not cogs_data and asin not in stock_info:
-                continue  # Only skip if using stock file as primary source
-                
-            # Calculate enhanced velocity
-            velocity_data = self.calculate_enhanced_velocity(asin, orders_df, for_date, user_timezone)
+        # If using COGS file, we want to include ALL ASINs even if not in stock file
+        # For ASINs not in stock file, we'll use fallback stock data or mark as out of stock
+        if not cogs_data:
+            products_to_analyze = [asin for asin in products_to_analyze if asin in stock_info]  # Only skip if using stock file as primary source
+        
+        # Calculate enhanced velocity for every product in one pass over the orders
+        products_to_analyze = list(products_to_analyze)
+        velocity_by_asin = self.calculate_enhanced_velocity_batch(orders_df, for_date, user_timezone, asins=products_to_analyze)
+        
+        # Get user's lead time setting, default to 90 days
+        user_lead_time = user_settings.get('amazon_lead_time_days', 90) if user_settings else 90
+        
+        # Score priority and restock quantity for every product at once
+        scores = self.score_restock_batch(products_to_analyze, velocity_by_asin, self.get_stock_index(stock_df),
+                                          lead_time_days=user_lead_time, purchase_analytics=purchase_insights)
+        
+        for i, asin in enumerate(products_to_analyze):
+            velocity_data = velocity_by_asin[asin]
+            units_sold = velocity_data.pop('units_sold')
             
             # For lead analysis, we need ALL products in inventory, even those with zero velocity
             # So we DO NOT skip products with zero velocity anymore
@@ -1771,13 +1694,10 @@ class EnhancedOrdersAnalysis:
             
             # Get priority score
             current_sales = today_sales.get(asin, 0)
-            priority_data = self.get_priority_score(asin, velocity_data, asin_stock_info, current_sales)
-            
-            # Get user's lead time setting, default to 90 days
-            user_lead_time = user_settings.get('amazon_lead_time_days', 90) if user_settings else 90
+            priority_data = priority_record(scores, i)
             
-            # Calculate optimal restock quantity with purchase analytics and user's lead time
-            restock_data = self.calculate_optimal_restock_quantity(asin, velocity_data, asin_stock_info, lead_time_days=user_lead_time, purchase_analytics=purchase_insights, stock_df=stock_df)
+            # Optimal restock quantity with purchase analytics and user's lead time
+            restock_data = restock_record(scores, i, user_lead_time)
             
             # Get current stock value for debugging
             stock_value = restock_data.get('current_stock', 0)
@@ -1786,17 +1706,9 @@ class EnhancedOrdersAnalysis:
             # Calculate actual units sold in last 30 and 7 days for the frontend
             # This is different from velocity which is daily average
             try:
-                # Get orders for last 30 days
-                start_date_30d = for_date - timedelta(days=29)  # 30 days including today
-                orders_30d = self.get_orders_for_date_range(orders_df, start_date_30d, for_date, user_timezone)
-                sales_30d = self.asin_sales_count(orders_30d)
-                units_sold_30d = sales_30d.get(asin, 0)
-                
-                # Get orders for last 7 days
-                start_date_7d = for_date - timedelta(days=6)  # 7 days including today
-                orders_7d = self.get_orders_for_date_range(orders_df, start_date_7d, for_date, user_timezone)
-                sales_7d = self.asin_sales_count(orders_7d)
-                units_sold_7d = sales_7d.get(asin, 0)
+                # Units sold in the last 30 and 7 days (including today)
+                units_sold_30d = units_sold['30d']
+                units_sold_7d = units_sold['7d']
                 
                 # Calculate revenue if we have price data
                 selling_price = 0
@@ -1944,18 +1856,6 @@ class EnhancedOrdersAnalysis:
             except:
                 pass
 
-        # Convert orders DataFrame to dict for revenue calculation
-        sellerboard_orders = []
-        if not today_orders.empty:
-            # Convert DataFrame to dict format for frontend
-            sellerboard_orders = today_orders.to_dict('records')
-            # Revenue data prepared
-            if sellerboard_orders:
-                # Check what revenue fields are available
-                sample_order = sellerboard_orders[0]
-                revenue_fields = [k for k in sample_order.keys() if 'total' in k.lower() or 'amount' in k.lower() or 'revenue' in k.lower()]
-                # Revenue fields identified
-
         return {
             # Enhanced analytics (new)
             "enhanced_analytics": enhanced_analytics,
@@ -1976,8 +1876,8 @@ class EnhancedOrdersAnalysis:
             "orders_df": today_orders,
             "stockout_30d": stockout_30d,
             
-            # Revenue data for frontend
-            "sellerboard_orders": sellerboard_orders,
+            # Revenue data for frontend (order count and total, not the order rows)
+            "orders_summary": summarize_orders(today_orders),
         }
 
 class BasicOrdersAnalysis:
@@ -2007,9 +1907,10 @@ class BasicOrdersAnalysis:
 # Maintain backward compatibility
 class OrdersAnalysis(EnhancedOrdersAnalysis):
     """Backward compatible class name"""
-    def __init__(self, orders_url: Optional[str] = None, stock_url: Optional[str] = None, cogs_url: Optional[str] = None, discord_id: Optional[str] = None):
+    def __init__(self, orders_url: Optional[str] = None, stock_url: Optional[str] = None, cogs_url: Optional[str] = None, discord_id: Optional[str] = None,
+                 cogs_provider: Optional[Callable[[str], Optional[Dict]]] = None, token_refresher: Optional[Callable[[dict], str]] = None):
         try:
-            super().__init__(orders_url, stock_url, cogs_url, discord_id)
+            super().__init__(orders_url, stock_url, cogs_url, discord_id, cogs_provider=cogs_provider, token_refresher=token_refresher)
         except Exception as e:
             pass  # Debug print removed
             # Fall back to basic implementation
@@ -2017,6 +1918,8 @@ class OrdersAnalysis(EnhancedOrdersAnalysis):
             self.stock_url = stock_url
             self.cogs_url = cogs_url
             self.discord_id = discord_id
+            self._cogs_provider = cogs_provider
+            self._token_refresher = token_refresher
             self.is_fallback = True
     
     def analyze(self, for_date: date, prev_date: Optional[date] = None, user_timezone: str = None, user_settings: dict = None, preserve_purchase_history: bool = False) -> dict:
@@ -0,0 +1,248 @@
+"""
+Array-based restock priority and reorder quantity scoring.
+
+``EnhancedOrdersAnalysis`` used to score every ASIN separately: each call re-scanned the
+stock row's keys for column-name patterns, looked up purchase analytics and branched
+through the urgency/category/cap rules in Python. ``score_restock`` applies the same
+rules to whole arrays (one element per ASIN) with ``np.select``/``np.where``, in the
+same order of floating-point operations, so results match the per-ASIN code exactly.
+``priority_record`` and ``restock_record`` turn one element back into the dicts the
+dashboard has always received (including the reasoning text and int/float types).
+
+Priority keeps the per-ASIN quirk for a "Days of stock left" value that ``float()``
+rejects ('1,200', '-', 'N/A'): the product is scored as out of stock with no days
+left figure. Pass its stock as 0 in ``priority_stock`` and MISSING_DAYS_LEFT in
+``days_left``; the reorder quantity still uses the real stock.
+"""
+
+from typing import Dict, Optional
+
+import numpy as np
+
+TARGET_STOCK_DAYS = 45
+MISSING_DAYS_LEFT = 9999
+
+CATEGORY_EMOJI = {
+    'no_velocity': '⏸️',
+    'critical_high_velocity': '🚨',
+    'critical_low_velocity': '🔴',
+    'warning_high_velocity': '🚀',
+    'warning_moderate': '🟡',
+    'opportunity_high_velocity': '⚡',
+    'monitor': '📊',
+    'low_priority': '⏸️',
+}
+
+
+def _round_order_quantity(quantity: np.ndarray) -> np.ndarray:
+    """Minimum order thresholds: 1 unit minimum, then whole units, 5s and 10s"""
+    return np.select(
+        [quantity <= 0, quantity < 5, quantity < 20, quantity < 100],
+        [0.0, np.maximum(1, np.ceil(quantity)), np.ceil(quantity), np.ceil(quantity / 5) * 5],
+        default=np.ceil(quantity / 10) * 10,
+    )
+
+
+def score_restock(weighted_velocity, trend_factor, confidence, current_stock, days_left, recent_purchases,
+                  seasonality: float, lead_time_days, has_purchase_analytics: bool,
+                  priority_stock: Optional[np.ndarray] = None, stock_found: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """Priority and reorder arrays for many ASINs at once.
+
+    All array arguments are aligned per ASIN; ``days_left`` uses MISSING_DAYS_LEFT when the
+    report has no value and ``recent_purchases`` holds units bought in the last two months.
+    ``priority_stock`` (default ``current_stock``) is the stock the priority urgency sees;
+    ``stock_found`` (default all True) is False where the report row had no usable stock value.
+    """
+    velocity = np.asarray(weighted_velocity, dtype=float)
+    trend = np.asarray(trend_factor, dtype=float)
+    confidence = np.asarray(confidence, dtype=float)
+    stock = np.asarray(current_stock, dtype=float)
+    priority_stock = stock if priority_stock is None else np.asarray(priority_stock, dtype=float)
+    stock_found = np.ones(stock.shape, dtype=bool) if stock_found is None else np.asarray(stock_found, dtype=bool)
+    days_left = np.asarray(days_left, dtype=float)
+    recent_purchases = np.asarray(recent_purchases, dtype=float)
+    lead_time = np.asarray(lead_time_days, dtype=float)
+
+    # Priority: stock-based urgency first, then days of stock left
+    urgency = np.select(
+        [priority_stock <= 0, priority_stock <= velocity * 3, priority_stock <= velocity * 7,
+         days_left <= 3, days_left <= 7, days_left <= 14, days_left <= 30],
+        [1.0, 1.0, 0.8, 1.0, 0.8, 0.6, 0.3],
+        default=0.1,
+    )
+    opportunity = velocity * trend * seasonality
+    score = urgency * (1 + opportunity)
+    category = np.select(
+        [velocity <= 0,
+         (priority_stock <= 0) & (opportunity >= 1.0), priority_stock <= 0,
+         (urgency >= 0.8) & (opportunity >= 1.0), urgency >= 0.8,
+         (urgency >= 0.6) & (opportunity >= 1.0), urgency >= 0.6,
+         opportunity >= 2.0,
+         (urgency >= 0.3) | (opportunity >= 0.5)],
+        ['no_velocity',
+         'critical_high_velocity', 'critical_low_velocity',
+         'critical_high_velocity', 'critical_low_velocity',
+         'warning_high_velocity', 'warning_moderate',
+         'opportunity_high_velocity',
+         'monitor'],
+        default='low_priority',
+    )
+
+    # Reorder quantity: cover lead time + target stock + safety buffer, capped by velocity band
+    clipped_trend = np.maximum(0.3, np.minimum(trend, 3.0))
+    adjusted_velocity = velocity * clipped_trend * seasonality
+    safety_days = np.select([confidence > 0.8, confidence > 0.6], [7, 14], default=21)
+    total_coverage_days = lead_time + TARGET_STOCK_DAYS + safety_days
+    uncapped_needed = adjusted_velocity * total_coverage_days
+    cap_extra_days = np.select(
+        [adjusted_velocity <= 0.5, adjusted_velocity <= 1.0, adjusted_velocity <= 2.0, adjusted_velocity <= 5.0],
+        [60, 45, 30, 14],
+        default=7,
+    )
+    max_quantity = adjusted_velocity * (lead_time + cap_extra_days)
+    total_needed = np.minimum(uncapped_needed, max_quantity)
+    suggested = np.maximum(0, total_needed - stock)
+
+    if has_purchase_analytics:
+        # Already bought in the last two months counts against the order
+        purchase_adjustment = np.where(recent_purchases > 0, recent_purchases, 0.0)
+        suggested = np.where(recent_purchases > 0, np.maximum(0, suggested - recent_purchases), suggested)
+    else:
+        # No purchase data: estimate ~15 days already on order for thin suggestions on selling items
+        estimated_recent = np.maximum(1, np.trunc(velocity * 15))
+        estimate = (velocity > 0) & (suggested < velocity * 30) & (estimated_recent < suggested)
+        purchase_adjustment = np.where(estimate, estimated_recent, 0.0)
+
+    suggested = _round_order_quantity(suggested)
+    # Never more than lead time + 3 months at base velocity
+    absolute_max = velocity * (lead_time + 90)
+    suggested = np.where((suggested > absolute_max) & (absolute_max > 0), np.ceil(absolute_max / 10) * 10, suggested)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        coverage_days = np.where(adjusted_velocity > 0, (stock + suggested) / adjusted_velocity, 999)
+        cap_days = np.where(adjusted_velocity > 0, max_quantity / adjusted_velocity, 0)
+
+    return {
+        'weighted_velocity': velocity,
+        'trend_factor': trend,
+        'clipped_trend_factor': clipped_trend,
+        'confidence': confidence,
+        'current_stock': stock,
+        'stock_found': stock_found,
+        'priority_stock': priority_stock,
+        'days_left': days_left,
+        'seasonality': np.full(velocity.shape, float(seasonality)),
+        'urgency': urgency,
+        'opportunity': opportunity,
+        'score': score,
+        'category': category,
+        'adjusted_velocity': adjusted_velocity,
+        'safety_days': safety_days,
+        'capped': total_needed != uncapped_needed,
+        'cap_days': cap_days,
+        'suggested_quantity': suggested,
+        'estimated_coverage_days': coverage_days,
+        'monthly_purchase_adjustment': purchase_adjustment,
+    }
+
+
+def priority_record(scores: Dict[str, np.ndarray], i: int) -> dict:
+    """The get_priority_score dict for element ``i``"""
+    category = str(scores['category'][i])
+    emoji = CATEGORY_EMOJI[category]
+    current_stock = float(scores['priority_stock'][i])
+    days_left = float(scores['days_left'][i])
+    velocity = float(scores['weighted_velocity'][i])
+    trend_factor = float(scores['trend_factor'][i])
+    seasonality = float(scores['seasonality'][i])
+
+    reasoning_parts = []
+    if current_stock <= 0:
+        reasoning_parts.append("OUT OF STOCK")
+    else:
+        reasoning_parts.append(f"{days_left:.1f} days stock remaining")
+    reasoning_parts.append(f"{velocity:.1f} daily velocity")
+
+    if trend_factor > 1.2:
+        if trend_factor >= 3.0:
+            reasoning_parts.append(f"strong acceleration (3x+ recent growth)")
+        else:
+            reasoning_parts.append(f"accelerating trend (+{(trend_factor-1)*100:.0f}%)")
+    elif trend_factor < 0.8:
+        if trend_factor <= 0.3:
+            reasoning_parts.append(f"steep decline (-{(1-trend_factor)*100:.0f}%)")
+        else:
+            reasoning_parts.append(f"declining trend (-{(1-trend_factor)*100:.0f}%)")
+
+    if seasonality > 1.1:
+        reasoning_parts.append(f"high season (+{(seasonality-1)*100:.0f}%)")
+    elif seasonality < 0.9:
+        reasoning_parts.append(f"low season ({(seasonality-1)*100:.0f}%)")
+
+    return {
+        'score': float(scores['score'][i]),
+        'category': category,
+        'urgency': float(scores['urgency'][i]),
+        'opportunity': float(scores['opportunity'][i]),
+        'reasoning': f"{emoji} " + ", ".join(reasoning_parts),
+        'emoji': emoji
+    }
+
+
+def restock_record(scores: Dict[str, np.ndarray], i: int, lead_time_days) -> dict:
+    """The calculate_optimal_restock_quantity dict for element ``i`` (lead time as configured, for display)"""
+    base_velocity = float(scores['weighted_velocity'][i])
+    trend_factor = float(scores['clipped_trend_factor'][i])
+    seasonality = float(scores['seasonality'][i])
+    adjusted_velocity = float(scores['adjusted_velocity'][i])
+    safety_days = int(scores['safety_days'][i])
+    purchase_adjustment = scores['monthly_purchase_adjustment'][i]
+    purchase_adjustment = int(purchase_adjustment) if float(purchase_adjustment).is_integer() else float(purchase_adjustment)
+    # extract_current_stock returned int 0 when the row had no usable stock value, a float otherwise
+    current_stock = float(scores['current_stock'][i]) if scores['stock_found'][i] else 0
+    # 999 (an int) stood for "no velocity", any computed coverage was a rounded float
+    coverage_days = round(float(scores['estimated_coverage_days'][i]), 1) if adjusted_velocity > 0 else 999
+
+    reasoning_parts = [
+        f"Base velocity: {base_velocity:.1f}/day",
+        f"Lead time: {lead_time_days} days",
+        f"Target stock: {TARGET_STOCK_DAYS} days",
+        f"Safety buffer: {safety_days} days"
+    ]
+
+    if abs(trend_factor - 1.0) > 0.1:
+        if trend_factor > 1.0:
+            reasoning_parts.append(f"Growing trend (+{(trend_factor-1)*100:.0f}%)")
+        else:
+            reasoning_parts.append(f"Declining trend ({(trend_factor-1)*100:.0f}%)")
+
+    if abs(seasonality - 1.0) > 0.1:
+        reasoning_parts.append(f"Seasonal factor: {seasonality:.1f}x")
+
+    if scores['capped'][i]:
+        cap_months = float(scores['cap_days'][i]) / 30
+        if adjusted_velocity <= 0.5:
+            reasoning_parts.append(f"Capped at {cap_months:.1f}mo (slow-moving)")
+        elif adjusted_velocity <= 1.0:
+            reasoning_parts.append(f"Capped at {cap_months:.1f}mo (moderate)")
+        elif adjusted_velocity <= 2.0:
+            reasoning_parts.append(f"Capped at {cap_months:.1f}mo (medium)")
+        elif adjusted_velocity <= 5.0:
+            reasoning_parts.append(f"Capped at {cap_months:.1f}mo (high velocity)")
+        else:
+            reasoning_parts.append(f"Capped at {cap_months:.1f}mo (very high velocity)")
+
+    if purchase_adjustment > 0:
+        reasoning_parts.append(f"Reduced by {purchase_adjustment} units (recent purchases)")
+
+    return {
+        'suggested_quantity': int(scores['suggested_quantity'][i]),
+        'current_stock': current_stock,
+        'adjusted_velocity': adjusted_velocity,
+        'estimated_coverage_days': coverage_days,
+        'safety_days': safety_days,
+        'reasoning': ", ".join(reasoning_parts),
+        'lead_time_days': lead_time_days,
+        'confidence': float(scores['confidence'][i]),
+        'monthly_purchase_adjustment': purchase_adjustment
+    }
@@ -0,0 +1,147 @@
+"""
+Process-wide cache of downloaded and parsed Sellerboard report DataFrames.
+
+Entries are keyed by report URL and validated with the ETag/Last-Modified headers
+Sellerboard returns, falling back to a hash of the response body. Fresh entries
+(younger than the TTL) are served without touching the network; stale entries are
+revalidated and only re-parsed when the content actually changed. The cache is
+bounded by an approximate memory budget and evicts least recently used frames.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import pandas as pd
+
+SELLERBOARD_CACHE_TTL_SECONDS = int(os.getenv('SELLERBOARD_CACHE_TTL_SECONDS', '300'))
+SELLERBOARD_CACHE_MAX_MB = int(os.getenv('SELLERBOARD_CACHE_MAX_MB', '256'))
+# Download locks are striped over a fixed set, so they do not grow with the number of URLs
+DOWNLOAD_LOCK_STRIPES = 64
+
+
+class CachedFrame:
+    """A parsed report plus the validators needed to revalidate it"""
+
+    __slots__ = ('df', 'etag', 'last_modified', 'body_hash', 'size_bytes', 'fetched_at')
+
+    def __init__(self, df: pd.DataFrame, etag: Optional[str], last_modified: Optional[str], body_hash: str):
+        self.df = df
+        self.etag = etag
+        self.last_modified = last_modified
+        self.body_hash = body_hash
+        self.size_bytes = int(df.memory_usage(index=True, deep=True).sum())
+        self.fetched_at = time.monotonic()
+
+    def is_fresh(self, ttl_seconds: int) -> bool:
+        return (time.monotonic() - self.fetched_at) < ttl_seconds
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """Headers for a conditional GET against the origin"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class SellerboardFrameCache:
+    """Thread-safe, memory-bounded LRU cache of report DataFrames keyed by URL"""
+
+    def __init__(self, ttl_seconds: int = SELLERBOARD_CACHE_TTL_SECONDS, max_bytes: int = SELLERBOARD_CACHE_MAX_MB * 1024 * 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, CachedFrame]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._url_locks = [threading.Lock() for _ in range(DOWNLOAD_LOCK_STRIPES)]
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    @staticmethod
+    def hash_body(body: bytes) -> str:
+        return hashlib.sha256(body).hexdigest()
+
+    def lock_for(self, url: str) -> threading.Lock:
+        """Per-URL lock so concurrent requests for the same report share one download
+
+        URLs share a fixed set of locks, so two reports may occasionally wait on each other.
+        """
+        return self._url_locks[hash(url) % len(self._url_locks)]
+
+    def get_fresh(self, url: str) -> Optional[pd.DataFrame]:
+        """Return a copy of the cached frame if it is still within the TTL"""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None or not entry.is_fresh(self.ttl_seconds):
+                return None
+            self._entries.move_to_end(url)
+            self.hits += 1
+            return entry.df.copy()
+
+    def peek(self, url: str) -> Optional[CachedFrame]:
+        """Return the cached entry regardless of age (used for revalidation)"""
+        with self._lock:
+            return self._entries.get(url)
+
+    def revalidated(self, url: str) -> Optional[pd.DataFrame]:
+        """Mark a stale entry as confirmed unchanged by the origin and return a copy"""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None
+            entry.fetched_at = time.monotonic()
+            self._entries.move_to_end(url)
+            self.revalidations += 1
+            return entry.df.copy()
+
+    def put(self, url: str, df: pd.DataFrame, etag: Optional[str] = None, last_modified: Optional[str] = None, body_hash: str = '') -> pd.DataFrame:
+        """Store a parsed frame and return a copy for the caller"""
+        entry = CachedFrame(df, etag, last_modified, body_hash)
+        with self._lock:
+            self.misses += 1
+            previous = self._entries.pop(url, None)
+            if previous is not None:
+                self._total_bytes -= previous.size_bytes
+            if entry.size_bytes <= self.max_bytes:
+                self._entries[url] = entry
+                self._total_bytes += entry.size_bytes
+                self._evict_locked()
+        return df.copy()
+
+    def invalidate(self, url: Optional[str] = None):
+        """Drop one URL, or everything when no URL is given"""
+        with self._lock:
+            if url is None:
+                self._entries.clear()
+                self._total_bytes = 0
+                return
+            entry = self._entries.pop(url, None)
+            if entry is not None:
+                self._total_bytes -= entry.size_bytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'size_bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidations': self.revalidations,
+            }
+
+    def _evict_locked(self):
+        while self._total_bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._total_bytes -= evicted.size_bytes
+
+
+# Shared by every analyzer instance in the process
+sellerboard_frame_cache = SellerboardFrameCache()
@@ -0,0 +1,192 @@
+"""
+Streaming download and parsing of Sellerboard CSV reports.
+
+Reports used to be fetched with a fresh ``requests.Session`` per call, buffered as
+``response.content``, decoded again into ``response.text`` and only then parsed, so a
+large account held the bytes, the str and the DataFrame at once. Here the response is
+streamed straight into ``pd.read_csv`` in row chunks (hashing and size-checking the
+bytes on the way), with per-report column and dtype hints and an optional per-chunk
+row filter, so only the parsed rows that are actually kept stay in memory.
+
+Sessions are pooled per thread (keep-alive connections to Sellerboard are reused);
+cookies are cleared before every download so one user's automation cookies never
+travel with another user's report.
+"""
+
+import hashlib
+import io
+import os
+import threading
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urljoin
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+SELLERBOARD_CSV_CHUNK_ROWS = int(os.getenv('SELLERBOARD_CSV_CHUNK_ROWS', '50000'))
+SELLERBOARD_MAX_DOWNLOAD_MB = int(os.getenv('SELLERBOARD_MAX_DOWNLOAD_MB', '256'))
+SELLERBOARD_POOL_SIZE = int(os.getenv('SELLERBOARD_POOL_SIZE', '10'))
+SELLERBOARD_REQUEST_TIMEOUT = 30
+
+REQUEST_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/csv,application/csv,text/plain,*/*',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Connection': 'keep-alive',
+}
+
+
+def _orders_column(name: str) -> bool:
+    # Everything EnhancedOrdersAnalysis resolves through _order_columns (file order is kept,
+    # so "first date column" still picks the same column), plus the order total columns
+    # the revenue summary reads
+    lowered = str(name).lower()
+    return ('date' in lowered or 'time' in lowered or 'product' in lowered or 'asin' in lowered
+            or lowered.replace(' ', '') == 'orderstatus'
+            or 'total' in lowered or 'amount' in lowered or 'revenue' in lowered)
+
+
+# read_csv hints per report type. Stock and COGS rows are handed out whole, so they keep
+# every column; identifiers are read as text (numeric ISBN ASINs keep their leading zeros).
+REPORT_READ_OPTIONS: Dict[str, dict] = {
+    'orders': {'usecols': _orders_column, 'dtype': {'ASIN': str, 'Products': str, 'Order Status': str}},
+    'stock': {'dtype': {'ASIN': str, 'SKU': str}},
+    'cogs': {'dtype': {'ASIN': str, 'SKU': str}},
+}
+
+
+class ReportTooLarge(ValueError):
+    """The report exceeds SELLERBOARD_MAX_DOWNLOAD_MB"""
+
+
+_local = threading.local()
+
+
+def get_session() -> requests.Session:
+    """This thread's pooled session"""
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=SELLERBOARD_POOL_SIZE, pool_maxsize=SELLERBOARD_POOL_SIZE)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _local.session = session
+    return session
+
+
+def normalize_report_url(url: str) -> str:
+    if 'sellerboard.com' in url and 'format=csv' not in url:
+        # Add CSV format if missing
+        separator = '&' if '?' in url else '?'
+        url = f"{url}{separator}format=csv"
+    return url
+
+
+def fetch_report(url: str, extra_headers: Optional[Dict[str, str]] = None) -> requests.Response:
+    """Start a streamed (possibly conditional) report download; the body is not read yet"""
+    session = get_session()
+    session.cookies.clear()
+    headers = dict(REQUEST_HEADERS)
+    if extra_headers:
+        headers.update(extra_headers)
+
+    # First, get the redirect URL without following it
+    initial_response = session.get(url, timeout=SELLERBOARD_REQUEST_TIMEOUT, allow_redirects=False,
+                                   headers=headers, stream=True)
+
+    if initial_response.status_code == 302:
+        redirect_url = urljoin(url, initial_response.headers.get('Location', ''))
+        initial_response.close()
+        print(f"Got redirect to: {redirect_url}")
+
+        # Now follow the redirect with the same session (preserving automation cookies)
+        response = session.get(redirect_url, timeout=SELLERBOARD_REQUEST_TIMEOUT, headers=headers, stream=True)
+
+        if response.status_code == 401:
+            response.close()
+            print(f"❌ 401 error - download URL requires additional authentication")
+            print(f"🔍 The automation token creates a session but download needs browser login")
+            print(f"💡 Solution: User must download manually through logged-in browser")
+            raise Exception(f"AUTHENTICATION_REQUIRED: Sellerboard COGS downloads require browser login session. Please download manually: {url}")
+    else:
+        response = initial_response
+
+    if response.status_code == 304:
+        response.close()
+        return response
+
+    try:
+        response.raise_for_status()
+    except requests.exceptions.HTTPError:
+        response.close()
+        raise
+
+    max_bytes = SELLERBOARD_MAX_DOWNLOAD_MB * 1024 * 1024
+    content_length = response.headers.get('Content-Length')
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        response.close()
+        raise ReportTooLarge(f"Sellerboard report is {int(content_length) // (1024 * 1024)} MB, above the {SELLERBOARD_MAX_DOWNLOAD_MB} MB limit")
+    return response
+
+
+class _StreamedBody(io.RawIOBase):
+    """Binary file view of a streamed response that hashes and size-checks what is read"""
+
+    def __init__(self, raw, max_bytes: int):
+        self._raw = raw
+        self._max_bytes = max_bytes
+        self._hash = hashlib.sha256()
+        self.bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._raw.read(len(buffer))
+        if not data:
+            return 0
+        self.bytes_read += len(data)
+        if self.bytes_read > self._max_bytes:
+            raise ReportTooLarge(f"Sellerboard report exceeds the {SELLERBOARD_MAX_DOWNLOAD_MB} MB limit")
+        self._hash.update(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+
+def read_report_frame(response: requests.Response, report_type: Optional[str] = None,
+                      chunk_filter: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+                      chunk_rows: int = SELLERBOARD_CSV_CHUNK_ROWS) -> Tuple[pd.DataFrame, str]:
+    """Parse a streamed report in chunks; returns the frame and the SHA-256 of the body
+
+    ``chunk_filter`` runs on every chunk before it is kept (e.g. dropping old orders).
+    """
+    # Let urllib3 undo gzip/deflate transfer encoding while we stream
+    response.raw.decode_content = True
+    body = _StreamedBody(response.raw, SELLERBOARD_MAX_DOWNLOAD_MB * 1024 * 1024)
+    # Sellerboard exports are UTF-8; only trust an explicitly declared charset
+    content_type = response.headers.get('Content-Type', '')
+    encoding = response.encoding if 'charset=' in content_type.lower() and response.encoding else 'utf-8'
+
+    options = REPORT_READ_OPTIONS.get(report_type, {})
+    try:
+        reader = pd.read_csv(io.BufferedReader(body, buffer_size=1024 * 1024), chunksize=max(1, chunk_rows),
+                             encoding=encoding, encoding_errors='replace', **options)
+        with reader:
+            chunks = []
+            for chunk in reader:
+                if chunk_filter is not None:
+                    chunk = chunk_filter(chunk)
+                chunks.append(chunk)
+    finally:
+        response.close()
+
+    if len(chunks) == 1:
+        df = chunks[0].reset_index(drop=True)
+    else:
+        df = pd.concat(chunks, ignore_index=True)
+    return df, body.hexdigest()
@@ -0,0 +1,337 @@
+"""
+Persistent per-worksheet snapshots of users' Google Sheets.
+
+Monthly purchase tabs rarely change once the month is over, yet every analytics call
+used to download and re-parse all of them. Snapshots of each worksheet's payload
+(values, plus anything a caller derives from the grid such as hyperlinks) are stored
+in SQLite keyed by spreadsheet id + worksheet title + range. Freshness is tracked per
+worksheet:
+
+* unchanged Drive ``modifiedTime`` -> every snapshot is served from disk, no Sheets calls
+* changed or unknown               -> the caller's ``probe`` returns a key per stale tab
+                                      (a checksum of its values, from one batched
+                                      values:batchGet); tabs whose key matches the stored
+                                      one are re-stamped with the new ``modifiedTime``,
+                                      and only the others are re-fetched, re-stored and
+                                      marked changed for the caller to re-process
+
+An edit to the current month's tab therefore no longer re-fetches (hyperlinks included)
+and rewrites every monthly tab. Fetch errors are raised rather than stored, so a failed
+request is never served later as an empty worksheet.
+
+Results a caller derives from a snapshot (e.g. the parsed COGS of a tab) can be kept
+next to it with ``load_result``/``save_result``; they live in the same SQLite file, so
+every worker process shares them.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+SHEET_SNAPSHOT_DB = os.getenv('SHEET_SNAPSHOT_DB', 'sheet_snapshots.db')
+
+# Worksheet ranges per values:batchGet call and number of calls in flight
+SHEETS_BATCH_RANGES = 20
+SHEETS_MAX_WORKERS = 4
+
+
+class WorksheetSnapshot:
+    """One worksheet's payload and whether it differs from the previous snapshot"""
+
+    __slots__ = ('title', 'payload', 'content_hash', 'changed')
+
+    def __init__(self, title: str, payload, content_hash: str, changed: bool):
+        self.title = title
+        self.payload = payload
+        self.content_hash = content_hash
+        self.changed = changed
+
+    @property
+    def values(self) -> list:
+        return self.payload.get('values', []) if isinstance(self.payload, dict) else []
+
+
+def content_hash(payload) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def drive_modified_time(session: requests.Session, headers: dict, spreadsheet_id: str) -> Optional[str]:
+    """Spreadsheet modifiedTime from Drive, or None when it cannot be read"""
+    try:
+        r = session.get(
+            f"https://www.googleapis.com/drive/v3/files/{spreadsheet_id}",
+            headers=headers,
+            params={'fields': 'modifiedTime', 'supportsAllDrives': 'true'},
+            timeout=15
+        )
+        if r.status_code != 200:
+            return None
+        return r.json().get('modifiedTime')
+    except Exception:
+        return None
+
+
+def batch_get_values(session: requests.Session, headers: dict, spreadsheet_id: str, worksheet_titles: List[str], range_suffix: str = 'A1:Z') -> Dict[str, list]:
+    """Fetch one range from many worksheets with values:batchGet, a few chunks in parallel.
+
+    A chunk that fails falls back to one GET per worksheet, so a single bad tab shows up
+    as that tab's error instead of the chunk's. Errors (401s included, for the caller's
+    token refresh logic) are raised: every requested title is in the result, and an
+    empty list means the worksheet really is empty.
+    """
+    batch_url = f"https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}/values:batchGet"
+    chunks = [worksheet_titles[i:i + SHEETS_BATCH_RANGES] for i in range(0, len(worksheet_titles), SHEETS_BATCH_RANGES)]
+
+    def fetch_single(title):
+        range_ = f"'{title}'!{range_suffix}"
+        url = (
+            f"https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}"
+            f"/values/{requests.utils.quote(range_, safe='')}?majorDimension=ROWS"
+        )
+        r = session.get(url, headers=headers, timeout=60)
+        r.raise_for_status()
+        return r.json().get("values", [])
+
+    def fetch_chunk(chunk):
+        params = [('ranges', f"'{title}'!{range_suffix}") for title in chunk] + [('majorDimension', 'ROWS')]
+        r = session.get(batch_url, headers=headers, params=params, timeout=60)
+        if r.status_code == 401:
+            r.raise_for_status()
+        if r.status_code != 200:
+            return {title: fetch_single(title) for title in chunk}
+        value_ranges = r.json().get("valueRanges", [])
+        if len(value_ranges) != len(chunk):
+            raise ValueError(f"values:batchGet returned {len(value_ranges)} ranges for {len(chunk)} worksheets")
+        return {title: value_range.get("values", []) for title, value_range in zip(chunk, value_ranges)}
+
+    values_by_title = {}
+    if not chunks:
+        return values_by_title
+    with ThreadPoolExecutor(max_workers=min(SHEETS_MAX_WORKERS, len(chunks))) as executor:
+        for chunk_values in executor.map(fetch_chunk, chunks):
+            values_by_title.update(chunk_values)
+    return values_by_title
+
+
+def values_key(values: list) -> str:
+    """Per-worksheet freshness key: a checksum of the probed range's values"""
+    return content_hash({'values': values})
+
+
+class SheetSnapshotStore:
+    """SQLite-backed snapshot store, safe to share between threads and worker processes"""
+
+    def __init__(self, db_path: str = SHEET_SNAPSHOT_DB):
+        self.db_path = db_path
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.execute('PRAGMA journal_mode=WAL')
+                    conn.execute('''
+                        CREATE TABLE IF NOT EXISTS sheet_snapshots (
+                            spreadsheet_id TEXT NOT NULL,
+                            worksheet_title TEXT NOT NULL,
+                            range_key TEXT NOT NULL,
+                            modified_time TEXT,
+                            content_hash TEXT NOT NULL,
+                            payload BLOB NOT NULL,
+                            updated_at REAL NOT NULL,
+                            tab_key TEXT,
+                            PRIMARY KEY (spreadsheet_id, worksheet_title, range_key)
+                        )
+                    ''')
+                    # Snapshots written before per-worksheet keys: a NULL key is re-fetched once
+                    columns = {row[1] for row in conn.execute('PRAGMA table_info(sheet_snapshots)')}
+                    if 'tab_key' not in columns:
+                        conn.execute('ALTER TABLE sheet_snapshots ADD COLUMN tab_key TEXT')
+                    conn.execute('''
+                        CREATE TABLE IF NOT EXISTS worksheet_results (
+                            spreadsheet_id TEXT NOT NULL,
+                            worksheet_title TEXT NOT NULL,
+                            variant TEXT NOT NULL,
+                            content_hash TEXT NOT NULL,
+                            result BLOB NOT NULL,
+                            updated_at REAL NOT NULL,
+                            PRIMARY KEY (spreadsheet_id, worksheet_title, variant)
+                        )
+                    ''')
+                    conn.commit()
+                    self._schema_ready = True
+        return conn
+
+    def _read(self, spreadsheet_id: str, titles: List[str], range_key: str) -> Dict[str, tuple]:
+        if not titles:
+            return {}
+        conn = self._connect()
+        try:
+            placeholders = ','.join('?' * len(titles))
+            rows = conn.execute(
+                f'SELECT worksheet_title, modified_time, content_hash, payload, tab_key FROM sheet_snapshots '
+                f'WHERE spreadsheet_id = ? AND range_key = ? AND worksheet_title IN ({placeholders})',
+                [spreadsheet_id, range_key, *titles]
+            ).fetchall()
+        finally:
+            conn.close()
+        return {title: (modified_time, digest, payload, tab_key) for title, modified_time, digest, payload, tab_key in rows}
+
+    def _write(self, spreadsheet_id: str, range_key: str, modified_time: Optional[str], snapshots: List[WorksheetSnapshot],
+               tab_keys: Dict[str, str]):
+        if not snapshots:
+            return
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.executemany(
+                'INSERT OR REPLACE INTO sheet_snapshots '
+                '(spreadsheet_id, worksheet_title, range_key, modified_time, content_hash, payload, updated_at, tab_key) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [
+                    (spreadsheet_id, snapshot.title, range_key, modified_time, snapshot.content_hash,
+                     zlib.compress(json.dumps(snapshot.payload, separators=(',', ':')).encode('utf-8')), now,
+                     tab_keys.get(snapshot.title))
+                    for snapshot in snapshots
+                ]
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _restamp(self, spreadsheet_id: str, range_key: str, modified_time: Optional[str], titles: List[str]):
+        """Record that ``titles`` were verified unchanged at ``modified_time``"""
+        if not titles or not modified_time:
+            return
+        conn = self._connect()
+        try:
+            conn.executemany(
+                'UPDATE sheet_snapshots SET modified_time = ? WHERE spreadsheet_id = ? AND range_key = ? AND worksheet_title = ?',
+                [(modified_time, spreadsheet_id, range_key, title) for title in titles]
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def load(self, spreadsheet_id: str, titles: List[str], range_key: str, modified_time: Optional[str],
+             fetch: Callable[[List[str]], Dict[str, object]],
+             probe: Optional[Callable[[List[str]], Dict[str, str]]] = None) -> Dict[str, WorksheetSnapshot]:
+        """Return snapshots for ``titles``, calling ``fetch`` only for tabs that may have changed.
+
+        ``fetch(titles)`` returns a JSON-serializable payload per title (at least
+        ``{'values': [...]}``) and raises when it cannot. ``probe(titles)`` returns a
+        cheap freshness key per title; without one, every stale tab is re-fetched.
+        """
+        try:
+            stored = self._read(spreadsheet_id, titles, range_key)
+        except sqlite3.Error as e:
+            print(f"Sheet snapshot read failed: {e}")
+            stored = {}
+
+        def from_disk(title):
+            return WorksheetSnapshot(title, json.loads(zlib.decompress(stored[title][2])), stored[title][1], changed=False)
+
+        stale = [title for title in titles if not modified_time or title not in stored or stored[title][0] != modified_time]
+        if not stale:
+            return {title: from_disk(title) for title in titles}
+
+        tab_keys = probe(stale) if probe else {}
+        refetch = [title for title in stale
+                   if title not in stored or not tab_keys.get(title) or stored[title][3] != tab_keys[title]]
+        verified = [title for title in stale if title not in refetch]
+
+        payloads = fetch(refetch) if refetch else {}
+        snapshots = {}
+        for title in titles:
+            if title not in refetch:
+                snapshots[title] = from_disk(title)
+                continue
+            payload = payloads[title]
+            digest = content_hash(payload)
+            previous = stored.get(title)
+            snapshots[title] = WorksheetSnapshot(title, payload, digest, changed=previous is None or previous[1] != digest)
+
+        try:
+            self._write(spreadsheet_id, range_key, modified_time, [snapshots[title] for title in refetch], tab_keys)
+            self._restamp(spreadsheet_id, range_key, modified_time, verified)
+        except sqlite3.Error as e:
+            print(f"Sheet snapshot write failed: {e}")
+        return snapshots
+
+    def load_result(self, spreadsheet_id: str, title: str, variant: str, digest: str) -> Optional[Any]:
+        """A result derived from the snapshot with content hash ``digest``, or None"""
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    'SELECT result FROM worksheet_results WHERE spreadsheet_id = ? AND worksheet_title = ? '
+                    'AND variant = ? AND content_hash = ?',
+                    (spreadsheet_id, title, variant, digest)
+                ).fetchone()
+            finally:
+                conn.close()
+            return pickle.loads(zlib.decompress(row[0])) if row else None
+        except Exception as e:
+            print(f"Worksheet result read failed: {e}")
+            return None
+
+    def save_result(self, spreadsheet_id: str, title: str, variant: str, digest: str, result: Any):
+        """Keep one derived result per worksheet and variant, replacing older content's"""
+        try:
+            blob = zlib.compress(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+            conn = self._connect()
+            try:
+                conn.execute(
+                    'INSERT OR REPLACE INTO worksheet_results '
+                    '(spreadsheet_id, worksheet_title, variant, content_hash, result, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                    (spreadsheet_id, title, variant, digest, blob, time.time())
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"Worksheet result write failed: {e}")
+
+    def invalidate(self, spreadsheet_id: str):
+        """Forget every snapshot of a spreadsheet (e.g. after the user re-links their sheet)"""
+        conn = self._connect()
+        try:
+            conn.execute('DELETE FROM sheet_snapshots WHERE spreadsheet_id = ?', (spreadsheet_id,))
+            conn.execute('DELETE FROM worksheet_results WHERE spreadsheet_id = ?', (spreadsheet_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+
+# Shared by the analyzers and the app's sheet helpers
+sheet_snapshot_store = SheetSnapshotStore()
+
+
+def load_worksheet_values(access_token: str, spreadsheet_id: str, titles: List[str], range_suffix: str = 'A1:Z',
+                          session: Optional[requests.Session] = None) -> Dict[str, WorksheetSnapshot]:
+    """Values-only snapshots for plain callers: one Drive probe, then a batched fetch if needed"""
+    session = session or requests.Session()
+    headers = {"Authorization": f"Bearer {access_token}"}
+    modified_time = drive_modified_time(session, headers, spreadsheet_id)
+    # The probe already downloads the values, so the fetch of changed tabs reuses them
+    probed: Dict[str, list] = {}
+
+    def probe(stale):
+        probed.update(batch_get_values(session, headers, spreadsheet_id, stale, range_suffix))
+        return {title: values_key(probed[title]) for title in stale}
+
+    return sheet_snapshot_store.load(
+        spreadsheet_id, titles, range_suffix, modified_time,
+        lambda changed: {title: {'values': probed[title]} for title in changed}, probe
+    )
@@ -0,0 +1,165 @@
+"""
+Column-oriented index over a Sellerboard stock report.
+
+Column roles (ASIN, FBA/FBM stock, days of stock left, price, title) are resolved once
+per report and the values are held as typed NumPy arrays with an ASIN -> row map, so
+per-ASIN lookups are O(1) array reads. JSON-ready row dicts are only built for the
+ASINs a caller actually asks for.
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Stock columns in priority order, mirroring EnhancedOrdersAnalysis.extract_current_stock
+STOCK_COLUMNS = ['FBA/FBM Stock', 'FBA/FBM stock', 'FBA / FBM Stock', 'FBA stock', 'FBA Stock']
+ASIN_COLUMN_NAMES = ['ASIN', 'asin', 'Asin', 'SKU', 'sku', 'Sku', 'Product ID', 'product_id', 'Product Code']
+MISSING_TEXT = ['nan', 'none', '', 'null']
+
+
+def find_asin_column(columns: Iterable[str]) -> Optional[str]:
+    """Resolve the ASIN column of a stock report (exact names first, then 'asin'/'sku' substrings)"""
+    columns = list(columns)
+    for col in columns:
+        if col.strip().upper() == 'ASIN':
+            return col
+        for name in ASIN_COLUMN_NAMES:
+            if col.strip().lower() == name.lower():
+                return col
+    for col in columns:
+        if 'asin' in col.lower() or 'sku' in col.lower():
+            print(f"Using column '{col}' as ASIN column")
+            return col
+    return None
+
+
+def find_days_left_column(columns: Iterable[str]) -> Optional[str]:
+    """First column mentioning days, stock and left (e.g. 'Days of stock left')"""
+    for col in columns:
+        lowered = col.lower()
+        if 'days' in lowered and 'stock' in lowered and 'left' in lowered:
+            return col
+    return None
+
+
+def _numeric(series: pd.Series) -> np.ndarray:
+    """Parse a column like the per-row float(str(value).replace(',', '')) conversions did"""
+    text = series.astype(str).str.replace(',', '', regex=False).str.strip()
+    values = pd.to_numeric(text, errors='coerce').to_numpy(dtype=float)
+    values[text.str.lower().isin(MISSING_TEXT).to_numpy()] = np.nan
+    return values
+
+
+def _float_fails(value) -> bool:
+    try:
+        float(value)
+        return False
+    except (ValueError, TypeError):
+        return True
+
+
+def _json_safe_column(series: pd.Series) -> list:
+    """Convert a column to native Python values the way get_stock_info always has"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return [value.to_pydatetime().isoformat() if not pd.isna(value) else None for value in series]
+    if isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.is_extension_array_dtype(series.dtype):
+        return [str(value) for value in series]
+    return series.tolist()
+
+
+class StockIndex:
+    """Typed, ASIN-addressable view of a stock report DataFrame"""
+
+    def __init__(self, stock_df: pd.DataFrame):
+        self.df = stock_df
+        self.asin_column = find_asin_column(stock_df.columns)
+        if not self.asin_column:
+            # Debug: show all columns to help identify the issue
+            print(f"Available columns in stock report: {list(stock_df.columns)}")
+            raise ValueError(f"ASIN column not found in stock report. Available columns: {', '.join(stock_df.columns[:10])}...")
+
+        self.stock_columns = [col for col in STOCK_COLUMNS if col in stock_df.columns]
+        self.days_left_column = find_days_left_column(stock_df.columns)
+        self.price_column = 'Price' if 'Price' in stock_df.columns else None
+        self.title_column = 'Title' if 'Title' in stock_df.columns else None
+
+        asins = stock_df[self.asin_column].astype(str).str.strip()
+        valid = ~asins.isin(['', 'nan', 'None'])
+        # Later rows win for duplicate ASINs, as they did when building the dict row by row
+        self.rows: Dict[str, int] = {asin: row for row, asin in zip(np.flatnonzero(valid.to_numpy()), asins[valid])}
+        self.asins = list(self.rows.keys())
+
+        # FBA/FBM stock: first column with a valid non-negative value, otherwise 0
+        current_stock = np.full(len(stock_df), np.nan)
+        for col in self.stock_columns:
+            values = _numeric(stock_df[col])
+            values[values < 0] = np.nan
+            current_stock = np.where(np.isnan(current_stock), values, current_stock)
+        self.stock_found = ~np.isnan(current_stock)
+        self.current_stock = np.nan_to_num(current_stock, nan=0.0)
+
+        self.days_left = _numeric(stock_df[self.days_left_column]) if self.days_left_column else np.full(len(stock_df), np.nan)
+        # Days-left cells a plain float() rejects ('1,200', '-', 'N/A', ''), which restock priority treats as out of stock
+        self.days_left_unreadable = np.zeros(len(stock_df), dtype=bool)
+        if self.days_left_column and stock_df[self.days_left_column].dtype == object:
+            self.days_left_unreadable = np.fromiter((_float_fails(value) for value in stock_df[self.days_left_column]),
+                                                    dtype=bool, count=len(stock_df))
+        self.price = _numeric(stock_df[self.price_column]) if self.price_column else np.full(len(stock_df), np.nan)
+        self.titles = stock_df[self.title_column].to_numpy(dtype=object) if self.title_column else None
+
+        self._records: Optional[List[dict]] = None
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __contains__(self, asin: str) -> bool:
+        return asin in self.rows
+
+    def row_of(self, asin: str) -> Optional[int]:
+        return self.rows.get(asin)
+
+    def stock_for(self, asin: str) -> float:
+        row = self.rows.get(asin)
+        return float(self.current_stock[row]) if row is not None else 0
+
+    def days_left_for(self, asin: str, default: float = 9999) -> float:
+        row = self.rows.get(asin)
+        if row is None or np.isnan(self.days_left[row]):
+            return default
+        return float(self.days_left[row])
+
+    def price_for(self, asin: str) -> float:
+        row = self.rows.get(asin)
+        if row is None or np.isnan(self.price[row]):
+            return 0
+        return float(self.price[row])
+
+    def title_for(self, asin: str, default: Optional[str] = None) -> Optional[str]:
+        row = self.rows.get(asin)
+        if row is None or self.titles is None:
+            return default
+        return self.titles[row]
+
+    def _all_records(self) -> List[dict]:
+        if self._records is None:
+            columns = {col: _json_safe_column(self.df[col]) for col in self.df.columns}
+            names = list(columns.keys())
+            self._records = [dict(zip(names, values)) for values in zip(*columns.values())] if names else []
+        return self._records
+
+    def record(self, asin: str) -> Optional[dict]:
+        """JSON-serializable stock row for one ASIN"""
+        row = self.rows.get(asin)
+        if row is None:
+            return None
+        if self._records is not None:
+            return self._records[row]
+        return {col: _json_safe_column(self.df[col].iloc[row:row + 1])[0] for col in self.df.columns}
+
+    def records(self, asins: Optional[Iterable[str]] = None) -> Dict[str, dict]:
+        """ASIN -> stock row dicts, for every ASIN or only the requested ones"""
+        if asins is None:
+            all_records = self._all_records()
+            return {asin: all_records[row] for asin, row in self.rows.items()}
+        return {asin: self.record(asin) for asin in asins if asin in self.rows}
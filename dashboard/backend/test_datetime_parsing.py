@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Test sniffed datetime parsing against pd.to_datetime and the previous first-match parser
+"""
+import random
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# Add current directory to Python path
+sys.path.insert(0, '.')
+
+from datetime_parsing import DATETIME_FORMATS, parse_datetime_robust, parse_with_format
+
+
+def legacy_parse(series):
+    """The parser before format sniffing: the first format that parses any value wins"""
+    for fmt in DATETIME_FORMATS:
+        parsed = pd.to_datetime(series, format=fmt, errors='coerce')
+        if parsed.notna().sum() > 0:
+            return parsed
+    return pd.to_datetime(series, errors='coerce')
+
+
+def same(a, b):
+    return bool(((a == b) | (a.isna() & b.isna())).all())
+
+
+def order_times(count=50000, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, 200 * 86400, count), unit='s')
+
+
+def fuzzed_values(fmt, rng, count=5000):
+    """Valid values of ``fmt`` plus values with one piece mangled"""
+    values = []
+    for _ in range(count):
+        text = (pd.Timestamp('1990-01-01') + pd.Timedelta(seconds=rng.randint(0, 50 * 365 * 86400))).strftime(fmt)
+        if rng.random() < 0.5:
+            pieces = re.split(r'(\d+)', text)
+            i = rng.randrange(len(pieces))
+            pieces[i] = rng.choice(['', '0', '00', '13', '29', '31', '60', '1677', '2262', '12345', ' 7', 'x', '/', ':', '-'])
+            text = ''.join(pieces)
+        values.append(text)
+    return values + [None, np.nan, '', 'nan', ' 7/26/25 6:05', '2/29/24 1:00', '2/29/23 1:00', '1/1/68 0:00', '1/1/69 0:00']
+
+
+def test_matches_to_datetime():
+    print("=== Testing parse_with_format against pd.to_datetime ===")
+    rng = random.Random(1)
+    for fmt in DATETIME_FORMATS:
+        series = pd.Series(fuzzed_values(fmt, rng), name='date')
+        series.index = series.index * 3
+        expected = pd.to_datetime(series, format=fmt, errors='coerce')
+        parsed = parse_with_format(series, fmt)
+        assert parsed.dtype == expected.dtype and parsed.index.equals(expected.index) and parsed.name == 'date'
+        assert same(parsed, expected), fmt
+        print(f"   ✅ {fmt}: {int(expected.notna().sum())} parsed, identical")
+
+
+def test_matches_legacy():
+    print("=== Testing parse_datetime_robust against the first-match parser ===")
+    times = order_times(5000)
+    for fmt in ["%m/%d/%y %H:%M", "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%Y-%m-%d %H:%M:%S", "%m/%d/%Y %I:%M:%S %p"]:
+        series = pd.Series(times.strftime(fmt))
+        assert same(parse_datetime_robust(series), legacy_parse(series)), fmt
+        print(f"   ✅ {fmt}: unchanged")
+
+    # US exports with 4-digit years were read as day/month by the first-match parser:
+    # swapped dates where the day was <= 12, NaT everywhere else
+    series = pd.Series(times.strftime("%m/%d/%Y %H:%M:%S"))
+    legacy = legacy_parse(series)
+    parsed = parse_datetime_robust(series)
+    assert (parsed.values == times.values).all()
+    print(f"   ✅ %m/%d/%Y %H:%M:%S: all correct (first-match parser: {int(legacy.isna().sum())} NaT, "
+          f"{int((legacy.notna() & (legacy.values != times.values)).sum())} day/month swapped)")
+
+
+def best_of(func, runs=7):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def test_speed():
+    print("=== Benchmarking 50k order dates ===")
+    times = order_times()
+    # Sellerboard's own export: no zero padding, 2-digit year
+    series = pd.Series([f"{t.month}/{t.day}/{t:%y} {t.hour}:{t:%M}" for t in times])
+    parse_datetime_robust(series, source_key='benchmark')
+    legacy = best_of(lambda: legacy_parse(series))
+    sniffed = best_of(lambda: parse_datetime_robust(series, source_key='benchmark'))
+    print(f"   first-match {legacy * 1000:.1f}ms, sniffed {sniffed * 1000:.1f}ms ({legacy / sniffed:.1f}x)")
+    # Timing on shared machines is noisy; ~10x is typical, well under that means the fast path is not taken
+    assert legacy / sniffed >= 5, legacy / sniffed
+
+
+if __name__ == "__main__":
+    test_matches_to_datetime()
+    test_matches_legacy()
+    test_speed()
+    print("\n🎯 Datetime parsing tests passed")
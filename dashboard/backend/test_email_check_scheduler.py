@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Test that the account check scheduler sleeps while providers are at their limits
+"""
+import sys
+import threading
+import time
+
+# Add current directory to Python path
+sys.path.insert(0, '.')
+
+import email_check_scheduler
+from email_check_scheduler import AccountCheckScheduler
+
+CHECK_SECONDS = 0.3
+REAL_WAIT = email_check_scheduler.wait
+
+
+def imap_config(number, server='imap.example.com'):
+    return {'discord_id': str(number), 'email_address': f'user{number}@example.com', 'imap_server': server}
+
+
+def run_cycle(configs, **kwargs):
+    calls = []
+    checked = []
+    lock = threading.Lock()
+
+    def check(config):
+        time.sleep(CHECK_SECONDS)
+        with lock:
+            checked.append(config['discord_id'])
+
+    def counting_wait(*args, **kwargs):
+        calls.append(kwargs.get('timeout'))
+        return REAL_WAIT(*args, **kwargs)
+
+    # Each pass of the run loop that has checks running waits on them once
+    email_check_scheduler.wait = counting_wait
+    try:
+        metrics = AccountCheckScheduler(check, provider_interval=0.01, account_timeout=30, **kwargs).run(configs)
+    finally:
+        email_check_scheduler.wait = REAL_WAIT
+    return metrics, calls, checked
+
+
+def test_provider_at_limit():
+    print("=== Testing the scheduler loop while a provider is at its limit ===")
+    print("1. One provider, one slot, three accounts...")
+    metrics, calls, checked = run_cycle([imap_config(n) for n in range(3)], workers=4, provider_limits={},
+                                        default_limit=1)
+    assert sorted(checked) == ['0', '1', '2'] and metrics['ok'] == 3, metrics
+    # One wait per finished check (plus a few for the start spacing), not a spin until each finishes
+    assert len(calls) <= 8, f"{len(calls)} loop iterations"
+    print(f"   ✅ {len(calls)} loop iterations in {metrics['duration_seconds']}s")
+
+    print("2. Pool full...")
+    metrics, calls, checked = run_cycle([imap_config(n, f'imap{n}.example.com') for n in range(4)], workers=2,
+                                        provider_limits={}, default_limit=2)
+    assert sorted(checked) == ['0', '1', '2', '3'] and metrics['peak_concurrency'] == 2, metrics
+    assert len(calls) <= 8, f"{len(calls)} loop iterations"
+    print(f"   ✅ {len(calls)} loop iterations in {metrics['duration_seconds']}s")
+
+
+if __name__ == "__main__":
+    test_provider_at_limit()
+    print("\n🎯 Email check scheduler tests passed")
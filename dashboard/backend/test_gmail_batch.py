@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Test batched Gmail message fetching against a local Gmail API stub server
+"""
+import json
+import os
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Fast retries against the stub
+os.environ['GMAIL_BACKOFF_SECONDS'] = '0.01'
+
+# Add current directory to Python path
+sys.path.insert(0, '.')
+
+from gmail_batch import MESSAGE_METADATA_FIELDS, GmailAuthError, GmailFetcher, parse_batch_response
+
+VALID_TOKEN = 'good-token'
+
+
+def make_message(message_id, subject):
+    return {'id': message_id, 'threadId': f't{message_id}', 'internalDate': '1724859000000',
+            'snippet': subject, 'payload': {'headers': [{'name': 'Subject', 'value': subject},
+                                                        {'name': 'From', 'value': 'alert@distill.io'}]}}
+
+
+class StubGmail:
+    def __init__(self):
+        self.messages = {}
+        self.batches = []             # message ids requested per batch POST
+        self.part_failures = {}       # message id -> statuses to answer before the message
+        self.request_failures = []    # statuses to answer whole batch POSTs with first
+        self.fields = set()
+
+    def add(self, message_id, subject):
+        self.messages[message_id] = make_message(message_id, subject)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Just enough of the Gmail API for gmail_batch: message list and /batch/gmail/v1"""
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body, content_type='application/json', headers=()):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def authorized(self):
+        if self.headers.get('Authorization') != f'Bearer {VALID_TOKEN}':
+            self.reply(401, {'error': {'code': 401, 'message': 'Invalid Credentials'}})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self.authorized():
+            return
+        box = self.server.gmail
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        ids = sorted(box.messages, reverse=True)
+        start = int(query.get('pageToken', ['0'])[0])
+        page = ids[start:start + 2]
+        body = {'messages': [{'id': message_id} for message_id in page]}
+        if start + 2 < len(ids):
+            body['nextPageToken'] = str(start + 2)
+        self.reply(200, body)
+
+    def do_POST(self):
+        if not self.authorized():
+            return
+        box = self.server.gmail
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if box.request_failures:
+            self.reply(box.request_failures.pop(0), {'error': {'code': 429}}, headers=[('Retry-After', '0')])
+            return
+        boundary = re.search(r'boundary=(\S+)', self.headers['Content-Type']).group(1)
+        requested = []
+        parts = []
+        for part in body.decode().split(f'--{boundary}')[1:]:
+            if part.startswith('--'):
+                break
+            content_id = re.search(r'Content-ID: <([^>]+)>', part).group(1)
+            path = re.search(r'GET (\S+)', part).group(1)
+            url = urlsplit(path)
+            message_id = url.path.rsplit('/', 1)[-1]
+            box.fields.update(parse_qs(url.query).get('fields', []))
+            requested.append(message_id)
+            failures = box.part_failures.get(message_id)
+            if failures:
+                status, data = failures.pop(0), {'error': {'code': 0}}
+            elif message_id in box.messages:
+                status, data = 200, box.messages[message_id]
+            else:
+                status, data = 404, {'error': {'code': 404, 'message': 'Not Found'}}
+            parts.append(
+                f'--batch_stub\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n'
+                f'HTTP/1.1 {status} X\r\nContent-Type: application/json; charset=UTF-8\r\n\r\n{json.dumps(data)}\r\n'
+            )
+        box.batches.append(requested)
+        self.reply(200, (''.join(parts) + '--batch_stub--\r\n').encode(), 'multipart/mixed; boundary=batch_stub')
+
+
+def start_stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.gmail = StubGmail()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def fetcher(server, token=VALID_TOKEN, batch_size=2):
+    return GmailFetcher(token, base_url=f'http://127.0.0.1:{server.server_address[1]}', batch_size=batch_size)
+
+
+def test_gmail_batch():
+    print("=== Testing batched Gmail fetching ===")
+    server = start_stub()
+    box = server.gmail
+    for number, subject in enumerate(['B008XQO7WA price drop', 'B07XVTRJKX back in stock', 'Weekly news',
+                                      'B0CHX1W1XY deal', 'Receipt'], start=1):
+        box.add(f'm{number}', subject)
+
+    print("1. Listing follows page tokens...")
+    ids = fetcher(server).list_message_ids('from:distill.io')
+    assert ids == ['m5', 'm4', 'm3', 'm2', 'm1'], ids
+    print(f"   ✅ {ids}")
+
+    print("2. Messages come back from multipart batch responses...")
+    messages = fetcher(server).get_messages(['m1', 'm2', 'm3', 'm1', 'm9'], 'metadata', fields=MESSAGE_METADATA_FIELDS)
+    assert list(messages) == ['m1', 'm2', 'm3'], list(messages)
+    assert messages['m2'] == box.messages['m2']
+    assert box.batches == [['m1', 'm2'], ['m3', 'm9']], box.batches
+    assert box.fields == {MESSAGE_METADATA_FIELDS}, box.fields
+    print(f"   ✅ {len(messages)} messages in {len(box.batches)} batches, missing m9 left out")
+
+    print("3. A rate-limited part is retried on its own...")
+    box.batches.clear()
+    box.part_failures['m4'] = [429]
+    messages = fetcher(server).get_messages(['m3', 'm4', 'm5'])
+    assert list(messages) == ['m3', 'm4', 'm5'], list(messages)
+    assert box.batches == [['m3', 'm4'], ['m5'], ['m4']], box.batches
+    print(f"   ✅ batches {box.batches}")
+
+    print("4. A rate-limited batch request is retried whole...")
+    box.batches.clear()
+    box.request_failures = [429]
+    messages = fetcher(server).get_messages(['m1'])
+    assert list(messages) == ['m1'] and box.batches == [['m1']], box.batches
+    print("   ✅ retried after 429")
+
+    print("5. A rejected token raises GmailAuthError...")
+    for call in (lambda: fetcher(server, token='expired').get_messages(['m1']),
+                 lambda: fetcher(server, token='expired').list_message_ids('in:inbox')):
+        try:
+            call()
+            raise AssertionError("401 was not raised")
+        except GmailAuthError as e:
+            assert '401' in str(e), str(e)
+    box.part_failures['m2'] = [401]
+    try:
+        fetcher(server).get_messages(['m1', 'm2'])
+        raise AssertionError("part 401 was not raised")
+    except GmailAuthError as e:
+        assert '401' in str(e), str(e)
+    print("   ✅ request and part 401s raise GmailAuthError")
+
+    print("6. Unquoted boundaries and LF-only parts parse...")
+    parsed = parse_batch_response('multipart/mixed; boundary=b1',
+                                  b'--b1\nContent-ID: <response-item-0>\n\nHTTP/1.1 200 OK\n\n{"id": "x"}\n--b1--')
+    assert parsed == {'item-0': (200, {'id': 'x'})}, parsed
+    print("   ✅ parsed")
+
+    server.shutdown()
+    print("\n🎯 Gmail batch tests passed")
+
+
+if __name__ == "__main__":
+    test_gmail_batch()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Test incremental IMAP sync against a local IMAP stub server
+"""
+import os
+import re
+import socketserver
+import sys
+import tempfile
+import threading
+from email.message import EmailMessage
+
+# Plain IMAP to the stub and a throwaway sync database
+os.environ['IMAP_PLAINTEXT_HOSTS'] = '127.0.0.1'
+os.environ['IMAP_SYNC_DB'] = os.path.join(tempfile.mkdtemp(), 'imap_sync.db')
+
+# Add current directory to Python path
+sys.path.insert(0, '.')
+
+from imap_sync import ImapMailboxSync, connect, uid_set
+
+
+def make_message(subject, sender, html=None, plain=None, attachment=None):
+    msg = EmailMessage()
+    msg['Subject'] = subject
+    msg['From'] = sender
+    msg['Date'] = 'Wed, 28 Aug 2024 15:30:00 +0000'
+    if plain is not None:
+        msg.set_content(plain)
+    if html is not None:
+        if plain is not None:
+            msg.add_alternative(html, subtype='html')
+        else:
+            msg.set_content(html, subtype='html')
+    if attachment is not None:
+        msg.add_attachment(attachment, maintype='application', subtype='pdf', filename='invoice.pdf')
+    return msg
+
+
+def body_structure(part):
+    """BODYSTRUCTURE of an email.message part (the fields the sync reads)"""
+    if part.is_multipart():
+        children = ''.join(body_structure(child) for child in part.get_payload())
+        return f'({children} "{part.get_content_subtype().upper()}")'
+    raw = part.get_payload().encode()
+    charset = f'("CHARSET" "{part.get_content_charset()}")' if part.get_content_charset() else 'NIL'
+    encoding = (part.get('Content-Transfer-Encoding') or '7bit').upper()
+    fields = f'"{part.get_content_maintype().upper()}" "{part.get_content_subtype().upper()}" {charset} NIL NIL "{encoding}" {len(raw)}'
+    disposition = 'NIL'
+    if part.get_content_disposition() == 'attachment':
+        disposition = f'("ATTACHMENT" ("FILENAME" "{part.get_filename()}"))'
+    if part.get_content_maintype() == 'text':
+        lines = raw.count(b'\n')
+        return f'({fields} {lines} NIL {disposition} NIL NIL)'
+    return f'({fields} NIL {disposition} NIL NIL)'
+
+
+def section_bytes(msg, section):
+    if section == 'TEXT':
+        return msg.get_payload().encode()
+    part = msg
+    for number in section.split('.'):
+        part = part.get_payload()[int(number) - 1]
+    return part.get_payload().encode()
+
+
+class StubMailbox:
+    def __init__(self):
+        self.uidvalidity = 1
+        self.messages = {}
+        self.next_uid = 1
+        self.commands = []
+
+    def add(self, msg):
+        self.messages[self.next_uid] = msg
+        self.next_uid += 1
+
+
+def parse_uid_set(value, highest):
+    uids = set()
+    for item in value.split(','):
+        start, _, end = item.partition(':')
+        start = highest if start == '*' else int(start)
+        end = start if not end else (highest if end == '*' else int(end))
+        uids.update(range(min(start, end), max(start, end) + 1))
+    return uids
+
+
+class StubHandler(socketserver.StreamRequestHandler):
+    """Just enough IMAP4rev1 for imap_sync: LOGIN, EXAMINE, UID SEARCH/FETCH, LOGOUT"""
+
+    def send(self, line):
+        self.wfile.write(line if isinstance(line, bytes) else line.encode() + b'\r\n')
+
+    def handle(self):
+        box = self.server.mailbox
+        self.send('* OK [CAPABILITY IMAP4rev1] stub ready')
+        while True:
+            line = self.rfile.readline().decode().strip()
+            if not line:
+                return
+            tag, command, *rest = line.split(' ', 2)
+            args = rest[0] if rest else ''
+            box.commands.append(f'{command} {args}'.strip())
+            command = command.upper()
+            if command == 'LOGOUT':
+                self.send('* BYE')
+                self.send(f'{tag} OK LOGOUT completed')
+                return
+            if command == 'CAPABILITY':
+                self.send('* CAPABILITY IMAP4rev1')
+            elif command in ('EXAMINE', 'SELECT'):
+                self.send(f'* {len(box.messages)} EXISTS')
+                self.send(f'* OK [UIDVALIDITY {box.uidvalidity}] UIDs valid')
+                self.send(f'* OK [UIDNEXT {box.next_uid}] Predicted next UID')
+                self.send(f'{tag} OK [READ-ONLY] EXAMINE completed')
+                continue
+            elif command == 'UID' and args.upper().startswith('SEARCH'):
+                criteria = args[len('SEARCH '):]
+                highest = max(box.messages, default=0)
+                match = re.match(r'UID (\S+)', criteria)
+                uids = sorted(parse_uid_set(match.group(1), highest) & set(box.messages)) if match else sorted(box.messages)
+                self.send('* SEARCH ' + ' '.join(map(str, uids)))
+            elif command == 'UID' and args.upper().startswith('FETCH'):
+                _, uids, items = args.split(' ', 2)
+                for uid in sorted(parse_uid_set(uids, max(box.messages, default=0)) & set(box.messages)):
+                    msg = box.messages[uid]
+                    parts = [f'UID {uid}'.encode()]
+                    if 'INTERNALDATE' in items:
+                        parts.append(b'INTERNALDATE "28-Aug-2024 15:30:00 +0000"')
+                    if 'BODYSTRUCTURE' in items:
+                        parts.append(b'BODYSTRUCTURE ' + body_structure(msg).encode())
+                    header = re.search(r'BODY\.PEEK\[HEADER\.FIELDS \(([^)]*)\)\]', items)
+                    if header:
+                        names = header.group(1).split()
+                        data = ''.join(f'{name}: {msg[name]}\r\n' for name in names if msg[name]).encode() + b'\r\n'
+                        parts.append(f'BODY[HEADER.FIELDS ({header.group(1)})] {{{len(data)}}}\r\n'.encode() + data)
+                    text = re.search(r'BODY\.PEEK\[([0-9.]+|TEXT)\]', items)
+                    if text:
+                        data = section_bytes(msg, text.group(1))
+                        parts.append(f'BODY[{text.group(1)}] {{{len(data)}}}\r\n'.encode() + data)
+                    self.send(f'* {uid} FETCH ('.encode() + b' '.join(parts) + b')\r\n')
+            self.send(f'{tag} OK {command} completed')
+
+
+def start_stub():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.mailbox = StubMailbox()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_sync(server, mailbox='test:stub'):
+    mail = connect('127.0.0.1', server.server_address[1])
+    mail.login('user', 'password')
+    sync = ImapMailboxSync(mail, mailbox)
+    batch = sync.new_uids('SINCE "01-Jan-2024"')
+    messages = sync.fetch_headers(batch.uids)
+    candidates = [message for message in messages.values() if 'distill' in message.header('From')]
+    sync.fetch_text(candidates)
+    sync.commit(batch)
+    mail.logout()
+    return batch, messages
+
+
+def test_imap_sync():
+    print("=== Testing incremental IMAP sync ===")
+    server = start_stub()
+    box = server.mailbox
+    box.add(make_message('Alert: B008XQO7WA price drop', 'alert@distill.io',
+                         html='<p>B008XQO7WA now $5</p>', plain='B008XQO7WA now $5'))
+    box.add(make_message('Newsletter', 'news@example.com', plain='Weekly news', attachment=b'%PDF' * 1000))
+    box.add(make_message('Alert: B07XVTRJKX back in stock', 'alert@distill.io', plain='B07XVTRJKX in stock'))
+
+    print("1. First sync runs the window search...")
+    batch, messages = run_sync(server)
+    assert batch.full_sync and batch.uids == [1, 2, 3], batch.uids
+    assert messages[1].html_content == '<p>B008XQO7WA now $5</p>\n', messages[1].html_content
+    assert messages[3].html_content == '<div>B07XVTRJKX in stock\n</div>', messages[3].html_content
+    assert messages[1].html == messages[1].html_content and messages[3].html == '', messages[3].html
+    assert messages[2].text is None, "pre-filtered message body was downloaded"
+    assert not any('RFC822' in command for command in box.commands)
+    print(f"   ✅ {len(messages)} headers, text parts for {sorted(m.uid for m in messages.values() if m.text)}")
+
+    print("2. Second sync reads only new UIDs...")
+    box.commands.clear()
+    box.add(make_message('Alert: B0CHX1W1XY deal', 'alert@distill.io', html='<b>B0CHX1W1XY</b>'))
+    batch, messages = run_sync(server)
+    assert not batch.full_sync and batch.uids == [4], batch.uids
+    assert any(command.startswith('UID SEARCH UID 4:*') for command in box.commands), box.commands
+    assert messages[4].html_content == '<b>B0CHX1W1XY</b>\n'
+    print(f"   ✅ incremental batch {batch.uids}")
+
+    print("3. Nothing new...")
+    batch, messages = run_sync(server)
+    assert not batch.full_sync and batch.uids == [] and not messages
+    print("   ✅ empty batch")
+
+    print("4. UIDVALIDITY change falls back to the search...")
+    box.uidvalidity = 2
+    batch, _ = run_sync(server)
+    assert batch.full_sync and batch.uids == [1, 2, 3, 4], batch.uids
+    print("   ✅ full resync")
+
+    print(f"5. UID sets: {uid_set([1, 2, 3, 7, 9, 10])}")
+    assert uid_set([1, 2, 3, 7, 9, 10]) == '1:3,7,9:10'
+
+    server.shutdown()
+    print("\n🎯 IMAP sync tests passed")
+
+
+if __name__ == "__main__":
+    test_imap_sync()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Test that streamed Sellerboard orders parsing keeps every column the analytics read
+"""
+import io
+import sys
+
+import pandas as pd
+
+# Add current directory to Python path
+sys.path.insert(0, '.')
+
+from orders_analysis import EnhancedOrdersAnalysis
+from sellerboard_download import read_report_frame
+
+# Order row fields the Overview revenue figure reads from sellerboard_orders
+REVENUE_COLUMNS = ['OrderTotalAmount', 'order_total_amount', 'Order Total Amount', 'Revenue', 'revenue',
+                   'Total', 'total', 'Amount', 'amount']
+
+SAMPLE_ORDERS_CSV = (
+    'AmazonOrderId,PurchaseDate(UTC),OrderStatus,Products,NumberOfItems,OrderTotalAmount,'
+    'Marketplace,SalesChannel,ShipCountry,Coupon\n'
+    '111-0000001,08/27/2024 10:15:00,Shipped,B008XQO7WA,1,19.99,Amazon.com,Amazon,US,\n'
+    '111-0000002,08/27/2024 11:40:00,Pending,B07XVTRJKX,2,45.50,Amazon.com,Amazon,US,SAVE5\n'
+    '111-0000003,08/28/2024 09:05:00,Shipped,0316769487,1,8.25,Amazon.com,Amazon,US,\n'
+    '111-0000004,08/28/2024 17:30:00,Cancelled,B0CHX1W1XY,1,0,Amazon.com,Amazon,US,\n'
+)
+
+
+class FakeResponse:
+    """The parts of a streamed requests.Response that read_report_frame uses"""
+
+    def __init__(self, body: bytes):
+        self.raw = io.BytesIO(body)
+        self.headers = {'Content-Type': 'text/csv'}
+        self.encoding = None
+
+    def close(self):
+        pass
+
+
+def analytics_columns(df):
+    analyzer = EnhancedOrdersAnalysis(orders_url='https://example.com/orders', stock_url='https://example.com/stock')
+    resolved = [col for col in analyzer._order_columns(df) if col]
+    return resolved + [col for col in REVENUE_COLUMNS if col in df.columns]
+
+
+def test_orders_columns():
+    print("=== Testing streamed orders columns ===")
+    # Before streaming: the decoded body was parsed whole
+    before = pd.read_csv(io.StringIO(SAMPLE_ORDERS_CSV))
+    after, _ = read_report_frame(FakeResponse(SAMPLE_ORDERS_CSV.encode()), 'orders', chunk_rows=2)
+
+    wanted = analytics_columns(before)
+    print(f"1. Columns the analytics read: {wanted}")
+    assert 'OrderTotalAmount' in wanted, wanted
+    assert analytics_columns(after) == wanted, (analytics_columns(after), wanted)
+    print(f"   ✅ kept: {list(after.columns)}")
+
+    print("2. Values match the whole-body parse...")
+    for col in wanted:
+        assert before[col].astype(str).tolist() == after[col].astype(str).tolist(), col
+    assert after['Products'].tolist()[2] == '0316769487', "ISBN ASIN lost its leading zero"
+    print("   ✅ same values")
+
+    print("\n🎯 Sellerboard download tests passed")
+
+
+if __name__ == "__main__":
+    test_orders_columns()
@@ -0,0 +1,77 @@
+"""
+In-memory index over the users config.
+
+``users.json`` is a list, so finding a user by Discord ID, internal id or email used to
+scan it (and re-normalize the match) on every call, several times per request. A
+``UserDirectory`` is built once per loaded users list from already-normalized records
+and answers those lookups from hash indexes. ``app.py`` rebuilds it whenever the
+users config is reloaded or written through ``update_users_config``.
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+
+def _field(user: dict, section: str, key: str):
+    value = user.get(section)
+    return value.get(key) if isinstance(value, dict) else None
+
+
+class UserDirectory:
+    """Hash indexes over a list of normalized user records (first match wins, like a scan)"""
+
+    def __init__(self, users: Iterable[dict], version: Optional[str] = None):
+        self.version = version
+        # Kept as the same list object so callers can edit it and pass it to update_users_config
+        self.users: List[dict] = users if isinstance(users, list) else list(users)
+        self._by_discord_id: Dict[str, dict] = {}
+        self._position_by_discord_id: Dict[str, int] = {}
+        self._by_id: Dict[str, dict] = {}
+        self._by_email: Dict[str, dict] = {}
+        self._subusers_by_parent: Dict[str, List[dict]] = {}
+
+        for position, user in enumerate(self.users):
+            discord_id = _field(user, 'identity', 'discord_id') or user.get('discord_id')
+            if discord_id not in (None, ''):
+                # Lookups accept int or str IDs; records always carry the string form
+                discord_id = str(discord_id)
+                if isinstance(user.get('identity'), dict):
+                    user['identity']['discord_id'] = discord_id
+                self._by_discord_id.setdefault(discord_id, user)
+                self._position_by_discord_id.setdefault(discord_id, position)
+
+            user_id = user.get('id')
+            if user_id:
+                self._by_id.setdefault(user_id, user)
+
+            email = _field(user, 'identity', 'email')
+            if email:
+                self._by_email.setdefault(email, user)
+
+            parent_user_id = _field(user, 'account', 'parent_user_id')
+            if parent_user_id:
+                self._subusers_by_parent.setdefault(str(parent_user_id), []).append(user)
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    def by_discord_id(self, discord_id) -> Optional[dict]:
+        if discord_id is None:
+            return None
+        return self._by_discord_id.get(str(discord_id))
+
+    def index_of(self, discord_id) -> Optional[int]:
+        """Position of the user in the users list (for replace-and-save updates)"""
+        if discord_id is None:
+            return None
+        return self._position_by_discord_id.get(str(discord_id))
+
+    def by_id(self, user_id) -> Optional[dict]:
+        return self._by_id.get(user_id) if user_id else None
+
+    def by_email(self, email) -> Optional[dict]:
+        return self._by_email.get(email) if email else None
+
+    def subusers_of(self, parent_discord_id) -> List[dict]:
+        if parent_discord_id is None:
+            return []
+        return list(self._subusers_by_parent.get(str(parent_discord_id), []))
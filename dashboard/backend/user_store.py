@@ -0,0 +1,307 @@
+"""
+Storage backends for the users config.
+
+``single_file`` (default) keeps the historical layout: one ``users.json`` document that
+is rewritten on every change. ``per_user`` stores each user as its own S3 object under
+``USERS_RECORD_PREFIX`` plus a compact ``index.json`` listing the records. Saving a
+full users list then only PUTs the records whose content changed, in parallel, each
+conditioned on the ETag it was read with (``If-Match``) so concurrent writers cannot
+silently overwrite each other. When the index does not exist yet the legacy
+``users.json`` is imported automatically.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from botocore.exceptions import ClientError
+
+USERS_STORAGE_MODE = os.getenv('USERS_STORAGE_MODE', 'single_file').lower()
+USERS_RECORD_PREFIX = os.getenv('USERS_RECORD_PREFIX', 'users/')
+USERS_STORE_WORKERS = int(os.getenv('USERS_STORE_WORKERS', '8'))
+
+
+class UserRecordConflict(Exception):
+    """Another writer changed a user record since it was read"""
+
+    def __init__(self, record_keys: List[str]):
+        super().__init__(f"User records changed concurrently: {', '.join(record_keys)}")
+        self.record_keys = record_keys
+
+
+def user_record_key(user: dict) -> Optional[str]:
+    identity = user.get('identity') if isinstance(user.get('identity'), dict) else {}
+    key = identity.get('discord_id') or user.get('discord_id') or user.get('id')
+    return str(key) if key not in (None, '') else None
+
+
+def _error_code(error: ClientError) -> str:
+    return str(error.response.get('Error', {}).get('Code', ''))
+
+
+def _is_missing(error: ClientError) -> bool:
+    return _error_code(error) in ('NoSuchKey', '404', 'NotFound')
+
+
+def _is_conflict(error: ClientError) -> bool:
+    return _error_code(error) in ('PreconditionFailed', '412', 'ConditionalRequestConflict', '409')
+
+
+class SingleFileUserStore:
+    """The whole users list in one JSON document"""
+
+    mode = 'single_file'
+
+    def __init__(self, s3_client_factory: Callable, bucket: str, key: str):
+        self.s3_client_factory = s3_client_factory
+        self.bucket = bucket
+        self.key = key
+
+    def load(self) -> List[dict]:
+        response = self.s3_client_factory().get_object(Bucket=self.bucket, Key=self.key)
+        return json.loads(response['Body'].read().decode('utf-8')).get('users', [])
+
+    def save_all(self, users: List[dict]):
+        config_data = {
+            "version": "2.0",
+            "last_updated": datetime.utcnow().isoformat(),
+            "users": users
+        }
+        self.s3_client_factory().put_object(
+            Bucket=self.bucket,
+            Key=self.key,
+            Body=json.dumps(config_data, indent=2),
+            ContentType='application/json'
+        )
+
+    def save_record(self, user: dict, users: List[dict]):
+        self.save_all(users)
+
+    def snapshot_state(self) -> dict:
+        return {}
+
+    def restore_state(self, snapshot: dict) -> bool:
+        return True
+
+
+class PerUserS3Store:
+    """One S3 object per user plus an index document, written with conditional PUTs"""
+
+    mode = 'per_user'
+
+    def __init__(self, s3_client_factory: Callable, bucket: str, legacy_key: str,
+                 prefix: str = USERS_RECORD_PREFIX, max_workers: int = USERS_STORE_WORKERS):
+        self.s3_client_factory = s3_client_factory
+        self.bucket = bucket
+        self.legacy_key = legacy_key
+        self.prefix = prefix
+        self.index_key = f"{prefix}index.json"
+        self.max_workers = max(1, max_workers)
+        self._lock = threading.Lock()
+        # record key -> (ETag, content hash) as last read or written by this process
+        self._state: Dict[str, tuple] = {}
+        self._index_keys: List[str] = []
+        self._index_etag: Optional[str] = None
+
+    def snapshot_state(self) -> dict:
+        """ETags behind the cached users list, shared with other processes via the config cache"""
+        with self._lock:
+            return {'records': dict(self._state), 'index_keys': list(self._index_keys), 'index_etag': self._index_etag}
+
+    def restore_state(self, snapshot: dict) -> bool:
+        """Adopt another process's ETags; False when there is nothing to adopt and a load is needed"""
+        if not snapshot or 'records' not in snapshot:
+            return False
+        with self._lock:
+            self._state = dict(snapshot['records'])
+            self._index_keys = list(snapshot['index_keys'])
+            self._index_etag = snapshot['index_etag']
+        return True
+
+    def _object_key(self, record_key: str) -> str:
+        return f"{self.prefix}{record_key}.json"
+
+    @staticmethod
+    def _serialize(user: dict) -> str:
+        return json.dumps(user, separators=(',', ':'), sort_keys=True, default=str)
+
+    @staticmethod
+    def _digest(body: str) -> str:
+        return hashlib.sha1(body.encode('utf-8')).hexdigest()
+
+    def load(self) -> List[dict]:
+        s3 = self.s3_client_factory()
+        try:
+            response = s3.get_object(Bucket=self.bucket, Key=self.index_key)
+        except ClientError as e:
+            if _is_missing(e):
+                return self.import_single_file()
+            raise
+        index = json.loads(response['Body'].read().decode('utf-8'))
+        index_etag = response.get('ETag')
+        record_keys = [entry['key'] for entry in index.get('users', [])]
+
+        def fetch(record_key):
+            try:
+                obj = s3.get_object(Bucket=self.bucket, Key=self._object_key(record_key))
+            except ClientError as e:
+                if _is_missing(e):
+                    return record_key, None, None
+                raise
+            return record_key, obj['Body'].read().decode('utf-8'), obj.get('ETag')
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            fetched = list(executor.map(fetch, record_keys))
+
+        users, state = [], {}
+        for record_key, body, etag in fetched:
+            if body is None:
+                continue
+            user = json.loads(body)
+            users.append(user)
+            state[record_key] = (etag, self._digest(self._serialize(user)))
+        with self._lock:
+            self._state = state
+            self._index_keys = [record_key for record_key, body, _ in fetched if body is not None]
+            self._index_etag = index_etag
+        return users
+
+    def import_single_file(self) -> List[dict]:
+        """Copy the legacy users.json into per-user records (the legacy file is left untouched)"""
+        try:
+            users = SingleFileUserStore(self.s3_client_factory, self.bucket, self.legacy_key).load()
+        except ClientError as e:
+            if not _is_missing(e):
+                raise
+            users = []
+        with self._lock:
+            self._state = {}
+            self._index_keys = []
+            self._index_etag = None
+        self.save_all(users, force=True)
+        print(f"Imported {len(users)} users from {self.legacy_key} into {self.prefix}")
+        return users
+
+    def _put_record(self, s3, record_key: str, body: str, etag: Optional[str], indexed: bool,
+                    force: bool) -> Optional[str]:
+        kwargs = {}
+        if not force and indexed:
+            # Indexed records must be unchanged since we read them (no ETag: it went stale, reload first).
+            # New records are guarded by the conditional index write instead.
+            kwargs = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+        response = s3.put_object(Bucket=self.bucket, Key=self._object_key(record_key), Body=body,
+                                 ContentType='application/json', **kwargs)
+        return response.get('ETag')
+
+    def _write_index(self, s3, record_keys: List[str], force: bool):
+        index = {
+            'version': 3,
+            'updated_at': datetime.utcnow().isoformat(),
+            'users': [{'key': record_key} for record_key in record_keys],
+        }
+        kwargs = {}
+        if not force:
+            # Membership changes from another process must be reloaded, not overwritten
+            kwargs = {'IfMatch': self._index_etag} if self._index_etag else {'IfNoneMatch': '*'}
+        response = s3.put_object(Bucket=self.bucket, Key=self.index_key, Body=json.dumps(index, separators=(',', ':')),
+                                 ContentType='application/json', **kwargs)
+        return response.get('ETag')
+
+    def save_all(self, users: List[dict], force: bool = False):
+        """Write only the records that changed since they were loaded; raises UserRecordConflict"""
+        s3 = self.s3_client_factory()
+        pending, record_keys = {}, []
+        for user in users:
+            record_key = user_record_key(user)
+            if record_key is None or record_key in pending:
+                continue
+            record_keys.append(record_key)
+            body = self._serialize(user)
+            pending[record_key] = (body, self._digest(body))
+
+        with self._lock:
+            state = dict(self._state)
+            previous_keys = list(self._index_keys)
+        changed = {key: value for key, value in pending.items() if force or state.get(key, (None, None))[1] != value[1]}
+        removed = [key for key in previous_keys if key not in pending]
+
+        def put(item):
+            record_key, (body, digest) = item
+            try:
+                etag = self._put_record(s3, record_key, body, state.get(record_key, (None, None))[0],
+                                        record_key in previous_keys, force)
+                return record_key, etag, digest, False
+            except ClientError as e:
+                if _is_conflict(e):
+                    return record_key, None, None, True
+                raise
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(put, changed.items()))
+
+        conflicts = []
+        with self._lock:
+            for record_key, etag, digest, conflicted in results:
+                if conflicted:
+                    conflicts.append(record_key)
+                    # Forget the stale ETag; the caller reloads before retrying
+                    self._state.pop(record_key, None)
+                else:
+                    self._state[record_key] = (etag, digest)
+
+        if force or record_keys != previous_keys:
+            try:
+                index_etag = self._write_index(s3, record_keys, force)
+            except ClientError as e:
+                if not _is_conflict(e):
+                    raise
+                with self._lock:
+                    self._index_etag = None
+                raise UserRecordConflict(conflicts + ['index'])
+            with self._lock:
+                self._index_keys = record_keys
+                self._index_etag = index_etag
+
+        # Removed users are deleted only once the index no longer lists them
+        for record_key in removed:
+            s3.delete_object(Bucket=self.bucket, Key=self._object_key(record_key))
+            with self._lock:
+                self._state.pop(record_key, None)
+
+        if conflicts:
+            raise UserRecordConflict(conflicts)
+
+    def save_record(self, user: dict, users: List[dict]):
+        """Write one user's record; falls back to save_all when the user is not indexed yet"""
+        record_key = user_record_key(user)
+        with self._lock:
+            indexed = record_key in self._index_keys
+            etag, previous_digest = self._state.get(record_key, (None, None))
+        if not indexed:
+            self.save_all(users)
+            return
+
+        body = self._serialize(user)
+        digest = self._digest(body)
+        if digest == previous_digest:
+            return
+        try:
+            etag = self._put_record(self.s3_client_factory(), record_key, body, etag, indexed=True, force=False)
+        except ClientError as e:
+            if _is_conflict(e):
+                with self._lock:
+                    self._state.pop(record_key, None)
+                raise UserRecordConflict([record_key])
+            raise
+        with self._lock:
+            self._state[record_key] = (etag, digest)
+
+
+def create_user_store(s3_client_factory: Callable, bucket: str, legacy_key: str, mode: str = USERS_STORAGE_MODE):
+    if mode == 'per_user':
+        return PerUserS3Store(s3_client_factory, bucket, legacy_key)
+    return SingleFileUserStore(s3_client_factory, bucket, legacy_key)
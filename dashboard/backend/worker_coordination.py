@@ -0,0 +1,205 @@
+"""
+Coordination between worker processes when the app is served by a pre-fork server.
+
+Under gunicorn every worker imports ``app.py``, but singleton background services
+(email monitoring, analytics precompute) must run in exactly one process. Workers elect
+an owner with an exclusive ``flock`` on a lock file: the holder starts the services and
+the others retry periodically, taking over if the owner exits (the OS releases the lock
+with the process). A single ``python app.py`` process simply wins the election.
+
+Work that any worker may start but only one may run at a time (an email check cycle,
+which the leader runs on its schedule and users trigger from whichever worker serves
+their request) takes a ``TaskLock``: the same kind of ``flock``, held for one run.
+
+Requests to an outside site that every worker makes (Amazon product-page scrapes) are
+spaced by a ``RequestSpacer``: the time of the last request lives in a lock file, so
+the minimum interval holds for all workers together rather than for each of them.
+"""
+
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, a single process is assumed
+    fcntl = None
+
+SERVICE_LOCK_PATH = os.getenv('SERVICE_LOCK_PATH', os.path.join(tempfile.gettempdir(), 'dms_background_services.lock'))
+SERVICE_LOCK_RETRY_SECONDS = int(os.getenv('SERVICE_LOCK_RETRY_SECONDS', '30'))
+EMAIL_CHECK_LOCK_PATH = os.getenv('EMAIL_CHECK_LOCK_PATH', os.path.join(tempfile.gettempdir(), 'dms_email_check.lock'))
+AMAZON_REQUEST_LOCK_PATH = os.getenv('AMAZON_REQUEST_LOCK_PATH',
+                                     os.path.join(tempfile.gettempdir(), 'dms_amazon_requests.lock'))
+
+
+class ServiceLeader:
+    """Cross-process election of the background-service owner"""
+
+    def __init__(self, lock_path: str = SERVICE_LOCK_PATH, retry_seconds: int = SERVICE_LOCK_RETRY_SECONDS):
+        self.lock_path = lock_path
+        self.retry_seconds = retry_seconds
+        self._fd: Optional[int] = None
+        self._owner_pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._retry_thread: Optional[threading.Thread] = None
+
+    @property
+    def is_leader(self) -> bool:
+        # A lock inherited through fork belongs to the parent, not to this process
+        return self._fd is not None and self._owner_pid == os.getpid()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.is_leader:
+                return True
+            if fcntl is None:
+                self._fd, self._owner_pid = -1, os.getpid()
+                return True
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+            os.ftruncate(fd, 0)
+            os.write(fd, str(os.getpid()).encode())
+            self._fd, self._owner_pid = fd, os.getpid()
+            return True
+
+    def held_elsewhere(self) -> bool:
+        """True when another live process currently owns the background services"""
+        if self.is_leader or fcntl is None:
+            return False
+        try:
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return True
+        else:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            return False
+        finally:
+            os.close(fd)
+
+    def run_when_leader(self, start_services: Callable[[], None]):
+        """Start the services now if this process wins, otherwise keep trying in the background"""
+        if self.try_acquire():
+            print(f"Process {os.getpid()} owns the background services")
+            start_services()
+            return
+
+        def wait_for_leadership():
+            while not self.try_acquire():
+                threading.Event().wait(self.retry_seconds)
+            print(f"Process {os.getpid()} took over the background services")
+            start_services()
+
+        self._retry_thread = threading.Thread(target=wait_for_leadership, name='service-leader-election', daemon=True)
+        self._retry_thread.start()
+
+    def release(self):
+        with self._lock:
+            if self.is_leader and self._fd not in (None, -1):
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+                os.close(self._fd)
+            self._fd = self._owner_pid = None
+
+
+class TaskLock:
+    """At most one run of a task at a time across worker processes and their threads"""
+
+    def __init__(self, lock_path: str):
+        self.lock_path = lock_path
+        # flock excludes other open file descriptions, in this process too; without
+        # fcntl this lock is all there is
+        self._local_lock = threading.Lock()
+
+    @contextmanager
+    def hold(self) -> Iterator[bool]:
+        """Yields True while this caller holds the lock, False (without waiting) if a run is in progress"""
+        if not self._local_lock.acquire(blocking=False):
+            yield False
+            return
+        fd = None
+        try:
+            if fcntl is not None:
+                fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    yield False
+                    return
+            yield True
+        finally:
+            if fd is not None:
+                os.close(fd)
+            self._local_lock.release()
+
+    def in_progress(self) -> bool:
+        with self.hold() as acquired:
+            return not acquired
+
+
+class RequestSpacer:
+    """A minimum interval between request starts across worker processes and their threads"""
+
+    def __init__(self, lock_path: str, interval: float):
+        self.lock_path = lock_path
+        self.interval = interval
+        # Threads of one process queue here; processes queue on the flock
+        self._local_lock = threading.Lock()
+        self._last = 0.0
+
+    def _read(self, fd: int) -> float:
+        try:
+            return float(os.pread(fd, 64, 0).decode() or 0)
+        except ValueError:
+            return 0.0
+
+    def wait(self, jitter: Callable[[], float] = lambda: 0.0):
+        """Block until ``interval`` has passed since the last request anywhere, then claim the slot
+
+        ``jitter()`` seconds are added whenever the caller has to wait.
+        """
+        with self._local_lock:
+            fd = None
+            try:
+                if fcntl is not None:
+                    fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                    self._last = self._read(fd)
+                remaining = self.interval - (time.time() - self._last)
+                if remaining > 0:
+                    time.sleep(remaining + jitter())
+                self._last = time.time()
+                if fd is not None:
+                    os.ftruncate(fd, 0)
+                    os.pwrite(fd, repr(self._last).encode(), 0)
+            finally:
+                if fd is not None:
+                    os.close(fd)
+
+    def last_request(self) -> float:
+        """Wall-clock time of the last request from any process (0 if none yet)"""
+        if fcntl is None:
+            return self._last
+        try:
+            fd = os.open(self.lock_path, os.O_RDONLY)
+        except OSError:
+            return 0.0
+        try:
+            return self._read(fd)
+        finally:
+            os.close(fd)
+
+
+# One election per process
+service_leader = ServiceLeader()
+# Email check cycles, scheduled or manual, from any worker
+email_check_lock = TaskLock(EMAIL_CHECK_LOCK_PATH)
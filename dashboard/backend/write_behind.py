@@ -0,0 +1,91 @@
+"""
+Write-behind buffering for low-value bookkeeping updates.
+
+Last-activity timestamps, Discord name/avatar refreshes and refreshed Google tokens are
+written on the request path, yet nobody needs them persisted within the same second.
+``FieldWriteBehind`` records them as ``{key: {field_path: value}}``, coalescing repeated
+updates of the same field, and hands the whole batch to a flush callback every
+``interval_seconds`` and at interpreter exit. The callback applies only the buffered
+(dirty) fields onto the freshest stored records, so edits made elsewhere in the meantime
+are kept. A failed flush is re-queued without overwriting newer buffered values.
+"""
+
+import atexit
+import os
+import threading
+from typing import Any, Callable, Dict, Optional
+
+USER_WRITE_BEHIND_SECONDS = float(os.getenv('USER_WRITE_BEHIND_SECONDS', '30'))
+
+
+class FieldWriteBehind:
+    """Coalesces per-key field updates and flushes them in batches from a background thread"""
+
+    def __init__(self, flush_batch: Callable[[Dict[str, Dict[str, Any]]], None],
+                 interval_seconds: float = USER_WRITE_BEHIND_SECONDS, name: str = 'write-behind'):
+        self.flush_batch = flush_batch
+        self.interval_seconds = interval_seconds
+        self.name = name
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._atexit_registered = False
+
+    def record(self, key, fields: Dict[str, Any]):
+        """Buffer field updates for a key; with a non-positive interval they are written immediately"""
+        if self.interval_seconds <= 0:
+            self.flush_batch({str(key): dict(fields)})
+            return
+        with self._lock:
+            self._pending.setdefault(str(key), {}).update(fields)
+        self._ensure_thread()
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.stop)
+                self._atexit_registered = True
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            self.flush()
+
+    def flush(self) -> int:
+        """Write everything buffered so far; returns the number of keys flushed"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            try:
+                self.flush_batch(batch)
+            except Exception as e:
+                print(f"[{self.name}] Flush of {len(batch)} pending updates failed, will retry: {e}")
+                with self._lock:
+                    for key, fields in batch.items():
+                        # Values buffered while the flush ran are newer and win
+                        merged = dict(fields)
+                        merged.update(self._pending.get(key, {}))
+                        self._pending[key] = merged
+                return 0
+            return len(batch)
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def stop(self):
+        """Stop the flush thread and write what is left (called at shutdown)"""
+        self._stop.set()
+        self.flush()
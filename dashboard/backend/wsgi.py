@@ -0,0 +1,23 @@
+"""
+WSGI entry point for production serving.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Each gunicorn worker imports the app on its own (no preload), so database connections
+and per-process threads are created inside the worker. Singleton background services
+are started by whichever worker wins ``worker_coordination.service_leader``.
+"""
+
+import importlib.util
+import os
+import sys
+
+# app.py is loaded by path: ``import app`` resolves to the app/ package next to it
+_APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+_spec = importlib.util.spec_from_file_location('dashboard_app', _APP_PATH)
+dashboard_app = importlib.util.module_from_spec(_spec)
+sys.modules['dashboard_app'] = dashboard_app
+_spec.loader.exec_module(dashboard_app)
+
+app = dashboard_app.app
+application = app
@@ -103,7 +103,14 @@ const SmartRestockAlerts = React.memo(({ analytics, loading = false }) => {
   const [sourcesLoading, setSourcesLoading] = useState(false);
   
   // Extract data first (before any conditional returns to avoid hook order issues)
-  const { enhanced_analytics, restock_alerts } = analytics || {};
+  const { enhanced_analytics, restock_alerts, stock_info } = analytics || {};
+  
+  // Source link from the stock report row (top-level stock_info; older payloads nested it per ASIN)
+  const stockSourceLink = (asin) => {
+    const row = stock_info?.[asin] || enhanced_analytics?.[asin]?.stock_info;
+    return row?.Source || row?.source || row?.['Source Link'] || row?.['source link'] ||
+      row?.Link || row?.link || row?.URL || row?.url;
+  };
   
   // Extract all ASINs for batch image loading
   const allAsins = useMemo(() => {
@@ -259,26 +266,11 @@ const SmartRestockAlerts = React.memo(({ analytics, loading = false }) => {
                 </div>
                 <div className="text-xs text-gray-500">
                   {alert.asin}
-                  {(enhanced_analytics?.[alert.asin]?.stock_info?.Source || 
-                    enhanced_analytics?.[alert.asin]?.stock_info?.source ||
-                    enhanced_analytics?.[alert.asin]?.stock_info?.['Source Link'] ||
-                    enhanced_analytics?.[alert.asin]?.stock_info?.['source link'] ||
-                    enhanced_analytics?.[alert.asin]?.stock_info?.Link ||
-                    enhanced_analytics?.[alert.asin]?.stock_info?.link ||
-                    enhanced_analytics?.[alert.asin]?.stock_info?.URL ||
-                    enhanced_analytics?.[alert.asin]?.stock_info?.url) && (
+                  {stockSourceLink(alert.asin) && (
                     <>
                       {' • '}
                       <a 
-                        href={enhanced_analytics[alert.asin]?.stock_info?.Source ||
-                              enhanced_analytics[alert.asin]?.stock_info?.source ||
-                              enhanced_analytics[alert.asin]?.stock_info?.['Source Link'] ||
-                              enhanced_analytics[alert.asin]?.stock_info?.['source link'] ||
-                              enhanced_analytics[alert.asin]?.stock_info?.Link ||
-                              enhanced_analytics[alert.asin]?.stock_info?.link ||
-                              enhanced_analytics[alert.asin]?.stock_info?.URL ||
-                              enhanced_analytics[alert.asin]?.stock_info?.url ||
-                              `https://www.amazon.com/dp/${alert.asin}`} 
+                        href={stockSourceLink(alert.asin) || `https://www.amazon.com/dp/${alert.asin}`} 
                         target="_blank" 
                         rel="noopener noreferrer"
                         className="text-blue-600 hover:text-blue-800"
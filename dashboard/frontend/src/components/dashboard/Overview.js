@@ -30,6 +30,20 @@ import {
   SkeletonTable
 } from '../common/SkeletonLoaders';
 
+// Only the parts of the analytics payload this page renders
+const OVERVIEW_ANALYTICS_FIELDS = [
+  'today_sales',
+  'orders_summary',
+  'low_stock',
+  'restock_priority',
+  'purchase_insights',
+  'enhanced_analytics.product_name',
+  'enhanced_analytics.velocity.weighted_velocity',
+  'enhanced_analytics.restock.current_stock',
+  'enhanced_analytics.restock.suggested_quantity',
+  'enhanced_analytics.priority.category'
+].join(',');
+
 const Overview = () => {
   const { user } = useAuth();
   const [analytics, setAnalytics] = useState(null);
@@ -41,7 +55,10 @@ const Overview = () => {
     try {
       setError(null);
       setLoading(true);
-      const response = await axios.get('/api/analytics/orders', { withCredentials: true });
+      const response = await axios.get('/api/analytics/orders', {
+        params: { fields: OVERVIEW_ANALYTICS_FIELDS },
+        withCredentials: true
+      });
       setAnalytics(response.data);
       setLastUpdated(new Date());
       
@@ -235,7 +252,9 @@ const Overview = () => {
     
     // Calculate yesterday's revenue - optimized with early return
     let yesterdayRevenue = 0;
-    if (analytics.sellerboard_orders?.length > 0) {
+    if (analytics.orders_summary) {
+      yesterdayRevenue = analytics.orders_summary.revenue || 0;
+    } else if (analytics.sellerboard_orders?.length > 0) {
       yesterdayRevenue = analytics.sellerboard_orders.reduce((total, order) => {
         const amount = parseFloat(
           order.OrderTotalAmount || 
@@ -287,7 +306,7 @@ const Overview = () => {
     }
     
     return { todayOrders, activeProducts, lowStockCount, restockPriorityCount, yesterdayRevenue };
-  }, [analytics?.today_sales, analytics?.sellerboard_orders, analytics?.enhanced_analytics, analytics?.low_stock, analytics?.restock_priority]);
+  }, [analytics?.today_sales, analytics?.orders_summary, analytics?.sellerboard_orders, analytics?.enhanced_analytics, analytics?.low_stock, analytics?.restock_priority]);
 
   const topProducts = useMemo(() => {
     if (!analytics?.today_sales) return [];
@@ -0,0 +1,291 @@
+"""
+Fast datetime parsing for Sellerboard report columns.
+
+The format is sniffed from a small sample of the column instead of trial-parsing the
+whole series with every candidate format, and the winning format is remembered per
+report source (usually the Sellerboard URL) so later downloads go straight to a single
+vectorized conversion. Only rows that fail the chosen format are re-parsed with the
+remaining formats.
+
+``pd.to_datetime(format=...)`` runs strptime once per value for the non-ISO Sellerboard
+formats, so ``parse_with_format`` handles purely numeric formats such as
+``%m/%d/%y %H:%M`` with numpy instead: the column is joined into one byte buffer, the
+fields are read between the separator positions and the timestamps are assembled with
+datetime64 arithmetic. Values it does not accept (wrong width, out-of-range fields,
+padding spaces) go through ``pd.to_datetime`` as before, so the result is the same.
+"""
+
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Common datetime formats from Sellerboard and other sources
+# PRIORITY ORDER: Most common Sellerboard formats first
+DATETIME_FORMATS = [
+    # Sellerboard specific formats (most common first)
+    "%m/%d/%y %H:%M",        # 7/26/25 6:05 (US Sellerboard format)
+    "%d/%m/%Y %H:%M:%S",     # 28/07/2025 06:21:44 (EU/International Sellerboard format)
+    "%m/%d/%Y %H:%M:%S",     # 07/28/2025 14:30:45 (US with seconds)
+    "%d/%m/%Y %H:%M",        # 28/07/2025 06:21 (EU without seconds)
+    "%m/%d/%y %H:%M:%S",     # 7/26/25 6:05:00 (US with seconds)
+    "%d/%m/%y %H:%M:%S",     # 28/07/25 06:21:44 (EU with 2-digit year)
+
+    # Legacy formats for backward compatibility
+    "%m/%d/%Y %I:%M:%S %p",  # 07/28/2025 02:30:45 PM (12-hour with AM/PM)
+    "%d/%m/%Y %I:%M:%S %p",  # 28/07/2025 02:30:45 PM (EU with AM/PM)
+    "%Y-%m-%d %H:%M:%S",     # 2025-07-28 14:30:45 (ISO-like)
+    "%Y-%m-%d %I:%M:%S %p",  # 2025-07-28 02:30:45 PM
+    "%m/%d/%Y",              # 07/28/2025 (date only)
+    "%Y-%m-%d",              # 2025-07-28 (ISO date)
+    "%d/%m/%Y",              # 28/07/2025 (EU date only)
+]
+
+SAMPLE_SIZE = 200
+
+# Fields the numpy parser reads: (min digits, max digits, min value, max value). Years
+# stay inside the datetime64[ns] range; anything else is left to pd.to_datetime.
+_NUMERIC_FIELDS = {
+    '%m': (1, 2, 1, 12),
+    '%d': (1, 2, 1, 31),
+    '%y': (2, 2, 0, 99),
+    '%Y': (4, 4, 1678, 2261),
+    '%H': (1, 2, 0, 23),
+    '%M': (1, 2, 0, 59),
+    '%S': (1, 2, 0, 59),
+}
+_DAYS_IN_MONTH = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+# Winning format per report source, e.g. {sellerboard_url: "%m/%d/%y %H:%M"}
+_format_memo: Dict[str, str] = {}
+_memo_lock = threading.Lock()
+
+
+def _sample_positions(length: int, size: int = SAMPLE_SIZE) -> np.ndarray:
+    """Head plus evenly spaced rows, so a format change further down the file is still seen"""
+    if length <= size:
+        return np.arange(length)
+    step = max(1, length // (size // 2))
+    return np.concatenate([np.arange(size // 2), np.arange(0, length, step)])
+
+
+def _sample(values: pd.Series, size: int = SAMPLE_SIZE) -> pd.Series:
+    return values.iloc[_sample_positions(len(values), size)]
+
+
+def _numeric_format(fmt: str) -> Optional[Tuple[List[str], List[str]]]:
+    """(fields, separators) of a format the numpy parser handles, else None"""
+    if fmt.startswith('%Y-%m-%d'):
+        # pandas parses ISO 8601 natively
+        return None
+    tokens = re.findall(r'%.|[^%]+', fmt)
+    fields, separators = tokens[0::2], tokens[1::2]
+    if len(fields) != len(separators) + 1 or len(set(fields)) != len(fields):
+        return None
+    if any(field not in _NUMERIC_FIELDS for field in fields):
+        return None
+    if any(len(sep) != 1 or sep.isdigit() or sep == '\n' for sep in separators):
+        return None
+    if '%m' not in fields or '%d' not in fields or ('%y' not in fields and '%Y' not in fields):
+        return None
+    return fields, separators
+
+
+def _parse_numeric(values: np.ndarray, fields: List[str], separators: List[str]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """Positions of the accepted values and their datetime64[ns] timestamps"""
+    try:
+        buffer = ('\n'.join(values) + '\n').encode('ascii')
+    except (TypeError, UnicodeEncodeError):
+        return None
+    chars = np.frombuffer(buffer, dtype=np.uint8)
+    digits = chars - np.uint8(ord('0'))
+
+    # Every accepted value is digit runs split by exactly len(separators) non-digits,
+    # plus the newline ending it
+    width = len(fields)
+    boundaries = np.flatnonzero(digits > 9)
+    digits[boundaries] = 0
+    newlines = np.flatnonzero(chars[boundaries] == ord('\n'))
+    if len(newlines) != len(values):
+        return None
+    counts = np.diff(newlines, prepend=-1)
+    accepted = counts == width
+    rows = np.flatnonzero(accepted)
+    # Digits between consecutive boundaries (a value starts after the previous newline)
+    lengths = np.diff(boundaries, prepend=-1) - 1
+    if len(rows) < len(values):
+        keep = np.repeat(accepted, counts)
+        boundaries, lengths = boundaries[keep], lengths[keep]
+    # One row per field: (fields, values) keeps the per-value reductions elementwise
+    boundaries = np.ascontiguousarray(boundaries.reshape(len(rows), width).T)
+    lengths = np.ascontiguousarray(lengths.reshape(len(rows), width).T)
+
+    limits = np.array([_NUMERIC_FIELDS[field] for field in fields], dtype=np.int64)[:, :, None]
+    ok = ((lengths >= limits[:, 0]) & (lengths <= limits[:, 1])).all(axis=0)
+    separator_codes = np.frombuffer(''.join(separators).encode('ascii'), dtype=np.uint8)[:, None]
+    ok &= (chars[boundaries[:-1]] == separator_codes).all(axis=0)
+
+    # Each field is read from the digits before its boundary. Where a field is shorter
+    # than its maximum width (only 1-2 digit fields are), the extra position read is the
+    # boundary before it, which was zeroed above.
+    numbers = digits[boundaries - 1].astype(np.int32)
+    numbers += digits[boundaries - 2].astype(np.int32) * 10
+    wide = [i for i, field in enumerate(fields) if _NUMERIC_FIELDS[field][1] == 4]
+    for back in (3, 4):
+        numbers[wide] += digits[boundaries[wide] - back].astype(np.int32) * 10 ** (back - 1)
+    numbers = numbers.astype(np.int64)
+    ok &= ((numbers >= limits[:, 2]) & (numbers <= limits[:, 3])).all(axis=0)
+    parts = dict(zip(fields, numbers))
+
+    if '%Y' in parts:
+        year = parts['%Y']
+    else:
+        # strptime's pivot: 69-99 are 19xx, 00-68 are 20xx
+        year = parts['%y'] + np.where(parts['%y'] < 69, 2000, 1900)
+    month, day = parts['%m'], parts['%d']
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    ok &= day <= _DAYS_IN_MONTH[np.clip(month, 1, 12) - 1] + (leap & (month == 2))
+
+    # Days since 1970-01-01 (proleptic Gregorian, years counted from March)
+    shifted = year - (month <= 2)
+    era = shifted // 400
+    year_of_era = shifted - era * 400
+    day_of_year = (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    days = era * 146097 + year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year - 719468
+    seconds = days * 86400 + (parts.get('%H', 0) * 60 + parts.get('%M', 0)) * 60 + parts.get('%S', 0)
+    return rows[ok], (seconds[ok] * 1_000_000_000).view('datetime64[ns]')
+
+
+def parse_with_format(series: pd.Series, fmt: str) -> pd.Series:
+    """``pd.to_datetime(series, format=fmt, errors='coerce')``, vectorized for numeric formats"""
+    spec = _numeric_format(fmt)
+    if spec is None or series.dtype != object:
+        return pd.to_datetime(series, format=fmt, errors='coerce')
+
+    values = series.to_numpy()
+    present = np.arange(len(values))
+    parsed = _parse_numeric(values, *spec)
+    if parsed is None:
+        # Missing values cannot be joined; parse the others
+        present = np.flatnonzero(pd.notna(values))
+        if len(present) < len(values):
+            parsed = _parse_numeric(values[present], *spec)
+    if parsed is None:
+        return pd.to_datetime(series, format=fmt, errors='coerce')
+
+    rows, stamps = parsed
+    result = np.full(len(values), np.datetime64('NaT'), dtype='datetime64[ns]')
+    result[present[rows]] = stamps
+    if len(rows) < len(present):
+        rejected = np.setdiff1d(present, present[rows], assume_unique=True)
+        result[rejected] = pd.to_datetime(series.iloc[rejected], format=fmt, errors='coerce').to_numpy(dtype='datetime64[ns]')
+    return pd.Series(result, index=series.index, name=series.name)
+
+
+def _parses_all(sample: pd.Series, fmt: str) -> bool:
+    try:
+        return bool(pd.to_datetime(sample, format=fmt, errors='coerce').notna().all())
+    except (ValueError, TypeError):
+        return False
+
+
+def sniff_datetime_format(series: pd.Series, source_key: Optional[str] = None, formats: List[str] = DATETIME_FORMATS) -> Optional[str]:
+    """Pick the first format (memoized one first) that parses every value in a sample of the column"""
+    sample = _sample(series).dropna()
+    if sample.empty:
+        sample = series.dropna()
+        if sample.empty:
+            return None
+    sample = sample.astype(str)
+
+    candidates = list(formats)
+    remembered = _remembered_format(source_key)
+    if remembered:
+        candidates.insert(0, remembered)
+
+    for fmt in candidates:
+        if _parses_all(sample, fmt):
+            if source_key:
+                with _memo_lock:
+                    _format_memo[source_key] = fmt
+            return fmt
+    return None
+
+
+def _remembered_format(source_key: Optional[str]) -> Optional[str]:
+    if not source_key:
+        return None
+    with _memo_lock:
+        return _format_memo.get(source_key)
+
+
+def forget_datetime_format(source_key: str):
+    """Drop the remembered format for a source (e.g. after the user changes report URLs)"""
+    with _memo_lock:
+        _format_memo.pop(source_key, None)
+
+
+def parse_datetime_robust(series: pd.Series, column_name: str = '', source_key: Optional[str] = None, formats: List[str] = DATETIME_FORMATS) -> pd.Series:
+    """Parse a datetime column in one vectorized pass, falling back per row only where needed"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+
+    fmt = None
+    remembered = _remembered_format(source_key)
+    if remembered:
+        # Parse with the remembered format straight away and keep the result if it
+        # covers the sample sniff_datetime_format would have checked
+        parsed = parse_with_format(series, remembered)
+        positions = _sample_positions(len(series))
+        present = series.iloc[positions].notna().to_numpy()
+        if present.any() and parsed.iloc[positions][present].notna().all():
+            fmt = remembered
+    if fmt is None:
+        fmt = sniff_datetime_format(series, source_key, formats)
+        if fmt is not None:
+            parsed = parse_with_format(series, fmt)
+    if fmt is None:
+        # No format covers the sample - keep the legacy behaviour of taking the first
+        # format that parses anything, then pandas' flexible parsing
+        for candidate in formats:
+            try:
+                parsed = pd.to_datetime(series, format=candidate, errors='coerce')
+            except (ValueError, TypeError):
+                continue
+            if parsed.notna().any():
+                fmt = candidate
+                break
+        else:
+            return pd.to_datetime(series, errors='coerce')
+
+    # Re-parse only the rows the chosen format could not handle
+    failed = parsed.isna()
+    if failed.any():
+        failed &= series.notna()
+    if failed.any():
+        remaining = series[failed]
+        for candidate in formats:
+            if candidate == fmt:
+                continue
+            try:
+                retry = pd.to_datetime(remaining, format=candidate, errors='coerce')
+            except (ValueError, TypeError):
+                continue
+            recovered = retry.notna()
+            if recovered.any():
+                parsed.loc[retry.index[recovered]] = retry[recovered]
+                remaining = remaining[~recovered]
+                if remaining.empty:
+                    break
+        if not remaining.empty:
+            try:
+                flexible = pd.to_datetime(remaining, errors='coerce', format='mixed')
+                recovered = flexible.notna()
+                if recovered.any():
+                    parsed.loc[flexible.index[recovered]] = flexible[recovered]
+            except (ValueError, TypeError):
+                pass
+
+    return parsed
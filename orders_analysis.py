@@ -5,6 +5,7 @@ from datetime import datetime, date, timedelta
 import json
 import os
 from typing import Dict, Optional
+from datetime_parsing import parse_datetime_robust
 
 ORDERS_REPORT_URL = "https://app.sellerboard.com/en/automation/reports?id=e0989fcf9a9e40b8a116318d4fd7ee84&format=csv&t=c3c41a4645fa4003ab1254d06820b076"
 STOCK_REPORT_URL = "https://app.sellerboard.com/en/automation/reports?id=b1e7d7e73f72404588b44df0839067dc&format=csv&t=c3c41a4645fa4003ab1254d06820b076"
@@ -16,57 +17,14 @@ class OrdersAnalysis:
         self.stock_url = stock_url or STOCK_REPORT_URL
 
     def _parse_datetime_robust(self, series: pd.Series, column_name: str) -> pd.Series:
-        """Robust datetime parsing that tries multiple formats"""
+        """Robust datetime parsing that sniffs the format from a sample (memoized per report URL)"""
         print(f"[DEBUG] Parsing datetime column '{column_name}' with {len(series)} values")
-        
-        # Common datetime formats from Sellerboard and other sources
-        # PRIORITY ORDER: Most common Sellerboard formats first
-        formats_to_try = [
-            # Sellerboard specific formats (most common first)
-            "%m/%d/%y %H:%M",        # 7/26/25 6:05 (US Sellerboard format)
-            "%d/%m/%Y %H:%M:%S",     # 28/07/2025 06:21:44 (EU/International Sellerboard format)
-            "%m/%d/%Y %H:%M:%S",     # 07/28/2025 14:30:45 (US with seconds)
-            "%d/%m/%Y %H:%M",        # 28/07/2025 06:21 (EU without seconds)
-            "%m/%d/%y %H:%M:%S",     # 7/26/25 6:05:00 (US with seconds)
-            "%d/%m/%y %H:%M:%S",     # 28/07/25 06:21:44 (EU with 2-digit year)
-            
-            # Legacy formats for backward compatibility
-            "%m/%d/%Y %I:%M:%S %p",  # 07/28/2025 02:30:45 PM (12-hour with AM/PM)
-            "%d/%m/%Y %I:%M:%S %p",  # 28/07/2025 02:30:45 PM (EU with AM/PM)
-            "%Y-%m-%d %H:%M:%S",     # 2025-07-28 14:30:45 (ISO-like)
-            "%Y-%m-%d %I:%M:%S %p",  # 2025-07-28 02:30:45 PM
-            "%m/%d/%Y",              # 07/28/2025 (date only)  
-            "%Y-%m-%d",              # 2025-07-28 (ISO date)
-            "%d/%m/%Y",              # 28/07/2025 (EU date only)
-        ]
-        
-        parsed_series = None
-        successful_format = None
-        
-        for fmt in formats_to_try:
-            try:
-                parsed_series = pd.to_datetime(series, format=fmt, errors='coerce')
-                # Count how many values were successfully parsed
-                valid_count = parsed_series.notna().sum()
-                if valid_count > 0:
-                    print(f"[DEBUG] Format '{fmt}' parsed {valid_count}/{len(series)} values successfully")
-                    successful_format = fmt
-                    break
-            except Exception as e:
-                continue
-        
-        # If no specific format worked, try pandas' flexible parsing as fallback
-        if parsed_series is None or parsed_series.notna().sum() == 0:
-            print(f"[DEBUG] All specific formats failed, trying flexible parsing")
-            parsed_series = pd.to_datetime(series, errors='coerce')
+        parsed_series = parse_datetime_robust(series, column_name, source_key=self.orders_url)
         
         # Log results
         final_valid_count = parsed_series.notna().sum()
         nat_count = parsed_series.isna().sum()
-        
         print(f"[DEBUG] Final parsing results: {final_valid_count} valid, {nat_count} NaT values")
-        if successful_format:
-            print(f"[DEBUG] Best format was: '{successful_format}'")
         
         # Show sample of unparseable values for debugging
         if nat_count > 0: